@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк массовой вставки связей в настольную модель (как при импорте CSV):
+add_parent для всех связей «ребёнок → родитель», затем add_marriage для всех пар.
+
+«legacy» — прежние creates_cycle (обход предков ребёнка) и _is_blood_relative
+(рекурсивный сбор предков обоих супругов) на каждый вызов; «index» — текущая
+модель с инкрементальным AncestorIndex. Порядок «file» — связи в порядке
+персон (родители раньше детей), «shuffled» — в случайном порядке: индексу
+приходится дописывать предков уже вставленным потомкам.
+
+Запуск: python scripts/bench_ancestors.py [--sizes 2000,5000] [--seed 1]
+"""
+import argparse
+import logging
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from bench_utils import ROOT, make_tree, timed  # noqa: E402
+
+sys.path.insert(0, str(ROOT / "Дерево"))
+from models import FamilyTreeModel  # noqa: E402
+
+
+class _LegacyModel(FamilyTreeModel):
+    """Прежние проверки: обход предков на каждый вызов."""
+
+    def creates_cycle(self, potential_parent_id, potential_child_id):
+        visited = set()
+        stack = [potential_child_id]
+        while stack:
+            current_id = stack.pop()
+            if current_id == potential_parent_id:
+                return True
+            if current_id in visited:
+                continue
+            visited.add(current_id)
+            current_person = self.persons.get(current_id)
+            if current_person:
+                stack.extend(current_person.parents)
+        return False
+
+    def add_parent(self, child_id, parent_id):
+        if child_id not in self.persons or parent_id not in self.persons:
+            return False, "Ребёнок или родитель не найдены"
+        if self.creates_cycle(parent_id, child_id):
+            return False, "Обнаружен цикл в родственных связях"
+        self.persons[child_id].parents.add(parent_id)
+        self.persons[parent_id].children.add(child_id)
+        self.mark_modified()
+        return True, ""
+
+    def _is_blood_relative(self, person1_id, person2_id):
+        def get_all_ancestors(pid, ancestors):
+            person = self.persons.get(pid)
+            if not person:
+                return
+            for parent_id in person.parents:
+                if parent_id not in ancestors:
+                    ancestors.add(parent_id)
+                    get_all_ancestors(parent_id, ancestors)
+
+        if person1_id == person2_id:
+            return True
+        ancestors1 = set()
+        get_all_ancestors(person1_id, ancestors1)
+        ancestors2 = set()
+        get_all_ancestors(person2_id, ancestors2)
+        return bool(ancestors1 & ancestors2)
+
+
+def _insert(model_cls, tree, links, marriages):
+    model = model_cls()
+    for data in tree["persons"].values():
+        model.add_person(data["name"], data["surname"], gender=data["gender"])
+    _, parents_ms = timed(lambda: [model.add_parent(c, p) for c, p in links])
+    _, marriages_ms = timed(lambda: [model.add_marriage(a, b) for a, b in marriages])
+    return model, parents_ms, marriages_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="2000,5000")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    sys.setrecursionlimit(100000)
+
+    print(f"{'persons':>8} | {'links':>6} | {'order':>8} | {'legacy add_parent':>17} | {'index add_parent':>16} | "
+          f"{'legacy marriages':>16} | {'index marriages':>15}")
+    for n in (int(x) for x in args.sizes.split(",") if x):
+        tree = make_tree(n)
+        links = [(pid, parent) for pid, p in tree["persons"].items() for parent in p["parents"]]
+        # Пары, где у супругов общие предки, отклоняются обеими моделями одинаково
+        marriages = [tuple(m["persons"]) for m in tree["marriages"]]
+        shuffled = links[:]
+        random.Random(args.seed).shuffle(shuffled)
+        for order, order_links in (("file", links), ("shuffled", shuffled)):
+            legacy, legacy_parents, legacy_marriages = _insert(_LegacyModel, tree, order_links, marriages)
+            model, parents_ms, marriages_ms = _insert(FamilyTreeModel, tree, order_links, marriages)
+            assert model.marriages.keys() == legacy.marriages.keys()
+            assert model.check_ancestors() == []
+            print(f"{n:>8} | {len(links):>6} | {order:>8} | {legacy_parents:>17.0f} | {parents_ms:>16.0f} | "
+                  f"{legacy_marriages:>16.0f} | {marriages_ms:>15.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+Микробенчмарк require_auth сервера синхронизации.
+
+Запуск: python scripts/bench_auth.py [--requests 10000]
+Декорированная пустая функция вызывается N раз в контексте запроса:
+с кэшем токенов (TTL по умолчанию) и без него (TTL = 0, каждый вызов — SELECT).
+"""
+import argparse
+import contextlib
+import io
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from bench_utils import load_sync_app, sync_login, timed  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=10000)
+    args = parser.parse_args()
+    n = args.requests
+
+    with tempfile.TemporaryDirectory() as tmp:
+        with contextlib.redirect_stdout(io.StringIO()):
+            module = load_sync_app(tmp)
+            headers = sync_login(module.app.test_client())
+
+        @module.require_auth
+        def view():
+            return module.g.current_user_id
+
+        def run():
+            for _ in range(n):
+                with module.app.test_request_context("/api/auth/me", headers=headers):
+                    view()
+
+        cache = module.token_cache
+        default_ttl = cache.ttl
+        print(f"{'mode':>8} | {'total ms':>9} | {'us/request':>10} | stats")
+        for mode, ttl in (("no cache", 0), ("cache", default_ttl)):
+            cache.clear()
+            cache.ttl = ttl
+            cache.stats.update(hits=0, misses=0, touches=0)
+            _, ms = timed(run)
+            stats = cache.get_stats()
+            print(f"{mode:>8} | {ms:>9.1f} | {ms * 1000 / n:>10.1f} | "
+                  f"hits={stats['hits']} misses={stats['misses']} touches={stats['touches']}")
+        module.db_pool.close_all()
+
+
+if __name__ == "__main__":
+    main()
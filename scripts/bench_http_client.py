@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк http_client (пул keep-alive) против urllib.request.urlopen.
+
+Запуск: python scripts/bench_http_client.py [--requests 2000] [--threads 8] [--latency-ms 0]
+Локальный HTTP/1.1-сервер-заглушка отдаёт JSON ~2 КБ (с задержкой --latency-ms);
+запросы выполняются последовательно и из --threads потоков. На localhost нет
+TLS, поэтому выигрыш — только от TCP-рукопожатия; с HTTPS до Railway он больше.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "web"))
+from http_client import PooledHttpClient  # noqa: E402
+
+BODY = json.dumps({"persons": {str(i): {"name": f"Иван{i}"} for i in range(60)}}).encode()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Заголовки и тело — одной записью в сокет (иначе Nagle + delayed ACK дают ~40 мс на keep-alive)
+    wbufsize = 1 << 16
+    latency = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+
+def _run(opener, url, requests, threads):
+    """(запросов в секунду, p50 мс, p99 мс)."""
+    latencies = []
+
+    def one(_):
+        t0 = time.perf_counter()
+        with opener(urllib.request.Request(url, headers={"Authorization": "Bearer x"}), timeout=10) as resp:
+            resp.read()
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    started = time.perf_counter()
+    if threads == 1:
+        for i in range(requests):
+            one(i)
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return requests / elapsed, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    _Handler.latency = args.latency_ms / 1000
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    httpd.daemon_threads = True
+    httpd.request_queue_size = 128
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{httpd.server_address[1]}/api/tree"
+
+    print(f"{'client':>8} | {'threads':>7} | {'req/s':>8} | {'p50 ms':>7} | {'p99 ms':>7}")
+    for threads in (1, args.threads):
+        pooled = PooledHttpClient(pool_size=args.threads)
+        for name, opener in (("urllib", urllib.request.urlopen), ("pooled", pooled.urlopen)):
+            rps, p50, p99 = _run(opener, url, args.requests, threads)
+            print(f"{name:>8} | {threads:>7} | {rps:>8.0f} | {p50:>7.2f} | {p99:>7.2f}")
+        stats = pooled.get_stats()
+        print(f"{'':>8} | pooled: connections={stats['connections']} reused={stats['reused']}")
+        pooled.close()
+    httpd.shutdown()
+
+
+if __name__ == "__main__":
+    main()
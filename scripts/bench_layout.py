@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк раскладки настольного приложения: FamilyTreeApp.calculate_layout
+на синтетических деревьях.
+
+Раскладка вызывается без окна: вместо FamilyTreeApp — объект с моделью, холстом
+фиксированной ширины и размерами карточек. --baseline REV дополнительно
+запускает Дерево/app.py из указанной ревизии git (например, до канонических id),
+чтобы сравнить рост времени: прежний поиск ключей перебором давал O(N²).
+
+Нужны зависимости настольного приложения (tkinter, Pillow).
+
+Запуск: python scripts/bench_layout.py [--sizes 1000,2000,4000,8000] [--baseline REV]
+"""
+import argparse
+import contextlib
+import importlib.util
+import io
+import logging
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from bench_utils import ROOT, timed  # noqa: E402
+
+sys.path.insert(0, str(ROOT / "Дерево"))
+from models import FamilyTreeModel, marriage_pair  # noqa: E402
+
+
+class _Canvas:
+    def winfo_width(self):
+        return 1600
+
+
+class _LayoutHost:
+    """Минимальный «FamilyTreeApp» для calculate_layout: модель, холст, размеры карточек."""
+
+    CARD_WIDTH = 120
+    CARD_HEIGHT = 100
+
+    def __init__(self, model):
+        self.model = model
+        self.canvas = _Canvas()
+        self.coords = {}
+        self.units = {}
+        self.level_structure = {}
+
+
+def _load_app(source, name):
+    path = Path(tempfile.mkdtemp()) / f"{name}.py"
+    path.write_text(source, encoding="utf-8")
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.FamilyTreeApp
+
+
+def _model(n, fanout=3):
+    """
+    Дерево потомков одной пары: у каждой пары fanout детей, каждый ребёнок женат
+    на персоне «со стороны» (без родителей в дереве). Центр — корневая пара,
+    поэтому в раскладку попадают все n персон.
+    """
+    model = FamilyTreeModel()
+
+    def add(gender):
+        pid, _ = model.add_person("Иван" if gender == "Мужской" else "Анна", "Тестов", gender=gender)
+        return pid
+
+    couples = [(add("Мужской"), add("Женский"))]
+    model.add_marriage(*couples[0])
+    head = 0
+    while len(model.persons) + 2 <= n:
+        father, mother = couples[head // fanout]
+        head += 1
+        child, spouse = add("Мужской"), add("Женский")
+        for parent in (father, mother):
+            model.persons[child].parents.add(parent)
+            model.persons[parent].children.add(child)
+        model.persons[child].spouse_ids.add(spouse)
+        model.persons[spouse].spouse_ids.add(child)
+        model.marriages[marriage_pair(child, spouse)] = {"date": ""}
+        couples.append((child, spouse))
+    model.current_center = couples[0][0]
+    return model
+
+
+def _run(app_cls, model):
+    host = _LayoutHost(model)
+    app_cls.calculate_layout(host, skip_centering=False)
+    return len(host.coords)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="1000,2000,4000,8000")
+    parser.add_argument("--baseline", default=None, help="ревизия git для сравнения (прежний app.py)")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    sys.setrecursionlimit(100000)
+
+    current = _load_app((ROOT / "Дерево" / "app.py").read_text(encoding="utf-8"), "app_current")
+    baseline = None
+    if args.baseline:
+        source = subprocess.run(["git", "show", f"{args.baseline}:Дерево/app.py"], cwd=ROOT,
+                                capture_output=True, check=True).stdout.decode("utf-8")
+        baseline = _load_app(source, "app_baseline")
+
+    print(f"{'persons':>8} | {'placed':>7} | {'layout ms':>9} | {'us/person':>9} | {'baseline ms':>11} | {'us/person':>9}")
+    for n in (int(x) for x in args.sizes.split(",") if x):
+        model = _model(n)
+        with contextlib.redirect_stdout(io.StringIO()):
+            placed, ms = timed(_run, current, model)
+            base = "—", "—"
+            if baseline is not None:
+                _, base_ms = timed(_run, baseline, model)
+                base = f"{base_ms:.0f}", f"{base_ms * 1000 / n:.0f}"
+        print(f"{n:>8} | {placed:>7} | {ms:>9.0f} | {ms * 1000 / n:>9.0f} | {base[0]:>11} | {base[1]:>9}")
+
+
+if __name__ == "__main__":
+    main()
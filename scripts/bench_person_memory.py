@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк памяти настольной модели: байт на персону после FamilyTreeModel.load_from_file
+(tracemalloc) — прежний Person (__dict__ и три set на персону) против текущего
+(__slots__, интернированные строки, RelationSet).
+
+Запуск: python scripts/bench_person_memory.py [--sizes 10000,100000]
+"""
+import argparse
+import contextlib
+import gc
+import io
+import json
+import logging
+import sys
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from bench_utils import ROOT, make_tree, timed  # noqa: E402
+
+sys.path.insert(0, str(ROOT / "Дерево"))
+import models  # noqa: E402
+
+
+class _LegacyPerson:
+    """Прежний Person: атрибуты в __dict__, связи — set."""
+
+    def __init__(self, name="", surname="", patronymic="", birth_date="", gender="",
+                 photo=None, photo_path="", is_deceased=False, death_date="", maiden_name="",
+                 birth_place="", biography="", burial_place="", burial_date="",
+                 photo_album=None, links=None, occupation="", education="", address="", notes="",
+                 significant_events=None, phone="", email="", social_media=None, blood_type="", medical_info=None,
+                 vk="", telegram="", whatsapp="", rh_factor="", allergies="", chronic_conditions="",
+                 photo_full=None):
+        self.id = None
+        self.name, self.surname, self.patronymic = name, surname, patronymic
+        self.birth_date, self.gender, self.photo = birth_date, gender, photo
+        self.photo_path, self.photo_full, self.is_deceased = photo_path or "", photo_full, is_deceased
+        self.death_date, self.maiden_name = death_date or "", maiden_name or ""
+        self.parents, self.children, self.spouse_ids = set(), set(), set()
+        self.collapsed_branches = False
+        self.birth_place, self.biography = birth_place or "", biography or ""
+        self.burial_place, self.burial_date = burial_place or "", burial_date or ""
+        self.photo_album = list(photo_album) if photo_album is not None else []
+        self.links = list(links) if links is not None else []
+        self.occupation, self.education, self.address, self.notes = occupation, education, address, notes
+        self.significant_events = list(significant_events) if significant_events is not None else []
+        self.phone, self.email = phone, email
+        self.social_media = list(social_media) if social_media is not None else []
+        self.blood_type = blood_type
+        self.medical_info = list(medical_info) if medical_info is not None else []
+        self.vk, self.telegram, self.whatsapp = vk, telegram, whatsapp
+        self.rh_factor, self.allergies, self.chronic_conditions = rh_factor, allergies, chronic_conditions
+
+
+def _measure(path, person_cls, relation_cls):
+    models.Person, models.RelationSet = person_cls, relation_cls
+    gc.collect()
+    tracemalloc.start()
+    model = models.FamilyTreeModel(str(path))
+    model.load_from_file()
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    gc.collect()
+    _, load_ms = timed(models.FamilyTreeModel(str(path)).load_from_file)
+    return model, used, load_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="10000,100000")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    current = (models.Person, models.RelationSet)
+
+    print(f"{'persons':>8} | {'legacy B/person':>15} | {'slots B/person':>14} | {'saved':>6} | "
+          f"{'legacy load ms':>14} | {'slots load ms':>13}")
+    for n in (int(x) for x in args.sizes.split(",") if x):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "tree.json"
+            path.write_text(json.dumps(make_tree(n), ensure_ascii=False), encoding="utf-8")
+            with contextlib.redirect_stdout(io.StringIO()):
+                legacy, legacy_bytes, legacy_ms = _measure(path, _LegacyPerson, set)
+                del legacy
+                model, slots_bytes, slots_ms = _measure(path, *current)
+            assert len(model.persons) == n
+            del model
+        print(f"{n:>8} | {legacy_bytes / n:>15.0f} | {slots_bytes / n:>14.0f} | "
+              f"{1 - slots_bytes / legacy_bytes:>6.0%} | {legacy_ms:>14.0f} | {slots_ms:>13.0f}")
+
+
+if __name__ == "__main__":
+    main()
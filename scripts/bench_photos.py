@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк отдачи фото web: /api/photo/<id> через дерево (кэш фото отключён)
+против дискового кэша photo_cache (200 и 304 по If-None-Match) и URL по хешу.
+
+Запуск: python scripts/bench_photos.py [--persons 2000] [--photo-bytes 20000] [--requests 2000]
+"""
+import argparse
+import importlib.util
+import io
+import os
+import sys
+import tempfile
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_utils import ROOT, make_tree, timed  # noqa: E402
+
+
+def _load_web_app(data_dir):
+    os.environ["DATA_DIR"] = str(data_dir)
+    sys.path.insert(0, str(ROOT / "web"))
+    spec = importlib.util.spec_from_file_location("web_app", ROOT / "web" / "app.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--persons", type=int, default=2000)
+    parser.add_argument("--photo-bytes", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp, redirect_stdout(io.StringIO()):
+        web = _load_web_app(tmp)
+        import tree_service
+
+        tree_service.save_tree("bench", make_tree(args.persons, photo_bytes=args.photo_bytes))
+        client = web.app.test_client()
+        with client.session_transaction() as s:
+            s["username"] = "bench"
+        pids = [str(i) for i in range(10, args.persons + 1, 10)]
+        hashes = [tree_service.photo_hashes("bench")[pid]["photo"] for pid in pids]
+        etags = {pid: client.get(f"/api/photo/{pid}").headers["ETag"] for pid in pids}
+
+        def run(url_of, headers_of=lambda key: {}, keys=pids):
+            for i in range(args.requests):
+                key = keys[i % len(keys)]
+                client.get(url_of(key), headers=headers_of(key)).close()
+
+        results = []
+        tree_service.photo_cache.enabled = False
+        results.append(("через дерево", timed(run, lambda pid: f"/api/photo/{pid}")[1]))
+        tree_service.photo_cache.enabled = True
+        results.append(("кэш фото, 200", timed(run, lambda pid: f"/api/photo/{pid}")[1]))
+        results.append(("кэш фото, 304", timed(run, lambda pid: f"/api/photo/{pid}",
+                                               lambda pid: {"If-None-Match": etags[pid]})[1]))
+        results.append(("URL по хешу", timed(run, lambda h: f"/api/photo/hash/{h}/card", keys=hashes)[1]))
+
+    print(f"persons={args.persons}, фото по {args.photo_bytes} Б у каждой десятой, запросов={args.requests}")
+    print(f"{'mode':>16} | {'req/s':>8} | {'ms/req':>7}")
+    for name, ms in results:
+        print(f"{name:>16} | {args.requests / (ms / 1000):>8.0f} | {ms / args.requests:>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
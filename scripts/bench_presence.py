@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Микробенчмарк онлайн-статуса: sync_server/presence.py против Дерево/active_users.py.
+
+Запуск: python scripts/bench_presence.py [--users 10000] [--online 200] [--rounds 50]
+users пользователей отмечаются один раз (все онлайн), затем rounds раз:
+online из них шлют пинг и запрашивается список онлайн. ActiveUsersTracker на
+каждый запрос дважды перебирает всех и пересобирает словарь, PresenceTracker
+снимает с кучи только истёкшие записи и копирует словарь.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from bench_utils import ROOT, timed  # noqa: E402
+
+sys.path.insert(0, str(ROOT / "sync_server"))
+sys.path.insert(0, str(ROOT / "Дерево"))
+from presence import PresenceTracker  # noqa: E402
+from active_users import ActiveUsersTracker  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--online", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+    live = range(args.online)
+
+    def run_presence():
+        tracker = PresenceTracker(timeout=300)
+        for user in range(args.users):
+            tracker.mark(user)
+        for _ in range(args.rounds):
+            for user in live:
+                tracker.mark(user)
+            online = tracker.online()
+        return len(online)
+
+    def run_active_users():
+        tracker = ActiveUsersTracker(timeout_seconds=300)
+        for user in range(args.users):
+            tracker.mark_active(user)
+        for _ in range(args.rounds):
+            for user in live:
+                tracker.mark_active(user)
+            online = tracker.get_active_users()
+        return len(online)
+
+    print(f"{'tracker':>18} | {'total ms':>9} | {'us/round':>9} | online")
+    for name, fn in (("ActiveUsersTracker", run_active_users), ("PresenceTracker", run_presence)):
+        online, ms = timed(fn)
+        print(f"{name:>18} | {ms:>9.1f} | {ms * 1000 / args.rounds:>9.1f} | {online}")
+
+
+if __name__ == "__main__":
+    main()
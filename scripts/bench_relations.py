@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк таблицы relations: скачивание дерева и запросы предков/потомков.
+
+Запуск: python scripts/bench_relations.py [--sizes 1000,10000] [--queries 200]
+Для каждого размера: загрузка дерева, /api/sync/download, заполнение relations
+с нуля (миграция существующей БД), затем предки и потомки случайных персон —
+рекурсивным CTE по relations и прежним способом (json.loads parents всех
+персон дерева + обход в Python). Колонка «d=4» — предки на 4 поколения
+(типичный запрос карточки персоны): CTE читает только их, JSON-путь — всё дерево.
+«neigh» — окрестность для первой отрисовки (up=2, down=2, siblings=1) вместе
+с чтением записей персон (/api/tree/persons/<id>/neighbourhood).
+"""
+import argparse
+import contextlib
+import io
+import json
+import random
+import sqlite3
+import sys
+import tempfile
+from collections import deque
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from bench_utils import load_sync_app, make_tree, sync_login, timed  # noqa: E402
+
+
+def _json_ancestors(conn, tree_id, person_id):
+    """Прежний путь: все parents дерева из JSON-колонок, BFS в Python."""
+    parents = {row[0]: json.loads(row[1] or "[]")
+               for row in conn.execute("SELECT id, parents FROM persons WHERE tree_id = ?", (tree_id,))}
+    seen = {}
+    queue = deque([(person_id, 0)])
+    while queue:
+        pid, depth = queue.popleft()
+        for parent in parents.get(pid, []):
+            if parent not in seen:
+                seen[parent] = depth + 1
+                queue.append((parent, depth + 1))
+    return seen
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="1000,10000")
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+    sizes = [int(x) for x in args.sizes.split(",") if x]
+
+    print(f"{'persons':>8} | {'upload ms':>9} | {'download ms':>11} | {'rebuild ms':>10} | "
+          f"{'CTE anc ms':>10} | {'CTE d=4 ms':>10} | {'CTE desc ms':>11} | {'neigh ms':>8} | {'JSON anc ms':>11} | edges")
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+            module = load_sync_app(tmp)
+            client = module.app.test_client()
+            headers = sync_login(client)
+            tree = make_tree(n)
+            body = json.dumps({"tree": tree})
+            _, t_upload = timed(client.post, "/api/sync/upload", data=body, headers=headers,
+                                content_type="application/json")
+            _, t_download = timed(lambda: client.get("/api/sync/download", headers=headers).get_data())
+
+            from relations import ancestors, descendants, neighbourhood, rebuild_relations
+            from tree_store import load_persons
+            conn = sqlite3.connect(module.DB_FILE)
+            conn.row_factory = sqlite3.Row
+            tree_id = conn.execute("SELECT id FROM family_trees").fetchone()[0]
+            edges, t_rebuild = timed(rebuild_relations, conn, tree_id)
+            conn.commit()
+
+            rnd = random.Random(7)
+            ids = list(tree["persons"])
+            sample = [rnd.choice(ids) for _ in range(args.queries)]
+            _, t_anc = timed(lambda: [ancestors(conn, tree_id, pid) for pid in sample])
+            _, t_near = timed(lambda: [ancestors(conn, tree_id, pid, 4) for pid in sample])
+            _, t_desc = timed(lambda: [descendants(conn, tree_id, pid) for pid in sample])
+            _, t_neigh = timed(lambda: [load_persons(conn, tree_id, neighbourhood(conn, tree_id, pid))
+                                        for pid in sample])
+            json_sample = sample[: max(1, args.queries // 10)]
+            _, t_json = timed(lambda: [_json_ancestors(conn, tree_id, pid) for pid in json_sample])
+            conn.close()
+            module.db_pool.close_all()
+        per = args.queries
+        print(f"{n:>8} | {t_upload:>9.0f} | {t_download:>11.0f} | {t_rebuild:>10.0f} | "
+              f"{t_anc / per:>10.2f} | {t_near / per:>10.2f} | {t_desc / per:>11.2f} | {t_neigh / per:>8.2f} | {t_json / len(json_sample):>11.2f} | {edges}")
+    print("CTE/JSON — миллисекунды на один запрос")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк сохранения настольной модели после правки одной персоны: снимок целиком
+(прежнее поведение — переписать весь файл с фото) против пакета в журнале
+изменений (change_journal). Отдельно — загрузка с применением журнала и
+фоновая свёртка журнала в снимок.
+
+Запуск: python scripts/bench_save.py [--sizes 50000] [--photo-bytes 12000] [--edits 20]
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from bench_utils import ROOT, make_tree, timed  # noqa: E402
+
+sys.path.insert(0, str(ROOT / "Дерево"))
+import models  # noqa: E402
+
+
+def _load(path):
+    model = models.FamilyTreeModel(str(path))
+    model.load_from_file()
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="50000")
+    parser.add_argument("--photo-bytes", type=int, default=12000)
+    parser.add_argument("--edits", type=int, default=20)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    print(f"{'persons':>8} | {'snapshot save ms':>16} | {'journal save ms':>15} | {'journal KB':>10} | "
+          f"{'load + replay ms':>16} | {'compaction ms':>13}")
+    for n in (int(x) for x in args.sizes.split(",") if x):
+        with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+            path = Path(tmp) / "tree.json"
+            path.write_text(json.dumps(make_tree(n, photo_bytes=args.photo_bytes), ensure_ascii=False),
+                            encoding="utf-8")
+            model = _load(path)
+            snapshot_ms = journal_ms = 0.0
+            for i in range(args.edits):
+                pid = str(1 + i * (n // args.edits))
+                model.persons[pid].birth_place = f"Гродно {i}"
+                model.mark_modified()
+                snapshot_ms += timed(model.save_to_file)[1]
+                model.persons[pid].birth_place = f"Витебск {i}"
+                model.mark_modified(pid)
+                journal_ms += timed(model.save_to_file)[1]
+            journal_kb = Path(str(path) + ".journal").stat().st_size / 1024
+            replayed, replay_ms = timed(_load, path)
+            assert replayed.persons[pid].birth_place == f"Витебск {args.edits - 1}"
+            models.COMPACT_MIN_BYTES = models.COMPACT_SNAPSHOT_FRACTION = 0
+            model.persons[pid].birth_place = "Минск"
+            model.mark_modified(pid)
+            model.save_to_file()
+            _, compact_ms = timed(model.wait_for_compaction)
+        print(f"{n:>8} | {snapshot_ms / args.edits:>16.1f} | {journal_ms / args.edits:>15.1f} | "
+              f"{journal_kb:>10.1f} | {replay_ms:>16.0f} | {compact_ms:>13.0f}")
+
+
+if __name__ == "__main__":
+    main()
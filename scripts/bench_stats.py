@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк подсчёта поколений для /api/stats: прежняя рекурсия с копией visited
+на каждом шаге против tree_stats (один проход, O(N + E)).
+
+Деревья — «лестницы» родственных браков: в каждом поколении брат и сестра с
+общими родителями, поэтому число путей к предкам растёт как 2^глубины.
+Прежний подсчёт запускается, пока предыдущая глубина укладывалась в --budget секунд;
+на make_tree (случайные браки внутри 50 последних пар) он не завершается вовсе.
+
+Запуск: python scripts/bench_stats.py [--depths 10,14,16,18,20,22,1000,10000] [--budget 5]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_utils import ROOT, make_tree, timed  # noqa: E402
+
+sys.path.insert(0, str(ROOT / "web"))
+from tree_stats import tree_stats  # noqa: E402
+
+
+def _legacy_generations(persons):
+    def get_generation(pid, visited=None):
+        if visited is None:
+            visited = set()
+        if pid in visited:
+            return 0
+        visited.add(pid)
+        p = persons.get(str(pid)) or persons.get(pid)
+        if not p or not p.get('parents'):
+            return 1
+        return 1 + max(get_generation(pr, visited.copy()) for pr in p.get('parents', []))
+
+    return max((get_generation(pid) for pid in persons), default=0)
+
+
+def _ladder(generations):
+    persons = {"1": {"parents": []}, "2": {"parents": []}}
+    for g in range(1, generations):
+        parents = [str(2 * g - 1), str(2 * g)]
+        persons[str(2 * g + 1)] = {"gender": "Мужской", "parents": parents}
+        persons[str(2 * g + 2)] = {"gender": "Женский", "parents": parents}
+    return persons
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--depths", default="10,14,16,18,20,22,1000,10000")
+    parser.add_argument("--budget", type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f"{'tree':>22} | {'persons':>8} | {'legacy ms':>10} | {'tree_stats ms':>13} | generations")
+    legacy_ok = True
+    cases = [(f"ladder depth {d}", _ladder(int(d))) for d in args.depths.split(",") if d]
+    cases.append(("make_tree 10000", make_tree(10000)["persons"]))
+    for name, persons in cases:
+        stats, fast_ms = timed(tree_stats, persons)
+        legacy = "—"
+        if legacy_ok and name.startswith("ladder"):
+            generations, legacy_ms = timed(_legacy_generations, persons)
+            assert generations == stats["max_generations"]
+            legacy = f"{legacy_ms:.1f}"
+            legacy_ok = legacy_ms < args.budget * 1000
+        print(f"{name:>22} | {len(persons):>8} | {legacy:>10} | {fast_ms:>13.1f} | {stats['max_generations']}")
+
+
+if __name__ == "__main__":
+    main()
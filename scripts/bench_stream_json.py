@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк памяти /api/sync/download: пиковый RSS воркера до и после потоковой выдачи.
+
+Запуск: python scripts/bench_stream_json.py [--sizes 10000,50000] [--photo-bytes 4096]
+Для каждого размера дерево (фото у каждой десятой персоны) загружается в
+БД один раз, затем в отдельных процессах выполняется скачивание
+?include_photos=1: «buffered» — прежний путь (словарь всех персон + jsonify),
+«stream» — текущий потоковый ответ. Тело ответа читается кусками и не
+накапливается. Пиковый RSS — VmHWM из /proc/self/status (Linux), иначе
+ru_maxrss (macOS; он наследуется от родителя при fork и может быть завышен).
+"""
+import argparse
+import contextlib
+import io
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from bench_utils import load_sync_app, make_tree, sync_login  # noqa: E402
+
+
+def _peak_rss_mb():
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux — килобайты, macOS — байты
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def _buffered_download(module):
+    """Прежняя реализация sync_download: всё дерево в dict, затем jsonify."""
+    from tree_store import PERSON_COLUMNS, attach_photos, person_from_row
+
+    db = module.get_db()
+    tree = db.execute('SELECT id, name, revision FROM family_trees WHERE user_id = ?',
+                      (module.g.current_user_id,)).fetchone()
+    persons = {row['id']: person_from_row(row)
+               for row in db.execute(f'SELECT {PERSON_COLUMNS} FROM persons WHERE tree_id = ?', (tree['id'],))}
+    attach_photos(db, persons)
+    marriages = [{'persons': [row['person1_id'], row['person2_id']], 'date': row['marriage_date'] or ''}
+                 for row in db.execute('SELECT * FROM marriages WHERE tree_id = ?', (tree['id'],))]
+    return module.jsonify({'tree': {'persons': persons, 'marriages': marriages},
+                           'tree_name': tree['name'], 'revision': tree['revision'] or 0})
+
+
+def child(data_dir, mode):
+    with contextlib.redirect_stdout(io.StringIO()):
+        module = load_sync_app(data_dir)
+        if mode == "buffered":
+            module.app.add_url_rule("/bench/buffered", "bench_buffered",
+                                    module.require_auth(lambda: _buffered_download(module)))
+        client = module.app.test_client()
+        headers = sync_login(client)
+    url = "/bench/buffered" if mode == "buffered" else "/api/sync/download?include_photos=1"
+    baseline = _peak_rss_mb()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        r = client.get(url, headers=headers, buffered=False)
+        size = sum(len(chunk) for chunk in r.response)
+        r.close()
+    elapsed = (time.perf_counter() - started) * 1000
+    module.db_pool.close_all()
+    print(json.dumps({"baseline_mb": baseline, "peak_mb": _peak_rss_mb(), "ms": elapsed, "bytes": size}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="10000,50000")
+    parser.add_argument("--photo-bytes", type=int, default=4096)
+    parser.add_argument("--child", nargs=2, metavar=("DATA_DIR", "MODE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(*args.child)
+        return
+
+    sizes = [int(x) for x in args.sizes.split(",") if x]
+    print(f"{'persons':>8} | {'mode':>8} | {'body MB':>8} | {'ms':>8} | {'RSS before':>10} | {'peak RSS':>8} | {'delta MB':>8}")
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            with contextlib.redirect_stdout(io.StringIO()):
+                module = load_sync_app(tmp)
+                client = module.app.test_client()
+                client.post("/api/sync/upload", headers=sync_login(client),
+                            data=json.dumps({"tree": make_tree(n, photo_bytes=args.photo_bytes)}),
+                            content_type="application/json")
+                module.db_pool.close_all()
+            for mode in ("buffered", "stream"):
+                out = subprocess.run([sys.executable, __file__, "--child", tmp, mode],
+                                     capture_output=True, text=True, check=True).stdout
+                res = json.loads(out.strip().splitlines()[-1])
+                print(f"{n:>8} | {mode:>8} | {res['bytes'] / 1e6:>8.1f} | {res['ms']:>8.0f} | "
+                      f"{res['baseline_mb']:>10.1f} | {res['peak_mb']:>8.1f} | "
+                      f"{res['peak_mb'] - res['baseline_mb']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк /api/sync/upload на синтетических деревьях 1k/10k/50k персон.
+
+Запуск: python scripts/bench_sync_upload.py [--sizes 1000,10000,50000]
+Для каждого размера: первая загрузка (вставка), повтор без изменений,
+загрузка с 1% изменённых и 1% удалённых персон.
+"""
+import argparse
+import contextlib
+import io
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from bench_utils import load_sync_app, make_tree, sync_login, timed  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="1000,10000,50000")
+    args = parser.parse_args()
+    sizes = [int(x) for x in args.sizes.split(",") if x]
+
+    print(f"{'persons':>8} | {'insert ms':>10} | {'unchanged ms':>12} | {'1% edit ms':>10} | stats")
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+            module = load_sync_app(tmp)
+            client = module.app.test_client()
+            headers = sync_login(client)
+
+            tree = make_tree(n)
+            body = json.dumps({"tree": tree})
+
+            def upload(payload):
+                r = client.post("/api/sync/upload", data=payload, headers=headers,
+                                content_type="application/json")
+                return r.get_json()["stats"]["persons"]
+
+            _, t_insert = timed(upload, body)
+            _, t_same = timed(upload, body)
+            step = 100
+            for i, pid in enumerate(list(tree["persons"])):
+                if i % step == 0:
+                    tree["persons"][pid]["notes"] = "изменено"
+                elif i % step == 1:
+                    del tree["persons"][pid]
+            stats, t_edit = timed(upload, json.dumps({"tree": tree}))
+            module.db_pool.close_all()
+        print(f"{n:>8} | {t_insert:>10.1f} | {t_same:>12.1f} | {t_edit:>10.1f} | {stats}")
+
+
+if __name__ == "__main__":
+    main()
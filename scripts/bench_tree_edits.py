@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк правки одной персоны на сервере синхронизации: прежняя выгрузка
+всего дерева (/api/sync/upload) против PATCH /api/tree/persons/<id>.
+
+Запуск: python scripts/bench_tree_edits.py [--sizes 1000,10000] [--repeat 20]
+"""
+import argparse
+import contextlib
+import io
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from bench_utils import load_sync_app, make_tree, sync_login, timed  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="1000,10000")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'persons':>8} | {'upload ms':>9} | {'upload KB':>9} | {'PATCH ms':>8} | {'PATCH B':>7}")
+    for n in (int(x) for x in args.sizes.split(",") if x):
+        with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+            module = load_sync_app(tmp)
+            client = module.app.test_client()
+            headers = sync_login(client)
+            tree = make_tree(n)
+            client.post("/api/sync/upload", json={"tree": tree}, headers=headers)
+            pid = str(n // 2)
+
+            def upload(i):
+                tree["persons"][pid]["notes"] = f"правка {i}"
+                body = json.dumps({"tree": tree})
+                client.post("/api/sync/upload", data=body, headers=headers, content_type="application/json")
+                return len(body)
+
+            def patch(i):
+                body = json.dumps({"notes": f"правка {i}"})
+                client.patch(f"/api/tree/persons/{pid}", data=body, headers=headers,
+                             content_type="application/json")
+                return len(body)
+
+            upload_bytes, t_upload = timed(lambda: [upload(i) for i in range(args.repeat)][-1])
+            patch_bytes, t_patch = timed(lambda: [patch(i) for i in range(args.repeat)][-1])
+            module.db_pool.close_all()
+        print(f"{n:>8} | {t_upload / args.repeat:>9.1f} | {upload_bytes / 1024:>9.0f} | "
+              f"{t_patch / args.repeat:>8.2f} | {patch_bytes:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк запуска настольной модели на большом файле с фото: FamilyTreeModel.load_from_file
+с прежним чтением (json.load всего файла) против tree_reader.read_tree (фото —
+ссылки на байтовый диапазон файла до первого обращения).
+
+Время — без трассировки; пиковая и оставшаяся после загрузки память — tracemalloc.
+Последний столбец — загрузка всех фото после старта (так их прочтёт, например, сохранение).
+
+Запуск: python scripts/bench_tree_load.py [--sizes 50000] [--photo-bytes 12000]
+"""
+import argparse
+import contextlib
+import gc
+import io
+import json
+import logging
+import sys
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from bench_utils import ROOT, make_tree, timed  # noqa: E402
+
+sys.path.insert(0, str(ROOT / "Дерево"))
+import models  # noqa: E402
+
+
+def _legacy_read_tree(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _load(path):
+    model = models.FamilyTreeModel(str(path))
+    model.load_from_file()
+    return model
+
+
+def _measure(path, reader):
+    models.read_tree = reader
+    gc.collect()
+    _, load_ms = timed(_load, path)
+    gc.collect()
+    tracemalloc.start()
+    model = _load(path)
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    photos, hydrate_ms = timed(lambda: sum(1 for p in model.persons.values() if p.photo))
+    return load_ms, peak, retained, hydrate_ms, photos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="50000")
+    parser.add_argument("--photo-bytes", type=int, default=12000)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    current = models.read_tree
+    mb = 1024 * 1024
+
+    print(f"{'persons':>8} | {'file MB':>7} | {'loader':>9} | {'load ms':>8} | {'peak MB':>8} | "
+          f"{'retained MB':>11} | {'all photos ms':>13}")
+    for n in (int(x) for x in args.sizes.split(",") if x):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "tree.json"
+            path.write_text(json.dumps(make_tree(n, photo_bytes=args.photo_bytes), ensure_ascii=False),
+                            encoding="utf-8")
+            size = path.stat().st_size / mb
+            rows = []
+            with contextlib.redirect_stdout(io.StringIO()):
+                for name, reader in (("json.load", _legacy_read_tree), ("streaming", current)):
+                    rows.append((name, *_measure(path, reader)))
+            models.read_tree = current
+            assert rows[0][-1] == rows[1][-1]
+        for name, load_ms, peak, retained, hydrate_ms, _ in rows:
+            print(f"{n:>8} | {size:>7.1f} | {name:>9} | {load_ms:>8.0f} | {peak / mb:>8.1f} | "
+                  f"{retained / mb:>11.1f} | {hydrate_ms:>13.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк записи файла дерева: прежний json.dump(indent=2) поверх файла
+против atomic_json.write_json (временный файл + fsync + os.replace, компактный JSON).
+
+Запуск: python scripts/bench_tree_write.py [--sizes 1000,10000] [--photo-bytes 0] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from bench_utils import ROOT, make_tree, timed  # noqa: E402
+
+sys.path.insert(0, str(ROOT / "web"))
+from atomic_json import write_json  # noqa: E402
+
+
+def _legacy(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="1000,10000")
+    parser.add_argument("--photo-bytes", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    modes = (
+        ("indent=2, in place", _legacy),
+        ("atomic, compact", lambda path, data: write_json(path, data)),
+        ("atomic, no fsync", lambda path, data: write_json(path, data, fsync=False)),
+        ("atomic, pretty", lambda path, data: write_json(path, data, pretty=True)),
+    )
+    print(f"{'persons':>8} | {'mode':>20} | {'ms/write':>9} | {'size KB':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "family_tree_bench.json")
+        for n in (int(x) for x in args.sizes.split(",")):
+            data = make_tree(n, photo_bytes=args.photo_bytes)
+            for name, fn in modes:
+                _, ms = timed(lambda: [fn(path, data) for _ in range(args.repeat)])
+                size = os.path.getsize(path) / 1024
+                print(f"{n:>8} | {name:>20} | {ms / args.repeat:>9.1f} | {size:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
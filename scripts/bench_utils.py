@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""Общие помощники для скриптов scripts/bench_*.py: синтетические деревья и запуск серверов."""
+import importlib.util
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+_NAMES_M = ["Иван", "Пётр", "Николай", "Сергей", "Андрей", "Михаил", "Алексей", "Дмитрий"]
+_NAMES_F = ["Анна", "Мария", "Ольга", "Елена", "Татьяна", "Наталья", "Ирина", "Светлана"]
+_SURNAMES = ["Иванов", "Петров", "Сидоров", "Емельянов", "Кузнецов", "Смирнов", "Попов", "Васильев"]
+_PLACES = ["Минск, Беларусь", "Гомель, Беларусь", "Москва, Россия", "Брест, Беларусь", ""]
+
+
+def make_tree(n, photo_bytes=0, seed=42):
+    """
+    Синтетическое дерево из n персон в формате JSON дерева.
+
+    Персоны связаны в поколения: у каждой (кроме первых) есть отец и мать из
+    предыдущих записей, пары родителей — в браке. photo_bytes > 0 добавляет
+    base64-«фото» такого размера каждой десятой персоне.
+    """
+    rnd = random.Random(seed)
+    persons = {}
+    marriages = []
+    couples = []
+    photo = None
+    if photo_bytes:
+        import base64
+        photo = base64.b64encode(os.urandom(photo_bytes)).decode()
+    for i in range(1, n + 1):
+        pid = str(i)
+        male = i % 2 == 1
+        year = 1800 + (i * 200) // max(n, 1)
+        persons[pid] = {
+            "name": rnd.choice(_NAMES_M if male else _NAMES_F),
+            "surname": rnd.choice(_SURNAMES),
+            "patronymic": "",
+            "birth_date": f"{rnd.randint(1, 28):02d}.{rnd.randint(1, 12):02d}.{year}",
+            "death_date": "",
+            "is_deceased": year < 1930,
+            "gender": "Мужской" if male else "Женский",
+            "birth_place": rnd.choice(_PLACES),
+            "photo": photo if photo and i % 10 == 0 else None,
+            "parents": [],
+            "children": [],
+            "spouse_ids": [],
+        }
+        if not male:
+            husband = str(i - 1)
+            persons[husband]["spouse_ids"].append(pid)
+            persons[pid]["spouse_ids"].append(husband)
+            marriages.append({"persons": [husband, pid], "date": ""})
+            couples.append((husband, pid))
+        # Родители — одна из предыдущих пар (кроме своей)
+        if len(couples) > 1 and i > 4:
+            father, mother = couples[rnd.randrange(max(0, len(couples) - 50), len(couples) - 1)]
+            persons[pid]["parents"] = [father, mother]
+            persons[father]["children"].append(pid)
+            persons[mother]["children"].append(pid)
+    return {"persons": persons, "marriages": marriages, "current_center": "1"}
+
+
+def load_sync_app(data_dir):
+    """Импортировать sync_server/app.py с БД в data_dir. Возвращает модуль."""
+    os.environ["DATA_DIR"] = str(data_dir)
+    sync_dir = str(ROOT / "sync_server")
+    if sync_dir not in sys.path:
+        sys.path.insert(0, sync_dir)
+    spec = importlib.util.spec_from_file_location("sync_server_app", ROOT / "sync_server" / "app.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def sync_login(client, login="admin", password="admin123"):
+    """Заголовки авторизации для test_client сервера синхронизации."""
+    r = client.post("/api/auth/login", json={"login": login, "password": password})
+    return {"Authorization": f"Bearer {r.get_json()['token']}"}
+
+
+def timed(fn, *args, **kwargs):
+    """(результат, миллисекунды)."""
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - started) * 1000
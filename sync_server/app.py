@@ -9,6 +9,7 @@ import os
 import sys
 import secrets
 import hashlib
+import time
 from datetime import datetime, timedelta
 from functools import wraps
 from pathlib import Path
@@ -21,6 +22,23 @@ _repo_root = os.path.dirname(_sync_dir)
 if os.path.isfile(os.path.join(_repo_root, "auth_utils.py")) and _repo_root not in sys.path:
     sys.path.insert(0, _repo_root)
 from auth_utils import SUPER_ADMINS, _password_hash, _verify_password
+from auth_cache import SESSION_LIFETIME, TokenCache
+from db_pool import ConnectionPool, PeriodicJob
+from schema import ensure_schema
+from maintenance import MAINTENANCE_INTERVAL, recent_runs, run_if_due, run_maintenance
+from presence import FLUSH_INTERVAL, PresenceTracker
+from stats_store import RECONCILE_INTERVAL, bump, daily_activity, log_sync, read_counters, reconcile, record_login
+from photo_store import is_photo_hash, owned_photo_hashes
+from relations import MAX_DEPTH, ancestors, attach_names, descendants, neighbourhood
+from http_cache import (
+    JsonArrayStream, JsonObjectStream, json_response, make_etag, not_modified, not_modified_response,
+    stream_json_response,
+)
+from tree_store import (
+    apply_delta, attach_photos, changes_since, decode_cursor, edit_tree, encode_cursor, iter_marriages,
+    iter_persons, iter_admin_trees, load_persons, marriages_of, next_person_id, person_page, replace_tree,
+    tree_counts, tree_revision, tree_summaries,
+)
 
 try:
     import bcrypt
@@ -52,26 +70,40 @@ DATA_DIR = os.environ.get("DATA_DIR") or os.path.dirname(os.path.abspath(__file_
 DB_FILE = os.path.join(DATA_DIR, "family_tree.db")
 
 # === БАЗА ДАННЫХ ===
+# Пул соединений на воркер: PRAGMA (WAL, foreign_keys и т.д.) выставляются один раз
+db_pool = ConnectionPool(DB_FILE)
+# Токен → (user_id, is_admin): require_auth не ходит в БД на каждый запрос
+token_cache = TokenCache()
+# Фоновая сверка счётчиков админки (stats_store) с реальными таблицами
+stats_reconciler = PeriodicJob(db_pool, RECONCILE_INTERVAL, reconcile, 'stats-reconciler')
+# Фоновое обслуживание БД: старые сессии и sync_logs, incremental_vacuum, PRAGMA optimize
+maintenance_job = PeriodicJob(db_pool, MAINTENANCE_INTERVAL, run_if_due, 'maintenance')
+# Онлайн-статус в памяти; last_activity сессий пишется в БД пачками
+presence = PresenceTracker()
+presence_flusher = PeriodicJob(db_pool, FLUSH_INTERVAL, presence.flush, 'presence-flush')
+# Версия формата ответов download/changes в ETag: увеличить при изменении полей ответа
+TREE_ETAG_VERSION = 1
+
+
 def get_db():
-    """Получить соединение с БД."""
+    """Получить соединение с БД (из пула, одно на запрос)."""
     if 'db' not in g:
-        g.db = sqlite3.connect(DB_FILE)
-        g.db.row_factory = sqlite3.Row
-        # Включаем проверку FOREIGN KEY
-        g.db.execute('PRAGMA foreign_keys = ON')
+        g.db = db_pool.acquire()
     return g.db
 
 @app.teardown_appcontext
 def close_db(exception):
-    """Закрыть соединение с БД."""
+    """Вернуть соединение в пул."""
     db = g.pop('db', None)
     if db is not None:
-        db.close()
+        db_pool.release(db)
 
 def init_db():
     """Инициализировать базу данных."""
     DB_FILE = os.environ.get('DATA_DIR', '/data') + '/family_tree.db'
     db = sqlite3.connect(DB_FILE)
+    # До создания таблиц: освобождённые страницы возвращает incremental_vacuum (maintenance.py)
+    db.execute('PRAGMA auto_vacuum = INCREMENTAL')
 
     # Таблица пользователей
     db.execute('''
@@ -102,7 +134,7 @@ def init_db():
     # Таблица персон
     db.execute('''
         CREATE TABLE IF NOT EXISTS persons (
-            id TEXT PRIMARY KEY,
+            id TEXT NOT NULL,
             tree_id INTEGER NOT NULL,
             name TEXT NOT NULL,
             surname TEXT NOT NULL,
@@ -139,6 +171,7 @@ def init_db():
             collapsed_branches BOOLEAN DEFAULT 0,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (tree_id, id),
             FOREIGN KEY (tree_id) REFERENCES family_trees (id) ON DELETE CASCADE
         )
     ''')
@@ -186,7 +219,6 @@ def init_db():
     ''')
     
     # Индексы для ускорения поиска
-    db.execute('CREATE INDEX IF NOT EXISTS idx_persons_tree ON persons(tree_id)')
     db.execute('CREATE INDEX IF NOT EXISTS idx_marriages_tree ON marriages(tree_id)')
     db.execute('CREATE INDEX IF NOT EXISTS idx_users_login ON users(login)')
     db.execute('CREATE INDEX IF NOT EXISTS idx_sessions_user ON user_sessions(user_id)')
@@ -227,19 +259,34 @@ def require_auth(f):
             return jsonify({'error': 'Требуется авторизация'}), 401
         
         token = token[7:]
-        db = get_db()
-        session = db.execute(
-            'SELECT user_id FROM user_sessions WHERE session_token = ? AND last_activity > datetime("now", "-24 hours")',
-            (token,)
-        ).fetchone()
-        
-        if not session:
-            return jsonify({'error': 'Неверный токен или истёк срок действия'}), 401
-        
-        g.current_user_id = session['user_id']
+        cached = token_cache.get(token)
+        if cached is None:
+            db = get_db()
+            session = db.execute(f'''
+                SELECT s.user_id, u.login, u.is_admin,
+                       CAST(strftime('%s', s.last_activity) AS INTEGER) + {SESSION_LIFETIME} AS expires_at
+                FROM user_sessions s JOIN users u ON u.id = s.user_id
+                WHERE s.session_token = ? AND s.last_activity > datetime("now", "-24 hours")
+                  AND u.is_active = 1
+            ''', (token,)).fetchone()
+
+            if not session:
+                return jsonify({'error': 'Неверный токен или истёк срок действия'}), 401
+
+            # Супер-админы всегда имеют доступ (используем общую константу)
+            is_admin = session['login'] in SUPER_ADMINS or bool(session['is_admin'])
+            token_cache.put(token, session['user_id'], is_admin, session['expires_at'])
+            cached = (session['user_id'], is_admin)
+
+        g.current_user_id, g.current_user_is_admin = cached
+        g.current_token = token
+        # Онлайн-статус — в памяти; last_activity (продление сессии) уходит в БД
+        # пачкой presence_flusher, не чаще раза в touch_interval на токен
+        presence.mark(g.current_user_id, token if token_cache.should_touch(token) else None)
         return f(*args, **kwargs)
     return decorated
 
+
 def require_admin(f):
     """Требует права администратора.
 
@@ -250,20 +297,20 @@ def require_admin(f):
     @wraps(f)
     @require_auth
     def decorated(*args, **kwargs):
-        db = get_db()
-        user = db.execute('SELECT login, is_admin FROM users WHERE id = ?', (g.current_user_id,)).fetchone()
-
-        # Супер-админы всегда имеют доступ (используем общую константу)
-        if user and user['login'] in SUPER_ADMINS:
-            return f(*args, **kwargs)
-
-        # Проверяем флаг is_admin для остальных
-        if not user or not user['is_admin']:
+        if not g.current_user_is_admin:
             return jsonify({'error': 'Требуется права администратора'}), 403
 
         return f(*args, **kwargs)
     return decorated
 
+
+def _user_is_admin(db, user_id):
+    """Супер-админ (общая константа SUPER_ADMINS) или флаг is_admin."""
+    user = db.execute('SELECT login, is_admin FROM users WHERE id = ?', (user_id,)).fetchone()
+    if not user:
+        return False
+    return user['login'] in SUPER_ADMINS or bool(user['is_admin'])
+
 # === API АУТЕНТИФИКАЦИИ ===
 @app.route('/api/auth/register', methods=['POST'])
 def register():
@@ -293,6 +340,7 @@ def register():
         (login, password_hash, email)
     )
     user_id = cursor.lastrowid
+    bump(db, users=1, active_users=1)
     db.commit()
     
     print(f"[REGISTER] User created: login='{login}', user_id={user_id}")
@@ -303,6 +351,7 @@ def register():
             'INSERT INTO family_trees (user_id, name) VALUES (?, ?)',
             (user_id, f'Дерево {login}')
         )
+        bump(db, trees=1)
         db.commit()
         print(f"[REGISTER] Tree created for user_id={user_id}")
     except Exception as e:
@@ -336,6 +385,7 @@ def login():
             'INSERT INTO family_trees (user_id, name) VALUES (?, ?)',
             (user['id'], f'Дерево {login}')
         )
+        bump(db, trees=1)
         db.commit()
         print(f"[AUTH_LOGIN] Tree created for user_id={user['id']}")
 
@@ -345,7 +395,11 @@ def login():
         'INSERT INTO user_sessions (user_id, session_token, ip_address, user_agent) VALUES (?, ?, ?, ?)',
         (user['id'], session_token, request.remote_addr, request.user_agent.string)
     )
+    record_login(db)
     db.commit()
+    # Сессия только что создана — last_activity свежий, первое продление не нужно
+    token_cache.should_touch(session_token)
+    presence.mark(user['id'])
 
     print(f"[AUTH_LOGIN] SUCCESS for login='{login}', user_id={user['id']}, token={session_token[:10]}...")
 
@@ -362,16 +416,39 @@ def login():
 def get_current_user():
     """Получить информацию о текущем пользователе по токену."""
     db = get_db()
-    user = db.execute('SELECT id, login, email, is_admin FROM users WHERE id = ?', (g.current_user_id,)).fetchone()
+    user = db.execute('SELECT id, login, email FROM users WHERE id = ?', (g.current_user_id,)).fetchone()
     
     if not user:
         return jsonify({'error': 'Пользователь не найден'}), 404
     
+    # is_admin — как у require_admin (с супер-админами): web проверяет права через /api/auth/me
     return jsonify({
         'id': user['id'],
         'login': user['login'],
         'email': user['email'],
-        'is_admin': bool(user['is_admin'])
+        'is_admin': g.current_user_is_admin
+    })
+
+
+@app.route('/api/auth/introspect', methods=['GET'])
+@require_auth
+def introspect_token():
+    """Проверка токена для web: пользователь, роль и счётчики дерева без данных персон.
+
+    Один запрос вместо /api/auth/me + загрузки дерева; expires_in — сколько
+    секунд web может считать проверку действительной (не дольше кэша токенов).
+    """
+    db = get_db()
+    user = db.execute('SELECT id, login, email FROM users WHERE id = ?', (g.current_user_id,)).fetchone()
+    if not user:
+        return jsonify({'error': 'Пользователь не найден'}), 404
+    return jsonify({
+        'id': user['id'],
+        'login': user['login'],
+        'email': user['email'],
+        'is_admin': g.current_user_is_admin,
+        'tree': tree_counts(db, user['id']),
+        'expires_in': int(token_cache.ttl),
     })
 
 
@@ -383,6 +460,8 @@ def logout():
     db = get_db()
     db.execute('DELETE FROM user_sessions WHERE session_token = ?', (token,))
     db.commit()
+    token_cache.invalidate_token(token)
+    presence.forget_token(token)
 
     return jsonify({'message': 'Выход выполнен успешно'})
 
@@ -390,21 +469,11 @@ def logout():
 @app.route('/api/heartbeat', methods=['POST'])
 @require_auth
 def heartbeat():
-    """Подтверждение активности пользователя (обновление last_activity)."""
-    db = get_db()
-    
-    # Обновляем время последней активности
-    db.execute('''
-        UPDATE user_sessions 
-        SET last_activity = CURRENT_TIMESTAMP 
-        WHERE session_token = (
-            SELECT session_token FROM user_sessions 
-            WHERE user_id = ? AND last_activity > datetime("now", "-24 hours")
-            LIMIT 1
-        )
-    ''', (g.current_user_id,))
-    db.commit()
-    
+    """Подтверждение активности пользователя.
+
+    Визит отмечает require_auth в памяти (presence), last_activity сессии
+    пишется в БД пачкой — запись на каждый пинг здесь не нужна.
+    """
     return jsonify({
         'status': 'ok',
         'timestamp': datetime.now().isoformat()
@@ -412,132 +481,69 @@ def heartbeat():
 
 
 # === API СИНХРОНИЗАЦИИ ===
+def _get_or_create_tree(db, user_id, tree_name):
+    """id дерева пользователя (создаётся при первой загрузке)."""
+    tree = db.execute(
+        'SELECT id FROM family_trees WHERE user_id = ?',
+        (user_id,)
+    ).fetchone()
+
+    if tree:
+        # Обновляем время обновления дерева
+        db.execute('UPDATE family_trees SET updated_at = CURRENT_TIMESTAMP WHERE id = ?', (tree['id'],))
+        return tree['id']
+    cursor = db.execute(
+        'INSERT INTO family_trees (user_id, name) VALUES (?, ?)',
+        (user_id, tree_name)
+    )
+    bump(db, trees=1)
+    return cursor.lastrowid
+
+
 @app.route('/api/sync/upload', methods=['POST'])
 @require_auth
 def sync_upload():
-    """Загрузка данных дерева на сервер."""
+    """Загрузка данных дерева на сервер.
+
+    Всё дерево записывается одной транзакцией: пакетные INSERT/UPDATE только
+    для изменённых персон, удаление персон и браков, которых нет у клиента.
+    """
     data = request.get_json()
     tree_data = data.get('tree', {})
     tree_name = data.get('tree_name', 'Моё дерево')
+    persons = tree_data.get('persons', {})
+    marriages = tree_data.get('marriages', [])
     
     db = get_db()
     start_time = datetime.now()
-    
-    try:
-        # Получаем или создаём дерево
-        tree = db.execute(
-            'SELECT id FROM family_trees WHERE user_id = ?',
-            (g.current_user_id,)
-        ).fetchone()
-
-        if tree:
-            tree_id = tree['id']
-            # Обновляем время обновления дерева
-            db.execute('UPDATE family_trees SET updated_at = CURRENT_TIMESTAMP WHERE id = ?', (tree_id,))
-        else:
-            cursor = db.execute(
-                'INSERT INTO family_trees (user_id, name) VALUES (?, ?)',
-                (g.current_user_id, tree_name)
-            )
-            tree_id = cursor.lastrowid
-
-        # Вставляем персоны (INSERT OR REPLACE обновляет существующие)
-        persons = tree_data.get('persons', {})
-        for pid, pdata in persons.items():
-            links_json = json.dumps(pdata.get('links', []))
-            photo_album_json = json.dumps(pdata.get('photo_album', []))
-            parents_json = json.dumps(list(pdata.get('parents', [])))
-            children_json = json.dumps(list(pdata.get('children', [])))
-            spouse_ids_json = json.dumps(list(pdata.get('spouse_ids', [])))
-
-            db.execute('''
-                INSERT OR REPLACE INTO persons (
-                    id, tree_id, name, surname, patronymic, birth_date, death_date,
-                    is_deceased, gender, photo_path, photo, photo_full, birth_place, biography,
-                    burial_place, burial_date, occupation, education, address, notes,
-                    phone, email, vk, telegram, whatsapp, blood_type, rh_factor,
-                    allergies, chronic_conditions, links, photo_album, parents,
-                    children, spouse_ids, collapsed_branches
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                pid, tree_id,
-                pdata.get('name', ''),
-                pdata.get('surname', ''),
-                pdata.get('patronymic', ''),
-                pdata.get('birth_date', ''),
-                pdata.get('death_date', ''),
-                1 if pdata.get('is_deceased') else 0,
-                pdata.get('gender', ''),
-                pdata.get('photo_path', ''),
-                pdata.get('photo'),
-                pdata.get('photo_full'),
-                pdata.get('birth_place', ''),
-                pdata.get('biography', ''),
-                pdata.get('burial_place', ''),
-                pdata.get('burial_date', ''),
-                pdata.get('occupation', ''),
-                pdata.get('education', ''),
-                pdata.get('address', ''),
-                pdata.get('notes', ''),
-                pdata.get('phone', ''),
-                pdata.get('email', ''),
-                pdata.get('vk', ''),
-                pdata.get('telegram', ''),
-                pdata.get('whatsapp', ''),
-                pdata.get('blood_type', ''),
-                pdata.get('rh_factor', ''),
-                pdata.get('allergies', ''),
-                pdata.get('chronic_conditions', ''),
-                links_json,
-                photo_album_json,
-                parents_json,
-                children_json,
-                spouse_ids_json,
-                1 if pdata.get('collapsed_branches') else 0
-            ))
-        
-        # Вставляем браки (INSERT OR REPLACE чтобы избежать конфликтов)
-        marriages = tree_data.get('marriages', [])
-        if isinstance(marriages, list):
-            # СНАЧАЛА удаляем все старые браки этого дерева
-            db.execute('DELETE FROM marriages WHERE tree_id = ?', (tree_id,))
-            
-            # Потом вставляем новые
-            for marriage in marriages:
-                if isinstance(marriage, dict):
-                    persons_list = marriage.get('persons', [])
-                    if len(persons_list) >= 2:
-                        db.execute('''
-                            INSERT INTO marriages (tree_id, person1_id, person2_id, marriage_date)
-                            VALUES (?, ?, ?, ?)
-                        ''', (tree_id, persons_list[0], persons_list[1], marriage.get('date', '')))
-                elif isinstance(marriage, (list, tuple)) and len(marriage) >= 2:
-                    db.execute('''
-                        INSERT INTO marriages (tree_id, person1_id, person2_id)
-                        VALUES (?, ?, ?)
-                    ''', (tree_id, marriage[0], marriage[1]))
-        
-        db.commit()
-        
-        # Лог синхронизации
+
+    def _write(db, user_id):
+        db.execute('BEGIN IMMEDIATE')
+        tree_id = _get_or_create_tree(db, user_id, tree_name)
+        stats = replace_tree(db, tree_id, persons, marriages)
+
+        # Лог синхронизации — в той же транзакции
         duration = int((datetime.now() - start_time).total_seconds() * 1000)
-        db.execute('''
-            INSERT INTO sync_logs (user_id, action, entities_count, sync_duration_ms, status)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (g.current_user_id, 'upload', len(persons), duration, 'success'))
+        log_sync(db, user_id, 'upload', 'success', len(persons), duration)
         db.commit()
-        
-        return jsonify({'message': 'Синхронизация успешна', 'persons_count': len(persons)})
+        return stats
+    
+    try:
+        stats = db_pool.run(_write, g.current_user_id, conn=db)
+        print(f"[SYNC_UPLOAD] user_id={g.current_user_id} persons={stats['persons']} marriages={stats['marriages']}")
+        return jsonify({
+            'message': 'Синхронизация успешна',
+            'persons_count': len(persons),
+            'revision': stats['revision'],
+            'stats': stats,
+        })
     
     except Exception as e:
         db.rollback()
         print(f"[SYNC_UPLOAD] ERROR: {type(e).__name__}: {e}")
         import traceback
         traceback.print_exc()
-        db.execute('''
-            INSERT INTO sync_logs (user_id, action, status, error_message)
-            VALUES (?, ?, ?, ?)
-        ''', (g.current_user_id, 'upload', 'error', str(e)))
+        log_sync(db, g.current_user_id, 'upload', 'error', error_message=str(e))
         db.commit()
 
         return jsonify({'error': f'Ошибка синхронизации: {str(e)}'}), 500
@@ -545,7 +551,11 @@ def sync_upload():
 @app.route('/api/sync/download', methods=['GET'])
 @require_auth
 def sync_download():
-    """Скачивание данных дерева с сервера."""
+    """Скачивание данных дерева с сервера.
+
+    Байты фото по умолчанию не передаются — только photo_hash/photo_full_hash
+    (фото отдаёт /api/photos/<hash>). ?include_photos=1 — base64 в дереве, как раньше.
+    """
     db = get_db()
     
     # Логирование для отладки проблемы с загрузкой чужого дерева
@@ -553,71 +563,411 @@ def sync_download():
     print(f"[SYNC_DOWNLOAD] user_id={g.current_user_id}, login={user_info['login'] if user_info else 'UNKNOWN'}")
 
     tree = db.execute(
-        'SELECT id, name FROM family_trees WHERE user_id = ?',
+        'SELECT id, name, revision FROM family_trees WHERE user_id = ?',
         (g.current_user_id,)
     ).fetchone()
     
     if not tree:
-        return jsonify({'tree': {'persons': {}, 'marriages': []}})
+        return json_response({'tree': {'persons': {}, 'marriages': []}, 'revision': 0})
     
     tree_id = tree['id']
+    include_photos = request.args.get('include_photos') == '1'
+
+    # ETag из ревизии: неизменённое дерево — 304 без чтения персон
+    etag = make_etag('download', TREE_ETAG_VERSION, tree_id, tree['revision'] or 0, tree['name'], include_photos)
+    if not_modified(etag):
+        print(f"[SYNC_DOWNLOAD] Not modified (revision={tree['revision'] or 0})")
+        return not_modified_response(etag)
     
-    # Получаем персоны
-    persons = {}
-    for row in db.execute('SELECT * FROM persons WHERE tree_id = ?', (tree_id,)):
-        pid = row['id']
-        persons[pid] = {
-            'name': row['name'],
-            'surname': row['surname'],
-            'patronymic': row['patronymic'] or '',
-            'birth_date': row['birth_date'] or '',
-            'death_date': row['death_date'] or '',
-            'is_deceased': bool(row['is_deceased']),
-            'gender': row['gender'] or '',
-            'photo_path': row['photo_path'] or '',
-            'photo': row['photo'],
-            'photo_full': row['photo_full'],
-            'birth_place': row['birth_place'] or '',
-            'biography': row['biography'] or '',
-            'burial_place': row['burial_place'] or '',
-            'burial_date': row['burial_date'] or '',
-            'occupation': row['occupation'] or '',
-            'education': row['education'] or '',
-            'address': row['address'] or '',
-            'notes': row['notes'] or '',
-            'phone': row['phone'] or '',
-            'email': row['email'] or '',
-            'vk': row['vk'] or '',
-            'telegram': row['telegram'] or '',
-            'whatsapp': row['whatsapp'] or '',
-            'blood_type': row['blood_type'] or '',
-            'rh_factor': row['rh_factor'] or '',
-            'allergies': row['allergies'] or '',
-            'chronic_conditions': row['chronic_conditions'] or '',
-            'links': json.loads(row['links'] or '[]'),
-            'photo_album': json.loads(row['photo_album'] or '[]'),
-            'parents': json.loads(row['parents'] or '[]'),
-            'children': json.loads(row['children'] or '[]'),
-            'spouse_ids': json.loads(row['spouse_ids'] or '[]'),
-            'collapsed_branches': bool(row['collapsed_branches'])
-        }
-    
-    # Получаем браки
-    marriages = []
-    for row in db.execute('SELECT * FROM marriages WHERE tree_id = ?', (tree_id,)):
-        marriages.append({
-            'persons': [row['person1_id'], row['person2_id']],
-            'date': row['marriage_date'] or ''
-        })
-    
+    print(f"[SYNC_DOWNLOAD] Streaming tree_id={tree_id} revision={tree['revision'] or 0}")
+    return stream_json_response(JsonObjectStream(_stream_tree(tree_id, include_photos)), etag=etag)
+
+
+def _stream_tree(tree_id, include_photos):
+    """
+    Пары верхнего уровня ответа /api/sync/download для потоковой выдачи.
+
+    Генератор работает после выхода из view, поэтому берёт своё соединение
+    из пула; персоны и браки читаются в одной транзакции (один снимок WAL).
+    """
+    conn = db_pool.acquire()
+    try:
+        conn.execute('BEGIN')
+        tree = conn.execute('SELECT name, revision FROM family_trees WHERE id = ?', (tree_id,)).fetchone()
+        yield 'tree', JsonObjectStream([
+            ('persons', JsonObjectStream(iter_persons(conn, tree_id, include_photos))),
+            ('marriages', JsonArrayStream(iter_marriages(conn, tree_id))),
+        ])
+        yield 'tree_name', tree['name'] if tree else None
+        yield 'revision', (tree['revision'] or 0) if tree else 0
+    finally:
+        db_pool.release(conn)
+
+
+@app.route('/api/sync/changes', methods=['GET'])
+@require_auth
+def sync_changes():
+    """Изменения дерева после ревизии клиента (?since=N).
+
+    Ответ: revision, full, persons (изменённые), marriages (изменённые),
+    deleted_persons, deleted_marriages. full=true — полный снимок дерева
+    (since=0 или клиент отстал дальше сохранённой истории удалений).
+    """
+    since = request.args.get('since', 0, type=int)
+    db = get_db()
+    tree = db.execute('SELECT id, name, revision FROM family_trees WHERE user_id = ?',
+                      (g.current_user_id,)).fetchone()
+    if not tree:
+        return json_response({'revision': 0, 'full': True, 'persons': {}, 'marriages': [],
+                              'deleted_persons': [], 'deleted_marriages': []})
+
+    include_photos = request.args.get('include_photos') == '1'
+    etag = make_etag('changes', TREE_ETAG_VERSION, tree['id'], tree['revision'] or 0, tree['name'],
+                     since, include_photos)
+    if not_modified(etag):
+        return not_modified_response(etag)
+
+    changes = changes_since(db, tree['id'], since)
+    if include_photos:
+        attach_photos(db, changes['persons'])
+    changes['tree_name'] = tree['name']
+    print(f"[SYNC_CHANGES] user_id={g.current_user_id} since={since} revision={changes['revision']} "
+          f"full={changes['full']} persons={len(changes['persons'])} deleted={len(changes['deleted_persons'])}")
+    return json_response(changes, etag=etag)
+
+
+@app.route('/api/sync/delta', methods=['POST'])
+@require_auth
+def sync_delta():
+    """Загрузка только изменённых и удалённых сущностей.
+
+    Тело: base_revision, persons (изменённые), deleted_persons,
+    marriages (изменённые), deleted_marriages. Если base_revision не совпадает
+    с ревизией дерева на сервере — 409: клиент должен сначала получить
+    изменения (/api/sync/changes) или загрузить дерево целиком.
+    """
+    data = request.get_json() or {}
+    base_revision = data.get('base_revision')
+    persons = data.get('persons') or {}
+    deleted_persons = data.get('deleted_persons') or []
+    marriages = data.get('marriages') or []
+    deleted_marriages = data.get('deleted_marriages') or []
+    tree_name = data.get('tree_name', 'Моё дерево')
+
+    if not isinstance(base_revision, int) or not isinstance(persons, dict):
+        return jsonify({'error': 'Требуются base_revision и persons'}), 400
+
+    db = get_db()
+    start_time = datetime.now()
+
+    def _write(db, user_id):
+        db.execute('BEGIN IMMEDIATE')
+        tree_id = _get_or_create_tree(db, user_id, tree_name)
+        current = tree_revision(db, tree_id)
+        if current != base_revision:
+            db.rollback()
+            return None, current
+        stats = apply_delta(db, tree_id, persons, deleted_persons, marriages, deleted_marriages)
+        duration = int((datetime.now() - start_time).total_seconds() * 1000)
+        log_sync(db, user_id, 'delta', 'success', len(persons) + len(deleted_persons), duration)
+        db.commit()
+        return stats, current
+
+    try:
+        stats, current = db_pool.run(_write, g.current_user_id, conn=db)
+    except Exception as e:
+        db.rollback()
+        print(f"[SYNC_DELTA] ERROR: {type(e).__name__}: {e}")
+        return jsonify({'error': f'Ошибка синхронизации: {str(e)}'}), 500
+
+    if stats is None:
+        print(f"[SYNC_DELTA] user_id={g.current_user_id} conflict: base={base_revision} server={current}")
+        return jsonify({'error': 'Дерево на сервере изменилось', 'revision': current}), 409
+
+    print(f"[SYNC_DELTA] user_id={g.current_user_id} revision={stats['revision']} "
+          f"persons={stats['persons']} marriages={stats['marriages']}")
     return jsonify({
-        'tree': {
-            'persons': persons,
-            'marriages': marriages
-        },
-        'tree_name': tree['name']
+        'message': 'Синхронизация успешна',
+        'revision': stats['revision'],
+        'stats': stats,
+    })
+
+# === ТОЧЕЧНЫЕ ПРАВКИ ===
+
+def _tree_edit(apply, action):
+    """
+    Правка дерева пользователя одной короткой транзакцией (tree_store.edit_tree).
+
+    apply(db, tree_id, edit) — сама правка; читаются и пишутся только
+    затронутые строки. Ответ: revision, person_id (результат apply),
+    updated — id записанных персон, deleted — удалённых.
+    """
+    db = get_db()
+
+    def _write(db, user_id):
+        db.execute('BEGIN IMMEDIATE')
+        tree_id = _get_or_create_tree(db, user_id, 'Моё дерево')
+        result = edit_tree(db, tree_id, lambda edit: apply(db, tree_id, edit))
+        db.commit()
+        return result
+
+    try:
+        edit, person_id, stats = db_pool.run(_write, g.current_user_id, conn=db)
+    except LookupError as e:
+        db.rollback()
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        db.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.rollback()
+        print(f"[TREE_EDIT] ERROR {action}: {type(e).__name__}: {e}")
+        return jsonify({'error': f'Ошибка сохранения: {str(e)}'}), 500
+
+    print(f"[TREE_EDIT] user_id={g.current_user_id} {action} revision={stats['revision']} "
+          f"persons={len(edit.persons)} deleted={len(edit.deleted)}")
+    return jsonify({
+        'revision': stats['revision'],
+        'person_id': person_id,
+        'updated': sorted(edit.persons),
+        'deleted': edit.deleted,
+    })
+
+
+@app.route('/api/tree/persons', methods=['POST'])
+@require_auth
+def create_person():
+    """Новая персона (тело — JSON персоны; id необязателен, иначе максимум + 1)."""
+    data = request.get_json() or {}
+
+    def apply(db, tree_id, edit):
+        return edit.create_person(data.get('id') or next_person_id(db, tree_id), data)
+    return _tree_edit(apply, 'create')
+
+
+@app.route('/api/tree/persons/<person_id>', methods=['PATCH'])
+@require_auth
+def update_person(person_id):
+    """Изменить поля персоны (связи — отдельными запросами)."""
+    fields = request.get_json() or {}
+    return _tree_edit(lambda db, tree_id, edit: edit.update_person(person_id, fields), 'update')
+
+
+@app.route('/api/tree/persons/<person_id>', methods=['DELETE'])
+@require_auth
+def delete_person(person_id):
+    """Удалить персону, ссылки на неё у родственников и её браки."""
+    return _tree_edit(lambda db, tree_id, edit: edit.delete_person(person_id), 'delete')
+
+
+@app.route('/api/tree/persons/<person_id>/<relation>/<other_id>', methods=['PUT', 'DELETE'])
+@require_auth
+def link_person(person_id, relation, other_id):
+    """Связь родитель — ребёнок: /parents/<id родителя> или /children/<id ребёнка>."""
+    if relation not in ('parents', 'children'):
+        return jsonify({'error': 'Неизвестная связь'}), 404
+    child_id, parent_id = (person_id, other_id) if relation == 'parents' else (other_id, person_id)
+    linked = request.method == 'PUT'
+    return _tree_edit(lambda db, tree_id, edit: edit.link_parent(child_id, parent_id, linked),
+                      f'{relation} {"link" if linked else "unlink"}')
+
+
+@app.route('/api/tree/marriages/<person1_id>/<person2_id>', methods=['PUT', 'DELETE'])
+@require_auth
+def set_marriage(person1_id, person2_id):
+    """Добавить брак (PUT, тело {date}) или убрать его (DELETE)."""
+    married = request.method == 'PUT'
+    date = (request.get_json(silent=True) or {}).get('date') if married else None
+    return _tree_edit(lambda db, tree_id, edit: edit.set_marriage(person1_id, person2_id, married, date),
+                      'marriage' if married else 'divorce')
+
+
+@app.route('/api/tree/persons/<person_id>/photo', methods=['PUT'])
+@require_auth
+def set_person_photo(person_id):
+    """Фото персоны: {photo, photo_full?, photo_path?} в base64 (photo=null — убрать)."""
+    data = request.get_json() or {}
+    if 'photo' not in data:
+        return jsonify({'error': 'Фото не предоставлено'}), 400
+    return _tree_edit(lambda db, tree_id, edit: edit.set_photo(
+        person_id, data['photo'], data.get('photo_full'), data.get('photo_path')), 'photo')
+
+
+# === ФОТО ===
+# Чтение BLOB кусками, чтобы не держать крупное фото целиком в памяти воркера
+PHOTO_CHUNK_SIZE = 64 * 1024
+
+
+def _graph_query(person_id, walk):
+    """Общая часть /ancestors и /descendants: дерево пользователя, глубина, 404."""
+    db = get_db()
+    tree = db.execute('SELECT id, revision FROM family_trees WHERE user_id = ?', (g.current_user_id,)).fetchone()
+    if not tree or not db.execute('SELECT 1 FROM persons WHERE tree_id = ? AND id = ?',
+                                  (tree['id'], person_id)).fetchone():
+        return jsonify({'error': 'Персона не найдена'}), 404
+    depth = max(1, min(request.args.get('depth', MAX_DEPTH, type=int), MAX_DEPTH))
+    return jsonify({
+        'person_id': person_id,
+        'depth': depth,
+        'persons': attach_names(db, tree['id'], walk(db, tree['id'], person_id, depth)),
+        'revision': tree['revision'] or 0,
     })
 
+
+@app.route('/api/tree/persons/<person_id>/ancestors', methods=['GET'])
+@require_auth
+def person_ancestors(person_id):
+    """Предки персоны (?depth=N поколений) — рекурсивный CTE по relations."""
+    return _graph_query(person_id, ancestors)
+
+
+@app.route('/api/tree/persons/<person_id>/descendants', methods=['GET'])
+@require_auth
+def person_descendants(person_id):
+    """Потомки персоны (?depth=N поколений) — рекурсивный CTE по relations."""
+    return _graph_query(person_id, descendants)
+
+
+# Размер страницы /api/tree/persons по умолчанию и наибольший
+PAGE_LIMIT = int(os.environ.get('SYNC_PAGE_LIMIT', '500'))
+MAX_PAGE_LIMIT = 5000
+
+
+@app.route('/api/tree/persons/<person_id>/neighbourhood', methods=['GET'])
+@require_auth
+def person_neighbourhood(person_id):
+    """Окрестность персоны для первой отрисовки (?up=2&down=2&siblings=1).
+
+    Ответ: persons (полные записи окрестности), roles ({id: роль}), marriages
+    между ними, revision и cursor — с него /api/tree/persons отдаёт всё дерево
+    страницами. Считается по relations и первичному ключу, без чтения дерева.
+    """
+    db = get_db()
+    tree = db.execute('SELECT id, revision FROM family_trees WHERE user_id = ?', (g.current_user_id,)).fetchone()
+    if not tree or not db.execute('SELECT 1 FROM persons WHERE tree_id = ? AND id = ?',
+                                  (tree['id'], person_id)).fetchone():
+        return jsonify({'error': 'Персона не найдена'}), 404
+    up = max(0, min(request.args.get('up', 2, type=int), MAX_DEPTH))
+    down = max(0, min(request.args.get('down', 2, type=int), MAX_DEPTH))
+    siblings = max(0, min(request.args.get('siblings', 1, type=int), MAX_DEPTH))
+    include_photos = request.args.get('include_photos') == '1'
+    revision = tree['revision'] or 0
+
+    etag = make_etag('neighbourhood', TREE_ETAG_VERSION, tree['id'], revision, person_id,
+                     up, down, siblings, include_photos)
+    if not_modified(etag):
+        return not_modified_response(etag)
+
+    roles = neighbourhood(db, tree['id'], person_id, up, down, siblings)
+    persons = load_persons(db, tree['id'], roles, include_photos)
+    print(f"[NEIGHBOURHOOD] tree_id={tree['id']} person={person_id} up={up} down={down} "
+          f"siblings={siblings}: {len(persons)} persons")
+    return json_response({
+        'person_id': person_id,
+        'persons': persons,
+        'roles': {pid: role for pid, role in roles.items() if pid in persons},
+        'marriages': marriages_of(db, tree['id'], persons, both=True),
+        'revision': revision,
+        'cursor': encode_cursor(revision, ''),
+    }, etag=etag)
+
+
+@app.route('/api/tree/persons', methods=['GET'])
+@require_auth
+def tree_persons_page():
+    """Страница персон дерева по курсору (?cursor=...&limit=500).
+
+    Ответ: persons, marriages (браки, где person1 на этой странице), revision,
+    next_cursor (None — страниц больше нет). Если дерево изменилось после
+    выдачи курсора — 409: клиенту нужно начать заново или дозапросить
+    /api/sync/changes.
+    """
+    db = get_db()
+    tree = db.execute('SELECT id, revision FROM family_trees WHERE user_id = ?', (g.current_user_id,)).fetchone()
+    revision = (tree['revision'] or 0) if tree else 0
+    cursor = request.args.get('cursor')
+    try:
+        cursor_revision, after = decode_cursor(cursor) if cursor else (revision, '')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if cursor_revision != revision:
+        return jsonify({'error': 'Дерево изменилось, начните загрузку заново', 'revision': revision}), 409
+    if not tree:
+        return jsonify({'persons': {}, 'marriages': [], 'revision': 0, 'next_cursor': None})
+
+    limit = max(1, min(request.args.get('limit', PAGE_LIMIT, type=int), MAX_PAGE_LIMIT))
+    persons, last_id = person_page(db, tree['id'], after, limit, request.args.get('include_photos') == '1')
+    return json_response({
+        'persons': persons,
+        'marriages': marriages_of(db, tree['id'], persons),
+        'revision': revision,
+        'next_cursor': encode_cursor(revision, last_id) if last_id is not None else None,
+    })
+
+
+@app.route('/api/photos/<photo_hash>', methods=['GET'])
+@require_auth
+def get_photo(photo_hash):
+    """Фото по SHA-256. Содержимое по хешу не меняется — ETag сильный, кэш immutable."""
+    if not is_photo_hash(photo_hash):
+        return jsonify({'error': 'Неверный хеш фото'}), 400
+
+    etag = f'"{photo_hash}"'
+    if request.if_none_match.contains(photo_hash):
+        response = app.response_class(status=304)
+        response.headers['ETag'] = etag
+        response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+        return response
+
+    db = get_db()
+    photo = db.execute('SELECT rowid, mime, size FROM photos WHERE hash = ?', (photo_hash,)).fetchone()
+    if not photo:
+        return jsonify({'error': 'Фото не найдено'}), 404
+
+    # Фото доступно владельцу дерева, где оно используется, и администраторам
+    owner = db.execute(
+        'SELECT 1 FROM persons p JOIN family_trees t ON t.id = p.tree_id '
+        'WHERE t.user_id = ? AND (p.photo_hash = ? OR p.photo_full_hash = ?) LIMIT 1',
+        (g.current_user_id, photo_hash, photo_hash)
+    ).fetchone()
+    if not owner and not _user_is_admin(db, g.current_user_id):
+        return jsonify({'error': 'Фото не найдено'}), 404
+
+    rowid = photo['rowid']
+
+    def _stream():
+        conn = db_pool.acquire()
+        try:
+            with conn.blobopen('photos', 'data', rowid, readonly=True) as blob:
+                while True:
+                    chunk = blob.read(PHOTO_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield chunk
+        finally:
+            db_pool.release(conn)
+
+    response = app.response_class(_stream(), mimetype=photo['mime'] or 'image/jpeg')
+    response.headers['Content-Length'] = str(photo['size'])
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
+
+@app.route('/api/photos/missing', methods=['POST'])
+@require_auth
+def missing_photos():
+    """
+    Какие из присланных хешей нужно загрузить байтами.
+
+    Известными считаются только фото из деревьев пользователя: наличие чужого
+    фото на сервере не раскрывается, а ссылку на него хешем сервер не примет.
+    """
+    hashes = [h for h in (request.get_json() or {}).get('hashes', []) if is_photo_hash(h)]
+    known = owned_photo_hashes(get_db(), g.current_user_id, hashes)
+    return jsonify({'missing': [h for h in hashes if h not in known]})
+
+
 # === АДМИН ПАНЕЛЬ ===
 @app.route('/api/admin/stats', methods=['GET'])
 @require_admin
@@ -625,13 +975,10 @@ def admin_stats():
     """Получение статистики системы."""
     db = get_db()
     
-    # Общая статистика
-    total_users = db.execute('SELECT COUNT(*) FROM users').fetchone()[0]
-    active_users = db.execute('SELECT COUNT(*) FROM users WHERE is_active = 1').fetchone()[0]
-    total_trees = db.execute('SELECT COUNT(*) FROM family_trees').fetchone()[0]
-    total_persons = db.execute('SELECT COUNT(*) FROM persons').fetchone()[0]
-    
-    # Активные сессии
+    # Счётчики ведутся при регистрации, входе, загрузке и удалении (stats_store)
+    counters = read_counters(db)
+
+    # Активные сессии — по индексу last_activity (только сессии за последний час)
     active_sessions = db.execute('''
         SELECT COUNT(DISTINCT user_id) FROM user_sessions 
         WHERE last_activity > datetime("now", "-1 hour")
@@ -651,53 +998,68 @@ def admin_stats():
         ORDER BY s.created_at DESC LIMIT 20
     ''').fetchall()
     
-    # Статистика по дням
-    daily_stats = db.execute('''
-        SELECT 
-            date(created_at) as date,
-            COUNT(*) as sync_count,
-            SUM(entities_count) as total_entities
-        FROM sync_logs
-        WHERE created_at > datetime("now", "-30 days")
-        GROUP BY date(created_at)
-        ORDER BY date DESC
-    ''').fetchall()
+    # Статистика по дням — из дневной сводки, не GROUP BY по sync_logs
+    daily_stats = daily_activity(db, days=30)
     
     return jsonify({
         'overview': {
-            'total_users': total_users,
-            'active_users': active_users,
-            'total_trees': total_trees,
-            'total_persons': total_persons,
+            'total_users': counters['users'],
+            'active_users': counters['active_users'],
+            'total_trees': counters['trees'],
+            'total_persons': counters['persons'],
             'active_sessions': active_sessions
         },
         'recent_users': [dict(row) for row in recent_users],
         'recent_syncs': [dict(row) for row in recent_syncs],
-        'daily_stats': [dict(row) for row in daily_stats]
+        'daily_stats': daily_stats
     })
 
+@app.route('/api/admin/maintenance', methods=['GET', 'POST'])
+@require_admin
+def admin_maintenance():
+    """Обслуживание БД: GET — последние отчёты, POST — запустить сейчас.
+
+    POST принимает session_days, log_days, tombstone_days (сроки хранения) и full_vacuum.
+    """
+    if request.method == 'GET':
+        return jsonify({'runs': recent_runs(get_db())})
+    data = request.get_json(silent=True) or {}
+    report = db_pool.run(run_maintenance, data.get('session_days'), data.get('log_days'),
+                         bool(data.get('full_vacuum')), data.get('tombstone_days'))
+    return jsonify({'report': report})
+
+
 @app.route('/api/admin/users', methods=['GET'])
 @require_admin
 def admin_users():
-    """Список всех пользователей со статусом онлайн."""
+    """Список всех пользователей со статусом онлайн.
+
+    Онлайн-статус — из памяти процесса (presence); визиты, которые видели
+    другие воркеры, добираются из user_sessions диапазоном по индексу
+    last_activity (только сессии за окно онлайн), без подзапроса на пользователя.
+    """
     db = get_db()
     users = db.execute('''
-        SELECT id, login, email, created_at, last_login, is_active, is_admin,
-               (SELECT MAX(last_activity) FROM user_sessions 
-                WHERE user_sessions.user_id = users.id 
-                AND last_activity > datetime("now", "-5 minutes")) as last_activity
+        SELECT id, login, email, created_at, last_login, is_active, is_admin
         FROM users ORDER BY created_at DESC
     ''').fetchall()
 
+    online = presence.online()
+    for user_id, seen in db.execute('''
+        SELECT user_id, MAX(CAST(strftime('%s', last_activity) AS INTEGER)) FROM user_sessions
+        WHERE last_activity > datetime("now", ?) GROUP BY user_id
+    ''', (f"-{int(presence.timeout)} seconds",)):
+        if seen > online.get(user_id, 0):
+            online[user_id] = seen
+
     users_list = []
     for row in users:
         user_dict = dict(row)
-        # Если last_activity не None и меньше 5 минут назад - пользователь онлайн
-        if user_dict.get('last_activity'):
-            user_dict['is_online'] = True
-        else:
-            user_dict['is_online'] = False
-            user_dict['last_activity'] = None
+        seen = online.get(user_dict['id'])
+        user_dict['is_online'] = seen is not None
+        user_dict['last_activity'] = (
+            time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(seen)) if seen is not None else None
+        )
         users_list.append(user_dict)
 
     return jsonify({'users': users_list})
@@ -708,7 +1070,12 @@ def admin_toggle_user(user_id):
     """Активировать/деактивировать пользователя."""
     db = get_db()
     db.execute('UPDATE users SET is_active = NOT is_active WHERE id = ?', (user_id,))
+    user = db.execute('SELECT is_active FROM users WHERE id = ?', (user_id,)).fetchone()
+    if user:
+        bump(db, active_users=1 if user['is_active'] else -1)
     db.commit()
+    token_cache.invalidate_user(user_id)
+    presence.forget_user(user_id)
 
     return jsonify({'message': 'Статус пользователя изменён'})
 
@@ -731,6 +1098,7 @@ def admin_grant_admin(user_id):
     # Предоставляем права администратора
     db.execute('UPDATE users SET is_admin = 1 WHERE id = ?', (user_id,))
     db.commit()
+    token_cache.invalidate_user(user_id)
 
     return jsonify({'message': 'Права администратора предоставлены', 'user_id': user_id})
 
@@ -805,25 +1173,84 @@ def _do_delete_user(user_id):
     trees = db.execute('SELECT id FROM family_trees WHERE user_id = ?', (user_id,)).fetchall()
     tree_ids = [t[0] for t in trees]
 
-    # Удаляем персон из деревьев
+    # Удаляем персон и рёбра родства из деревьев
+    removed_persons = 0
     if tree_ids:
         placeholders = ','.join('?' * len(tree_ids))
-        db.execute(f'DELETE FROM persons WHERE tree_id IN ({placeholders})', tree_ids)
+        removed_persons = db.execute(f'DELETE FROM persons WHERE tree_id IN ({placeholders})', tree_ids).rowcount
+        db.execute(f'DELETE FROM relations WHERE tree_id IN ({placeholders})', tree_ids)
 
     # Удаляем деревья
     db.execute('DELETE FROM family_trees WHERE user_id = ?', (user_id,))
 
     # Удаляем пользователя
+    active = db.execute('SELECT is_active FROM users WHERE id = ?', (user_id,)).fetchone()[0]
     db.execute('DELETE FROM users WHERE id = ?', (user_id,))
+    bump(db, users=-1, active_users=-1 if active else 0, trees=-len(tree_ids), persons=-removed_persons)
 
     db.commit()
+    token_cache.invalidate_user(user_id)
+    presence.forget_user(user_id)
 
     return jsonify({'message': 'Пользователь удалён'})
 
+# Деревьев на странице /api/admin/trees/summary по умолчанию и наибольшее
+ADMIN_TREES_LIMIT = 50
+MAX_ADMIN_TREES_LIMIT = 500
+
+
+def _stream_admin_trees(summaries):
+    """
+    Сводки деревьев с persons и marriages для потоковой выдачи.
+
+    Генератор работает после выхода из view — берёт своё соединение из пула;
+    персоны и браки всех деревьев читаются двумя запросами (без N+1).
+    """
+    conn = db_pool.acquire()
+    try:
+        conn.execute('BEGIN')
+        for summary, persons, marriages in iter_admin_trees(conn, summaries):
+            yield JsonObjectStream([
+                *summary.items(),
+                ('persons', JsonObjectStream(persons)),
+                ('marriages', JsonArrayStream(marriages)),
+            ])
+    finally:
+        db_pool.release(conn)
+
+
+@app.route('/api/admin/trees/summary', methods=['GET'])
+@require_admin
+def admin_tree_summaries():
+    """Сводка деревьев всех пользователей постранично (?cursor=&limit=50&include=persons).
+
+    Одна страница — один агрегирующий запрос: persons_count, marriages_count,
+    size (примерный объём без фото), last_sync. include=persons добавляет
+    персоны и браки деревьев страницы (ещё два запроса, потоковая выдача).
+    next_cursor=None — страниц больше нет.
+    """
+    try:
+        after = int(request.args.get('cursor') or 0)
+    except ValueError:
+        return jsonify({'error': 'Неверный курсор'}), 400
+    limit = max(1, min(request.args.get('limit', ADMIN_TREES_LIMIT, type=int), MAX_ADMIN_TREES_LIMIT))
+    include = set(filter(None, request.args.get('include', '').split(',')))
+
+    summaries = tree_summaries(get_db(), after, limit + 1)
+    next_cursor = str(summaries[limit - 1]['id']) if len(summaries) > limit else None
+    summaries = summaries[:limit]
+    if 'persons' in include:
+        return stream_json_response(JsonObjectStream([
+            ('trees', JsonArrayStream(_stream_admin_trees(summaries))),
+            ('next_cursor', next_cursor),
+        ]))
+    return json_response({'trees': summaries, 'next_cursor': next_cursor})
+
+
 @app.route('/api/admin/user/<int:user_id>/trees', methods=['GET'])
 @require_admin
 def admin_get_user_trees(user_id):
-    """Получить деревья пользователя."""
+    """Получить деревья пользователя (с персонами и браками)."""
     db = get_db()
 
     # Проверяем существование пользователя
@@ -831,115 +1258,19 @@ def admin_get_user_trees(user_id):
     if not user:
         return jsonify({'error': 'Пользователь не найден'}), 404
 
-    # Получаем деревья пользователя
-    trees = db.execute('''
-        SELECT id, name, created_at, updated_at
-        FROM family_trees
-        WHERE user_id = ?
-        ORDER BY updated_at DESC
-    ''', (user_id,)).fetchall()
-
-    trees_data = []
-    for tree in trees:
-        # Получаем персон для этого дерева
-        persons = db.execute('''
-            SELECT id, name, surname, patronymic, gender, birth_date,
-                   is_deceased, death_date, parents, children, spouse_ids
-            FROM persons
-            WHERE tree_id = ?
-        ''', (tree['id'],)).fetchall()
-
-        # Получаем браки
-        marriages = db.execute('''
-            SELECT person1_id, person2_id, marriage_date
-            FROM marriages
-            WHERE tree_id = ?
-        ''', (tree['id'],)).fetchall()
-
-        tree_data = {
-            'id': tree['id'],
-            'name': tree['name'],
-            'created_at': tree['created_at'],
-            'updated_at': tree['updated_at'],
-            'persons': {p['id']: {
-                'id': p['id'],
-                'name': p['name'],
-                'surname': p['surname'],
-                'patronymic': p['patronymic'],
-                'gender': p['gender'],
-                'birth_date': p['birth_date'],
-                'is_deceased': bool(p['is_deceased']),
-                'death_date': p['death_date'],
-                'parents': json.loads(p['parents']) if p['parents'] else [],
-                'children': json.loads(p['children']) if p['children'] else [],
-                'spouse_ids': json.loads(p['spouse_ids']) if p['spouse_ids'] else [],
-            } for p in persons},
-            'marriages': [{'persons': [m['person1_id'], m['person2_id']], 'date': m['marriage_date']} for m in marriages]
-        }
-        trees_data.append(tree_data)
-
-    return jsonify({'trees': trees_data})
+    summaries = tree_summaries(db, user_id=user_id, active_only=False)
+    return stream_json_response(JsonObjectStream([('trees', JsonArrayStream(_stream_admin_trees(summaries)))]))
 
 
 @app.route('/api/admin/trees', methods=['GET'])
 @require_admin
 def admin_get_all_trees():
-    """Получить все деревья всех пользователей."""
-    db = get_db()
-    
-    # Получаем всех пользователей
-    users = db.execute('SELECT id, login FROM users WHERE is_active = 1').fetchall()
-    
-    all_trees = []
-    for user in users:
-        # Получаем деревья пользователя
-        trees = db.execute('''
-            SELECT id, name, created_at, updated_at
-            FROM family_trees
-            WHERE user_id = ?
-            ORDER BY updated_at DESC
-        ''', (user['id'],)).fetchall()
-        
-        for tree in trees:
-            # Получаем персон
-            persons = db.execute('''
-                SELECT id, name, surname, patronymic, gender, birth_date,
-                       is_deceased, death_date, parents, children, spouse_ids
-                FROM persons
-                WHERE tree_id = ?
-            ''', (tree['id'],)).fetchall()
-            
-            # Получаем браки
-            marriages = db.execute('''
-                SELECT person1_id, person2_id, marriage_date
-                FROM marriages
-                WHERE tree_id = ?
-            ''', (tree['id'],)).fetchall()
-            
-            all_trees.append({
-                'id': tree['id'],
-                'user_id': user['id'],
-                'user_login': user['login'],
-                'name': tree['name'],
-                'created_at': tree['created_at'],
-                'updated_at': tree['updated_at'],
-                'persons': {p['id']: {
-                    'id': p['id'],
-                    'name': p['name'],
-                    'surname': p['surname'],
-                    'patronymic': p['patronymic'],
-                    'gender': p['gender'],
-                    'birth_date': p['birth_date'],
-                    'is_deceased': bool(p['is_deceased']),
-                    'death_date': p['death_date'],
-                    'parents': json.loads(p['parents']) if p['parents'] else [],
-                    'children': json.loads(p['children']) if p['children'] else [],
-                    'spouse_ids': json.loads(p['spouse_ids']) if p['spouse_ids'] else [],
-                } for p in persons},
-                'marriages': [{'persons': [m['person1_id'], m['person2_id']], 'date': m['marriage_date']} for m in marriages]
-            })
-    
-    return jsonify({'trees': all_trees})
+    """Получить все деревья всех активных пользователей (с персонами и браками).
+
+    Для больших баз — /api/admin/trees/summary с курсором.
+    """
+    summaries = tree_summaries(get_db())
+    return stream_json_response(JsonObjectStream([('trees', JsonArrayStream(_stream_admin_trees(summaries)))]))
 
 
 # === ЗДОРОВЬЕ ПРИЛОЖЕНИЯ ===
@@ -961,8 +1292,10 @@ def health_check():
         'timestamp': datetime.now().isoformat(),
         'database': {
             'status': db_status,
-            'path': DATA_DIR
+            'path': DATA_DIR,
+            'pool': db_pool.get_stats()
         },
+        'auth_cache': token_cache.get_stats(),
         'version': '1.0.0'
     }
 
@@ -1070,6 +1403,9 @@ def admin_fix_duplicates():
                     )
                 """, (tree_id, p1, p2, tree_id, p1, p2))
                 deleted = cursor.rowcount
+                # Новая ревизия: ETag /api/sync/download меняется вместе с содержимым
+                cursor.execute("UPDATE family_trees SET revision = COALESCE(revision, 0) + 1 WHERE id = ?",
+                               (tree_id,))
                 results.append(f"Удалено {deleted} дубликатов для tree={tree_id}")
             
             conn.commit()
@@ -1139,6 +1475,19 @@ def initialize_database():
         except Exception as e2:
             print(f"[DB] Create error: {e2}")
 
+    # Миграции схемы (новые колонки, таблицы, индексы)
+    try:
+        conn = sqlite3.connect(DB_FILE)
+        ensure_schema(conn)
+        # Счётчики админки: заполнить/сверить после записей init_db и скриптов обслуживания
+        reconcile(conn)
+        conn.close()
+    except Exception as e:
+        print(f"[DB] Schema migration error: {e}")
+    stats_reconciler.start()
+    maintenance_job.start()
+    presence_flusher.start()
+
 # Авто-инициализация при импорте
 initialize_database()
 
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Кэш токен → пользователь для require_auth сервера синхронизации.
+
+Запись живёт не дольше SYNC_AUTH_CACHE_TTL секунд (30) и не дольше срока
+действия сессии. Кэш — на процесс: при нескольких воркерах gunicorn
+изменение роли/блокировки в другом воркере применяется максимум через TTL.
+Обновление last_activity сессии выполняется не чаще раза в
+SYNC_AUTH_TOUCH_INTERVAL секунд (60) на токен.
+"""
+
+import os
+import threading
+import time
+
+# Срок жизни сессии с момента last_activity (как в запросе require_auth)
+SESSION_LIFETIME = 24 * 3600
+
+
+class TokenCache:
+    """Потокобезопасный TTL-кэш {токен: (user_id, is_admin, expires_at)}."""
+
+    def __init__(self, ttl=None, max_entries=None, touch_interval=None):
+        self.ttl = ttl if ttl is not None else float(os.environ.get("SYNC_AUTH_CACHE_TTL", "30"))
+        self.max_entries = max_entries or int(os.environ.get("SYNC_AUTH_CACHE_SIZE", "10000"))
+        self.touch_interval = (touch_interval if touch_interval is not None
+                               else float(os.environ.get("SYNC_AUTH_TOUCH_INTERVAL", "60")))
+        self._entries = {}
+        self._touched = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0, "touches": 0}
+
+    def get(self, token, now=None):
+        """(user_id, is_admin) или None, если записи нет или она устарела."""
+        now = now if now is not None else time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[2] <= now:
+                if entry is not None:
+                    del self._entries[token]
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+            return entry[0], entry[1]
+
+    def put(self, token, user_id, is_admin, session_expires_at, now=None):
+        """Запомнить токен до min(now + ttl, истечение сессии)."""
+        now = now if now is not None else time.time()
+        expires = min(now + self.ttl, session_expires_at)
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._evict(now)
+            self._entries[token] = (user_id, bool(is_admin), expires)
+
+    def _evict(self, now):
+        expired = [t for t, e in self._entries.items() if e[2] <= now]
+        for t in expired:
+            del self._entries[t]
+        if len(self._entries) >= self.max_entries:
+            # Всё ещё полно — сбрасываем самую старую половину (dict хранит порядок вставки)
+            for t in list(self._entries)[: len(self._entries) // 2]:
+                del self._entries[t]
+
+    def should_touch(self, token, now=None):
+        """True, если пора записать last_activity для токена (и отметить запись)."""
+        now = now if now is not None else time.time()
+        with self._lock:
+            last = self._touched.get(token)
+            if last is not None and now - last < self.touch_interval:
+                return False
+            if len(self._touched) >= self.max_entries:
+                self._touched.clear()
+            self._touched[token] = now
+            self.stats["touches"] += 1
+            return True
+
+    def invalidate_token(self, token):
+        with self._lock:
+            self._entries.pop(token, None)
+            self._touched.pop(token, None)
+            self.stats["invalidations"] += 1
+
+    def invalidate_user(self, user_id):
+        """Сбросить все токены пользователя (блокировка, смена роли, удаление)."""
+        with self._lock:
+            for token in [t for t, e in self._entries.items() if e[0] == user_id]:
+                del self._entries[token]
+            self.stats["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._touched.clear()
+
+    def get_stats(self):
+        with self._lock:
+            snapshot = dict(self.stats)
+            snapshot["size"] = len(self._entries)
+            snapshot["ttl"] = self.ttl
+        return snapshot
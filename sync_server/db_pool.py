@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+Пул соединений SQLite для сервера синхронизации.
+
+Соединения открываются один раз на воркер gunicorn, PRAGMA (WAL, synchronous,
+cache_size, mmap_size, busy_timeout) выставляются при создании соединения,
+а не на каждый запрос. Настройки берутся из переменных окружения:
+
+    SYNC_DB_POOL_SIZE        — максимум соединений в пуле (по умолчанию 8)
+    SYNC_DB_POOL_TIMEOUT     — сколько секунд ждать свободное соединение (10)
+    SYNC_DB_BUSY_TIMEOUT_MS  — PRAGMA busy_timeout в мс (5000)
+    SYNC_DB_CACHE_SIZE_KB    — PRAGMA cache_size в КБ (20000)
+    SYNC_DB_MMAP_SIZE        — PRAGMA mmap_size в байтах (268435456)
+    SYNC_DB_SYNCHRONOUS      — PRAGMA synchronous: OFF, NORMAL, FULL или EXTRA (NORMAL)
+    SYNC_DB_LOCK_RETRIES     — повторов при "database is locked" (3)
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+# Допустимые значения PRAGMA synchronous (значение подставляется в текст PRAGMA)
+SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def is_lock_error(exc):
+    """True, если исключение — блокировка БД (SQLITE_BUSY / SQLITE_LOCKED)."""
+    if not isinstance(exc, sqlite3.OperationalError):
+        return False
+    msg = str(exc).lower()
+    return "database is locked" in msg or "database table is locked" in msg
+
+
+class PoolTimeout(Exception):
+    """Не удалось получить соединение из пула за отведённое время."""
+
+
+class ConnectionPool:
+    """Ограниченный пул соединений SQLite с настроенными PRAGMA."""
+
+    def __init__(self, db_file, size=None, timeout=None, busy_timeout_ms=None,
+                 cache_size_kb=None, mmap_size=None, synchronous=None, lock_retries=None):
+        self.db_file = db_file
+        self.size = size if size is not None else _env_int("SYNC_DB_POOL_SIZE", 8)
+        self.timeout = timeout if timeout is not None else _env_float("SYNC_DB_POOL_TIMEOUT", 10.0)
+        self.busy_timeout_ms = (busy_timeout_ms if busy_timeout_ms is not None
+                                else _env_int("SYNC_DB_BUSY_TIMEOUT_MS", 5000))
+        self.cache_size_kb = (cache_size_kb if cache_size_kb is not None
+                              else _env_int("SYNC_DB_CACHE_SIZE_KB", 20000))
+        self.mmap_size = mmap_size if mmap_size is not None else _env_int("SYNC_DB_MMAP_SIZE", 268435456)
+        self.synchronous = str(synchronous or os.environ.get("SYNC_DB_SYNCHRONOUS") or "NORMAL").strip().upper()
+        if self.synchronous not in SYNCHRONOUS_MODES:
+            raise ValueError(f"SYNC_DB_SYNCHRONOUS={self.synchronous!r}: допустимо {', '.join(SYNCHRONOUS_MODES)}")
+        self.lock_retries = (lock_retries if lock_retries is not None
+                             else _env_int("SYNC_DB_LOCK_RETRIES", 3))
+
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        """Сбросить состояние пула (при создании и после fork воркера)."""
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self.stats = {
+            "connections": 0,
+            "checkouts": 0,
+            "waits": 0,
+            "wait_ms": 0.0,
+            "lock_retries": 0,
+            "timeouts": 0,
+        }
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.db_file,
+            timeout=self.busy_timeout_ms / 1000.0,
+            check_same_thread=False,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+        conn.execute(f"PRAGMA cache_size = -{int(self.cache_size_kb)}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    def acquire(self):
+        """Взять соединение из пула (или открыть новое, если лимит не достигнут)."""
+        if os.getpid() != self._pid:
+            # Соединения SQLite нельзя переносить через fork — начинаем с чистого пула
+            with self._lock:
+                if os.getpid() != self._pid:
+                    self._reset()
+
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if self._created < self.size:
+                    self._created += 1
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+                with self._lock:
+                    self.stats["connections"] += 1
+            else:
+                started = time.perf_counter()
+                with self._lock:
+                    self.stats["waits"] += 1
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self.stats["timeouts"] += 1
+                    raise PoolTimeout(f"Нет свободных соединений с БД за {self.timeout} с")
+                finally:
+                    with self._lock:
+                        self.stats["wait_ms"] += (time.perf_counter() - started) * 1000
+
+        with self._lock:
+            self.stats["checkouts"] += 1
+        return conn
+
+    def release(self, conn):
+        """Вернуть соединение в пул. Незавершённая транзакция откатывается."""
+        if conn is None:
+            return
+        if os.getpid() != self._pid:
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # Сломанное соединение не возвращаем — освобождаем слот
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+            with self._lock:
+                self._created -= 1
+            return
+        self._idle.put(conn)
+
+    def run(self, fn, *args, conn=None, **kwargs):
+        """
+        Выполнить fn(conn, *args, **kwargs) с повтором при блокировке БД.
+
+        fn должна быть целой транзакцией: при ошибке блокировки выполняется
+        rollback и fn вызывается заново (до lock_retries раз).
+        """
+        own = conn is None
+        if own:
+            conn = self.acquire()
+        try:
+            attempt = 0
+            while True:
+                try:
+                    return fn(conn, *args, **kwargs)
+                except sqlite3.OperationalError as e:
+                    if not is_lock_error(e) or attempt >= self.lock_retries:
+                        raise
+                    attempt += 1
+                    with self._lock:
+                        self.stats["lock_retries"] += 1
+                    if conn.in_transaction:
+                        conn.rollback()
+                    time.sleep(min(0.05 * (2 ** attempt), 1.0))
+        finally:
+            if own:
+                self.release(conn)
+
+    def close_all(self):
+        """Закрыть все свободные соединения (для тестов и остановки)."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+            with self._lock:
+                self._created -= 1
+
+    def get_stats(self):
+        """Снимок счётчиков пула."""
+        with self._lock:
+            snapshot = dict(self.stats)
+            snapshot["wait_ms"] = round(snapshot["wait_ms"], 2)
+            snapshot["size"] = self.size
+            snapshot["open"] = self._created
+            snapshot["idle"] = self._idle.qsize()
+        return snapshot
+
+
+class PeriodicJob:
+    """
+    Фоновая задача: fn(conn) раз в interval секунд на соединении пула.
+
+    Поток-демон запускается start() (повторный вызов и interval <= 0 — без
+    действия), stop() завершает его после текущего запуска. Ошибки задачи
+    пишутся в лог и не останавливают поток.
+    """
+
+    def __init__(self, pool, interval, fn, name):
+        self.pool = pool
+        self.interval = interval
+        self.fn = fn
+        self.name = name
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.pool.run(self.fn)
+            except Exception as e:
+                print(f"[DB_POOL] Фоновая задача {self.name} не удалась: {e}")
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+Условные GET и сжатие JSON-ответов (ETag / If-None-Match, gzip, brotli).
+
+Общий модуль sync_server и web: web/http_cache.py — копия этого файла
+для деплоя Railway (корень сервиса — своя папка), содержимое совпадает.
+
+Сервер: json_response(payload, etag) — 304 при совпадении If-None-Match,
+иначе тело, сжатое под Accept-Encoding клиента (от HTTP_COMPRESS_MIN_BYTES байт).
+stream_json_response() — то же для больших деревьев, но JSON пишется кусками
+по мере чтения (JsonObjectStream / JsonArrayStream), без копии всего тела в памяти.
+Клиент: ACCEPT_ENCODING для заголовка запроса и decode_body() для ответа.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import zlib
+
+from flask import current_app, request
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+# Тело меньше порога не сжимаем: выигрыш меньше заголовков
+COMPRESS_MIN_BYTES = int(os.environ.get("HTTP_COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.environ.get("HTTP_GZIP_LEVEL", "6"))
+# Размер куска потокового ответа (байт до сжатия)
+STREAM_CHUNK_BYTES = int(os.environ.get("HTTP_STREAM_CHUNK_BYTES", "65536"))
+
+# Что умеет распаковать decode_body (для заголовка Accept-Encoding запросов)
+ACCEPT_ENCODING = "br, gzip" if BROTLI_AVAILABLE else "gzip"
+
+# Суффиксы ETag сжатых представлений (строгий ETag различается по кодированию)
+_ENCODING_SUFFIX = {"gzip": "-gz", "br": "-br"}
+
+
+def make_etag(*parts):
+    """Строгий ETag из частей (ревизия, id дерева, параметры запроса)."""
+    raw = "\x1f".join(str(p) for p in parts).encode("utf-8")
+    return '"' + hashlib.sha256(raw).hexdigest()[:32] + '"'
+
+
+def content_etag(body):
+    """Строгий ETag по содержимому тела (когда ревизии нет)."""
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def _base_etag(tag):
+    tag = tag.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    for suffix in _ENCODING_SUFFIX.values():
+        if tag.endswith(suffix + '"'):
+            return tag[: -len(suffix) - 1] + '"'
+    return tag
+
+
+def etag_matches(if_none_match, etag):
+    """Совпадает ли If-None-Match с ETag (слабое сравнение, любое кодирование)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(_base_etag(tag) == etag for tag in if_none_match.split(","))
+
+
+def choose_encoding(accept_encoding):
+    """'br', 'gzip' или None по заголовку Accept-Encoding (с учётом q=0)."""
+    accepted = {}
+    for item in (accept_encoding or "").split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+    if BROTLI_AVAILABLE and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", accepted.get("*", 0)) > 0:
+        return "gzip"
+    return None
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def decode_body(body, content_encoding):
+    """Распаковать тело ответа по Content-Encoding (клиентская сторона)."""
+    encoding = (content_encoding or "").strip().lower()
+    if encoding == "gzip":
+        return gzip.decompress(body)
+    if encoding == "br":
+        return brotli.decompress(body)
+    return body
+
+
+def json_response(payload, etag=None, cache_control="private, no-cache"):
+    """
+    JSON-ответ с валидатором и сжатием.
+
+    etag=None — ETag считается по телу. Если etag передан заранее (например,
+    из ревизии дерева), вызывающий может проверить not_modified(etag) до
+    построения payload и не собирать тело вовсе.
+    """
+    body = None
+    if etag is None:
+        body = current_app.json.dumps(payload).encode("utf-8")
+        etag = content_etag(body)
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return not_modified_response(etag, cache_control)
+    if body is None:
+        body = current_app.json.dumps(payload).encode("utf-8")
+
+    response = current_app.response_class(body, mimetype="application/json")
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = cache_control
+    encoding = choose_encoding(request.headers.get("Accept-Encoding")) if len(body) >= COMPRESS_MIN_BYTES else None
+    if encoding:
+        response.set_data(compress(body, encoding))
+        response.headers["Content-Encoding"] = encoding
+        etag = etag[:-1] + _ENCODING_SUFFIX[encoding] + '"'
+    response.headers["ETag"] = etag
+    return response
+
+
+def not_modified(etag):
+    """True, если клиенту можно ответить 304 для этого ETag."""
+    return etag_matches(request.headers.get("If-None-Match"), etag)
+
+
+def not_modified_response(etag, cache_control="private, no-cache"):
+    response = current_app.response_class(status=304)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+
+# === ПОТОКОВЫЙ JSON ===
+
+class JsonObjectStream:
+    """JSON-объект, пары (ключ, значение) которого выдаёт итератор (читается один раз)."""
+
+    def __init__(self, pairs):
+        self.pairs = pairs.items() if isinstance(pairs, dict) else pairs
+
+
+class JsonArrayStream:
+    """JSON-массив, элементы которого выдаёт итератор (читается один раз)."""
+
+    def __init__(self, items):
+        self.items = items
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def iter_json(value):
+    """
+    Куски JSON-текста для value.
+
+    JsonObjectStream / JsonArrayStream раскрываются по элементу; обычные
+    значения (в том числе dict и list внутри них) сериализуются целиком.
+    """
+    if isinstance(value, JsonObjectStream):
+        yield "{"
+        first = True
+        for key, item in value.pairs:
+            yield ("" if first else ",") + _dumps(str(key)) + ":"
+            yield from iter_json(item)
+            first = False
+        yield "}"
+    elif isinstance(value, JsonArrayStream):
+        yield "["
+        first = True
+        for item in value.items:
+            if not first:
+                yield ","
+            yield from iter_json(item)
+            first = False
+        yield "]"
+    else:
+        yield _dumps(value)
+
+
+def _chunked(pieces, size):
+    buf = []
+    buffered = 0
+    for piece in pieces:
+        data = piece.encode("utf-8")
+        buf.append(data)
+        buffered += len(data)
+        if buffered >= size:
+            yield b"".join(buf)
+            buf = []
+            buffered = 0
+    if buf:
+        yield b"".join(buf)
+
+
+def _compressed(chunks, encoding):
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=5)
+        for chunk in chunks:
+            out = compressor.process(chunk)
+            if out:
+                yield out
+        yield compressor.finish()
+        return
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31 — формат gzip
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def stream_json_response(value, etag=None, cache_control="private, no-cache"):
+    """
+    Потоковый JSON-ответ (chunked): 304 по etag, иначе куски iter_json(value),
+    сжатые на лету под Accept-Encoding. Генераторы внутри value выполняются
+    уже после выхода из view — соединения с БД им нужны свои.
+    """
+    if etag is not None and not_modified(etag):
+        return not_modified_response(etag, cache_control)
+    chunks = _chunked(iter_json(value), STREAM_CHUNK_BYTES)
+    encoding = choose_encoding(request.headers.get("Accept-Encoding"))
+    if encoding:
+        chunks = _compressed(chunks, encoding)
+    response = current_app.response_class(chunks, mimetype="application/json")
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = cache_control
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+        if etag is not None:
+            etag = etag[:-1] + _ENCODING_SUFFIX[encoding] + '"'
+    if etag is not None:
+        response.headers["ETag"] = etag
+    return response
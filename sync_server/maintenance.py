@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+Обслуживание БД сервера синхронизации.
+
+- user_sessions: удаляются сессии без активности дольше срока хранения
+  (не меньше срока жизни токена — иначе удалилась бы живая сессия);
+- sync_logs: строки старше срока хранения сворачиваются в дневную сводку
+  sync_daily (stats_store) и удаляются — по дню за транзакцию, поэтому
+  прерванный запуск не теряет данных;
+- sync_tombstones: надгробия старше срока хранения удаляются, а
+  family_trees.tombstone_floor поднимается до их максимальной ревизии —
+  клиент, отставший сильнее, получает в /api/sync/changes полный снимок;
+- incremental_vacuum (если БД в режиме auto_vacuum=INCREMENTAL; перевести
+  существующую БД — --full-vacuum) и PRAGMA optimize.
+
+Сервер запускает обслуживание фоном раз в SYNC_MAINTENANCE_INTERVAL секунд
+(db_pool.PeriodicJob); при нескольких воркерах выполняет его тот, кто
+первым занял запуск строкой maintenance_runs (там же история отчётов).
+Вручную: python maintenance.py [--session-days N] [--log-days N] [--tombstone-days N]
+[--full-vacuum] [--json]
+или POST /api/admin/maintenance.
+
+Переменные окружения:
+    SYNC_SESSION_RETENTION_DAYS — хранить сессии без активности, дней (2)
+    SYNC_LOG_RETENTION_DAYS     — хранить строки sync_logs, дней (90)
+    SYNC_TOMBSTONE_RETENTION_DAYS — хранить надгробия удалений, дней (90)
+    SYNC_MAINTENANCE_INTERVAL   — период фонового обслуживания, секунд (86400, 0 — выключено)
+    SYNC_VACUUM_PAGES           — страниц за один incremental_vacuum (0 — все свободные)
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import time
+
+from auth_cache import SESSION_LIFETIME
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+SESSION_RETENTION_DAYS = _env_int("SYNC_SESSION_RETENTION_DAYS", 2)
+LOG_RETENTION_DAYS = _env_int("SYNC_LOG_RETENTION_DAYS", 90)
+TOMBSTONE_RETENTION_DAYS = _env_int("SYNC_TOMBSTONE_RETENTION_DAYS", 90)
+MAINTENANCE_INTERVAL = _env_int("SYNC_MAINTENANCE_INTERVAL", 86400)
+VACUUM_PAGES = _env_int("SYNC_VACUUM_PAGES", 0)
+# Сессий, удаляемых за одну транзакцию (запись не блокируется надолго)
+DELETE_BATCH = 5000
+
+_AUTO_VACUUM_MODES = {0: "none", 1: "full", 2: "incremental"}
+
+
+def ensure_maintenance_schema(db):
+    """Таблица истории запусков обслуживания."""
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS maintenance_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            report TEXT NOT NULL
+        )
+    """)
+
+
+def expire_sessions(db, days=None, batch=DELETE_BATCH):
+    """Удалить сессии без активности дольше days дней. Returns: число удалённых."""
+    days = SESSION_RETENTION_DAYS if days is None else days
+    seconds = max(int(days * 86400), SESSION_LIFETIME)
+    deleted = 0
+    while True:
+        db.execute("BEGIN IMMEDIATE")
+        count = db.execute(
+            "DELETE FROM user_sessions WHERE rowid IN ("
+            "SELECT rowid FROM user_sessions WHERE last_activity < datetime('now', ?) LIMIT ?)",
+            (f"-{seconds} seconds", batch)
+        ).rowcount
+        db.commit()
+        deleted += count
+        if count < batch:
+            return deleted
+
+
+def prune_sync_logs(db, days=None):
+    """
+    Свернуть строки sync_logs старше days дней в sync_daily и удалить их.
+
+    Каждый день — одна транзакция: сводка дня пересчитывается из его строк
+    (входы за день сохраняются) и строки удаляются. Returns: (дней, строк).
+    """
+    days = LOG_RETENTION_DAYS if days is None else days
+    cutoff = db.execute("SELECT date('now', ?)", (f"-{int(days)} days",)).fetchone()[0]
+    old_days = [row[0] for row in db.execute(
+        "SELECT DISTINCT date(created_at) FROM sync_logs WHERE created_at < ?", (cutoff,)
+    ).fetchall()]
+    deleted = 0
+    for day in old_days:
+        db.execute("BEGIN IMMEDIATE")
+        db.execute("""
+            INSERT INTO sync_daily (day, sync_count, total_entities)
+            SELECT ?, COUNT(*), IFNULL(SUM(entities_count), 0) FROM sync_logs
+            WHERE created_at >= ? AND created_at < date(?, '+1 day')
+            ON CONFLICT(day) DO UPDATE SET sync_count = excluded.sync_count,
+                                           total_entities = excluded.total_entities
+        """, (day, day, day))
+        deleted += db.execute(
+            "DELETE FROM sync_logs WHERE created_at >= ? AND created_at < date(?, '+1 day')", (day, day)
+        ).rowcount
+        db.commit()
+    return len(old_days), deleted
+
+
+def prune_tombstones(db, days=None):
+    """
+    Удалить надгробия старше days дней, подняв tombstone_floor их деревьев.
+
+    Клиент с ревизией ниже tombstone_floor не узнал бы об удалениях —
+    changes_since отдаёт ему полный снимок. Одна транзакция. Returns: число удалённых.
+    """
+    days = TOMBSTONE_RETENTION_DAYS if days is None else days
+    cutoff = db.execute("SELECT datetime('now', ?)", (f"-{int(days)} days",)).fetchone()[0]
+    db.execute("BEGIN IMMEDIATE")
+    db.execute("""
+        UPDATE family_trees SET tombstone_floor = MAX(IFNULL(tombstone_floor, 0), (
+            SELECT MAX(revision) FROM sync_tombstones t
+            WHERE t.tree_id = family_trees.id AND t.created_at < ?))
+        WHERE id IN (SELECT tree_id FROM sync_tombstones WHERE created_at < ?)
+    """, (cutoff, cutoff))
+    deleted = db.execute("DELETE FROM sync_tombstones WHERE created_at < ?", (cutoff,)).rowcount
+    db.commit()
+    return deleted
+
+
+def vacuum(db, full=False, pages=None):
+    """
+    Вернуть свободные страницы файлу БД.
+
+    В режиме auto_vacuum=INCREMENTAL — PRAGMA incremental_vacuum; full=True
+    переводит БД в этот режим полным VACUUM (долго, блокирует БД).
+    Returns: (режим auto_vacuum, освобождено страниц).
+    """
+    pages = VACUUM_PAGES if pages is None else pages
+    mode = db.execute("PRAGMA auto_vacuum").fetchone()[0]
+    before = db.execute("PRAGMA freelist_count").fetchone()[0]
+    if full and mode != 2:
+        db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        db.execute("VACUUM")
+        mode = db.execute("PRAGMA auto_vacuum").fetchone()[0]
+    elif mode == 2:
+        db.execute(f"PRAGMA incremental_vacuum({int(pages)})" if pages else "PRAGMA incremental_vacuum")
+    elif full:
+        db.execute("VACUUM")
+    after = db.execute("PRAGMA freelist_count").fetchone()[0]
+    return _AUTO_VACUUM_MODES.get(mode, str(mode)), before - after
+
+
+def run_maintenance(db, session_days=None, log_days=None, full_vacuum=False, tombstone_days=None, run_id=None):
+    """
+    Выполнить все шаги обслуживания и записать отчёт в maintenance_runs
+    (в строку run_id, если запуск занят claim_run). Returns: отчёт.
+    """
+    if db.in_transaction:
+        db.commit()
+    started = time.perf_counter()
+    report = {"timings_ms": {}}
+
+    def step(name, fn, *args, **kwargs):
+        t0 = time.perf_counter()
+        result = fn(*args, **kwargs)
+        report["timings_ms"][name] = round((time.perf_counter() - t0) * 1000, 1)
+        return result
+
+    report["sessions_deleted"] = step("sessions", expire_sessions, db, session_days)
+    report["log_days_rolled_up"], report["logs_deleted"] = step("sync_logs", prune_sync_logs, db, log_days)
+    report["tombstones_deleted"] = step("tombstones", prune_tombstones, db, tombstone_days)
+    report["auto_vacuum"], report["freed_pages"] = step("vacuum", vacuum, db, full_vacuum)
+    step("optimize", db.execute, "PRAGMA optimize")
+    report["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    ensure_maintenance_schema(db)
+    if run_id is None:
+        db.execute("INSERT INTO maintenance_runs (report) VALUES (?)", (json.dumps(report),))
+    else:
+        db.execute("UPDATE maintenance_runs SET report = ? WHERE id = ?", (json.dumps(report), run_id))
+    db.commit()
+    print(f"[MAINTENANCE] sessions -{report['sessions_deleted']}, sync_logs -{report['logs_deleted']} "
+          f"({report['log_days_rolled_up']} дн. в сводке), tombstones -{report['tombstones_deleted']}, freed pages {report['freed_pages']} "
+          f"({report['auto_vacuum']}), {report['total_ms']} ms")
+    return report
+
+
+def maintenance_due(db, interval=None):
+    """True, если с последнего запуска прошло не меньше interval секунд."""
+    interval = MAINTENANCE_INTERVAL if interval is None else interval
+    ensure_maintenance_schema(db)
+    db.commit()
+    return db.execute(
+        "SELECT 1 FROM maintenance_runs WHERE started_at > datetime('now', ?) LIMIT 1",
+        (f"-{int(interval * 0.9)} seconds",)
+    ).fetchone() is None
+
+
+def claim_run(db, interval=None):
+    """
+    Занять запуск обслуживания: в одной транзакции BEGIN IMMEDIATE проверить,
+    что с последнего запуска прошло не меньше interval секунд, и вставить строку
+    maintenance_runs. Другой воркер увидит её и запуск пропустит.
+    Returns: id строки или None, если запуск уже занят.
+    """
+    interval = MAINTENANCE_INTERVAL if interval is None else interval
+    ensure_maintenance_schema(db)
+    if db.in_transaction:
+        db.commit()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        recent = db.execute(
+            "SELECT 1 FROM maintenance_runs WHERE started_at > datetime('now', ?) LIMIT 1",
+            (f"-{int(interval * 0.9)} seconds",)
+        ).fetchone()
+        if recent:
+            db.rollback()
+            return None
+        run_id = db.execute("INSERT INTO maintenance_runs (report) VALUES (?)",
+                            (json.dumps({"status": "running"}),)).lastrowid
+        db.commit()
+        return run_id
+    except Exception:
+        db.rollback()
+        raise
+
+
+def run_if_due(db):
+    """Фоновый запуск: пропускается, если обслуживание выполняет или уже выполнил другой воркер."""
+    run_id = claim_run(db)
+    if run_id is None:
+        return None
+    return run_maintenance(db, run_id=run_id)
+
+
+def recent_runs(db, limit=10):
+    """Последние отчёты обслуживания, новые первыми."""
+    ensure_maintenance_schema(db)
+    return [{"id": row[0], "started_at": row[1], **json.loads(row[2])} for row in db.execute(
+        "SELECT id, started_at, report FROM maintenance_runs ORDER BY id DESC LIMIT ?", (limit,)
+    )]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Обслуживание БД сервера синхронизации")
+    parser.add_argument("--db", default=os.path.join(
+        os.environ.get("DATA_DIR") or os.path.dirname(os.path.abspath(__file__)), "family_tree.db"))
+    parser.add_argument("--session-days", type=float, default=None,
+                        help=f"хранить сессии без активности, дней ({SESSION_RETENTION_DAYS})")
+    parser.add_argument("--log-days", type=int, default=None,
+                        help=f"хранить строки sync_logs, дней ({LOG_RETENTION_DAYS})")
+    parser.add_argument("--tombstone-days", type=int, default=None,
+                        help=f"хранить надгробия удалений, дней ({TOMBSTONE_RETENTION_DAYS})")
+    parser.add_argument("--full-vacuum", action="store_true",
+                        help="полный VACUUM и перевод БД в auto_vacuum=INCREMENTAL")
+    parser.add_argument("--json", action="store_true", help="отчёт в JSON")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db, timeout=30)
+    try:
+        report = run_maintenance(conn, args.session_days, args.log_days, args.full_vacuum, args.tombstone_days)
+    finally:
+        conn.close()
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
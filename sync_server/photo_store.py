@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Хранилище фото сервера синхронизации, адресуемое по содержимому.
+
+Фото лежат в таблице photos как сырые байты с ключом SHA-256 (hex).
+Персоны хранят только хеши (persons.photo_hash / photo_full_hash), поэтому
+дерево читается без мегабайт base64, а одинаковое фото хранится один раз.
+"""
+
+import base64
+import binascii
+import hashlib
+import re
+
+# Поля JSON персоны с фото → колонки persons с хешем
+PHOTO_FIELDS = (("photo", "photo_hash"), ("photo_full", "photo_full_hash"))
+
+_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def is_photo_hash(value):
+    """True, если value похож на SHA-256 в hex."""
+    return isinstance(value, str) and bool(_HASH_RE.match(value))
+
+
+def photo_hash(raw):
+    """SHA-256 байтов фото."""
+    return hashlib.sha256(raw).hexdigest()
+
+
+def decode_photo(value):
+    """base64 (в т.ч. data:...;base64,) → bytes или None."""
+    if not value or not isinstance(value, str):
+        return None
+    value = value.strip()
+    if value.startswith("data:") and "," in value:
+        value = value.split(",", 1)[1]
+    try:
+        raw = base64.b64decode(value, validate=False)
+    except (binascii.Error, ValueError):
+        return None
+    return raw or None
+
+
+def encode_photo(raw):
+    """bytes → base64 (формат старых клиентов)."""
+    return base64.b64encode(raw).decode("ascii") if raw else None
+
+
+def photo_mime(raw):
+    """MIME-тип по сигнатуре файла."""
+    if raw[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    if raw[:3] == b"GIF":
+        return "image/gif"
+    if raw[:4] == b"RIFF" and raw[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
+
+
+def bare_photo_hashes(pdata):
+    """Хеши, которые клиент прислал без байтов фото."""
+    return [pdata[hash_field] for field, hash_field in PHOTO_FIELDS
+            if not pdata.get(field) and is_photo_hash(pdata.get(hash_field))]
+
+
+def person_photo_refs(pdata, blobs, owned=None):
+    """
+    Хеши фото персоны (photo_hash, photo_full_hash).
+
+    Байты из base64-полей складываются в blobs {hash: bytes}; если клиент
+    прислал только хеш (фото уже есть на сервере), берётся он — при owned
+    (owned_photo_hashes) лишь хеш, который уже есть в деревьях пользователя
+    или среди байтов этого же запроса, иначе фото считается отсутствующим.
+    """
+    refs = []
+    for field, hash_field in PHOTO_FIELDS:
+        raw = decode_photo(pdata.get(field))
+        if raw is not None:
+            digest = photo_hash(raw)
+            blobs.setdefault(digest, raw)
+            refs.append(digest)
+        elif is_photo_hash(pdata.get(hash_field)) and (
+                owned is None or pdata[hash_field] in owned or pdata[hash_field] in blobs):
+            refs.append(pdata[hash_field])
+        else:
+            refs.append(None)
+    return tuple(refs)
+
+
+def owned_photo_hashes(db, user_id, hashes):
+    """
+    Какие из хешей уже используются в деревьях пользователя.
+
+    Знание хеша не даёт права на фото: get_photo отдаёт фото владельцу дерева,
+    где оно используется, поэтому сослаться на него можно, только имея его.
+    """
+    hashes = list(set(hashes))
+    found = set()
+    for i in range(0, len(hashes), 500):
+        chunk = hashes[i:i + 500]
+        placeholders = ",".join("?" * len(chunk))
+        for row in db.execute(
+            "SELECT p.photo_hash, p.photo_full_hash FROM persons p JOIN family_trees t ON t.id = p.tree_id "
+            f"WHERE t.user_id = ? AND (p.photo_hash IN ({placeholders}) OR p.photo_full_hash IN ({placeholders}))",
+            (user_id, *chunk, *chunk)
+        ):
+            found.update(row)
+    return found
+
+
+def existing_hashes(db, hashes):
+    """Какие из хешей уже есть в photos."""
+    hashes = list(hashes)
+    found = set()
+    for i in range(0, len(hashes), 500):
+        chunk = hashes[i:i + 500]
+        placeholders = ",".join("?" * len(chunk))
+        found.update(row[0] for row in db.execute(
+            f"SELECT hash FROM photos WHERE hash IN ({placeholders})", chunk))
+    return found
+
+
+def store_photos(db, blobs):
+    """Записать новые фото {hash: bytes}. Уже известные пропускаются. → число записанных."""
+    if not blobs:
+        return 0
+    known = existing_hashes(db, blobs)
+    rows = [(digest, raw, photo_mime(raw), len(raw)) for digest, raw in blobs.items() if digest not in known]
+    if rows:
+        db.executemany("INSERT OR IGNORE INTO photos (hash, data, mime, size) VALUES (?, ?, ?, ?)", rows)
+    return len(rows)
+
+
+def load_photos(db, hashes):
+    """{hash: bytes} для перечисленных хешей."""
+    hashes = [h for h in set(hashes) if h]
+    result = {}
+    for i in range(0, len(hashes), 500):
+        chunk = hashes[i:i + 500]
+        placeholders = ",".join("?" * len(chunk))
+        result.update((row[0], row[1]) for row in db.execute(
+            f"SELECT hash, data FROM photos WHERE hash IN ({placeholders})", chunk))
+    return result
+
+
+def migrate_inline_photos(db, batch=200):
+    """
+    Перенести base64 из persons.photo/photo_full в photos.
+
+    Идемпотентно; обрабатывает строки пачками, чтобы не держать в памяти
+    все фото сразу. Возвращает число перенесённых персон.
+    """
+    moved = 0
+    while True:
+        rows = db.execute(
+            "SELECT rowid, photo, photo_full FROM persons "
+            "WHERE (photo IS NOT NULL AND photo != '') OR (photo_full IS NOT NULL AND photo_full != '') "
+            "LIMIT ?", (batch,)
+        ).fetchall()
+        if not rows:
+            break
+        blobs, updates = {}, []
+        for rowid, photo, photo_full in rows:
+            refs = person_photo_refs({"photo": _as_text(photo), "photo_full": _as_text(photo_full)}, blobs)
+            updates.append((refs[0], refs[1], rowid))
+        store_photos(db, blobs)
+        db.executemany(
+            "UPDATE persons SET photo_hash = ?, photo_full_hash = ?, photo = NULL, photo_full = NULL "
+            "WHERE rowid = ?", updates)
+        db.commit()
+        moved += len(rows)
+    if moved:
+        print(f"[PHOTOS] Перенесено фото персон в хранилище: {moved}")
+    return moved
+
+
+def _as_text(value):
+    if isinstance(value, (bytes, bytearray)):
+        try:
+            return value.decode("ascii")
+        except UnicodeDecodeError:
+            return encode_photo(bytes(value))
+    return value
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Присутствие пользователей сервера синхронизации («онлайн» в админке).
+
+require_auth отмечает пользователя в памяти процесса на каждый запрос
+(heartbeat — тоже обычный запрос с токеном): это запись в словарь, без БД.
+Онлайн — тот, кто был виден за последние SYNC_PRESENCE_TIMEOUT секунд (300).
+
+Истечение — по куче (heapq) с отложенным удалением: на пользователя в куче
+одна запись со сроком «последний визит + timeout»; повторные визиты её не
+трогают, а снятая с вершины запись, срок которой успел сдвинуться,
+возвращается в кучу с новым сроком. Поэтому отметка — O(1) для уже
+онлайн-пользователя, а выборка онлайн стоит O(k log n) по числу истёкших,
+а не O(n) по всем, как в Дерево/active_users.py:ActiveUsersTracker.
+
+last_activity сессий (продление токена) пишется в user_sessions пачкой —
+одной транзакцией раз в SYNC_PRESENCE_FLUSH_INTERVAL секунд (5) фоновым
+db_pool.PeriodicJob; токен попадает в пачку не чаще раза в
+SYNC_AUTH_TOUCH_INTERVAL (TokenCache.should_touch). При аварийной остановке
+теряется не больше одной пачки — сессия продлится при следующем запросе.
+"""
+
+import heapq
+import os
+import sqlite3
+import threading
+import time
+
+# Сколько секунд после последнего запроса пользователь считается онлайн
+PRESENCE_TIMEOUT = float(os.environ.get("SYNC_PRESENCE_TIMEOUT", "300"))
+# Период записи last_activity в БД (секунды)
+FLUSH_INTERVAL = float(os.environ.get("SYNC_PRESENCE_FLUSH_INTERVAL", "5"))
+
+
+class PresenceTracker:
+    """Потокобезопасный трекер {user_id: последний визит} с истечением по куче."""
+
+    def __init__(self, timeout=None):
+        self.timeout = PRESENCE_TIMEOUT if timeout is None else timeout
+        self._seen = {}      # user_id -> время последнего визита (epoch)
+        self._heap = []      # (срок, user_id), не больше одной записи на пользователя
+        self._pending = {}   # session_token -> время визита, ещё не записанное в БД
+        self._lock = threading.Lock()
+        self.stats = {"marks": 0, "flushes": 0, "flushed_sessions": 0}
+
+    def mark(self, user_id, token=None, now=None):
+        """Отметить визит; token — сессия, чей last_activity нужно записать в БД."""
+        now = now if now is not None else time.time()
+        with self._lock:
+            self.stats["marks"] += 1
+            if user_id not in self._seen:
+                heapq.heappush(self._heap, (now + self.timeout, user_id))
+            self._seen[user_id] = now
+            if token is not None:
+                self._pending[token] = now
+
+    def _expire(self, now):
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            _, user_id = heapq.heappop(heap)
+            last = self._seen.get(user_id)
+            if last is None:
+                continue  # пользователь уже забыт (forget_user)
+            if last + self.timeout > now:
+                heapq.heappush(heap, (last + self.timeout, user_id))
+            else:
+                del self._seen[user_id]
+
+    def online(self, now=None):
+        """{user_id: время последнего визита} пользователей онлайн."""
+        now = now if now is not None else time.time()
+        with self._lock:
+            self._expire(now)
+            return dict(self._seen)
+
+    def last_seen(self, user_id, now=None):
+        """Время последнего визита или None, если пользователь не онлайн."""
+        now = now if now is not None else time.time()
+        with self._lock:
+            last = self._seen.get(user_id)
+            return last if last is not None and last + self.timeout > now else None
+
+    def forget_user(self, user_id):
+        """Убрать пользователя из онлайн (блокировка, удаление); запись в куче снимется сама."""
+        with self._lock:
+            self._seen.pop(user_id, None)
+
+    def forget_token(self, token):
+        """Не записывать last_activity сессии (выход — строка сессии удалена)."""
+        with self._lock:
+            self._pending.pop(token, None)
+
+    def flush(self, db):
+        """Записать накопленные last_activity одной транзакцией. Returns: число сессий."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            # Время визита, а не момента записи; более свежее значение не затирается
+            db.executemany(
+                "UPDATE user_sessions SET last_activity = datetime(?, 'unixepoch') "
+                "WHERE session_token = ? AND last_activity < datetime(?, 'unixepoch')",
+                [(int(seen), token, int(seen)) for token, seen in pending.items()]
+            )
+            db.commit()
+        except sqlite3.Error:
+            if db.in_transaction:
+                db.rollback()
+            with self._lock:
+                # Вернуть несохранённое в очередь, не затирая визиты, пришедшие за время записи
+                for token, seen in pending.items():
+                    self._pending.setdefault(token, seen)
+            raise
+        with self._lock:
+            self.stats["flushes"] += 1
+            self.stats["flushed_sessions"] += len(pending)
+        return len(pending)
+
+    def get_stats(self):
+        with self._lock:
+            snapshot = dict(self.stats)
+            snapshot["tracked"] = len(self._seen)
+            snapshot["heap"] = len(self._heap)
+            snapshot["pending"] = len(self._pending)
+        return snapshot
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+Таблица рёбер родства relations(tree_id, from_id, to_id, kind).
+
+Рёбра — производный индекс от JSON-колонок persons (они остаются форматом
+дерева для клиентов): kind='parent' — from_id родитель to_id (из списка
+parents ребёнка), kind='spouse' — to_id в spouse_ids персоны from_id.
+Рёбра персоны перестраиваются при каждой её записи (tree_store), поэтому
+предки/потомки, окрестность персоны и счётчики считаются в SQL (рекурсивный
+CTE и индексные выборки) без json.loads всего дерева.
+"""
+
+import json
+
+PARENT = "parent"
+SPOUSE = "spouse"
+
+# Наибольшее число поколений в ответе предков/потомков
+MAX_DEPTH = 100
+# Роли персон в окрестности (neighbourhood)
+SELF = "self"
+ANCESTOR = "ancestor"
+DESCENDANT = "descendant"
+SIBLING = "sibling"
+
+# До этой глубины обход идёт по поколениям прямо в CTE, глубже — по рёбрам
+SHALLOW_DEPTH = 8
+
+RELATIONS_DDL = """
+    CREATE TABLE IF NOT EXISTS relations (
+        tree_id INTEGER NOT NULL,
+        from_id TEXT NOT NULL,
+        to_id TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        PRIMARY KEY (tree_id, kind, from_id, to_id),
+        FOREIGN KEY (tree_id) REFERENCES family_trees (id) ON DELETE CASCADE
+    ) WITHOUT ROWID
+"""
+# PK покрывает обход вниз (родитель → дети), индекс — вверх (ребёнок → родители)
+RELATIONS_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_relations_to ON relations(tree_id, kind, to_id, from_id)",
+)
+
+
+def _ids(value):
+    if isinstance(value, str):
+        try:
+            value = json.loads(value or "[]")
+        except ValueError:
+            return []
+    return [str(x) for x in (value or []) if x is not None and str(x) != ""]
+
+
+def person_edges(tree_id, person_id, parents, spouse_ids):
+    """Рёбра, которые задаёт персона своими parents и spouse_ids (JSON-строки или списки)."""
+    person_id = str(person_id)
+    edges = {(tree_id, parent_id, person_id, PARENT) for parent_id in _ids(parents)}
+    edges.update((tree_id, person_id, spouse_id, SPOUSE) for spouse_id in _ids(spouse_ids))
+    return edges
+
+
+def drop_person_edges(db, tree_id, person_ids):
+    """Удалить рёбра, заданные персонами person_ids (их родители и супруги)."""
+    db.executemany(
+        "DELETE FROM relations WHERE tree_id = ? AND kind = ? AND to_id = ?",
+        ((tree_id, PARENT, pid) for pid in person_ids)
+    )
+    db.executemany(
+        "DELETE FROM relations WHERE tree_id = ? AND kind = ? AND from_id = ?",
+        ((tree_id, SPOUSE, pid) for pid in person_ids)
+    )
+
+
+def write_person_edges(db, tree_id, persons, replaced=None):
+    """
+    Перестроить рёбра записанных персон. persons: {id: (parents, spouse_ids)}.
+
+    replaced — id персон, чьи старые рёбра нужно снять (по умолчанию все из
+    persons; для только что вставленных персон рёбер ещё нет).
+    """
+    if not persons:
+        return
+    drop_person_edges(db, tree_id, list(persons) if replaced is None else replaced)
+    edges = set()
+    for pid, (parents, spouse_ids) in persons.items():
+        edges |= person_edges(tree_id, pid, parents, spouse_ids)
+    db.executemany("INSERT OR IGNORE INTO relations (tree_id, from_id, to_id, kind) VALUES (?, ?, ?, ?)", edges)
+
+
+def rebuild_relations(db, tree_id=None, batch=1000):
+    """
+    Заполнить relations из JSON-колонок persons (миграция существующих БД).
+
+    tree_id=None — все деревья. Транзакцией управляет вызывающий код.
+    Returns: число записанных рёбер.
+    """
+    if tree_id is None:
+        db.execute("DELETE FROM relations")
+        cursor = db.execute("SELECT tree_id, id, parents, spouse_ids FROM persons")
+    else:
+        db.execute("DELETE FROM relations WHERE tree_id = ?", (tree_id,))
+        cursor = db.execute("SELECT tree_id, id, parents, spouse_ids FROM persons WHERE tree_id = ?", (tree_id,))
+    written = 0
+    while True:
+        rows = cursor.fetchmany(batch)
+        if not rows:
+            return written
+        edges = set()
+        for row in rows:
+            edges |= person_edges(row[0], row[1], row[2], row[3])
+        db.executemany("INSERT OR IGNORE INTO relations (tree_id, from_id, to_id, kind) VALUES (?, ?, ?, ?)",
+                       edges)
+        written += len(edges)
+
+
+def _walk_levels(db, tree_id, person_id, max_depth, start, step):
+    # Строка CTE — (id, поколение): UNION отсекает повторы только внутри поколения,
+    # поэтому годится для неглубоких запросов (строк не больше N × max_depth)
+    rows = db.execute(f"""
+        WITH RECURSIVE walk(id, depth) AS (
+            SELECT {start}, 1 FROM relations
+            WHERE tree_id = :tree AND kind = :kind AND {step} = :person
+            UNION
+            SELECT r.{start}, w.depth + 1 FROM relations r JOIN walk w ON r.{step} = w.id
+            WHERE r.tree_id = :tree AND r.kind = :kind AND w.depth < :max_depth
+        )
+        SELECT id, MIN(depth) FROM walk WHERE id != :person GROUP BY id
+    """, {"tree": tree_id, "kind": PARENT, "person": person_id, "max_depth": max_depth}).fetchall()
+    return dict(rows)
+
+
+def _walk_edges(db, tree_id, person_id, max_depth, start, step):
+    # Строка CTE — пройденное ребро: каждое ребро один раз (O(E) при любой
+    # глубине и общих предках), поколение — обход в ширину по этим рёбрам
+    rows = db.execute(f"""
+        WITH RECURSIVE walk(id, via) AS (
+            SELECT {start}, {step} FROM relations
+            WHERE tree_id = :tree AND kind = :kind AND {step} = :person
+            UNION
+            SELECT r.{start}, r.{step} FROM relations r JOIN walk w ON r.{step} = w.id
+            WHERE r.tree_id = :tree AND r.kind = :kind
+        )
+        SELECT id, via FROM walk
+    """, {"tree": tree_id, "kind": PARENT, "person": person_id}).fetchall()
+    nxt = {}
+    for pid, via in rows:
+        nxt.setdefault(via, []).append(pid)
+    generation = {person_id: 0}
+    frontier = [person_id]
+    depth = 0
+    while frontier and depth < max_depth:
+        depth += 1
+        level = []
+        for pid in frontier:
+            for other in nxt.get(pid, ()):
+                if other not in generation:
+                    generation[other] = depth
+                    level.append(other)
+        frontier = level
+    del generation[person_id]
+    return generation
+
+
+def _walk(db, tree_id, person_id, max_depth, up):
+    """[{id, generation}] по рёбрам parent вверх (up) или вниз, не глубже max_depth."""
+    # up: от ребёнка к родителям (to_id → from_id), иначе от родителя к детям
+    start, step = ("from_id", "to_id") if up else ("to_id", "from_id")
+    walk = _walk_levels if max_depth <= SHALLOW_DEPTH else _walk_edges
+    generation = walk(db, tree_id, str(person_id), max_depth, start, step)
+    return [{"id": pid, "generation": gen}
+            for pid, gen in sorted(generation.items(), key=lambda item: (item[1], item[0]))]
+
+
+def ancestors(db, tree_id, person_id, max_depth=MAX_DEPTH):
+    """Предки [{id, generation}]: generation 1 — родители, 2 — деды (кратчайший путь)."""
+    return _walk(db, tree_id, person_id, max_depth, up=True)
+
+
+def descendants(db, tree_id, person_id, max_depth=MAX_DEPTH):
+    """Потомки [{id, generation}]: generation 1 — дети, 2 — внуки."""
+    return _walk(db, tree_id, person_id, max_depth, up=False)
+
+
+def _adjacent(db, tree_id, kind, ids, forward, batch=500):
+    """Соседи ids по рёбрам kind: forward — from_id → to_id, иначе to_id → from_id."""
+    src, dst = ("from_id", "to_id") if forward else ("to_id", "from_id")
+    ids = list(ids)
+    found = set()
+    for i in range(0, len(ids), batch):
+        chunk = ids[i:i + batch]
+        marks = ",".join("?" * len(chunk))
+        found.update(row[0] for row in db.execute(
+            f"SELECT {dst} FROM relations WHERE tree_id = ? AND kind = ? AND {src} IN ({marks})",
+            [tree_id, kind, *chunk]
+        ))
+    return found
+
+
+def neighbourhood(db, tree_id, person_id, up=2, down=2, siblings=1):
+    """
+    Окрестность персоны {id: роль} для быстрой первой отрисовки.
+
+    Персона (self), предки до up поколений, потомки до down, братья и сёстры
+    персоны и её предков до siblings поколений (1 — свои, 2 — ещё дяди/тёти)
+    и супруги всех найденных (spouse). Роль — ближайшая по этому порядку.
+    """
+    person_id = str(person_id)
+    found = {person_id: SELF}
+    if up > 0:
+        for p in ancestors(db, tree_id, person_id, up):
+            found.setdefault(p["id"], ANCESTOR)
+    if down > 0:
+        for p in descendants(db, tree_id, person_id, down):
+            found.setdefault(p["id"], DESCENDANT)
+    line = {person_id}
+    for _ in range(siblings):
+        line = _adjacent(db, tree_id, PARENT, line, forward=False)
+        for sibling_id in _adjacent(db, tree_id, PARENT, line, forward=True):
+            found.setdefault(sibling_id, SIBLING)
+    spouses = _adjacent(db, tree_id, SPOUSE, found, True) | _adjacent(db, tree_id, SPOUSE, found, False)
+    for spouse_id in spouses:
+        found.setdefault(spouse_id, SPOUSE)
+    return found
+
+
+def attach_names(db, tree_id, persons, batch=500):
+    """Дописать name/surname в найденные персоны (по первичному ключу, пачками)."""
+    by_id = {p["id"]: p for p in persons}
+    ids = list(by_id)
+    for i in range(0, len(ids), batch):
+        chunk = ids[i:i + batch]
+        marks = ",".join("?" * len(chunk))
+        for pid, name, surname in db.execute(
+            f"SELECT id, name, surname FROM persons WHERE tree_id = ? AND id IN ({marks})", [tree_id, *chunk]
+        ):
+            by_id[pid]["name"] = name
+            by_id[pid]["surname"] = surname
+    return persons
+
+
+def relation_counts(db, tree_id):
+    """{'parent': N, 'spouse': M} — число рёбер дерева по видам."""
+    counts = {PARENT: 0, SPOUSE: 0}
+    for kind, count in db.execute(
+        "SELECT kind, COUNT(*) FROM relations WHERE tree_id = ? GROUP BY kind", (tree_id,)
+    ):
+        counts[kind] = count
+    return counts
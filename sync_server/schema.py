@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Миграции схемы БД сервера синхронизации.
+
+ensure_schema() идемпотентна: добавляет недостающие колонки, таблицы и индексы
+в уже существующую БД. Вызывается при старте сервера после init_db().
+"""
+
+from photo_store import migrate_inline_photos
+from relations import RELATIONS_DDL, RELATIONS_INDEXES, rebuild_relations
+from maintenance import ensure_maintenance_schema
+from stats_store import ensure_stats_schema
+
+
+def table_columns(db, table):
+    """Список колонок таблицы."""
+    return [row[1] for row in db.execute(f"PRAGMA table_info({table})").fetchall()]
+
+
+def _add_column(db, table, column, ddl, columns):
+    if column not in columns:
+        db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+        columns.append(column)
+        print(f"[SCHEMA] {table}.{column} добавлена")
+
+
+def _create_person_indexes(db):
+    db.execute("CREATE INDEX IF NOT EXISTS idx_persons_tree_revision ON persons(tree_id, revision)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_persons_photo_hash ON persons(photo_hash)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_persons_photo_full_hash ON persons(photo_full_hash)")
+
+
+def _persons_key_is_composite(db):
+    """PRIMARY KEY (tree_id, id) у persons (до миграции ключ — глобальный id)."""
+    pk = {row[1]: row[5] for row in db.execute("PRAGMA table_info(persons)")}
+    return pk.get("tree_id") == 1 and pk.get("id") == 2
+
+
+def migrate_persons_key(db):
+    """
+    Перестроить persons с составным ключом (tree_id, id).
+
+    Старый PRIMARY KEY id глобален: одинаковые id персон в разных деревьях
+    перезаписывали друг друга. SQLite не меняет ключ через ALTER, поэтому
+    таблица пересоздаётся с теми же колонками и копированием строк (rowid
+    сохраняется). Идемпотентна. Returns: True, если миграция выполнена.
+    """
+    if _persons_key_is_composite(db):
+        return False
+    columns = []
+    names = []
+    for _, name, col_type, notnull, default, _pk in db.execute("PRAGMA table_info(persons)"):
+        ddl = f"{name} {col_type or ''}".strip()
+        if notnull or name in ("id", "tree_id"):
+            ddl += " NOT NULL"
+        if default is not None:
+            ddl += f" DEFAULT {default}"
+        columns.append(ddl)
+        names.append(name)
+    column_list = ", ".join(names)
+    db.execute("DROP TABLE IF EXISTS persons_new")
+    db.execute(f"""
+        CREATE TABLE persons_new (
+            {", ".join(columns)},
+            PRIMARY KEY (tree_id, id),
+            FOREIGN KEY (tree_id) REFERENCES family_trees (id) ON DELETE CASCADE
+        )
+    """)
+    db.execute(f"INSERT INTO persons_new (rowid, {column_list}) SELECT rowid, {column_list} FROM persons")
+    db.execute("DROP TABLE persons")
+    db.execute("ALTER TABLE persons_new RENAME TO persons")
+    db.commit()
+    print("[SCHEMA] persons: ключ (tree_id, id)")
+    return True
+
+
+def ensure_schema(db):
+    """Привести схему существующей БД к актуальной версии."""
+    person_columns = table_columns(db, "persons")
+    if not person_columns:
+        return
+    _add_column(db, "persons", "photo_full", "BLOB", person_columns)
+    _add_column(db, "persons", "created_at", "TIMESTAMP", person_columns)
+    _add_column(db, "persons", "updated_at", "TIMESTAMP", person_columns)
+    # Хеш содержимого строки: позволяет не перезаписывать неизменённые персоны
+    _add_column(db, "persons", "row_hash", "TEXT", person_columns)
+
+    db.execute("CREATE INDEX IF NOT EXISTS idx_marriages_tree_pair ON marriages(tree_id, person1_id, person2_id)")
+
+    # Ревизии для дельта-синхронизации (/api/sync/changes, /api/sync/delta)
+    tree_columns = table_columns(db, "family_trees")
+    _add_column(db, "family_trees", "revision", "INTEGER DEFAULT 0", tree_columns)
+    # Надгробия с ревизией ниже tombstone_floor удалены — клиенту нужен полный снимок
+    _add_column(db, "family_trees", "tombstone_floor", "INTEGER DEFAULT 0", tree_columns)
+    _add_column(db, "persons", "revision", "INTEGER DEFAULT 0", person_columns)
+    marriage_columns = table_columns(db, "marriages")
+    _add_column(db, "marriages", "revision", "INTEGER DEFAULT 0", marriage_columns)
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS sync_tombstones (
+            tree_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            entity_id TEXT NOT NULL,
+            revision INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (tree_id, kind, entity_id),
+            FOREIGN KEY (tree_id) REFERENCES family_trees (id) ON DELETE CASCADE
+        )
+    """)
+    # Время надгробия: обслуживание удаляет старые и поднимает tombstone_floor
+    tombstone_columns = table_columns(db, "sync_tombstones")
+    if "created_at" not in tombstone_columns:
+        _add_column(db, "sync_tombstones", "created_at", "TIMESTAMP", tombstone_columns)
+        db.execute("UPDATE sync_tombstones SET created_at = CURRENT_TIMESTAMP")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_marriages_tree_revision ON marriages(tree_id, revision)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_tombstones_tree_revision ON sync_tombstones(tree_id, revision)")
+
+    # Фото по SHA-256 (photo_store): в persons — только хеши
+    _add_column(db, "persons", "photo_hash", "TEXT", person_columns)
+    _add_column(db, "persons", "photo_full_hash", "TEXT", person_columns)
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS photos (
+            hash TEXT PRIMARY KEY,
+            data BLOB NOT NULL,
+            mime TEXT,
+            size INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    _create_person_indexes(db)
+
+    # require_auth ищет сессию по токену
+    db.execute("CREATE INDEX IF NOT EXISTS idx_sessions_token ON user_sessions(session_token)")
+    # Дерево пользователя (загрузка, /api/auth/introspect) — по индексу, не перебором деревьев
+    db.execute("CREATE INDEX IF NOT EXISTS idx_trees_user ON family_trees(user_id)")
+    if table_columns(db, "sync_logs"):
+        db.execute("CREATE INDEX IF NOT EXISTS idx_sync_logs_user_created ON sync_logs(user_id, created_at)")
+        # Последняя синхронизация для сводки деревьев админки: sync_logs обслуживание
+        # удаляет через LOG_RETENTION_DAYS, поэтому время хранится у пользователя (log_sync)
+        user_columns = table_columns(db, "users")
+        if "last_sync" not in user_columns:
+            _add_column(db, "users", "last_sync", "TIMESTAMP", user_columns)
+            db.execute("UPDATE users SET last_sync = "
+                       "(SELECT MAX(s.created_at) FROM sync_logs s WHERE s.user_id = users.id)")
+        # Счётчики и дневная сводка для /api/admin/stats (заполняет stats_store.reconcile)
+        ensure_stats_schema(db)
+    ensure_maintenance_schema(db)
+    db.commit()
+    migrate_inline_photos(db)
+
+    # Составной ключ persons (tree_id, id) и рёбра родства relations
+    if migrate_persons_key(db):
+        _create_person_indexes(db)
+    # Ключ (tree_id, id) покрывает поиск по tree_id
+    db.execute("DROP INDEX IF EXISTS idx_persons_tree")
+    has_relations = db.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'relations'"
+    ).fetchone()
+    db.execute(RELATIONS_DDL)
+    for ddl in RELATIONS_INDEXES:
+        db.execute(ddl)
+    if not has_relations:
+        edges = rebuild_relations(db)
+        print(f"[SCHEMA] relations заполнена: {edges} рёбер")
+    db.commit()
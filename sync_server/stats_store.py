@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Материализованная статистика админки: счётчики и дневная сводка синхронизаций.
+
+counters(name, value) — число пользователей, активных пользователей, деревьев
+и персон; sync_daily(day, ...) — синхронизации, сущности и входы за день.
+Обе таблицы обновляются в тех же транзакциях, что и исходные записи
+(регистрация, вход, загрузка дерева, удаление пользователя), поэтому
+/api/admin/stats читает несколько строк вместо COUNT(*) по таблицам.
+
+reconcile() пересчитывает счётчики с нуля и исправляет расхождения —
+при старте сервера и фоном (db_pool.PeriodicJob): записи в обход API
+(скрипты обслуживания, init_db) не дают счётчикам «уплыть» надолго.
+"""
+
+import os
+
+USERS = "users"
+ACTIVE_USERS = "active_users"
+TREES = "trees"
+PERSONS = "persons"
+
+# Счётчик → запрос, считающий его с нуля
+COUNTER_QUERIES = {
+    USERS: "SELECT COUNT(*) FROM users",
+    ACTIVE_USERS: "SELECT COUNT(*) FROM users WHERE is_active = 1",
+    TREES: "SELECT COUNT(*) FROM family_trees",
+    PERSONS: "SELECT COUNT(*) FROM persons",
+}
+
+# Период фоновой сверки счётчиков (секунды); 0 — только при старте
+RECONCILE_INTERVAL = int(os.environ.get("SYNC_STATS_RECONCILE_INTERVAL", "3600"))
+
+
+def ensure_stats_schema(db):
+    """Создать таблицы счётчиков и индексы для «последних» списков админки."""
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """)
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS sync_daily (
+            day TEXT PRIMARY KEY,
+            sync_count INTEGER NOT NULL DEFAULT 0,
+            total_entities INTEGER NOT NULL DEFAULT 0,
+            logins INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """)
+    # Последние регистрации/синхронизации и активные сессии — по индексу, без сортировки таблиц
+    db.execute("CREATE INDEX IF NOT EXISTS idx_users_created ON users(created_at)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_sync_logs_created ON sync_logs(created_at)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_sessions_activity ON user_sessions(last_activity, user_id)")
+
+
+def bump(db, **deltas):
+    """Изменить счётчики на deltas (например, bump(db, users=1, active_users=1))."""
+    db.executemany(
+        "INSERT INTO counters (name, value) VALUES (?, ?) "
+        "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+        [(name, delta) for name, delta in deltas.items() if delta]
+    )
+
+
+def _bump_day(db, sync_count=0, total_entities=0, logins=0):
+    db.execute(
+        "INSERT INTO sync_daily (day, sync_count, total_entities, logins) VALUES (date('now'), ?, ?, ?) "
+        "ON CONFLICT(day) DO UPDATE SET sync_count = sync_count + excluded.sync_count, "
+        "total_entities = total_entities + excluded.total_entities, logins = logins + excluded.logins",
+        (sync_count, total_entities, logins)
+    )
+
+
+def log_sync(db, user_id, action, status, entities_count=None, duration_ms=None, error_message=None):
+    """
+    Запись в sync_logs, users.last_sync и дневную сводку
+    (транзакцией управляет вызывающий код).
+    """
+    db.execute(
+        "INSERT INTO sync_logs (user_id, action, entities_count, sync_duration_ms, status, error_message) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (user_id, action, entities_count, duration_ms, status, error_message)
+    )
+    db.execute("UPDATE users SET last_sync = CURRENT_TIMESTAMP WHERE id = ?", (user_id,))
+    _bump_day(db, sync_count=1, total_entities=entities_count or 0)
+
+
+def record_login(db):
+    """Учесть вход в дневной сводке."""
+    _bump_day(db, logins=1)
+
+
+def read_counters(db):
+    """{имя: значение} всех счётчиков (отсутствующие — 0)."""
+    counters = dict.fromkeys(COUNTER_QUERIES, 0)
+    counters.update(db.execute("SELECT name, value FROM counters").fetchall())
+    return counters
+
+
+def daily_activity(db, days=30):
+    """Сводка синхронизаций за последние days дней, новые дни первыми."""
+    rows = db.execute(
+        "SELECT day, sync_count, total_entities, logins FROM sync_daily "
+        "WHERE day > date('now', ?) ORDER BY day DESC", (f"-{int(days)} days",)
+    ).fetchall()
+    return [{"date": day, "sync_count": count, "total_entities": entities, "logins": logins}
+            for day, count, entities, logins in rows]
+
+
+def reconcile(db):
+    """
+    Пересчитать счётчики и дневную сводку синхронизаций с нуля, исправить расхождения.
+
+    Дни сводки сверяются только за период, который ещё есть в sync_logs
+    (старые логи может удалять обслуживание БД); входы не сверяются — их
+    источник не хранится. Returns: {имя: (было, стало)} для исправленных
+    счётчиков и {'sync_daily:<день>': ...} для дней.
+    """
+    drift = {}
+    # Запись блокируется на время сверки: счётчики не меняются между COUNT и исправлением
+    if not db.in_transaction:
+        db.execute("BEGIN IMMEDIATE")
+    stored = read_counters(db)
+    for name, query in COUNTER_QUERIES.items():
+        actual = db.execute(query).fetchone()[0]
+        if stored[name] != actual:
+            drift[name] = (stored[name], actual)
+    bump(db, **{name: actual - was for name, (was, actual) in drift.items()})
+
+    days = db.execute("""
+        SELECT date(created_at), COUNT(*), IFNULL(SUM(entities_count), 0) FROM sync_logs
+        GROUP BY date(created_at)
+    """).fetchall()
+    stored_days = {row[0]: (row[1], row[2]) for row in db.execute(
+        "SELECT day, sync_count, total_entities FROM sync_daily WHERE day >= ?",
+        (min((d[0] for d in days), default="9999"),)
+    )}
+    for day, count, entities in days:
+        if stored_days.get(day, (0, 0)) != (count, entities):
+            drift[f"sync_daily:{day}"] = (stored_days.get(day, (0, 0)), (count, entities))
+            db.execute(
+                "INSERT INTO sync_daily (day, sync_count, total_entities) VALUES (?, ?, ?) "
+                "ON CONFLICT(day) DO UPDATE SET sync_count = excluded.sync_count, "
+                "total_entities = excluded.total_entities",
+                (day, count, entities)
+            )
+    db.commit()
+    if drift:
+        print(f"[STATS] Расхождение счётчиков исправлено: {drift}")
+    return drift
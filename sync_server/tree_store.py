@@ -0,0 +1,689 @@
+# -*- coding: utf-8 -*-
+"""
+Запись дерева в БД сервера синхронизации.
+
+replace_tree() приводит персоны и браки дерева к присланному состоянию одним
+набором пакетных запросов (executemany) и возвращает счётчики изменений.
+apply_delta() применяет только изменённые/удалённые сущности, changes_since()
+отдаёт изменения после ревизии клиента, edit_tree() — точечные правки одной
+персоны, связи или брака (tree_edits), iter_persons()/iter_marriages() —
+строки дерева для потоковой выдачи, load_persons()/person_page() — выбранные
+персоны и страницы дерева по курсору (прогрессивная загрузка),
+tree_summaries()/iter_admin_trees() — сводка деревьев для админки.
+
+Ревизии: у дерева монотонный счётчик family_trees.revision; каждая запись,
+изменившая дерево, увеличивает его на 1 и проставляет новую ревизию всем
+затронутым строкам persons/marriages. Удаления запоминаются в sync_tombstones.
+Рёбра relations записанных и удалённых персон и счётчик персон (stats_store)
+обновляются в той же транзакции.
+Транзакцией управляет вызывающий код.
+"""
+
+import base64
+import hashlib
+import json
+
+from photo_store import (
+    bare_photo_hashes, encode_photo, load_photos, owned_photo_hashes, person_photo_refs, store_photos,
+)
+from relations import drop_person_edges, write_person_edges
+from stats_store import bump
+from tree_edits import TreeEdit
+
+# Колонки persons в порядке параметров INSERT/UPDATE (кроме id и tree_id).
+# Фото хранятся в photos по SHA-256, в строке персоны — только хеши.
+PERSON_FIELDS = (
+    "name", "surname", "patronymic", "birth_date", "death_date",
+    "is_deceased", "gender", "photo_path", "photo_hash", "photo_full_hash", "birth_place", "biography",
+    "burial_place", "burial_date", "occupation", "education", "address", "notes",
+    "phone", "email", "vk", "telegram", "whatsapp", "blood_type", "rh_factor",
+    "allergies", "chronic_conditions", "links", "photo_album", "parents",
+    "children", "spouse_ids", "collapsed_branches",
+)
+
+_TEXT_FIELDS = {
+    "name", "surname", "patronymic", "birth_date", "death_date", "gender", "photo_path",
+    "birth_place", "biography", "burial_place", "burial_date", "occupation", "education",
+    "address", "notes", "phone", "email", "vk", "telegram", "whatsapp", "blood_type",
+    "rh_factor", "allergies", "chronic_conditions",
+}
+
+# Колонки для чтения дерева: без устаревших base64-колонок photo/photo_full
+PERSON_COLUMNS = ", ".join(("id",) + PERSON_FIELDS)
+
+_INSERT_PERSON_SQL = (
+    f"INSERT OR REPLACE INTO persons (id, tree_id, {', '.join(PERSON_FIELDS)}, row_hash, revision, updated_at) "
+    f"VALUES (?, ?, {', '.join('?' * len(PERSON_FIELDS))}, ?, ?, CURRENT_TIMESTAMP)"
+)
+_UPDATE_PERSON_SQL = (
+    f"UPDATE persons SET {', '.join(f'{c} = ?' for c in PERSON_FIELDS)}, "
+    f"row_hash = ?, revision = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ? AND tree_id = ?"
+)
+
+# Виды записей в sync_tombstones
+PERSON = "person"
+MARRIAGE = "marriage"
+
+
+def person_values(pdata, photo_refs=(None, None)):
+    """Значения колонок persons (в порядке PERSON_FIELDS) из JSON персоны.
+
+    photo_refs — (photo_hash, photo_full_hash) из photo_store.person_photo_refs().
+    """
+    values = []
+    for field in PERSON_FIELDS:
+        if field in _TEXT_FIELDS:
+            values.append(pdata.get(field, ''))
+        elif field == "photo_hash":
+            values.append(photo_refs[0])
+        elif field == "photo_full_hash":
+            values.append(photo_refs[1])
+        elif field in ("is_deceased", "collapsed_branches"):
+            values.append(1 if pdata.get(field) else 0)
+        elif field in ("links", "photo_album"):
+            values.append(json.dumps(pdata.get(field, [])))
+        else:  # parents, children, spouse_ids
+            values.append(json.dumps(list(pdata.get(field, []))))
+    return values
+
+
+def row_hash(values):
+    """Хеш содержимого строки персоны (для поиска неизменённых записей)."""
+    raw = json.dumps(values, ensure_ascii=False, default=str, separators=(',', ':'))
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def person_from_row(row):
+    """Строка persons → JSON персоны (формат /api/sync/download).
+
+    Байты фото не включаются: photo/photo_full = None, клиент получает их
+    по photo_hash/photo_full_hash (GET /api/photos/<hash>) или через attach_photos().
+    """
+    return {
+        'name': row['name'],
+        'surname': row['surname'],
+        'patronymic': row['patronymic'] or '',
+        'birth_date': row['birth_date'] or '',
+        'death_date': row['death_date'] or '',
+        'is_deceased': bool(row['is_deceased']),
+        'gender': row['gender'] or '',
+        'photo_path': row['photo_path'] or '',
+        'photo': None,
+        'photo_full': None,
+        'photo_hash': row['photo_hash'],
+        'photo_full_hash': row['photo_full_hash'],
+        'birth_place': row['birth_place'] or '',
+        'biography': row['biography'] or '',
+        'burial_place': row['burial_place'] or '',
+        'burial_date': row['burial_date'] or '',
+        'occupation': row['occupation'] or '',
+        'education': row['education'] or '',
+        'address': row['address'] or '',
+        'notes': row['notes'] or '',
+        'phone': row['phone'] or '',
+        'email': row['email'] or '',
+        'vk': row['vk'] or '',
+        'telegram': row['telegram'] or '',
+        'whatsapp': row['whatsapp'] or '',
+        'blood_type': row['blood_type'] or '',
+        'rh_factor': row['rh_factor'] or '',
+        'allergies': row['allergies'] or '',
+        'chronic_conditions': row['chronic_conditions'] or '',
+        'links': json.loads(row['links'] or '[]'),
+        'photo_album': json.loads(row['photo_album'] or '[]'),
+        'parents': json.loads(row['parents'] or '[]'),
+        'children': json.loads(row['children'] or '[]'),
+        'spouse_ids': json.loads(row['spouse_ids'] or '[]'),
+        'collapsed_branches': bool(row['collapsed_branches'])
+    }
+
+
+def attach_photos(db, persons):
+    """Вставить base64 фото в JSON персон (для клиентов, которым нужны байты в дереве)."""
+    hashes = [p.get(k) for p in persons.values() for k in ('photo_hash', 'photo_full_hash')]
+    blobs = load_photos(db, hashes)
+    for pdata in persons.values():
+        pdata['photo'] = encode_photo(blobs.get(pdata.get('photo_hash')))
+        pdata['photo_full'] = encode_photo(blobs.get(pdata.get('photo_full_hash')))
+    return persons
+
+
+def iter_persons(db, tree_id, include_photos=False, batch=500):
+    """(id, JSON персоны) дерева пачками по batch строк — без словаря всех персон в памяти."""
+    cursor = db.execute(f'SELECT {PERSON_COLUMNS} FROM persons WHERE tree_id = ?', (tree_id,))
+    while True:
+        rows = cursor.fetchmany(batch)
+        if not rows:
+            return
+        persons = {row['id']: person_from_row(row) for row in rows}
+        if include_photos:
+            attach_photos(db, persons)
+        yield from persons.items()
+
+
+def iter_marriages(db, tree_id):
+    """Браки дерева в формате /api/sync/download."""
+    for row in db.execute('SELECT person1_id, person2_id, marriage_date FROM marriages WHERE tree_id = ?',
+                          (tree_id,)):
+        yield {'persons': [row['person1_id'], row['person2_id']], 'date': row['marriage_date'] or ''}
+
+
+def load_persons(db, tree_id, ids, include_photos=False, batch=500):
+    """{id: JSON персоны} для выбранных id (по первичному ключу, пачками)."""
+    ids = list(ids)
+    persons = {}
+    for i in range(0, len(ids), batch):
+        chunk = ids[i:i + batch]
+        marks = ",".join("?" * len(chunk))
+        for row in db.execute(f'SELECT {PERSON_COLUMNS} FROM persons WHERE tree_id = ? AND id IN ({marks})',
+                              [tree_id, *chunk]):
+            persons[row['id']] = person_from_row(row)
+    if include_photos:
+        attach_photos(db, persons)
+    return persons
+
+
+def marriages_of(db, tree_id, ids, both=False, batch=500):
+    """
+    Браки, где person1_id среди ids (both=True — оба супруга среди ids).
+
+    Брак хранится один раз под person1_id, поэтому при обходе дерева
+    страницами каждый брак попадает ровно в одну страницу.
+    """
+    ids = list(ids)
+    wanted = set(ids)
+    marriages = []
+    for i in range(0, len(ids), batch):
+        chunk = ids[i:i + batch]
+        marks = ",".join("?" * len(chunk))
+        for row in db.execute(
+            f'SELECT person1_id, person2_id, marriage_date FROM marriages '
+            f'WHERE tree_id = ? AND person1_id IN ({marks})', [tree_id, *chunk]
+        ):
+            if not both or row['person2_id'] in wanted:
+                marriages.append({'persons': [row['person1_id'], row['person2_id']],
+                                  'date': row['marriage_date'] or ''})
+    return marriages
+
+
+def encode_cursor(revision, after):
+    """Курсор страницы дерева: ревизия снимка и последний выданный id."""
+    raw = json.dumps([revision, after], ensure_ascii=False).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Курсор → (ревизия, после какого id). ValueError — испорченный курсор."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        revision, after = json.loads(raw)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f'Неверный курсор: {cursor!r}') from e
+    if not isinstance(revision, int) or not isinstance(after, str):
+        raise ValueError(f'Неверный курсор: {cursor!r}')
+    return revision, after
+
+
+def person_page(db, tree_id, after='', limit=500, include_photos=False):
+    """
+    Страница персон дерева по возрастанию id после after (ключевая пагинация
+    по первичному ключу (tree_id, id) — без OFFSET и полного чтения дерева).
+
+    Returns: (persons {id: JSON}, последний id страницы или None, если страниц больше нет).
+    """
+    rows = db.execute(f'SELECT {PERSON_COLUMNS} FROM persons WHERE tree_id = ? AND id > ? ORDER BY id LIMIT ?',
+                      (tree_id, after, limit + 1)).fetchall()
+    more = len(rows) > limit
+    persons = {row['id']: person_from_row(row) for row in rows[:limit]}
+    if include_photos:
+        attach_photos(db, persons)
+    return persons, (rows[limit - 1]['id'] if more else None)
+
+
+# Примерный объём дерева в ответе /api/sync/download без фото: сумма длин полей персон
+_PAYLOAD_SIZE_SQL = " + ".join(
+    f"IFNULL(LENGTH({c}), 0)" for c in PERSON_FIELDS if c not in ("is_deceased", "collapsed_branches")
+)
+
+_TREE_SUMMARY_SQL = f"""
+    SELECT t.id, t.user_id, u.login AS user_login, t.name, t.created_at, t.updated_at,
+           IFNULL(t.revision, 0) AS revision,
+           (SELECT COUNT(*) FROM persons p WHERE p.tree_id = t.id) AS persons_count,
+           (SELECT COUNT(*) FROM marriages m WHERE m.tree_id = t.id) AS marriages_count,
+           (SELECT IFNULL(SUM({_PAYLOAD_SIZE_SQL}), 0) FROM persons p WHERE p.tree_id = t.id) AS size,
+           u.last_sync
+    FROM family_trees t JOIN users u ON u.id = t.user_id
+    WHERE t.id > ? {{where}}
+    ORDER BY t.id
+    LIMIT ?
+"""
+
+# Поля персоны в списке персон админки
+_ADMIN_PERSON_SQL = (
+    "SELECT tree_id, id, name, surname, patronymic, gender, birth_date, is_deceased, death_date, "
+    "parents, children, spouse_ids FROM persons WHERE tree_id IN ({marks}) ORDER BY tree_id"
+)
+
+
+def tree_summaries(db, after=0, limit=-1, user_id=None, active_only=True):
+    """
+    Сводка деревьев одним запросом: владелец, число персон и браков, примерный
+    размер, последняя синхронизация. Счётчики — коррелированные подзапросы
+    по индексам (tree_id, ...), без чтения деревьев в Python.
+
+    after — id дерева, после которого начинается страница (порядок по id);
+    limit=-1 — без ограничения.
+    """
+    where, params = "", []
+    if user_id is not None:
+        where += " AND t.user_id = ?"
+        params.append(user_id)
+    if active_only:
+        where += " AND u.is_active = 1"
+    rows = db.execute(_TREE_SUMMARY_SQL.format(where=where), (after, *params, limit)).fetchall()
+    return [dict(row) for row in rows]
+
+
+def _admin_person(row):
+    return {
+        'id': row['id'],
+        'name': row['name'],
+        'surname': row['surname'],
+        'patronymic': row['patronymic'],
+        'gender': row['gender'],
+        'birth_date': row['birth_date'],
+        'is_deceased': bool(row['is_deceased']),
+        'death_date': row['death_date'],
+        'parents': json.loads(row['parents']) if row['parents'] else [],
+        'children': json.loads(row['children']) if row['children'] else [],
+        'spouse_ids': json.loads(row['spouse_ids']) if row['spouse_ids'] else [],
+    }
+
+
+def _grouped(rows, key):
+    """Разложить строки, отсортированные по key, по значениям key (генератор на каждое значение)."""
+    rows = iter(rows)
+    head = [next(rows, None)]
+
+    def take(value):
+        # Строки предыдущих значений, которые никто не запросил, пропускаются
+        while head[0] is not None and head[0][key] < value:
+            head[0] = next(rows, None)
+        while head[0] is not None and head[0][key] == value:
+            yield head[0]
+            head[0] = next(rows, None)
+    return take
+
+
+def iter_admin_trees(db, summaries):
+    """
+    Сводки деревьев с персонами и браками для потоковой выдачи.
+
+    Персоны и браки всех деревьев страницы читаются двумя запросами,
+    отсортированными по tree_id, и раздаются деревьям по мере сериализации.
+    summaries должны идти по возрастанию id (как из tree_summaries()).
+    """
+    tree_ids = [s['id'] for s in summaries]
+    if not tree_ids:
+        return
+    marks = ",".join("?" * len(tree_ids))
+    persons = _grouped(db.execute(_ADMIN_PERSON_SQL.format(marks=marks), tree_ids), 'tree_id')
+    marriages = _grouped(db.execute(
+        f'SELECT tree_id, person1_id, person2_id, marriage_date FROM marriages '
+        f'WHERE tree_id IN ({marks}) ORDER BY tree_id', tree_ids
+    ), 'tree_id')
+    for summary in summaries:
+        tree_id = summary['id']
+        tree_persons = ((row['id'], _admin_person(row)) for row in persons(tree_id))
+        tree_marriages = ({'persons': [row['person1_id'], row['person2_id']], 'date': row['marriage_date']}
+                          for row in marriages(tree_id))
+        yield summary, tree_persons, tree_marriages
+
+
+def marriage_key(person1_id, person2_id):
+    """Идентификатор брака в sync_tombstones."""
+    return json.dumps([str(person1_id), str(person2_id)], ensure_ascii=False)
+
+
+def _normalize_marriages(marriages):
+    """Браки из JSON → {(person1_id, person2_id): date} (дубликаты схлопываются)."""
+    result = {}
+    if not isinstance(marriages, list):
+        return result
+    for marriage in marriages:
+        if isinstance(marriage, dict):
+            persons_list = marriage.get('persons', [])
+            if len(persons_list) >= 2:
+                result[(str(persons_list[0]), str(persons_list[1]))] = marriage.get('date', '') or ''
+        elif isinstance(marriage, (list, tuple)) and len(marriage) >= 2:
+            result.setdefault((str(marriage[0]), str(marriage[1])), '')
+    return result
+
+
+def tree_counts(db, user_id):
+    """Дерево пользователя без данных персон: {id, revision, persons_count, marriages_count} или None."""
+    row = db.execute("""
+        SELECT t.id, IFNULL(t.revision, 0) AS revision,
+               (SELECT COUNT(*) FROM persons p WHERE p.tree_id = t.id) AS persons_count,
+               (SELECT COUNT(*) FROM marriages m WHERE m.tree_id = t.id) AS marriages_count
+        FROM family_trees t WHERE t.user_id = ? ORDER BY t.id LIMIT 1
+    """, (user_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def tree_revision(db, tree_id):
+    """Текущая ревизия дерева."""
+    row = db.execute('SELECT revision FROM family_trees WHERE id = ?', (tree_id,)).fetchone()
+    return (row[0] or 0) if row else 0
+
+
+def _counts(inserted, updated, unchanged, deleted):
+    return {'inserted': inserted, 'updated': updated, 'unchanged': unchanged, 'deleted': deleted}
+
+
+def _write_persons(db, tree_id, revision, persons, existing):
+    """Вставить/обновить персоны, у которых изменился row_hash. → (inserted, updated, unchanged)."""
+    to_insert, to_update = [], []
+    unchanged = 0
+    blobs = {}
+    edges = {}
+    # Фото только хешем — лишь из деревьев владельца (photo_store.owned_photo_hashes)
+    bare = [h for pdata in persons.values() for h in bare_photo_hashes(pdata)]
+    owned = set()
+    if bare:
+        owner = db.execute('SELECT user_id FROM family_trees WHERE id = ?', (tree_id,)).fetchone()
+        if owner:
+            owned = owned_photo_hashes(db, owner[0], bare)
+    for pid, pdata in persons.items():
+        pid = str(pid)
+        values = person_values(pdata, person_photo_refs(pdata, blobs, owned))
+        digest = row_hash(values)
+        if pid not in existing:
+            to_insert.append((pid, tree_id, *values, digest, revision))
+        elif existing[pid] != digest:
+            to_update.append((*values, digest, revision, pid, tree_id))
+        else:
+            unchanged += 1
+            continue
+        edges[pid] = (pdata.get('parents'), pdata.get('spouse_ids'))
+
+    # Новые фото — до персон; уже известные серверу не перезаписываются
+    store_photos(db, blobs)
+    if to_insert:
+        db.executemany(_INSERT_PERSON_SQL, to_insert)
+        # Персона снова существует — её надгробие больше не нужно
+        db.executemany(
+            'DELETE FROM sync_tombstones WHERE tree_id = ? AND kind = ? AND entity_id = ?',
+            ((tree_id, PERSON, row[0]) for row in to_insert)
+        )
+    if to_update:
+        db.executemany(_UPDATE_PERSON_SQL, to_update)
+    write_person_edges(db, tree_id, edges, replaced=[row[-2] for row in to_update])
+    return len(to_insert), len(to_update), unchanged
+
+
+def _bury(db, tree_id, revision, kind, entity_ids):
+    """Запомнить удалённые сущности для клиентов, синхронизирующихся по ревизии."""
+    db.executemany(
+        'INSERT OR REPLACE INTO sync_tombstones (tree_id, kind, entity_id, revision, created_at) '
+        'VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)',
+        ((tree_id, kind, entity_id, revision) for entity_id in entity_ids)
+    )
+
+
+def _current_marriages(db, tree_id):
+    """{(p1, p2): (id, date)} и id дубликатов одной пары."""
+    current = {}
+    duplicate_ids = []
+    for row in db.execute(
+        'SELECT id, person1_id, person2_id, marriage_date FROM marriages WHERE tree_id = ?', (tree_id,)
+    ):
+        key = (row[1], row[2])
+        if key in current:
+            duplicate_ids.append((row[0],))
+        else:
+            current[key] = (row[0], row[3] or '')
+    return current, duplicate_ids
+
+
+def _write_marriages(db, tree_id, revision, desired, current, removed_keys, duplicate_ids=()):
+    """Вставить/обновить браки desired и удалить removed_keys. → счётчики."""
+    m_insert = [(tree_id, p1, p2, date, revision) for (p1, p2), date in desired.items()
+                if (p1, p2) not in current]
+    m_update = [(date, revision, current[key][0]) for key, date in desired.items()
+                if key in current and current[key][1] != date]
+    m_delete = [(current[key][0],) for key in removed_keys if key in current]
+
+    if m_delete or duplicate_ids:
+        db.executemany('DELETE FROM marriages WHERE id = ?', m_delete + list(duplicate_ids))
+        _bury(db, tree_id, revision, MARRIAGE,
+              [marriage_key(*key) for key in removed_keys if key in current])
+    if m_insert:
+        db.executemany(
+            'INSERT INTO marriages (tree_id, person1_id, person2_id, marriage_date, revision) '
+            'VALUES (?, ?, ?, ?, ?)',
+            m_insert
+        )
+        db.executemany(
+            'DELETE FROM sync_tombstones WHERE tree_id = ? AND kind = ? AND entity_id = ?',
+            ((tree_id, MARRIAGE, marriage_key(row[1], row[2])) for row in m_insert)
+        )
+    if m_update:
+        db.executemany('UPDATE marriages SET marriage_date = ?, revision = ? WHERE id = ?', m_update)
+
+    return _counts(len(m_insert), len(m_update), len(desired) - len(m_insert) - len(m_update),
+                   len(m_delete) + len(duplicate_ids))
+
+
+def _finish(db, tree_id, revision, stats):
+    """Зафиксировать новую ревизию дерева, если что-то изменилось."""
+    changed = any(stats[kind][k] for kind in ('persons', 'marriages')
+                  for k in ('inserted', 'updated', 'deleted'))
+    if changed:
+        db.execute('UPDATE family_trees SET revision = ? WHERE id = ?', (revision, tree_id))
+        bump(db, persons=stats['persons']['inserted'] - stats['persons']['deleted'])
+    else:
+        revision -= 1
+    stats['revision'] = revision
+    return stats
+
+
+def replace_tree(db, tree_id, persons, marriages):
+    """
+    Привести дерево tree_id к состоянию persons/marriages.
+
+    Персоны сравниваются по row_hash: неизменённые не перезаписываются,
+    отсутствующие в payload — удаляются одним DELETE через временную таблицу.
+    Браки сверяются по паре (person1_id, person2_id).
+
+    Returns:
+        dict со счётчиками {persons: {...}, marriages: {...}, revision: N}.
+    """
+    revision = tree_revision(db, tree_id) + 1
+    existing = dict(db.execute(
+        'SELECT id, row_hash FROM persons WHERE tree_id = ?', (tree_id,)
+    ).fetchall())
+
+    inserted, updated, unchanged = _write_persons(db, tree_id, revision, persons, existing)
+
+    # Удаляем персоны, которых больше нет в дереве клиента
+    deleted = 0
+    if existing:
+        db.execute('CREATE TEMP TABLE IF NOT EXISTS upload_ids (id TEXT PRIMARY KEY)')
+        db.execute('DELETE FROM temp.upload_ids')
+        db.executemany('INSERT OR IGNORE INTO temp.upload_ids (id) VALUES (?)',
+                       ((str(pid),) for pid in persons))
+        gone = [row[0] for row in db.execute(
+            'SELECT id FROM persons WHERE tree_id = ? AND id NOT IN (SELECT id FROM temp.upload_ids)',
+            (tree_id,)
+        )]
+        if gone:
+            deleted = db.execute(
+                'DELETE FROM persons WHERE tree_id = ? AND id NOT IN (SELECT id FROM temp.upload_ids)',
+                (tree_id,)
+            ).rowcount
+            drop_person_edges(db, tree_id, gone)
+            _bury(db, tree_id, revision, PERSON, gone)
+        db.execute('DELETE FROM temp.upload_ids')
+
+    # Браки
+    desired = _normalize_marriages(marriages)
+    current, duplicate_ids = _current_marriages(db, tree_id)
+    removed = [key for key in current if key not in desired]
+    marriages_stats = _write_marriages(db, tree_id, revision, desired, current, removed, duplicate_ids)
+
+    return _finish(db, tree_id, revision, {
+        'persons': _counts(inserted, updated, unchanged, deleted),
+        'marriages': marriages_stats,
+    })
+
+
+def _row_hashes(db, tree_id, ids, batch=500):
+    """{id: row_hash} выбранных персон (по первичному ключу)."""
+    ids = list(ids)
+    found = {}
+    for i in range(0, len(ids), batch):
+        chunk = ids[i:i + batch]
+        marks = ",".join("?" * len(chunk))
+        found.update(db.execute(f'SELECT id, row_hash FROM persons WHERE tree_id = ? AND id IN ({marks})',
+                                [tree_id, *chunk]).fetchall())
+    return found
+
+
+def _marriages_by_key(db, tree_id, keys):
+    """{(p1, p2): (id, date)} для выбранных пар (индекс idx_marriages_tree_pair)."""
+    current = {}
+    for key in keys:
+        row = db.execute(
+            'SELECT id, marriage_date FROM marriages WHERE tree_id = ? AND person1_id = ? AND person2_id = ? '
+            'ORDER BY id LIMIT 1', (tree_id, *key)
+        ).fetchone()
+        if row:
+            current[key] = (row[0], row[1] or '')
+    return current
+
+
+def apply_delta(db, tree_id, persons, deleted_persons=(), marriages=(), deleted_marriages=()):
+    """
+    Применить к дереву только изменения: upsert persons/marriages и удаление
+    перечисленных персон и браков. Остальные записи не трогаются и не читаются:
+    стоимость зависит от размера правки, а не дерева.
+
+    Returns:
+        dict со счётчиками, как у replace_tree().
+    """
+    revision = tree_revision(db, tree_id) + 1
+    ids = {str(pid) for pid in persons} | {str(pid) for pid in deleted_persons}
+    existing = _row_hashes(db, tree_id, ids)
+
+    inserted, updated, unchanged = _write_persons(db, tree_id, revision, persons, existing)
+
+    gone = [str(pid) for pid in deleted_persons if str(pid) in existing and str(pid) not in persons]
+    if gone:
+        db.executemany('DELETE FROM persons WHERE tree_id = ? AND id = ?', ((tree_id, pid) for pid in gone))
+        drop_person_edges(db, tree_id, gone)
+        _bury(db, tree_id, revision, PERSON, gone)
+
+    desired = _normalize_marriages(list(marriages))
+    removed = [key for key in _normalize_marriages([list(m) if not isinstance(m, dict) else m
+                                                   for m in deleted_marriages])
+               if key not in desired]
+    current = _marriages_by_key(db, tree_id, list(desired) + removed)
+    marriages_stats = _write_marriages(db, tree_id, revision, desired, current, removed)
+
+    return _finish(db, tree_id, revision, {
+        'persons': _counts(inserted, updated, unchanged, len(gone)),
+        'marriages': marriages_stats,
+    })
+
+
+class _StoredPersons(dict):
+    """Персоны дерева, загружаемые из БД при первом обращении persons[id] (для TreeEdit)."""
+
+    def __init__(self, db, tree_id):
+        super().__init__()
+        self.db = db
+        self.tree_id = tree_id
+
+    def __missing__(self, pid):
+        person = load_persons(self.db, self.tree_id, [pid]).get(pid)
+        if person is None:
+            raise KeyError(pid)
+        self[pid] = person
+        return person
+
+
+def next_person_id(db, tree_id):
+    """Следующий числовой id персоны (как у клиентов: максимум + 1)."""
+    row = db.execute("SELECT MAX(CAST(id AS INTEGER)) FROM persons WHERE tree_id = ? AND id GLOB '[0-9]*'",
+                     (tree_id,)).fetchone()
+    return str((row[0] or 0) + 1)
+
+
+def edit_tree(db, tree_id, apply):
+    """
+    Точечная правка дерева (tree_edits.TreeEdit).
+
+    apply(edit) меняет персоны через edit; из БД читаются только те персоны,
+    к которым правка обратилась, записываются они и браки правки (apply_delta).
+
+    Returns:
+        (edit, результат apply, счётчики как у apply_delta).
+    """
+    def find_marriage(a, b):
+        return next(iter(_marriages_by_key(db, tree_id, [(a, b), (b, a)])), None)
+
+    edit = TreeEdit(_StoredPersons(db, tree_id), find_marriage)
+    result = apply(edit)
+    stats = apply_delta(
+        db, tree_id, edit.persons, edit.deleted,
+        [{'persons': list(key), 'date': date} for key, date in edit.marriages.items()],
+        [list(key) for key in edit.removed_marriages],
+    )
+    return edit, result, stats
+
+
+def changes_since(db, tree_id, since):
+    """
+    Изменения дерева после ревизии since.
+
+    since <= 0 (или ревизия старше сохранённых надгробий) — полный снимок
+    с full=True: клиент должен заменить своё дерево целиком.
+    """
+    revision = tree_revision(db, tree_id)
+    floor_row = db.execute('SELECT tombstone_floor FROM family_trees WHERE id = ?', (tree_id,)).fetchone()
+    floor = (floor_row[0] or 0) if floor_row else 0
+    full = since <= 0 or since < floor or since > revision
+    if full:
+        since = -1
+
+    persons = {
+        row['id']: person_from_row(row)
+        for row in db.execute(f'SELECT {PERSON_COLUMNS} FROM persons WHERE tree_id = ? AND revision > ?',
+                              (tree_id, since))
+    }
+    marriages = [
+        {'persons': [row['person1_id'], row['person2_id']], 'date': row['marriage_date'] or ''}
+        for row in db.execute(
+            'SELECT person1_id, person2_id, marriage_date FROM marriages WHERE tree_id = ? AND revision > ?',
+            (tree_id, since)
+        )
+    ]
+    deleted_persons, deleted_marriages = [], []
+    if not full:
+        for row in db.execute(
+            'SELECT kind, entity_id FROM sync_tombstones WHERE tree_id = ? AND revision > ?', (tree_id, since)
+        ):
+            if row[0] == PERSON:
+                deleted_persons.append(row[1])
+            else:
+                deleted_marriages.append(json.loads(row[1]))
+
+    return {
+        'revision': revision,
+        'full': full,
+        'persons': persons,
+        'marriages': marriages,
+        'deleted_persons': deleted_persons,
+        'deleted_marriages': deleted_marriages,
+    }
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""Общие фикстуры тестов."""
+import importlib.util
+import io
+import sys
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _load_module(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def sync_server(tmp_path, monkeypatch):
+    """Сервер синхронизации (sync_server/app.py) с БД во временной папке."""
+    pytest.importorskip("flask")
+    pytest.importorskip("flask_cors")
+    monkeypatch.setenv("DATA_DIR", str(tmp_path))
+    monkeypatch.syspath_prepend(str(ROOT / "sync_server"))
+    module = _load_module("sync_server_app", ROOT / "sync_server" / "app.py")
+    module.app.testing = True
+    yield module
+    module.stats_reconciler.stop()
+    module.maintenance_job.stop()
+    module.presence_flusher.stop()
+    module.db_pool.close_all()
+    sys.modules.pop("sync_server_app", None)
+
+
+@pytest.fixture
+def sync_headers(sync_server):
+    """Заголовки авторизации администратора по умолчанию."""
+    client = sync_server.app.test_client()
+    r = client.post("/api/auth/login", json={"login": "admin", "password": "admin123"})
+    assert r.status_code == 200
+    return {"Authorization": f"Bearer {r.get_json()['token']}"}
+
+
+@pytest.fixture
+def sync_client(sync_server, tmp_path, monkeypatch):
+    """SyncClient, который ходит в test_client сервера вместо сети."""
+    import sync_client as sync_client_module
+
+    monkeypatch.chdir(tmp_path)
+    http = sync_server.app.test_client()
+
+    class _TestClient(sync_client_module.SyncClient):
+        requests = []
+
+        def _request(self, endpoint, method='GET', data=None):
+            headers = {"Authorization": f"Bearer {self.token}"} if self.token else {}
+            r = http.open(endpoint, method=method, json=data, headers=headers)
+            self.requests.append((method, endpoint.split("?")[0], len(r.data)))
+            if r.status_code >= 400:
+                raise sync_client_module.SyncHTTPError(r.status_code, r.get_json().get("error"))
+            return r.get_json()
+
+    client = _TestClient(server_url="http://test")
+    client.login("admin", "admin123")
+    return client
+
+
+@pytest.fixture
+def web_app(tmp_path, monkeypatch):
+    """Web-приложение (web/app.py) с данными во временной папке и сервером синхронизации http://sync.test."""
+    pytest.importorskip("flask")
+    pytest.importorskip("flask_cors")
+    monkeypatch.setenv("DATA_DIR", str(tmp_path / "web_data"))
+    monkeypatch.setenv("SYNC_SERVER_URL", "http://sync.test")
+    monkeypatch.syspath_prepend(str(ROOT / "web"))
+    sys.modules.pop("tree_service", None)
+    module = _load_module("web_app", ROOT / "web" / "app.py")
+    module.app.testing = True
+    yield module
+    sys.modules.pop("web_app", None)
+    sys.modules.pop("tree_service", None)
+
+
+@pytest.fixture
+def sync_urlopen(sync_server, monkeypatch):
+    """urllib.request.urlopen и пул http_client, направленные в test_client сервера синхронизации.
+
+    Возвращает список (method, path, status, байт в ответе) выполненных запросов.
+    """
+    http = sync_server.app.test_client()
+    calls = []
+
+    class _Response:
+        def __init__(self, r):
+            self.status = r.status_code
+            self.headers = r.headers
+            self._data = r.get_data()
+
+        def read(self):
+            return self._data
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+    def urlopen(req, timeout=None):
+        path = "/" + req.full_url.split("://", 1)[1].split("/", 1)[1]
+        r = http.open(path, method=req.get_method(), data=req.data, headers=dict(req.header_items()))
+        calls.append((req.get_method(), path.split("?")[0], r.status_code, len(r.get_data())))
+        if r.status_code >= 300:
+            raise urllib.error.HTTPError(req.full_url, r.status_code, r.status, r.headers, io.BytesIO(r.get_data()))
+        return _Response(r)
+
+    import http_client
+
+    monkeypatch.setattr(urllib.request, "urlopen", urlopen)
+    monkeypatch.setattr(http_client.PooledHttpClient, "urlopen", lambda self, req, timeout=None: urlopen(req, timeout))
+    return calls
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""Тесты материализованной статистики админки (stats_store)."""
+import sqlite3
+
+
+def _person(name):
+    return {"name": name, "surname": "Тестов", "gender": "Мужской", "parents": [], "children": [], "spouse_ids": []}
+
+
+def _login(client, login):
+    client.post("/api/auth/register", json={"login": login, "password": "secret1"})
+    r = client.post("/api/auth/login", json={"login": login, "password": "secret1"})
+    return r.get_json()["user_id"], {"Authorization": f"Bearer {r.get_json()['token']}"}
+
+
+def _live_overview(sync_server):
+    conn = sqlite3.connect(sync_server.DB_FILE)
+    try:
+        return {
+            "total_users": conn.execute("SELECT COUNT(*) FROM users").fetchone()[0],
+            "active_users": conn.execute("SELECT COUNT(*) FROM users WHERE is_active = 1").fetchone()[0],
+            "total_trees": conn.execute("SELECT COUNT(*) FROM family_trees").fetchone()[0],
+            "total_persons": conn.execute("SELECT COUNT(*) FROM persons").fetchone()[0],
+        }
+    finally:
+        conn.close()
+
+
+def _overview(client, headers):
+    overview = client.get("/api/admin/stats", headers=headers).get_json()["overview"]
+    overview.pop("active_sessions")
+    return overview
+
+
+def test_counters_follow_writes(sync_server, sync_headers):
+    client = sync_server.app.test_client()
+    assert _overview(client, sync_headers) == _live_overview(sync_server)
+
+    user_id, headers = _login(client, "ivan")
+    _, other = _login(client, "petr")
+    r = client.post("/api/sync/upload", headers=headers,
+                    json={"tree": {"persons": {str(i): _person(f"Иван{i}") for i in range(5)}}})
+    client.post("/api/sync/delta", headers=headers, json={
+        "base_revision": r.get_json()["revision"], "persons": {"9": _person("Новый")}, "deleted_persons": ["0", "1"]})
+    client.post("/api/sync/upload", headers=other, json={"tree": {"persons": {"1": _person("Пётр")}}})
+    client.post(f"/api/admin/user/{user_id}/toggle", headers=sync_headers)
+    overview = _overview(client, sync_headers)
+    assert overview == _live_overview(sync_server)
+    assert overview["total_persons"] == 5
+
+    client.post(f"/api/admin/user/{user_id}/delete", headers=sync_headers)
+    assert _overview(client, sync_headers) == _live_overview(sync_server)
+
+    daily = client.get("/api/admin/stats", headers=sync_headers).get_json()["daily_stats"]
+    assert len(daily) == 1
+    assert daily[0]["sync_count"] == 3 and daily[0]["total_entities"] == 5 + 3 + 1
+    assert daily[0]["logins"] >= 3
+
+
+def test_reconcile_detects_and_fixes_drift(sync_server, sync_headers):
+    from stats_store import reconcile
+
+    client = sync_server.app.test_client()
+    _, headers = _login(client, "ivan")
+    client.post("/api/sync/upload", headers=headers, json={"tree": {"persons": {"1": _person("Иван")}}})
+
+    conn = sqlite3.connect(sync_server.DB_FILE)
+    try:
+        assert reconcile(conn) == {}
+        # Записи в обход API: счётчики и дневная сводка расходятся с таблицами
+        conn.execute("DELETE FROM persons")
+        conn.execute("UPDATE counters SET value = value + 7 WHERE name = 'users'")
+        conn.execute("UPDATE sync_daily SET sync_count = 0")
+        conn.commit()
+        drift = reconcile(conn)
+        assert drift["persons"] == (1, 0)
+        assert drift["users"][0] - drift["users"][1] == 7
+        assert any(key.startswith("sync_daily:") for key in drift)
+        assert reconcile(conn) == {}
+    finally:
+        conn.close()
+    assert _overview(client, sync_headers) == _live_overview(sync_server)
+    assert client.get("/api/admin/stats", headers=sync_headers).get_json()["daily_stats"][0]["sync_count"] == 1
+
+
+def test_stats_reads_no_table_scans(sync_server, sync_headers, monkeypatch):
+    statements = []
+    connect = sync_server.db_pool._connect
+
+    def _connect():
+        conn = connect()
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    sync_server.db_pool.close_all()
+    monkeypatch.setattr(sync_server.db_pool, "_connect", _connect)
+    client = sync_server.app.test_client()
+    assert client.get("/api/admin/stats", headers=sync_headers).status_code == 200
+    assert not [s for s in statements if "COUNT(*)" in s or "GROUP BY" in s]
+
+    # Web проверяет права администратора через /api/auth/me, а не /api/admin/stats
+    assert client.get("/api/auth/me", headers=sync_headers).get_json()["is_admin"] is True
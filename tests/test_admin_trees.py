@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""Тесты сводки деревьев админки (/api/admin/trees/summary)."""
+
+
+def _person(name, parents=(), spouses=()):
+    return {"name": name, "surname": "Тестов", "gender": "Мужской",
+            "parents": list(parents), "children": [], "spouse_ids": list(spouses)}
+
+
+def _add_user(client, login, size):
+    client.post("/api/auth/register", json={"login": login, "password": "secret1"})
+    token = client.post("/api/auth/login", json={"login": login, "password": "secret1"}).get_json()["token"]
+    persons = {str(i): _person(f"{login}{i}", spouses=[str(i + 1)] if i == 1 else []) for i in range(1, size + 1)}
+    client.post("/api/sync/upload", headers={"Authorization": f"Bearer {token}"},
+                json={"tree": {"persons": persons, "marriages": [{"persons": ["1", "2"], "date": ""}]}})
+
+
+def _traced_statements(sync_server, monkeypatch):
+    """SQL-запросы, выполненные через новые соединения пула."""
+    statements = []
+    connect = sync_server.db_pool._connect
+
+    def _connect():
+        conn = connect()
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    sync_server.db_pool.close_all()
+    monkeypatch.setattr(sync_server.db_pool, "_connect", _connect)
+    return statements
+
+
+def _tree_queries(statements):
+    return [s for s in statements if "FROM persons" in s or "FROM marriages" in s or "FROM family_trees" in s]
+
+
+def test_summary_counts_and_pages(sync_server, sync_headers):
+    client = sync_server.app.test_client()
+    for n in range(5):
+        _add_user(client, f"user{n}", n + 2)
+
+    trees, cursor = [], None
+    while True:
+        data = client.get("/api/admin/trees/summary", headers=sync_headers,
+                          query_string={"limit": 2, **({"cursor": cursor} if cursor else {})}).get_json()
+        assert len(data["trees"]) <= 2
+        trees += data["trees"]
+        cursor = data["next_cursor"]
+        if cursor is None:
+            break
+    by_login = {t["user_login"]: t for t in trees}
+    assert by_login["user3"]["persons_count"] == 5
+    assert by_login["user3"]["marriages_count"] == 1
+    assert by_login["user3"]["size"] > 0 and by_login["user3"]["last_sync"]
+    assert "persons" not in by_login["user3"]
+
+    data = client.get("/api/admin/trees/summary?include=persons", headers=sync_headers).get_json()
+    tree = next(t for t in data["trees"] if t["user_login"] == "user1")
+    assert sorted(p["name"] for p in tree["persons"].values()) == ["user11", "user12", "user13"]
+    assert tree["marriages"] == [{"persons": ["1", "2"], "date": ""}]
+    # Прежние эндпоинты — тот же формат с персонами
+    legacy = client.get("/api/admin/trees", headers=sync_headers).get_json()["trees"]
+    assert {t["user_login"]: len(t["persons"]) for t in legacy} == {t["user_login"]: t["persons_count"] for t in trees}
+    assert client.get("/api/admin/trees/summary?cursor=x", headers=sync_headers).status_code == 400
+
+
+def test_summary_query_count_does_not_grow_with_users(sync_server, sync_headers, monkeypatch):
+    client = sync_server.app.test_client()
+    statements = _traced_statements(sync_server, monkeypatch)
+    counts = []
+    for batch in range(2):
+        for n in range(4):
+            _add_user(client, f"user{batch}{n}", 3)
+        for url in ("/api/admin/trees/summary?include=persons", "/api/admin/trees"):
+            statements.clear()
+            assert client.get(url, headers=sync_headers).status_code == 200
+            counts.append(len(_tree_queries(statements)))
+    assert counts[:2] == counts[2:]
+
+
+def test_web_admin_trees_uses_summary_pages(web_app, sync_urlopen, sync_headers, sync_server, monkeypatch):
+    client = sync_server.app.test_client()
+    for n in range(5):
+        _add_user(client, f"user{n}", 2)
+    monkeypatch.setattr(web_app, "ADMIN_TREES_PAGE", 2)
+
+    web = web_app.app.test_client()
+    with web.session_transaction() as s:
+        s["username"] = "admin"
+        s["server_token"] = sync_headers["Authorization"].split()[1]
+    body = web.get("/api/admin/trees").get_json()
+    trees = body["trees"]
+    assert body["next_cursor"] is None
+    assert {t["user_login"] for t in trees} >= {f"user{n}" for n in range(5)}
+    assert all(len(t["persons"]) == t["persons_count"] for t in trees)
+    paths = [path for _, path, _, _ in sync_urlopen]
+    assert set(paths) == {"/api/admin/trees/summary"} and len(paths) == (len(trees) + 1) // 2
+
+
+def test_last_sync_survives_log_pruning(sync_server, sync_headers):
+    import sqlite3
+
+    from maintenance import run_maintenance
+
+    client = sync_server.app.test_client()
+    _add_user(client, "user1", 2)
+    conn = sqlite3.connect(sync_server.DB_FILE)
+    try:
+        conn.execute("UPDATE sync_logs SET created_at = datetime('now', '-200 days')")
+        conn.commit()
+        assert run_maintenance(conn, log_days=90)["logs_deleted"] >= 1
+        assert conn.execute("SELECT COUNT(*) FROM sync_logs").fetchone()[0] == 0
+    finally:
+        conn.close()
+
+    trees = client.get("/api/admin/trees/summary", headers=sync_headers).get_json()["trees"]
+    assert next(t for t in trees if t["user_login"] == "user1")["last_sync"]
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""Тесты надёжной записи JSON (atomic_json): атомарная замена, блокировка, компактный формат."""
+import json
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "Дерево"))
+
+from atomic_json import write_json  # noqa: E402
+
+# Дочерний процесс: пишет дерево writer_id в path count раз
+_WRITER = """
+import sys
+sys.path.insert(0, {dir!r})
+from atomic_json import write_json
+path, writer, count = sys.argv[1], int(sys.argv[2]), int(sys.argv[3])
+for i in range(count):
+    write_json(path, {{"writer": writer, "i": i, "persons": {{str(n): {{"name": "Иван" * 20}} for n in range(2000)}}}})
+"""
+
+# Дочерний процесс: «зависает» в fsync временного файла, пока его не убьют
+_STUCK = """
+import os, sys, time
+sys.path.insert(0, {dir!r})
+import atomic_json
+def stuck(fd):
+    print("writing", flush=True)
+    time.sleep(60)
+os.fsync = stuck
+atomic_json.write_json(sys.argv[1], {{"version": "new", "persons": {{str(n): {{}} for n in range(5000)}}}})
+"""
+
+
+def _tree(n):
+    return {"persons": {str(i): {"name": f"Иван{i}", "parents": [], "children": [], "spouse_ids": []}
+                        for i in range(1, n + 1)}, "marriages": [], "current_center": "1"}
+
+
+def test_copies_match_and_output_is_compact(tmp_path):
+    assert (ROOT / "Дерево" / "atomic_json.py").read_bytes() == (ROOT / "web" / "atomic_json.py").read_bytes()
+    path = tmp_path / "tree.json"
+    size = write_json(str(path), _tree(3))
+    text = path.read_text(encoding="utf-8")
+    assert size == path.stat().st_size and "\n" not in text and ": " not in text
+    assert json.loads(text) == _tree(3)
+    write_json(str(path), _tree(3), pretty=True)
+    assert "\n  " in path.read_text(encoding="utf-8")
+
+
+def test_concurrent_writers_never_expose_partial_file(tmp_path):
+    path = tmp_path / "tree.json"
+    write_json(str(path), {"writer": -1, "i": 0, "persons": {}})
+    errors, stop = [], threading.Event()
+
+    def reader():
+        while not stop.is_set():
+            try:
+                json.loads(path.read_bytes())
+            except ValueError as e:
+                errors.append(e)
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    writers = [subprocess.Popen([sys.executable, "-c", _WRITER.format(dir=str(ROOT / "Дерево")),
+                                 str(path), str(w), "15"]) for w in range(4)]
+    for w in writers:
+        assert w.wait(timeout=120) == 0
+    stop.set()
+    thread.join()
+    assert not errors
+    final = json.loads(path.read_bytes())
+    assert final["i"] == 14 and len(final["persons"]) == 2000
+    assert not list(tmp_path.glob(".tree.json.*.tmp"))
+
+
+def test_kill_mid_write_keeps_previous_version(tmp_path):
+    path = tmp_path / "tree.json"
+    write_json(str(path), {"version": "old"})
+    child = subprocess.Popen([sys.executable, "-c", _STUCK.format(dir=str(ROOT / "Дерево")), str(path)],
+                             stdout=subprocess.PIPE, text=True)
+    assert child.stdout.readline().strip() == "writing"
+    child.kill()
+    child.wait(timeout=10)
+    child.stdout.close()
+
+    assert json.loads(path.read_bytes()) == {"version": "old"}
+    # Блокировка убитого процесса снята ОС: следующая запись не ждёт
+    started = time.monotonic()
+    write_json(str(path), {"version": "next"})
+    assert time.monotonic() - started < 5
+    assert json.loads(path.read_bytes()) == {"version": "next"}
+
+
+def test_tree_writers_use_atomic_compact_json(tmp_path, web_app):
+    import tree_service as web_tree_service
+    from models import FamilyTreeModel, Person
+    from services.tree_service import TreeService
+
+    assert web_tree_service.save_tree("ivan", _tree(2))
+    assert "\n" not in Path(web_tree_service.get_data_path("ivan")).read_text(encoding="utf-8")
+
+    model = FamilyTreeModel()
+    model.persons["1"] = Person(name="Иван", surname="Иванов", gender="Мужской")
+    path = tmp_path / "desktop.json"
+    assert model.save_to_file(str(path))
+    assert "\n" not in path.read_text(encoding="utf-8")
+    assert json.loads(path.read_text(encoding="utf-8"))["persons"]["1"]["name"] == "Иван"
+
+    ok, error = TreeService(str(tmp_path)).save_tree("petr", _tree(2))
+    assert ok, error
+    saved = next(tmp_path.glob("*petr*.json"))
+    assert json.loads(saved.read_text(encoding="utf-8"))["persons"]["2"]["name"] == "Иван2"
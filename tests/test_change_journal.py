@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""Тесты журнала изменений (change_journal): сохранение дописыванием, replay после обрыва, свёртка в снимок."""
+import json
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "Дерево"))
+
+import models  # noqa: E402
+from change_journal import GENERATION_KEY, consolidated_tree  # noqa: E402
+from models import FamilyTreeModel  # noqa: E402
+
+PHOTO = "QUJD" * 200
+
+
+def _tree_file(tmp_path, n=6):
+    path = tmp_path / "family_tree.json"
+    m = FamilyTreeModel(data_file=str(path))
+    for i in range(n):
+        m.add_person(name=f"Иван{i}", surname="Иванов", photo=PHOTO if i % 2 else None)
+    m.add_parent("2", "1")
+    m.current_center = "1"
+    assert m.save_to_file()
+    return path
+
+
+def _load(path):
+    m = FamilyTreeModel(data_file=str(path))
+    assert m.load_from_file()
+    return m
+
+
+def test_tracked_edits_are_appended_and_replayed(tmp_path):
+    path = _tree_file(tmp_path)
+    snapshot = path.read_bytes()
+
+    m = _load(path)
+    m.persons["3"].birth_date = "01.02.1950"
+    m.mark_modified("3")
+    assert m.add_marriage("1", "4")[0] and m.add_parent("5", "1")[0]
+    m.current_center = "5"
+    assert m.save_to_file()
+    new_id, _ = m.add_person(name="Анна", surname="Иванова", gender="Женский")
+    assert m.remove_marriage("1", "4")[0]
+    assert m.save_to_file()
+
+    # Снимок не переписывался: всё в журнале
+    assert path.read_bytes() == snapshot
+    journal = Path(str(path) + ".journal")
+    assert journal.exists()
+
+    again = _load(path)
+    assert again.persons["3"].birth_date == "01.02.1950" and again.persons["4"].photo == PHOTO
+    assert again.persons["5"].parents == {"1"} and "5" in again.persons["1"].children
+    assert again.persons[new_id].name == "Анна" and again.current_center == "5"
+    assert again.marriages == {} and not again.persons["1"].spouse_ids
+    assert not again.check_ancestors()
+
+    # Правка в обход отметок — снимок целиком, журнал больше не нужен
+    again.persons["6"].name = "Пётр"
+    again.mark_modified()
+    assert again.save_to_file()
+    assert not journal.exists()
+    data = json.loads(path.read_text(encoding="utf-8"))
+    assert data[GENERATION_KEY] == 2 and data["persons"]["6"]["name"] == "Пётр"
+    assert data["persons"][new_id]["name"] == "Анна" and data["persons"]["4"]["photo"] == PHOTO
+
+
+def test_replay_after_truncated_append(tmp_path):
+    path = _tree_file(tmp_path)
+    journal = Path(str(path) + ".journal")
+    m = _load(path)
+    m.persons["2"].death_date = "01.01.2000"
+    m.mark_modified("2")
+    assert m.save_to_file()
+    first_batch = journal.stat().st_size
+    m.persons["3"].name = "Сергей"
+    m.persons["2"].death_date = "02.02.2002"
+    m.mark_modified("2", "3")
+    assert m.save_to_file()
+    full = journal.read_bytes()
+
+    # Обрыв в любом месте второго пакета: применяется только первый, хвост обрезается
+    for cut in range(first_batch, len(full)):
+        journal.write_bytes(full[:cut])
+        again = _load(path)
+        assert again.persons["2"].death_date == "01.01.2000" and again.persons["3"].name == "Иван2"
+        assert journal.stat().st_size == first_batch
+
+    # Следующее сохранение дописывает после последнего commit
+    again.persons["4"].surname = "Петров"
+    again.mark_modified("4")
+    assert again.save_to_file()
+    assert _load(path).persons["4"].surname == "Петров"
+
+    # Повреждённая строка: она и всё после неё отбрасываются
+    damaged = bytearray(journal.read_bytes())
+    damaged[first_batch + 3] ^= 0x01
+    journal.write_bytes(bytes(damaged))
+    assert _load(path).persons["4"].surname == "Иванов"
+
+    # Журнал чужого поколения (снимок подменён) не применяется
+    data = json.loads(path.read_text(encoding="utf-8"))
+    data[GENERATION_KEY] = 5
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    assert _load(path).persons["2"].death_date == "" and not journal.exists()
+
+
+def test_background_compaction(tmp_path, monkeypatch):
+    path = _tree_file(tmp_path)
+    monkeypatch.setattr(models, "COMPACT_MIN_BYTES", 1)
+    monkeypatch.setattr(models, "COMPACT_SNAPSHOT_FRACTION", 0)
+    m = _load(path)
+    m.persons["1"].name = "Николай"
+    m.mark_modified("1")
+    assert m.save_to_file()
+    m.wait_for_compaction()
+
+    journal = Path(str(path) + ".journal")
+    data = json.loads(path.read_text(encoding="utf-8"))
+    assert data[GENERATION_KEY] == 2 and data["persons"]["1"]["name"] == "Николай"
+    assert data["persons"]["4"]["photo"] == PHOTO
+    assert not journal.exists() and not Path(str(journal) + ".old").exists()
+    # Фото, ещё не загруженное из прежнего снимка, читается из нового
+    assert m.persons["2"].photo == PHOTO
+
+    # Прерванная свёртка: прежний журнал в .old, новые пакеты — следующего поколения
+    monkeypatch.setattr(models.FamilyTreeModel, "_compact", lambda self, journal, data: None)
+    m.persons["3"].name = "Олег"
+    m.mark_modified("3")
+    assert m.save_to_file()
+    m.persons["5"].name = "Павел"
+    m.mark_modified("5")
+    assert m.save_to_file()
+    assert Path(str(journal) + ".old").exists()
+    assert consolidated_tree(str(path))["persons"]["5"]["name"] == "Павел"
+    again = _load(path)
+    assert again.persons["3"].name == "Олег" and again.persons["5"].name == "Павел"
+    assert again.persons["1"].name == "Николай"
+
+
+def test_unmarked_changes_force_snapshot(tmp_path):
+    path = _tree_file(tmp_path)
+    m = _load(path)
+    # Свёртка всех ветвей и вставка в реестр в обход методов модели, без отметок
+    for person in m.persons.values():
+        person.collapsed_branches = True
+    m.persons["7"] = models.Person(name="Анна", surname="Иванова", gender="Женский")
+    # Следующая отмеченная правка не должна скрыть их: сохраняется снимок целиком
+    m.persons["2"].name = "Пётр"
+    m.mark_modified("2")
+    assert m.save_to_file()
+    assert not Path(str(path) + ".journal").exists()
+
+    again = _load(path)
+    assert again.persons["7"].name == "Анна" and again.persons["2"].name == "Пётр"
+    assert all(p.collapsed_branches for p in again.persons.values() if p.id != "7")
+
+
+def test_unmarked_field_edit_is_not_lost(tmp_path):
+    path = _tree_file(tmp_path)
+    m = _load(path)
+    # Поле и связь изменены без mark_modified, затем отмеченная правка другой персоны
+    m.persons["1"].name = "Изменён"
+    m.persons["3"].spouse_ids.add("5")
+    m.persons["2"].name = "Пётр"
+    m.mark_modified("2")
+    assert m.save_to_file()
+    assert not Path(str(path) + ".journal").exists()
+
+    again = _load(path)
+    assert again.persons["1"].name == "Изменён" and again.persons["2"].name == "Пётр"
+    assert again.persons["3"].spouse_ids == {"5"}
+    # Чтение отложенного фото — не изменение: следующая отмеченная правка идёт в журнал
+    assert again.persons["4"].photo == PHOTO
+    again.persons["6"].surname = "Петров"
+    again.mark_modified("6")
+    assert again.save_to_file()
+    assert Path(str(path) + ".journal").exists()
+
+
+def test_delete_married_person_is_journaled(tmp_path):
+    path = _tree_file(tmp_path)
+    m = _load(path)
+    assert m.add_marriage("3", "4")[0] and m.add_marriage("5", "6")[0]
+    assert m.save_to_file()
+    snapshot = path.read_bytes()
+    assert m.delete_person("3")[0]
+    assert m.remove_spouse_link("5", "6")[0]
+    assert m.save_to_file()
+    assert path.read_bytes() == snapshot
+
+    again = _load(path)
+    assert "3" not in again.persons and not again.persons["4"].spouse_ids
+    assert again.marriages == {} and not again.persons["5"].spouse_ids
+
+
+def test_snapshot_does_not_share_mutable_fields(tmp_path):
+    m = _load(_tree_file(tmp_path))
+    person = m.persons["1"]
+    person.links = [{"title": "сайт", "url": "https://example.org"}]
+    person.photo_album = ["a.jpg"]
+    record = m._snapshot(lazy=True)["persons"]["1"]
+    assert record["links"] == person.links and record["links"][0] is not person.links[0]
+    assert record["photo_album"] == person.photo_album and record["photo_album"] is not person.photo_album
+
+
+def test_undo_writes_go_through_journal(tmp_path):
+    from undo import AddMarriageAction, EditPersonAction
+
+    path = _tree_file(tmp_path)
+    m = _load(path)
+    assert m.add_marriage("3", "4")[0]
+    assert m.save_to_file()
+    snapshot = path.read_bytes()
+
+    old = {k: getattr(m.persons["2"], k) for k in ("name", "surname", "patronymic", "birth_date", "gender",
+                                                  "is_deceased", "death_date", "maiden_name")}
+    EditPersonAction("2", old, dict(old, name="Пётр")).redo(m)
+    AddMarriageAction("3", "4").undo(m)
+    assert m.save_to_file()
+    assert path.read_bytes() == snapshot
+
+    again = _load(path)
+    assert again.persons["2"].name == "Пётр"
+    assert again.marriages == {} and not again.persons["3"].spouse_ids
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""Тесты условных GET (ETag / 304) и сжатия JSON-ответов sync_server и web."""
+import gzip
+import json
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _tree(n):
+    persons = {str(i): {"name": f"Иван{i}", "surname": "Тестов", "gender": "Мужской",
+                        "parents": [], "children": [], "spouse_ids": []} for i in range(1, n + 1)}
+    return {"persons": persons, "marriages": []}
+
+
+def test_web_copy_matches_sync_server():
+    assert (ROOT / "web" / "http_cache.py").read_bytes() == (ROOT / "sync_server" / "http_cache.py").read_bytes()
+
+
+def test_encoding_negotiation_and_etag_matching(sync_server):
+    import http_cache
+
+    assert http_cache.choose_encoding("gzip, deflate") == "gzip"
+    assert http_cache.choose_encoding("gzip;q=0, identity") is None
+    assert http_cache.choose_encoding("") is None
+    etag = http_cache.make_etag("download", 1, 5)
+    assert http_cache.etag_matches(etag, etag)
+    assert http_cache.etag_matches(f'"other", W/{etag[:-1]}-gz"', etag)
+    assert not http_cache.etag_matches('"other"', etag)
+
+
+def test_download_conditional_get_and_gzip(sync_server, sync_headers):
+    client = sync_server.app.test_client()
+    client.post("/api/sync/upload", headers=sync_headers, json={"tree": _tree(50)})
+
+    r = client.get("/api/sync/download", headers={**sync_headers, "Accept-Encoding": "gzip"})
+    assert r.status_code == 200
+    assert r.headers["Content-Encoding"] == "gzip"
+    assert r.headers["Vary"] == "Accept-Encoding"
+    data = json.loads(gzip.decompress(r.get_data()))
+    assert len(data["tree"]["persons"]) == 50
+    etag = r.headers["ETag"]
+
+    # Без Accept-Encoding — несжатое тело, тот же базовый ETag подходит для 304
+    plain = client.get("/api/sync/download", headers=sync_headers)
+    assert "Content-Encoding" not in plain.headers
+    assert plain.get_json()["revision"] == data["revision"]
+
+    r = client.get("/api/sync/download", headers={**sync_headers, "If-None-Match": etag})
+    assert r.status_code == 304
+    assert r.get_data() == b""
+
+    # Изменение дерева — новая ревизия и новый ETag
+    tree = _tree(50)
+    tree["persons"]["1"]["name"] = "Пётр"
+    client.post("/api/sync/upload", headers=sync_headers, json={"tree": tree})
+    r = client.get("/api/sync/download", headers={**sync_headers, "If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.get_json()["tree"]["persons"]["1"]["name"] == "Пётр"
+
+
+def test_sync_client_request_uses_validators(sync_urlopen, sync_server, tmp_path, monkeypatch):
+    import sync_client as sync_client_module
+
+    monkeypatch.chdir(tmp_path)
+    client = sync_client_module.SyncClient(server_url="http://sync.test")
+    client.login("admin", "admin123")
+    client.upload_tree_data(_tree(50))
+
+    first = client.download_tree()
+    second = client.download_tree()
+    assert first == second
+    statuses = [(path, status) for _, path, status, _ in sync_urlopen if path == "/api/sync/download"]
+    assert statuses == [("/api/sync/download", 200), ("/api/sync/download", 304)]
+    # Полный ответ пришёл сжатым
+    full_bytes = [size for _, path, status, size in sync_urlopen if path == "/api/sync/download" and status == 200]
+    assert full_bytes[0] < len(json.dumps(first).encode())
+
+
+def test_web_tree_proxy_is_conditional(web_app, sync_urlopen, sync_headers, sync_server):
+    http = sync_server.app.test_client()
+    http.post("/api/sync/upload", headers=sync_headers, json={"tree": _tree(20)})
+
+    client = web_app.app.test_client()
+    with client.session_transaction() as s:
+        s["username"] = "admin"
+        s["server_token"] = sync_headers["Authorization"].split()[1]
+        s["server_user_id"] = 1
+
+    r = client.get("/api/tree", headers={"Accept-Encoding": "gzip"})
+    assert r.status_code == 200
+    etag = r.headers["ETag"]
+    for _ in range(2):
+        r = client.get("/api/tree", headers={"If-None-Match": etag})
+        assert r.status_code == 304
+
+    # Полный снимок, затем изменения после ревизии; повтор того же запроса — 304 без тела
+    changes = [status for _, path, status, _ in sync_urlopen if path == "/api/sync/changes"]
+    assert changes == [200, 200, 304]
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""Тесты пула keep-alive соединений http_client (web и desktop)."""
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+from http_client import PooledHttpClient
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    wbufsize = 1 << 16
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body=b"ok", close=False, location=None):
+        self.send_response(status)
+        if location:
+            self.send_header("Location", location)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        # Закрыть соединение без «Connection: close» — как сервер, сбросивший простаивающее соединение
+        self.close_connection = close
+
+    def do_GET(self):
+        self.server.paths.append(self.path)
+        if self.path == "/flaky" and self.server.failures > 0:
+            self.server.failures -= 1
+            return self._reply(503, b"busy")
+        if self.path == "/missing":
+            return self._reply(404, b'{"error": "nope"}')
+        if self.path == "/moved":
+            return self._reply(302, b"", location="/ping")
+        if self.path == "/slow":
+            time.sleep(0.05)
+        self._reply(200, b"ok", close=self.path == "/drop")
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.server.paths.append(self.path)
+        body = self.rfile.read(length)
+        if self.path == "/flaky":
+            return self._reply(503, b"busy")
+        if self.path == "/moved":
+            return self._reply(302, b"", location="/echo")
+        if self.path == "/vanish":
+            # Запрос получен, но соединение оборвалось до ответа
+            self.close_connection = True
+            return
+        self._reply(200, body)
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    httpd.daemon_threads = True
+    httpd.connections, httpd.paths, httpd.failures = 0, [], 0
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_desktop_copy_matches_web():
+    assert (ROOT / "Дерево" / "http_client.py").read_bytes() == (ROOT / "web" / "http_client.py").read_bytes()
+
+
+def test_keep_alive_reuses_connection(server):
+    client = PooledHttpClient(pool_size=4)
+    for _ in range(5):
+        with client.urlopen(urllib.request.Request(server.url + "/ping"), timeout=5) as resp:
+            assert resp.status == 200 and resp.read() == b"ok"
+    req = urllib.request.Request(server.url + "/echo", data=b'{"a": 1}', method="POST")
+    assert client.urlopen(req, timeout=5).read() == b'{"a": 1}'
+    assert server.connections == 1
+    assert client.get_stats()["reused"] == 5
+
+    with pytest.raises(urllib.error.HTTPError) as e:
+        client.urlopen(urllib.request.Request(server.url + "/missing"), timeout=5)
+    assert e.value.code == 404 and e.value.read() == b'{"error": "nope"}'
+    client.close()
+
+
+def test_retries_idempotent_only(server):
+    client = PooledHttpClient(retries=2, backoff=0.001)
+    server.failures = 2
+    assert client.urlopen(urllib.request.Request(server.url + "/flaky"), timeout=5).read() == b"ok"
+    assert server.paths.count("/flaky") == 3 and client.get_stats()["retries"] == 2
+
+    server.paths.clear()
+    with pytest.raises(urllib.error.HTTPError) as e:
+        client.urlopen(urllib.request.Request(server.url + "/flaky", data=b"{}", method="POST"), timeout=5)
+    assert e.value.code == 503 and server.paths == ["/flaky"]
+
+    with pytest.raises(urllib.error.URLError):
+        PooledHttpClient(retries=1, backoff=0.001).urlopen(
+            urllib.request.Request("http://127.0.0.1:9/unreachable"), timeout=1)
+
+
+def test_stale_connection_is_replaced(server):
+    client = PooledHttpClient()
+    client.urlopen(urllib.request.Request(server.url + "/drop"), timeout=5)
+    time.sleep(0.05)
+    # Сервер закрыл соединение из пула: POST уходит по новому соединению без ошибки
+    req = urllib.request.Request(server.url + "/echo", data=b"x", method="POST")
+    assert client.urlopen(req, timeout=5).read() == b"x"
+    assert server.connections == 2 and server.paths.count("/echo") == 1
+
+
+def test_pool_size_bounds_connections(server):
+    client = PooledHttpClient(pool_size=2)
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        results = list(pool.map(
+            lambda _: client.urlopen(urllib.request.Request(server.url + "/slow"), timeout=5).status, range(12)))
+    assert results == [200] * 12
+    assert server.connections <= 2
+
+
+def test_post_is_not_resent_after_it_was_sent(server):
+    client = PooledHttpClient(retries=2, backoff=0.001)
+    client.urlopen(urllib.request.Request(server.url + "/ping"), timeout=5)
+    # Соединение из пула живо, запрос ушёл, ответа нет: сервер мог выполнить POST
+    with pytest.raises(urllib.error.URLError):
+        client.urlopen(urllib.request.Request(server.url + "/vanish", data=b"x", method="POST"), timeout=5)
+    assert server.paths.count("/vanish") == 1
+
+
+def test_get_follows_redirects(server):
+    client = PooledHttpClient()
+    with client.urlopen(urllib.request.Request(server.url + "/moved"), timeout=5) as resp:
+        assert resp.status == 200 and resp.read() == b"ok" and resp.url == server.url + "/ping"
+    assert server.paths == ["/moved", "/ping"]
+
+    with pytest.raises(urllib.error.HTTPError) as e:
+        client.urlopen(urllib.request.Request(server.url + "/moved", data=b"{}", method="POST"), timeout=5)
+    assert e.value.code == 302 and "/echo" not in server.paths
+
+
+def test_requests_go_through_configured_proxy(server):
+    # Тестовый сервер в роли прокси получает абсолютный URL
+    client = PooledHttpClient(proxies={"http": server.url})
+    assert client.urlopen(urllib.request.Request("http://sync.invalid/ping"), timeout=5).read() == b"ok"
+    assert server.paths == ["http://sync.invalid/ping"]
+
+    # Хост из исключений — напрямую, через пул
+    direct = PooledHttpClient(proxies={"http": "http://127.0.0.1:9", "no": "127.0.0.1"})
+    assert direct.urlopen(urllib.request.Request(server.url + "/ping"), timeout=5).read() == b"ok"
+    assert direct.get_stats()["connections"] == 1
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""Тесты обслуживания БД сервера синхронизации (maintenance.py)."""
+import json
+import sqlite3
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _age_rows(sync_server):
+    """Старые сессии и строки sync_logs, как после долгой работы сервера."""
+    conn = sqlite3.connect(sync_server.DB_FILE)
+    conn.executemany(
+        "INSERT INTO user_sessions (user_id, session_token, last_activity) VALUES (1, ?, datetime('now', ?))",
+        [(f"old{i}", "-10 days") for i in range(7)] + [("fresh", "-1 hour")]
+    )
+    conn.executemany(
+        "INSERT INTO sync_logs (user_id, action, entities_count, status, created_at) "
+        "VALUES (1, 'upload', ?, 'success', datetime('now', ?))",
+        [(10, "-200 days"), (5, "-200 days"), (1, "-150 days"), (3, "-1 days")]
+    )
+    conn.commit()
+    conn.close()
+
+
+def test_run_maintenance_prunes_and_rolls_up(sync_server, sync_headers):
+    from maintenance import run_maintenance
+    from stats_store import reconcile
+
+    _age_rows(sync_server)
+    conn = sqlite3.connect(sync_server.DB_FILE)
+    try:
+        report = run_maintenance(conn, session_days=2, log_days=90)
+        assert report["sessions_deleted"] == 7
+        assert report["logs_deleted"] == 3 and report["log_days_rolled_up"] == 2
+        assert report["auto_vacuum"] == "incremental"
+        assert set(report["timings_ms"]) == {"sessions", "sync_logs", "tombstones", "vacuum", "optimize"}
+
+        tokens = {row[0] for row in conn.execute("SELECT session_token FROM user_sessions")}
+        assert "fresh" in tokens and not any(t.startswith("old") for t in tokens)
+        assert conn.execute("SELECT COUNT(*) FROM sync_logs").fetchone()[0] == 1
+        rolled = conn.execute("SELECT sync_count, total_entities FROM sync_daily "
+                              "WHERE day = date('now', '-200 days')").fetchone()
+        assert rolled == (2, 15)
+        # Удалённые строки логов не считаются расхождением сводки (вчерашняя строка
+        # вставлена в обход log_sync — её день сверка дописывает)
+        recent = conn.execute("SELECT date('now', '-1 days')").fetchone()[0]
+        assert set(reconcile(conn)) <= {f"sync_daily:{recent}"}
+        # Повторный запуск — удалять нечего
+        assert run_maintenance(conn)["logs_deleted"] == 0
+    finally:
+        conn.close()
+
+    # Авторизация по живой сессии не пострадала
+    client = sync_server.app.test_client()
+    assert client.get("/api/auth/me", headers=sync_headers).status_code == 200
+
+
+def test_maintenance_cli_and_admin_endpoint(sync_server, sync_headers):
+    _age_rows(sync_server)
+    out = subprocess.run(
+        [sys.executable, str(ROOT / "sync_server" / "maintenance.py"), "--db", sync_server.DB_FILE,
+         "--log-days", "30", "--json"],
+        capture_output=True, text=True, check=True
+    ).stdout
+    report = json.loads(out[out.index("{"):])
+    assert report["sessions_deleted"] == 7 and report["logs_deleted"] == 3
+
+    client = sync_server.app.test_client()
+    r = client.post("/api/admin/maintenance", headers=sync_headers, json={"log_days": 0})
+    assert r.status_code == 200
+    assert r.get_json()["report"]["logs_deleted"] >= 1
+    runs = client.get("/api/admin/maintenance", headers=sync_headers).get_json()["runs"]
+    assert len(runs) == 2 and runs[0]["id"] > runs[1]["id"]
+
+
+def test_background_job_skips_when_recent(sync_server):
+    from maintenance import maintenance_due, run_if_due
+
+    conn = sqlite3.connect(sync_server.DB_FILE)
+    try:
+        assert maintenance_due(conn, interval=3600)
+        assert run_if_due(conn) is not None
+        assert run_if_due(conn) is None
+    finally:
+        conn.close()
+
+
+def test_concurrent_workers_claim_run_once(sync_server):
+    from maintenance import claim_run, recent_runs, run_maintenance
+
+    first, second = sqlite3.connect(sync_server.DB_FILE), sqlite3.connect(sync_server.DB_FILE)
+    try:
+        run_id = claim_run(first, interval=3600)
+        assert run_id is not None
+        # Пока первый воркер работает, второй видит занятый запуск
+        assert claim_run(second, interval=3600) is None
+        run_maintenance(first, run_id=run_id)
+        assert claim_run(second, interval=3600) is None
+
+        runs = recent_runs(second)
+        assert len(runs) == 1 and runs[0]["id"] == run_id and "total_ms" in runs[0]
+    finally:
+        first.close()
+        second.close()
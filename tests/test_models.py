@@ -6,7 +6,7 @@ from pathlib import Path
 ROOT = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(ROOT / "Дерево"))
 
-from models import FamilyTreeModel, Person  # noqa: E402
+from models import FamilyTreeModel, Person, canonical_id, marriage_pair  # noqa: E402
 
 
 def test_get_person_string_and_int_key():
@@ -26,3 +26,114 @@ def test_add_marriage_duplicate():
     ok2, _ = m.add_marriage("1", "2")
     assert ok1 is True
     assert ok2 is False
+
+
+def test_person_slots_and_relation_set_api():
+    p = Person(name="Иван", surname="Иванов", gender="Мужской", birth_place="Минск")
+    assert not hasattr(p, "__dict__")
+    assert p.gender is Person(gender="".join(["Муж", "ской"])).gender
+
+    p.parents = {"1", "2"}
+    p.parents.add("2")
+    p.children.update(str(i) for i in range(20))
+    p.spouse_ids.add("5")
+    p.spouse_ids.discard("5")
+    assert p.parents == {"1", "2"} and {"1", "2"} == p.parents and "1" in p.parents
+    assert len(p.children) == 20 and "19" in p.children and not p.spouse_ids
+    assert p.parents & {"2", "3"} == {"2"} and set(p.children) - {"0"} == {str(i) for i in range(1, 20)}
+    p.children.remove("0")
+    assert sorted(p.to_dict()["children"], key=int) == [str(i) for i in range(1, 20)]
+    assert p.to_dict()["birth_place"] == "Минск" and "_parents" not in p.to_dict()
+
+
+def test_save_load_roundtrip_keeps_relations(tmp_path):
+    m = FamilyTreeModel()
+    a, _ = m.add_person("Иван", "Иванов", gender="Мужской")
+    b, _ = m.add_person("Анна", "Иванова", gender="Женский")
+    c, _ = m.add_person("Пётр", "Иванов", gender="Мужской")
+    m.add_parent(c, a)
+    m.add_parent(c, b)
+    m.add_marriage(a, b, "01.01.1900")
+    path = tmp_path / "tree.json"
+    assert m.save_to_file(str(path))
+
+    loaded = FamilyTreeModel()
+    assert loaded.load_from_file(str(path))
+    assert loaded.persons[c].parents == {a, b} and loaded.persons[a].children == {c}
+    assert loaded.persons[a].spouse_ids == {b} and loaded.get_marriage_date(a, b) == "01.01.1900"
+    assert loaded.persons[a].children.copy() == {c}
+
+
+def test_canonical_ids_and_registry():
+    assert canonical_id(42) is canonical_id(" 42 ") is canonical_id("".join(["4", "2"]))
+    assert canonical_id(None) is None and canonical_id("  ") is None
+    assert marriage_pair(7, "10") == ("10", "7")
+
+    m = FamilyTreeModel()
+    m.persons[7] = Person(name="А", surname="Б", gender="Мужской")
+    m.persons["8"] = Person(name="В", surname="Г", gender="Женский")
+    assert list(m.persons) == ["7", "8"] and m.persons["7"].id == "7"
+    assert m.persons[7] is m.persons["7"] and m.get_person(" 7") is m.persons["7"]
+    assert m.resolve_id(8) == "8" and m.resolve_id(9) is None
+    try:
+        m.persons[""] = Person()
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("пустой id принят")
+
+    m.current_center = 7
+    assert m.current_center == "7"
+    ok, _ = m.add_parent(7, 8)
+    assert ok and m.persons["7"].parents == {"8"} and 8 in m.persons["7"].parents
+    assert m.validate_ids() == []
+
+    m.persons["7"].children.add("99")
+    m.marriages[("8", "7")] = {"date": ""}
+    problems = m.validate_ids()
+    assert len(problems) == 2 and "99" in problems[0]
+
+
+def _family(n):
+    m = FamilyTreeModel()
+    for i in range(n):
+        m.add_person(f"Имя{i}", "Тестов", gender="Мужской" if i % 2 else "Женский")
+    return m
+
+
+def test_ancestor_index_cycles_and_blood_relatives():
+    m = _family(6)
+    assert m.add_parent("3", "1")[0] and m.add_parent("3", "2")[0]
+    assert m.add_parent("5", "3")[0] and m.add_parent("6", "4")[0]
+    assert m.add_parent("1", "5")[0] is False  # 1 — предок 5: цикл
+    assert m.add_parent("1", "1")[0] is False
+    assert m.add_parent("5", "1")[0] is True  # уже предок через 3 — не цикл
+    assert m.creates_cycle("5", "2") and not m.creates_cycle("4", "5")
+    assert m._is_blood_relative("3", "5") and not m._is_blood_relative("5", "6")
+    assert m.add_marriage("5", "6")[0] is True
+    assert m.check_ancestors() == []
+
+    ok, _ = m.delete_person("3")
+    assert ok and not m._is_blood_relative("1", "5")
+    assert m.persons["5"].parents == {"1"} and m.check_ancestors() == []
+
+
+def test_ancestor_index_follows_direct_edits_and_reports_problems():
+    import random
+
+    m = _family(40)
+    rnd = random.Random(7)
+    for _ in range(120):
+        child, parent = str(rnd.randint(1, 40)), str(rnd.randint(1, 40))
+        m.add_parent(child, parent)
+    assert m.check_ancestors() == []
+
+    # Правка в обход модели (как undo или синхронизация) — индекс перестраивается
+    new_id, _ = m.add_person("Новый", "Тестов", gender="Мужской")
+    m.persons[new_id].parents.add("1")
+    m.persons["1"].children.add(new_id)
+    assert m.creates_cycle(new_id, "1") and m._ancestors().is_ancestor("1", new_id)
+    assert m.check_ancestors() == []
+
+    m.persons["3"].parents.add("4")  # без обратной связи
+    assert any("не знает о ребёнке" in p for p in m.check_ancestors())
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""Тесты отдачи фото web из дискового кэша (photo_cache): ETag, 304, immutable URL по хешу."""
+import base64
+import hashlib
+import json
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 20
+FULL = b"\xff\xd8\xff" + bytes(range(256)) * 60
+PNG_HASH = hashlib.sha256(PNG).hexdigest()
+FULL_HASH = hashlib.sha256(FULL).hexdigest()
+
+
+def _tree(n):
+    persons = {str(i): {"name": f"Иван{i}", "surname": "Тестов", "gender": "Мужской",
+                        "parents": [], "children": [], "spouse_ids": [],
+                        "photo": base64.b64encode(PNG).decode() if i > 1 else None}
+               for i in range(1, n + 1)}
+    persons["2"]["photo_full"] = base64.b64encode(FULL).decode()
+    return {"persons": persons, "marriages": [], "current_center": "1"}
+
+
+def _client(web_app, **extra):
+    client = web_app.app.test_client()
+    with client.session_transaction() as s:
+        s["username"] = "ivan"
+        s.update(extra)
+    return client
+
+
+def test_person_photos_served_without_parsing_tree(web_app):
+    import tree_service
+
+    tree_service.save_tree("ivan", _tree(50))
+    client = _client(web_app)
+    for i in range(2, 51):
+        r = client.get(f"/api/photo/{i}")
+        assert r.status_code == 200 and r.mimetype == "image/png" and r.data == PNG
+        assert r.headers["ETag"] == f'"{PNG_HASH}"' and r.headers["Cache-Control"] == "private, no-cache"
+    assert tree_service.tree_cache.get_stats()["misses"] == 0
+
+    r = client.get("/api/photo/3", headers={"If-None-Match": f'"{PNG_HASH}"'})
+    assert r.status_code == 304 and r.data == b""
+    full = client.get("/api/photo/2/full")
+    assert full.data == FULL and full.mimetype == "image/jpeg" and full.headers["ETag"] == f'"{FULL_HASH}"'
+    assert client.get("/api/photo/3/full").data == PNG
+    # У персоны без фото — прежний путь через дерево
+    assert client.get("/api/photo/1").status_code == 404
+
+
+def test_hash_url_is_immutable_and_renditions(web_app):
+    import tree_service
+
+    tree_service.save_tree("ivan", _tree(3))
+    client = _client(web_app)
+    for suffix in ("", "/thumb", "/card", "/full"):
+        r = client.get(f"/api/photo/hash/{FULL_HASH}{suffix}")
+        assert r.status_code == 200 and r.mimetype.startswith("image/")
+        assert r.headers["Cache-Control"] == "private, max-age=31536000, immutable"
+        again = client.get(f"/api/photo/hash/{FULL_HASH}{suffix}", headers={"If-None-Match": r.headers["ETag"]})
+        assert again.status_code == 304
+    assert client.get(f"/api/photo/hash/{FULL_HASH}/huge").status_code == 404
+    # Неизвестный хеш без токена сервера — 404, без сессии — 401
+    assert client.get("/api/photo/hash/" + "0" * 64).status_code == 404
+    assert web_app.app.test_client().get(f"/api/photo/hash/{FULL_HASH}").status_code == 401
+
+
+def test_index_follows_external_changes_and_other_workers(web_app):
+    import tree_service
+    from photo_cache import PhotoCache
+
+    tree_service.save_tree("ivan", _tree(3))
+    path = tree_service.get_data_path("ivan")
+    # Файл изменил другой процесс: индекс устарел и строится заново один раз
+    data = _tree(3)
+    data["persons"]["3"]["photo"] = base64.b64encode(FULL).decode()
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    assert tree_service.photo_hashes("ivan")["3"] == {"photo": FULL_HASH}
+    assert tree_service.photo_hashes("ivan")["2"]["photo"] == PNG_HASH
+    assert tree_service.tree_cache.get_stats()["misses"] == 1
+
+    # Другой воркер читает индекс с диска, не разбирая дерево
+    other = PhotoCache(tree_service.photo_cache.root)
+    st = tree_service.os.stat(path)
+    assert other.lookup(path, (st.st_mtime_ns, st.st_size))["3"] == {"photo": FULL_HASH}
+    assert other.lookup(path, (st.st_mtime_ns, st.st_size + 1)) is None
+
+
+def test_server_photo_fetched_once_then_cached(web_app, sync_urlopen, sync_server, sync_headers):
+    sync_server.app.test_client().post("/api/sync/upload", headers=sync_headers, json={"tree": {
+        "persons": {"1": {"name": "Иван", "photo": base64.b64encode(PNG).decode(),
+                          "parents": [], "children": [], "spouse_ids": []}}, "marriages": []}})
+    client = _client(web_app, server_token=sync_headers["Authorization"].split()[1])
+
+    for _ in range(3):
+        r = client.get(f"/api/photo/hash/{PNG_HASH}/card")
+        assert r.status_code == 200 and r.data == PNG
+    assert [path for _, path, _, _ in sync_urlopen] == [f"/api/photos/{PNG_HASH}"]
+
+
+def test_cached_photo_is_not_served_to_other_users(web_app):
+    import tree_service
+
+    tree_service.save_tree("ivan", _tree(3))
+    assert _client(web_app).get(f"/api/photo/hash/{PNG_HASH}").status_code == 200
+
+    # Кэш общий, но хеша нет в дереве petr, а сервер ему фото не отдавал
+    other = web_app.app.test_client()
+    with other.session_transaction() as s:
+        s["username"] = "petr"
+    assert other.get(f"/api/photo/hash/{PNG_HASH}").status_code == 404
+    assert other.get(f"/api/photo/hash/{PNG_HASH}/card").status_code == 404
+
+
+def test_foreign_hash_is_checked_by_server(web_app, sync_urlopen, sync_server, sync_headers):
+    import tree_service
+
+    tree_service.save_tree("ivan", _tree(3))
+    client = sync_server.app.test_client()
+    client.post("/api/auth/register", json={"login": "petr", "password": "secret1"})
+    token = client.post("/api/auth/login", json={"login": "petr", "password": "secret1"}).get_json()["token"]
+    other = web_app.app.test_client()
+    with other.session_transaction() as s:
+        s["username"], s["server_token"] = "petr", token
+    assert other.get(f"/api/photo/hash/{PNG_HASH}").status_code == 404
+    assert [path for _, path, _, _ in sync_urlopen] == [f"/api/photos/{PNG_HASH}"]
+
+
+def test_server_photo_grants_are_bounded():
+    from server_tree_cache import PhotoGrantCache
+
+    grants = PhotoGrantCache(max_entries=2)
+    grants.grant("ivan", "a")
+    grants.grant("petr", "b")
+    assert grants.allowed("ivan", "a")
+    grants.grant("petr", "c")
+    assert grants.allowed("ivan", "a") and grants.allowed("petr", "c")
+    assert not grants.allowed("petr", "b") and not grants.allowed("petr", "a")
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""Тесты присутствия пользователей сервера синхронизации (presence.py)."""
+import sqlite3
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "sync_server"))
+
+from presence import PresenceTracker  # noqa: E402
+
+
+def test_tracker_expires_by_heap():
+    tracker = PresenceTracker(timeout=300)
+    tracker.mark(1, now=0)
+    tracker.mark(2, now=100)
+    for t in range(0, 250, 10):
+        tracker.mark(1, now=t)
+    # Повторные визиты не добавляют записей в кучу
+    assert tracker.get_stats()["heap"] == 2
+    assert tracker.online(now=350) == {1: 240, 2: 100}
+    assert tracker.online(now=420) == {1: 240}
+    assert tracker.last_seen(1, now=539) == 240 and tracker.last_seen(1, now=540) is None
+    assert tracker.online(now=540) == {}
+    assert tracker.get_stats()["heap"] == 0
+
+    tracker.mark(3, now=600)
+    tracker.forget_user(3)
+    assert tracker.online(now=601) == {}
+
+
+def test_flush_batches_last_activity(sync_server, sync_headers, monkeypatch):
+    statements = []
+    connect = sync_server.db_pool._connect
+
+    def _connect():
+        conn = connect()
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    sync_server.db_pool.close_all()
+    monkeypatch.setattr(sync_server.db_pool, "_connect", _connect)
+    client = sync_server.app.test_client()
+    token = sync_headers["Authorization"].split()[1]
+    conn = sqlite3.connect(sync_server.DB_FILE)
+    conn.execute("UPDATE user_sessions SET last_activity = datetime('now', '-2 hours') WHERE session_token = ?",
+                 (token,))
+    conn.commit()
+    sync_server.token_cache.clear()
+
+    statements.clear()
+    for _ in range(20):
+        assert client.post("/api/heartbeat", headers=sync_headers).status_code == 200
+    # Пинги не пишут в БД: last_activity ждёт фоновой записи пачкой
+    assert not [s for s in statements if s.lstrip().upper().startswith("UPDATE")]
+    assert sync_server.presence.get_stats()["pending"] == 1
+
+    assert sync_server.db_pool.run(sync_server.presence.flush) == 1
+    fresh = conn.execute("SELECT last_activity > datetime('now', '-1 minute') FROM user_sessions "
+                         "WHERE session_token = ?", (token,)).fetchone()[0]
+    conn.close()
+    assert fresh == 1
+    assert sync_server.db_pool.run(sync_server.presence.flush) == 0
+
+
+def test_admin_users_reads_presence(sync_server, sync_headers, monkeypatch):
+    statements = []
+    connect = sync_server.db_pool._connect
+
+    def _connect():
+        conn = connect()
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    client = sync_server.app.test_client()
+    client.post("/api/auth/register", json={"login": "ivan", "password": "secret1"})
+    client.post("/api/auth/register", json={"login": "petr", "password": "secret1"})
+    token = client.post("/api/auth/login", json={"login": "ivan", "password": "secret1"}).get_json()["token"]
+    client.post("/api/heartbeat", headers={"Authorization": f"Bearer {token}"})
+
+    sync_server.db_pool.close_all()
+    monkeypatch.setattr(sync_server.db_pool, "_connect", _connect)
+    users = {u["login"]: u for u in client.get("/api/admin/users", headers=sync_headers).get_json()["users"]}
+    assert users["ivan"]["is_online"] and users["ivan"]["last_activity"]
+    assert not users["petr"]["is_online"] and users["petr"]["last_activity"] is None
+    assert users["admin"]["is_online"]
+    # Без коррелированного подзапроса по сессиям на каждого пользователя
+    assert not [s for s in statements if "user_sessions.user_id = users.id" in s]
+
+    # Визит, записанный другим воркером, виден через user_sessions
+    sync_server.presence.forget_user(users["ivan"]["id"])
+    users = {u["login"]: u for u in client.get("/api/admin/users", headers=sync_headers).get_json()["users"]}
+    assert users["ivan"]["is_online"]
+
+    client.post(f"/api/admin/user/{users['ivan']['id']}/toggle", headers=sync_headers)
+    assert users["ivan"]["id"] not in sync_server.presence.online()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""Тесты потоковой выдачи JSON (/api/sync/download, /api/tree)."""
+import base64
+import gzip
+import json
+
+
+def test_iter_json_matches_json_dumps(sync_server):
+    from http_cache import JsonArrayStream, JsonObjectStream, iter_json
+
+    value = {"tree": {"persons": {"1": {"name": "Иван", "parents": []}, "2": {"name": "Анна"}},
+                      "marriages": [{"persons": ["1", "2"], "date": ""}]},
+             "tree_name": "Дерево", "revision": 3}
+    streamed = JsonObjectStream([
+        ("tree", JsonObjectStream([
+            ("persons", JsonObjectStream(iter(value["tree"]["persons"].items()))),
+            ("marriages", JsonArrayStream(iter(value["tree"]["marriages"]))),
+        ])),
+        ("tree_name", "Дерево"),
+        ("revision", 3),
+    ])
+    assert json.loads("".join(iter_json(streamed))) == value
+    assert "".join(iter_json(JsonObjectStream({}))) == "{}"
+    assert "".join(iter_json(JsonArrayStream(iter([])))) == "[]"
+
+
+def test_download_is_streamed_in_chunks(sync_server, sync_headers, monkeypatch):
+    import http_cache
+
+    monkeypatch.setattr(http_cache, "STREAM_CHUNK_BYTES", 1024)
+    photo = base64.b64encode(b"\xff\xd8\xff" + bytes(range(256)) * 8).decode()
+    persons = {str(i): {"name": f"Иван{i}", "surname": "Тестов", "gender": "Мужской",
+                        "photo": photo if i == 1 else None,
+                        "parents": [], "children": [], "spouse_ids": ["2"] if i == 1 else []}
+               for i in range(1, 301)}
+    persons["2"]["spouse_ids"] = ["1"]
+    client = sync_server.app.test_client()
+    client.post("/api/sync/upload", headers=sync_headers,
+                json={"tree": {"persons": persons, "marriages": [{"persons": ["1", "2"], "date": "1900"}]}})
+
+    r = client.get("/api/sync/download?include_photos=1", headers=sync_headers, buffered=False)
+    assert r.is_streamed
+    chunks = list(r.response)
+    r.close()
+    assert len(chunks) > 1
+    data = json.loads(b"".join(chunks))
+    assert len(data["tree"]["persons"]) == 300
+    assert data["tree"]["persons"]["1"]["photo"] == photo
+    assert data["tree"]["marriages"] == [{"persons": ["1", "2"], "date": "1900"}]
+    assert data["revision"] >= 1 and data["tree_name"]
+
+    # Сжатый поток — корректный gzip
+    r = client.get("/api/sync/download", headers={**sync_headers, "Accept-Encoding": "gzip"})
+    assert json.loads(gzip.decompress(r.get_data()))["tree"]["persons"]["300"]["name"] == "Иван300"
+    # Соединение генератора вернулось в пул
+    stats = sync_server.db_pool.get_stats()
+    assert stats["idle"] == stats["open"]
+
+
+def test_web_local_tree_stream_and_304(web_app):
+    from tree_service import save_tree
+
+    save_tree("ivan", {"persons": {"1": {"name": "Иван", "parents": [], "children": [], "spouse_ids": []}},
+                       "marriages": [], "current_center": "1"})
+    client = web_app.app.test_client()
+    with client.session_transaction() as s:
+        s["username"] = "ivan"
+
+    r = client.get("/api/tree")
+    assert r.get_json() == {"persons": {"1": {"name": "Иван", "parents": [], "children": [], "spouse_ids": []}},
+                            "marriages": [], "current_center": "1"}
+    assert client.get("/api/tree", headers={"If-None-Match": r.headers["ETag"]}).status_code == 304
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""Тесты кэша токенов require_auth на сервере синхронизации."""
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "sync_server"))
+
+from auth_cache import TokenCache  # noqa: E402
+
+
+def test_entry_expires_by_ttl_and_session_lifetime():
+    cache = TokenCache(ttl=30, max_entries=10, touch_interval=60)
+    cache.put("t1", 1, False, session_expires_at=1000 + 3600, now=1000)
+    assert cache.get("t1", now=1029) == (1, False)
+    assert cache.get("t1", now=1031) is None
+
+    # Сессия истекает раньше TTL
+    cache.put("t2", 2, True, session_expires_at=1010, now=1000)
+    assert cache.get("t2", now=1009) == (2, True)
+    assert cache.get("t2", now=1011) is None
+
+
+def test_invalidate_user_drops_all_tokens():
+    cache = TokenCache(ttl=30, max_entries=10)
+    cache.put("a", 1, False, session_expires_at=10 ** 10)
+    cache.put("b", 1, False, session_expires_at=10 ** 10)
+    cache.put("c", 2, False, session_expires_at=10 ** 10)
+    cache.invalidate_user(1)
+    assert cache.get("a") is None and cache.get("b") is None
+    assert cache.get("c") == (2, False)
+
+
+def test_touch_is_coalesced():
+    cache = TokenCache(ttl=30, touch_interval=60)
+    assert cache.should_touch("t", now=0)
+    assert not cache.should_touch("t", now=59)
+    assert cache.should_touch("t", now=61)
+
+
+def test_require_auth_uses_cache_and_invalidation(sync_server, sync_headers):
+    client = sync_server.app.test_client()
+    cache = sync_server.token_cache
+
+    assert client.get("/api/auth/me", headers=sync_headers).status_code == 200
+    hits = cache.get_stats()["hits"]
+    assert client.get("/api/auth/me", headers=sync_headers).status_code == 200
+    assert cache.get_stats()["hits"] == hits + 1
+
+    # Пользователь, которого блокирует администратор
+    client.post("/api/auth/register", json={"login": "user1", "password": "secret1"})
+    login = client.post("/api/auth/login", json={"login": "user1", "password": "secret1"}).get_json()
+    user_headers = {"Authorization": f"Bearer {login['token']}"}
+    assert client.get("/api/admin/users", headers=user_headers).status_code == 403
+
+    # Выдача прав администратора действует сразу
+    client.post(f"/api/admin/user/{login['user_id']}/grant-admin", headers=sync_headers)
+    assert client.get("/api/admin/users", headers=user_headers).status_code == 200
+
+    # Блокировка — сразу 401
+    client.post(f"/api/admin/user/{login['user_id']}/toggle", headers=sync_headers)
+    assert client.get("/api/auth/me", headers=user_headers).status_code == 401
+
+    # Выход — токен больше не принимается
+    assert client.post("/api/auth/logout", headers=sync_headers).status_code == 200
+    assert client.get("/api/auth/me", headers=sync_headers).status_code == 401
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""Тесты пула соединений SQLite сервера синхронизации."""
+import sqlite3
+import sys
+import threading
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "sync_server"))
+
+from db_pool import ConnectionPool, PoolTimeout  # noqa: E402
+
+import pytest  # noqa: E402
+
+
+def _make_pool(tmp_path, **kwargs):
+    pool = ConnectionPool(str(tmp_path / "pool.db"), **kwargs)
+    conn = pool.acquire()
+    conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, writer INTEGER, n INTEGER)")
+    conn.commit()
+    pool.release(conn)
+    return pool
+
+
+def test_pragmas_applied_once_per_connection(tmp_path):
+    pool = _make_pool(tmp_path, size=2)
+    conn = pool.acquire()
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+    assert conn.execute("PRAGMA foreign_keys").fetchone()[0] == 1
+    assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == pool.busy_timeout_ms
+    pool.release(conn)
+    # Повторная выдача не открывает новое соединение
+    again = pool.acquire()
+    assert again is conn
+    pool.release(again)
+    assert pool.get_stats()["connections"] == 1
+    pool.close_all()
+
+
+def test_synchronous_mode_is_whitelisted(tmp_path, monkeypatch):
+    monkeypatch.setenv("SYNC_DB_SYNCHRONOUS", "full")
+    assert ConnectionPool(str(tmp_path / "pool.db")).synchronous == "FULL"
+    monkeypatch.setenv("SYNC_DB_SYNCHRONOUS", "OFF; DROP TABLE users")
+    with pytest.raises(ValueError, match="SYNC_DB_SYNCHRONOUS"):
+        ConnectionPool(str(tmp_path / "pool.db"))
+
+
+def test_release_rolls_back_open_transaction(tmp_path):
+    pool = _make_pool(tmp_path, size=1)
+    conn = pool.acquire()
+    conn.execute("INSERT INTO items (writer, n) VALUES (1, 1)")
+    pool.release(conn)
+    conn = pool.acquire()
+    assert conn.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 0
+    pool.release(conn)
+    pool.close_all()
+
+
+def test_pool_timeout_when_exhausted(tmp_path):
+    pool = _make_pool(tmp_path, size=1, timeout=0.05)
+    conn = pool.acquire()
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    pool.release(conn)
+    stats = pool.get_stats()
+    assert stats["waits"] == 1
+    assert stats["timeouts"] == 1
+    pool.close_all()
+
+
+def test_run_retries_on_lock(tmp_path):
+    pool = _make_pool(tmp_path, size=1, lock_retries=3)
+    calls = []
+
+    def flaky(conn):
+        calls.append(1)
+        if len(calls) < 3:
+            raise sqlite3.OperationalError("database is locked")
+        return "ok"
+
+    assert pool.run(flaky) == "ok"
+    assert len(calls) == 3
+    assert pool.get_stats()["lock_retries"] == 2
+    pool.close_all()
+
+
+def test_concurrent_readers_and_writers(tmp_path):
+    pool = _make_pool(tmp_path, size=4, busy_timeout_ms=5000)
+    writers, readers, rows_per_writer = 4, 8, 50
+    errors = []
+
+    def writer(wid):
+        def insert(conn, n):
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("INSERT INTO items (writer, n) VALUES (?, ?)", (wid, n))
+            conn.commit()
+        try:
+            for n in range(rows_per_writer):
+                pool.run(insert, n)
+        except Exception as e:  # pragma: no cover - отчёт об ошибке
+            errors.append(e)
+
+    def reader():
+        try:
+            for _ in range(rows_per_writer):
+                conn = pool.acquire()
+                try:
+                    conn.execute("SELECT COUNT(*) FROM items").fetchone()
+                finally:
+                    pool.release(conn)
+        except Exception as e:  # pragma: no cover - отчёт об ошибке
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    threads += [threading.Thread(target=reader) for _ in range(readers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    conn = pool.acquire()
+    assert conn.execute("SELECT COUNT(*) FROM items").fetchone()[0] == writers * rows_per_writer
+    pool.release(conn)
+    stats = pool.get_stats()
+    assert stats["open"] <= 4
+    assert stats["checkouts"] >= writers * rows_per_writer + readers * rows_per_writer
+    pool.close_all()
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""Тесты дельта-синхронизации по ревизиям (сервер + SyncClient)."""
+
+
+def _person(name, **extra):
+    data = {"name": name, "surname": "Тестов", "gender": "Мужской",
+            "parents": [], "children": [], "spouse_ids": []}
+    data.update(extra)
+    return data
+
+
+def _changes(client, headers, since):
+    r = client.get(f"/api/sync/changes?since={since}", headers=headers)
+    assert r.status_code == 200
+    return r.get_json()
+
+
+def test_revision_advances_only_on_changes(sync_server, sync_headers):
+    client = sync_server.app.test_client()
+    tree = {"persons": {"1": _person("Иван"), "2": _person("Анна")},
+            "marriages": [{"persons": ["1", "2"], "date": ""}]}
+
+    r1 = client.post("/api/sync/upload", headers=sync_headers, json={"tree": tree}).get_json()
+    assert r1["revision"] == 1
+    r2 = client.post("/api/sync/upload", headers=sync_headers, json={"tree": tree}).get_json()
+    assert r2["revision"] == 1  # ничего не изменилось
+
+    full = _changes(client, sync_headers, 0)
+    assert full["full"] is True and full["revision"] == 1
+    assert sorted(full["persons"]) == ["1", "2"]
+
+    tree["persons"]["2"] = _person("Анна", birth_date="01.01.1960")
+    del tree["persons"]["1"]
+    tree["marriages"] = []
+    r3 = client.post("/api/sync/upload", headers=sync_headers, json={"tree": tree}).get_json()
+    assert r3["revision"] == 2
+
+    delta = _changes(client, sync_headers, 1)
+    assert delta["full"] is False
+    assert list(delta["persons"]) == ["2"]
+    assert delta["deleted_persons"] == ["1"]
+    assert delta["deleted_marriages"] == [["1", "2"]]
+    assert _changes(client, sync_headers, 2)["persons"] == {}
+
+
+def test_delta_upload_and_conflict(sync_server, sync_headers):
+    client = sync_server.app.test_client()
+    tree = {"persons": {"1": _person("Иван"), "2": _person("Пётр")}, "marriages": []}
+    base = client.post("/api/sync/upload", headers=sync_headers, json={"tree": tree}).get_json()["revision"]
+
+    r = client.post("/api/sync/delta", headers=sync_headers, json={
+        "base_revision": base,
+        "persons": {"3": _person("Олег")},
+        "deleted_persons": ["2"],
+        "marriages": [{"persons": ["1", "3"], "date": "1990"}],
+        "deleted_marriages": [],
+    })
+    assert r.status_code == 200
+    body = r.get_json()
+    assert body["revision"] == base + 1
+    assert body["stats"]["persons"]["inserted"] == 1
+    assert body["stats"]["persons"]["deleted"] == 1
+
+    downloaded = client.get("/api/sync/download", headers=sync_headers).get_json()
+    assert sorted(downloaded["tree"]["persons"]) == ["1", "3"]
+    assert downloaded["revision"] == base + 1
+
+    # Устаревшая базовая ревизия — конфликт, ничего не записано
+    r = client.post("/api/sync/delta", headers=sync_headers, json={
+        "base_revision": base, "persons": {"4": _person("Лев")},
+    })
+    assert r.status_code == 409
+    assert r.get_json()["revision"] == base + 1
+    assert "4" not in client.get("/api/sync/download", headers=sync_headers).get_json()["tree"]["persons"]
+
+
+def test_reinserted_person_is_not_reported_deleted(sync_server, sync_headers):
+    client = sync_server.app.test_client()
+    tree = {"persons": {"1": _person("Иван"), "2": _person("Пётр")}, "marriages": []}
+    client.post("/api/sync/upload", headers=sync_headers, json={"tree": tree})
+    client.post("/api/sync/upload", headers=sync_headers,
+                json={"tree": {"persons": {"1": tree["persons"]["1"]}, "marriages": []}})
+    client.post("/api/sync/upload", headers=sync_headers, json={"tree": tree})
+
+    delta = _changes(client, sync_headers, 1)
+    assert delta["deleted_persons"] == []
+    assert list(delta["persons"]) == ["2"]
+
+
+def test_sync_client_sends_only_changes(sync_client):
+    tree = {"persons": {str(i): _person(f"П{i}") for i in range(1, 51)}, "marriages": []}
+    first = sync_client.upload_tree_data(tree)
+    assert sync_client.revision == first["revision"]
+    assert sync_client.requests[-1][1] == "/api/sync/upload"
+
+    # Без изменений — запрос не нужен
+    assert sync_client.upload_tree_data(tree)["revision"] == first["revision"]
+    assert sync_client.requests[-1][1] == "/api/sync/upload"
+
+    tree["persons"]["7"] = _person("П7", notes="правка")
+    del tree["persons"]["8"]
+    result = sync_client.upload_tree_data(tree)
+    assert sync_client.requests[-1][1] == "/api/sync/delta"
+    assert result["stats"]["persons"]["updated"] == 1
+    assert result["stats"]["persons"]["deleted"] == 1
+    assert sync_client.revision == first["revision"] + 1
+
+    changes = sync_client.get_changes()
+    assert changes["full"] is False and changes["persons"] == {}
+    # Ответ «нет изменений» на порядки меньше полного дерева
+    assert sync_client.requests[-1][2] < 300
+
+
+def test_sync_client_falls_back_to_full_upload_on_conflict(sync_client, sync_server, sync_headers):
+    tree = {"persons": {"1": _person("Иван")}, "marriages": []}
+    sync_client.upload_tree_data(tree)
+    # Другое устройство изменило дерево
+    sync_server.app.test_client().post("/api/sync/upload", headers=sync_headers,
+                                       json={"tree": {"persons": {"1": _person("Иван"), "2": _person("Пётр")}}})
+
+    tree["persons"]["3"] = _person("Олег")
+    sync_client.upload_tree_data(tree)
+    assert [r[1] for r in sync_client.requests[-2:]] == ["/api/sync/delta", "/api/sync/upload"]
+    assert sync_client.compute_delta(tree) == {
+        "persons": {}, "deleted_persons": [], "marriages": [], "deleted_marriages": []}
+
+
+def test_apply_changes_matches_full_download(sync_client, sync_server, sync_headers):
+    http = sync_server.app.test_client()
+    tree = {"persons": {"1": _person("Иван"), "2": _person("Анна")},
+            "marriages": [{"persons": ["1", "2"], "date": ""}]}
+    sync_client.upload_tree_data(tree)
+    local = sync_client.apply_changes({}, sync_client.get_changes() | {"full": True})
+    sync_client.remember_tree(local, sync_client.revision)
+
+    http.post("/api/sync/upload", headers=sync_headers, json={"tree": {
+        "persons": {"1": _person("Иван", notes="x"), "3": _person("Олег")},
+        "marriages": [{"persons": ["1", "3"], "date": "2000"}]}})
+    changes = sync_client.get_changes()
+    local = sync_client.apply_changes(local, changes)
+    sync_client.remember_changes(local, changes)
+
+    server = http.get("/api/sync/download", headers=sync_headers).get_json()["tree"]
+    assert local["persons"] == server["persons"]
+    assert local["marriages"] == server["marriages"]
+    assert sync_client.revision == changes["revision"]
+
+
+def test_web_tree_cache_applies_changes_without_mutating_cached_tree():
+    from server_tree_cache import ServerTreeCache, apply_changes
+
+    cached = apply_changes(None, {"full": True, "persons": {"1": _person("Иван", parents=[2])},
+                                  "marriages": [["1", "2"]]})
+    assert cached["persons"]["1"]["parents"] == ["2"]
+
+    updated = apply_changes(cached, {"full": False, "persons": {"3": _person("Олег")},
+                                     "deleted_persons": ["1"], "marriages": [],
+                                     "deleted_marriages": [["1", "2"]]})
+    assert list(updated["persons"]) == ["3"] and updated["marriages"] == []
+    assert list(cached["persons"]) == ["1"] and cached["marriages"] == [["1", "2"]]
+
+    cache = ServerTreeCache(max_entries=1)
+    cache.put("a", 1, cached)
+    cache.put("b", 2, updated)
+    assert cache.get("a") == (0, None)
+    assert cache.get("b") == (2, updated)
+
+
+def test_pruned_tombstones_force_full_snapshot(sync_server, sync_headers):
+    import sqlite3
+
+    from maintenance import run_maintenance
+
+    client = sync_server.app.test_client()
+    tree = {"persons": {"1": _person("Иван"), "2": _person("Пётр")}, "marriages": []}
+    client.post("/api/sync/upload", headers=sync_headers, json={"tree": tree})
+    del tree["persons"]["2"]
+    assert client.post("/api/sync/upload", headers=sync_headers, json={"tree": tree}).get_json()["revision"] == 2
+    tree["persons"]["3"] = _person("Олег")
+    assert client.post("/api/sync/upload", headers=sync_headers, json={"tree": tree}).get_json()["revision"] == 3
+
+    conn = sqlite3.connect(sync_server.DB_FILE)
+    try:
+        conn.execute("UPDATE sync_tombstones SET created_at = datetime('now', '-200 days')")
+        conn.commit()
+        assert run_maintenance(conn, tombstone_days=90)["tombstones_deleted"] == 1
+        assert conn.execute("SELECT COUNT(*) FROM sync_tombstones").fetchone()[0] == 0
+    finally:
+        conn.close()
+
+    # Ниже tombstone_floor удаление уже не восстановить — полный снимок
+    stale = _changes(client, sync_headers, 1)
+    assert stale["full"] is True and sorted(stale["persons"]) == ["1", "3"]
+    fresh = _changes(client, sync_headers, 2)
+    assert fresh["full"] is False and list(fresh["persons"]) == ["3"]
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""Тесты хранилища фото по SHA-256 на сервере синхронизации."""
+import base64
+import hashlib
+import sqlite3
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 40
+PHOTO_B64 = base64.b64encode(PNG).decode()
+PHOTO_HASH = hashlib.sha256(PNG).hexdigest()
+
+
+def _person(name, **extra):
+    data = {"name": name, "surname": "Тестов", "gender": "Мужской",
+            "parents": [], "children": [], "spouse_ids": []}
+    data.update(extra)
+    return data
+
+
+def _upload(client, headers, persons):
+    r = client.post("/api/sync/upload", headers=headers, json={"tree": {"persons": persons, "marriages": []}})
+    assert r.status_code == 200
+    return r.get_json()
+
+
+def _photo_rows(sync_server):
+    conn = sqlite3.connect(sync_server.DB_FILE)
+    try:
+        return conn.execute("SELECT hash, size FROM photos").fetchall()
+    finally:
+        conn.close()
+
+
+def test_download_returns_hashes_and_photo_endpoint_serves_bytes(sync_server, sync_headers):
+    client = sync_server.app.test_client()
+    _upload(client, sync_headers, {"1": _person("Иван", photo=PHOTO_B64), "2": _person("Пётр", photo=PHOTO_B64)})
+
+    # Одинаковое фото хранится один раз
+    assert _photo_rows(sync_server) == [(PHOTO_HASH, len(PNG))]
+
+    tree = client.get("/api/sync/download", headers=sync_headers).get_json()["tree"]
+    assert tree["persons"]["1"]["photo"] is None
+    assert tree["persons"]["1"]["photo_hash"] == PHOTO_HASH
+
+    r = client.get(f"/api/photos/{PHOTO_HASH}", headers=sync_headers)
+    assert r.status_code == 200
+    assert r.data == PNG
+    assert r.mimetype == "image/png"
+    assert r.headers["ETag"] == f'"{PHOTO_HASH}"'
+    assert "immutable" in r.headers["Cache-Control"]
+
+    r = client.get(f"/api/photos/{PHOTO_HASH}", headers={**sync_headers, "If-None-Match": f'"{PHOTO_HASH}"'})
+    assert r.status_code == 304
+    assert r.data == b""
+
+    full = client.get("/api/sync/download?include_photos=1", headers=sync_headers).get_json()["tree"]
+    assert base64.b64decode(full["persons"]["2"]["photo"]) == PNG
+
+
+def test_upload_by_hash_keeps_photo_and_missing_endpoint(sync_server, sync_headers):
+    client = sync_server.app.test_client()
+    r = client.post("/api/photos/missing", headers=sync_headers, json={"hashes": [PHOTO_HASH]})
+    assert r.get_json()["missing"] == [PHOTO_HASH]
+
+    _upload(client, sync_headers, {"1": _person("Иван", photo=PHOTO_B64)})
+    assert client.post("/api/photos/missing", headers=sync_headers,
+                       json={"hashes": [PHOTO_HASH]}).get_json()["missing"] == []
+
+    # Клиент отправляет дерево из загрузки: фото только хешем — строка не меняется
+    tree = client.get("/api/sync/download", headers=sync_headers).get_json()["tree"]
+    stats = _upload(client, sync_headers, tree["persons"])["stats"]["persons"]
+    assert stats["unchanged"] == 1
+    assert client.get("/api/sync/download", headers=sync_headers).get_json()["tree"]["persons"]["1"][
+        "photo_hash"] == PHOTO_HASH
+
+
+def test_photo_is_not_served_to_other_users(sync_server, sync_headers):
+    client = sync_server.app.test_client()
+    _upload(client, sync_headers, {"1": _person("Иван", photo=PHOTO_B64)})
+
+    client.post("/api/auth/register", json={"login": "other", "password": "secret1"})
+    token = client.post("/api/auth/login", json={"login": "other", "password": "secret1"}).get_json()["token"]
+    r = client.get(f"/api/photos/{PHOTO_HASH}", headers={"Authorization": f"Bearer {token}"})
+    assert r.status_code == 404
+
+
+def test_inline_photos_are_migrated(sync_server, sync_headers):
+    client = sync_server.app.test_client()
+    _upload(client, sync_headers, {"1": _person("Иван")})
+
+    conn = sqlite3.connect(sync_server.DB_FILE)
+    conn.execute("UPDATE persons SET photo = ?, photo_hash = NULL WHERE id = '1'", (PHOTO_B64,))
+    conn.commit()
+
+    from photo_store import migrate_inline_photos
+    assert migrate_inline_photos(conn) == 1
+    assert conn.execute("SELECT photo, photo_hash FROM persons WHERE id = '1'").fetchone() == (None, PHOTO_HASH)
+    assert migrate_inline_photos(conn) == 0
+    conn.close()
+
+    assert client.get(f"/api/photos/{PHOTO_HASH}", headers=sync_headers).data == PNG
+
+
+def test_sync_client_sends_known_photos_by_hash(sync_client, sync_server):
+    sync_client.upload_tree_data({"persons": {"1": _person("Иван", photo=PHOTO_B64)}, "marriages": []})
+
+    tree = {"persons": {"1": _person("Иван", photo=PHOTO_B64), "2": _person("Пётр", photo=PHOTO_B64)},
+            "marriages": []}
+    payload = sync_client._without_known_photos(tree["persons"])
+    assert payload["2"]["photo"] is None and payload["2"]["photo_hash"] == PHOTO_HASH
+    assert tree["persons"]["2"]["photo"] == PHOTO_B64  # исходное дерево не меняется
+
+    result = sync_client.upload_tree_data(tree)
+    assert result["stats"]["persons"]["inserted"] == 1
+    assert _photo_rows(sync_server) == [(PHOTO_HASH, len(PNG))]
+
+
+def test_foreign_photo_hash_is_not_accepted(sync_server, sync_headers):
+    client = sync_server.app.test_client()
+    _upload(client, sync_headers, {"1": _person("Иван", photo=PHOTO_B64)})
+
+    client.post("/api/auth/register", json={"login": "other", "password": "secret1"})
+    token = client.post("/api/auth/login", json={"login": "other", "password": "secret1"}).get_json()["token"]
+    other = {"Authorization": f"Bearer {token}"}
+    # Наличие чужого фото не раскрывается
+    r = client.post("/api/photos/missing", headers=other, json={"hashes": [PHOTO_HASH]})
+    assert r.get_json()["missing"] == [PHOTO_HASH]
+
+    # Ссылка на чужой хеш без байтов не даёт доступа к фото
+    _upload(client, other, {"1": _person("Пётр", photo_hash=PHOTO_HASH)})
+    assert client.get("/api/sync/download", headers=other).get_json()["tree"]["persons"]["1"]["photo_hash"] is None
+    assert client.get(f"/api/photos/{PHOTO_HASH}", headers=other).status_code == 404
+
+    # С байтами фото — своё
+    _upload(client, other, {"1": _person("Пётр", photo=PHOTO_B64)})
+    assert client.get(f"/api/photos/{PHOTO_HASH}", headers=other).data == PNG
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""Тесты составного ключа persons и таблицы рёбер relations."""
+import sqlite3
+
+
+def _person(name, parents=(), children=(), spouses=()):
+    return {"name": name, "surname": "Тестов", "gender": "Мужской",
+            "parents": list(parents), "children": list(children), "spouse_ids": list(spouses)}
+
+
+def _family():
+    """1+2 → 3; 3+4 → 5; 5 → 6."""
+    return {
+        "1": _person("Дед", children=["3"], spouses=["2"]),
+        "2": _person("Бабушка", children=["3"], spouses=["1"]),
+        "3": _person("Отец", parents=["1", "2"], children=["5"], spouses=["4"]),
+        "4": _person("Мать", children=["5"], spouses=["3"]),
+        "5": _person("Сын", parents=["3", "4"], children=["6"]),
+        "6": _person("Внук", parents=["5"]),
+    }
+
+
+def _login(client, login):
+    client.post("/api/auth/register", json={"login": login, "password": "secret1"})
+    token = client.post("/api/auth/login", json={"login": login, "password": "secret1"}).get_json()["token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _edges(sync_server):
+    conn = sqlite3.connect(sync_server.DB_FILE)
+    try:
+        return sorted(conn.execute("SELECT from_id, to_id, kind FROM relations").fetchall())
+    finally:
+        conn.close()
+
+
+def test_same_person_ids_in_different_trees(sync_server, sync_headers):
+    client = sync_server.app.test_client()
+    other = _login(client, "other")
+    client.post("/api/sync/upload", headers=sync_headers, json={"tree": {"persons": {"1": _person("Иван")}}})
+    client.post("/api/sync/upload", headers=other, json={"tree": {"persons": {"1": _person("Пётр")}}})
+
+    assert client.get("/api/sync/download", headers=sync_headers).get_json()["tree"]["persons"]["1"]["name"] == "Иван"
+    assert client.get("/api/sync/download", headers=other).get_json()["tree"]["persons"]["1"]["name"] == "Пётр"
+
+
+def test_relations_follow_uploads_and_deltas(sync_server, sync_headers):
+    client = sync_server.app.test_client()
+    r = client.post("/api/sync/upload", headers=sync_headers, json={"tree": {"persons": _family()}})
+    revision = r.get_json()["revision"]
+    assert ("3", "5", "parent") in _edges(sync_server)
+    assert ("1", "2", "spouse") in _edges(sync_server)
+    assert len([e for e in _edges(sync_server) if e[2] == "parent"]) == 5
+
+    # У внука сменился родитель, сын удалён
+    r = client.post("/api/sync/delta", headers=sync_headers, json={
+        "base_revision": revision, "persons": {"6": _person("Внук", parents=["3"])}, "deleted_persons": ["5"]})
+    assert r.status_code == 200
+    edges = _edges(sync_server)
+    assert ("3", "6", "parent") in edges
+    assert not [e for e in edges if "5" in e[:2]]
+
+
+def test_ancestors_and_descendants_endpoints(sync_server, sync_headers):
+    client = sync_server.app.test_client()
+    client.post("/api/sync/upload", headers=sync_headers, json={"tree": {"persons": _family()}})
+
+    data = client.get("/api/tree/persons/6/ancestors", headers=sync_headers).get_json()
+    assert [(p["id"], p["generation"]) for p in data["persons"]] == [
+        ("5", 1), ("3", 2), ("4", 2), ("1", 3), ("2", 3)]
+    data = client.get("/api/tree/persons/6/ancestors?depth=2", headers=sync_headers).get_json()
+    assert {p["id"] for p in data["persons"]} == {"5", "3", "4"}
+
+    data = client.get("/api/tree/persons/1/descendants", headers=sync_headers).get_json()
+    assert [(p["id"], p["generation"], p["name"]) for p in data["persons"]] == [
+        ("3", 1, "Отец"), ("5", 2, "Сын"), ("6", 3, "Внук")]
+    assert client.get("/api/tree/persons/404/ancestors", headers=sync_headers).status_code == 404
+
+
+def test_migration_of_old_schema(tmp_path, sync_server):
+    from relations import ancestors
+    from schema import ensure_schema
+
+    conn = sqlite3.connect(tmp_path / "old.db")
+    conn.executescript("""
+        CREATE TABLE family_trees (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, name TEXT NOT NULL);
+        CREATE TABLE persons (id TEXT PRIMARY KEY, tree_id INTEGER NOT NULL, name TEXT NOT NULL,
+                              surname TEXT NOT NULL, photo BLOB, parents TEXT, children TEXT, spouse_ids TEXT,
+                              is_deceased BOOLEAN DEFAULT 0);
+        CREATE INDEX idx_persons_tree ON persons(tree_id);
+        CREATE TABLE marriages (id INTEGER PRIMARY KEY AUTOINCREMENT, tree_id INTEGER NOT NULL,
+                                person1_id TEXT NOT NULL, person2_id TEXT NOT NULL, marriage_date TEXT);
+        CREATE TABLE user_sessions (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL,
+                                    session_token TEXT NOT NULL, last_activity TIMESTAMP);
+        INSERT INTO family_trees (id, user_id, name) VALUES (1, 1, 'Дерево');
+        INSERT INTO persons (id, tree_id, name, surname, parents, children, spouse_ids) VALUES
+            ('a', 1, 'Отец', 'Т', '[]', '["b"]', '[]'),
+            ('b', 1, 'Сын', 'Т', '["a"]', '[]', '[]');
+    """)
+    conn.commit()
+    rowids = conn.execute("SELECT id, rowid FROM persons ORDER BY id").fetchall()
+
+    ensure_schema(conn)
+    ensure_schema(conn)  # повторно — без изменений
+
+    pk = {row[1]: row[5] for row in conn.execute("PRAGMA table_info(persons)")}
+    assert pk["tree_id"] == 1 and pk["id"] == 2
+    assert conn.execute("SELECT id, rowid FROM persons ORDER BY id").fetchall() == rowids
+    assert conn.execute("SELECT from_id, to_id, kind FROM relations").fetchall() == [("a", "b", "parent")]
+    assert [p["id"] for p in ancestors(conn, 1, "b")] == ["a"]
+    # Теперь одинаковый id допустим в другом дереве
+    conn.execute("INSERT INTO persons (id, tree_id, name, surname) VALUES ('a', 2, 'Другой', 'Т')")
+    conn.close()
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""Тесты пакетной загрузки дерева на сервер синхронизации."""
+
+
+def _person(name, **extra):
+    data = {"name": name, "surname": "Тестов", "gender": "Мужской",
+            "parents": [], "children": [], "spouse_ids": []}
+    data.update(extra)
+    return data
+
+
+def _upload(client, headers, persons, marriages=()):
+    r = client.post("/api/sync/upload", headers=headers,
+                    json={"tree": {"persons": persons, "marriages": list(marriages)}})
+    assert r.status_code == 200, r.get_json()
+    return r.get_json()["stats"]
+
+
+def test_upload_reports_insert_update_unchanged_delete(sync_server, sync_headers):
+    client = sync_server.app.test_client()
+    persons = {"1": _person("Иван"), "2": _person("Пётр"), "3": _person("Олег")}
+
+    stats = _upload(client, sync_headers, persons, [{"persons": ["1", "2"], "date": ""}])
+    assert stats["persons"] == {"inserted": 3, "updated": 0, "unchanged": 0, "deleted": 0}
+    assert stats["marriages"]["inserted"] == 1
+
+    persons["2"] = _person("Пётр", birth_date="01.01.1950")
+    del persons["3"]
+    persons["4"] = _person("Анна", gender="Женский")
+    stats = _upload(client, sync_headers, persons, [{"persons": ["1", "2"], "date": "02.02.1970"}])
+    assert stats["persons"] == {"inserted": 1, "updated": 1, "unchanged": 1, "deleted": 1}
+    assert stats["marriages"] == {"inserted": 0, "updated": 1, "unchanged": 0, "deleted": 0}
+
+    tree = client.get("/api/sync/download", headers=sync_headers).get_json()["tree"]
+    assert sorted(tree["persons"]) == ["1", "2", "4"]
+    assert tree["persons"]["2"]["birth_date"] == "01.01.1950"
+    assert tree["marriages"] == [{"persons": ["1", "2"], "date": "02.02.1970"}]
+
+
+def test_upload_removes_marriages_missing_from_payload(sync_server, sync_headers):
+    client = sync_server.app.test_client()
+    persons = {"1": _person("Иван"), "2": _person("Анна", gender="Женский")}
+    _upload(client, sync_headers, persons, [["1", "2"], ["1", "2"]])
+    stats = _upload(client, sync_headers, persons, [])
+    assert stats["marriages"]["deleted"] == 1
+    assert stats["persons"]["unchanged"] == 2
+    tree = client.get("/api/sync/download", headers=sync_headers).get_json()["tree"]
+    assert tree["marriages"] == []
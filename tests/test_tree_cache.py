@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Тесты кэша разобранных деревьев web (tree_service.TreeCache)."""
+import base64
+import json
+import os
+
+
+def _tree(n, photo=None):
+    persons = {str(i): {"name": f"Иван{i:03d}", "surname": "Тестов", "gender": "Мужской",
+                        "parents": [], "children": [], "spouse_ids": [], "photo": photo}
+               for i in range(1, n + 1)}
+    return {"persons": persons, "marriages": [["1", "2"]], "current_center": "1"}
+
+
+def test_photo_page_parses_tree_once(web_app):
+    import tree_service
+
+    # Прежний путь отдачи фото — через дерево (кэш фото отключён)
+    tree_service.photo_cache.enabled = False
+    png = base64.b64encode(b"\x89PNG" + os.urandom(300)).decode()
+    tree_service.save_tree("ivan", _tree(200, photo=png))
+    client = web_app.app.test_client()
+    with client.session_transaction() as s:
+        s["username"] = "ivan"
+
+    for i in range(1, 201):
+        r = client.get(f"/api/photo/{i}")
+        assert r.status_code == 200 and r.mimetype == "image/png"
+    stats = tree_service.tree_cache.get_stats()
+    assert stats["misses"] == 1 and stats["hits"] == 199
+    assert stats["entries"] == 1 and stats["bytes"] == os.path.getsize(tree_service.get_data_path("ivan"))
+
+
+def test_copies_isolate_callers_and_save_invalidates(web_app):
+    import tree_service
+
+    tree_service.save_tree("ivan", _tree(3))
+    first = tree_service.load_tree("ivan")
+    first["persons"]["1"]["name"] = "Изменён"
+    first["persons"]["9"] = {"name": "Новый"}
+    first["marriages"][0].append("3")
+    again = tree_service.load_tree("ivan")
+    assert again["persons"]["1"]["name"] == "Иван001" and "9" not in again["persons"]
+    assert again["marriages"] == [["1", "2"]]
+
+    # Тот же размер файла: изменение видно благодаря явному сбросу в save_tree
+    again["persons"]["1"]["name"] = "Пётр001"
+    tree_service.save_tree("ivan", again)
+    assert tree_service.load_tree("ivan")["persons"]["1"]["name"] == "Пётр001"
+
+    # Файл изменил другой воркер: новый mtime/размер — разбор заново
+    path = tree_service.get_data_path("ivan")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(_tree(5), f, ensure_ascii=False)
+    assert len(tree_service.load_tree("ivan")["persons"]) == 5
+
+    # Испорченный файл не кэшируется
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("{broken")
+    assert tree_service.load_tree("ivan")["persons"] == {}
+    assert tree_service.tree_cache.get_stats()["entries"] == 0
+
+
+def test_memory_budget_evicts_lru(web_app):
+    from tree_service import TreeCache
+
+    cache = TreeCache(max_bytes=100)
+    cache.put("a", (1, 40), {"a": 1})
+    cache.put("b", (1, 40), {"b": 1})
+    assert cache.get("a", (1, 40)) == {"a": 1}
+    cache.put("c", (1, 40), {"c": 1})
+    assert cache.get("b", (1, 40)) is None and cache.get("a", (1, 40)) is not None
+    cache.put("huge", (1, 500), {})
+    assert cache.get("huge", (1, 500)) is None
+    assert cache.get_stats()["bytes"] == 80 and cache.get_stats()["evictions"] == 1
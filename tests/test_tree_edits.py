@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""Тесты точечных правок дерева (tree_edits): сервер синхронизации и web."""
+import base64
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 4
+
+
+def _tree(n):
+    persons = {str(i): {"name": f"Иван{i}", "surname": "Тестов", "gender": "Мужской",
+                        "parents": [], "children": [], "spouse_ids": []} for i in range(1, n + 1)}
+    persons["1"]["children"] = ["3"]
+    persons["3"]["parents"] = ["1"]
+    persons["1"]["spouse_ids"] = ["2"]
+    persons["2"]["spouse_ids"] = ["1"]
+    return {"persons": persons, "marriages": [{"persons": ["1", "2"], "date": "01.01.1900"}]}
+
+
+def _download(client, headers):
+    return client.get("/api/sync/download", headers=headers).get_json()["tree"]
+
+
+def test_copies_match():
+    assert (ROOT / "web" / "tree_edits.py").read_bytes() == (ROOT / "sync_server" / "tree_edits.py").read_bytes()
+
+
+def test_server_edits_keep_both_sides_of_links(sync_server, sync_headers):
+    client = sync_server.app.test_client()
+    client.post("/api/sync/upload", headers=sync_headers, json={"tree": _tree(5)})
+
+    r = client.post("/api/tree/persons", headers=sync_headers,
+                    json={"name": "Пётр", "surname": "Тестов", "parents": ["1", "2"], "spouse_ids": ["4"]})
+    assert r.status_code == 200
+    new_id = r.get_json()["person_id"]
+    assert new_id == "6" and r.get_json()["updated"] == ["1", "2", "4", "6"]
+    tree = _download(client, sync_headers)
+    assert tree["persons"]["6"]["parents"] == ["1", "2"] and "6" in tree["persons"]["2"]["children"]
+    assert tree["persons"]["4"]["spouse_ids"] == ["6"]
+    assert {"persons": ["6", "4"], "date": ""} in tree["marriages"]
+
+    assert client.put("/api/tree/persons/5/parents/3", headers=sync_headers).status_code == 200
+    assert client.delete("/api/tree/persons/1/children/3", headers=sync_headers).status_code == 200
+    assert client.put("/api/tree/marriages/2/1", headers=sync_headers, json={"date": "02.02.1902"}).status_code == 200
+    tree = _download(client, sync_headers)
+    assert tree["persons"]["5"]["parents"] == ["3"] and tree["persons"]["3"]["children"] == ["5"]
+    assert tree["persons"]["3"]["parents"] == [] and tree["persons"]["1"]["children"] == ["6"]
+    assert {"persons": ["1", "2"], "date": "02.02.1902"} in tree["marriages"]
+
+    r = client.delete("/api/tree/persons/1", headers=sync_headers)
+    assert r.get_json()["deleted"] == ["1"]
+    tree = _download(client, sync_headers)
+    assert "1" not in tree["persons"] and tree["persons"]["2"]["spouse_ids"] == []
+    assert "1" not in tree["persons"]["6"]["parents"]
+    assert all("1" not in m["persons"] for m in tree["marriages"])
+
+    photo = client.put("/api/tree/persons/2/photo", headers=sync_headers,
+                       json={"photo": base64.b64encode(PNG).decode()})
+    assert photo.status_code == 200
+    assert _download(client, sync_headers)["persons"]["2"]["photo_hash"]
+
+    assert client.patch("/api/tree/persons/99", headers=sync_headers, json={"name": "X"}).status_code == 404
+    assert client.patch("/api/tree/persons/2", headers=sync_headers, json={"parents": []}).status_code == 400
+    assert client.put("/api/tree/persons/2/parents/2", headers=sync_headers).status_code == 400
+    assert client.post("/api/tree/persons", headers=sync_headers, json={"id": "2"}).status_code == 400
+
+
+def test_server_patch_touches_only_affected_rows(sync_server, sync_headers, monkeypatch):
+    client = sync_server.app.test_client()
+    client.post("/api/sync/upload", headers=sync_headers, json={"tree": _tree(300)})
+    revision = client.get("/api/sync/changes?since=0", headers=sync_headers).get_json()["revision"]
+
+    statements = []
+    connect = sync_server.db_pool._connect
+
+    def _connect():
+        conn = connect()
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    sync_server.db_pool.close_all()
+    monkeypatch.setattr(sync_server.db_pool, "_connect", _connect)
+    r = client.patch("/api/tree/persons/150", headers=sync_headers, json={"birth_place": "Минск"})
+    assert r.status_code == 200 and r.get_json()["updated"] == ["150"]
+    reads = [s for s in statements if "FROM persons" in s]
+    assert reads and all(" id IN (" in s or "id = " in s for s in reads)
+
+    changes = client.get(f"/api/sync/changes?since={revision}", headers=sync_headers).get_json()
+    assert list(changes["persons"]) == ["150"] and changes["persons"]["150"]["birth_place"] == "Минск"
+    assert changes["revision"] == revision + 1
+
+
+def test_web_edits_local_file_and_proxies_to_server(web_app, sync_urlopen, sync_server, sync_headers):
+    import tree_service
+
+    tree_service.save_tree("ivan", {"persons": _tree(3)["persons"], "marriages": [["1", "2"]]})
+    client = web_app.app.test_client()
+    with client.session_transaction() as s:
+        s["username"] = "ivan"
+
+    assert client.patch("/api/tree/persons/3", json={"name": "Пётр"}).get_json()["person_id"] == "3"
+    r = client.post("/api/tree/persons", json={"name": "Анна", "parents": ["3"]})
+    assert r.get_json()["person_id"] == "4"
+    assert client.delete("/api/tree/marriages/2/1").status_code == 200
+    assert client.put("/api/photo/4", json={"photo": base64.b64encode(PNG).decode()}).status_code == 200
+    data = tree_service.load_tree("ivan")
+    assert data["persons"]["3"]["name"] == "Пётр" and data["persons"]["3"]["children"] == ["4"]
+    assert data["marriages"] == [] and data["persons"]["1"]["spouse_ids"] == []
+    assert client.get("/api/photo/4").data == PNG
+    assert sync_urlopen == []
+
+    # С токеном правка уходит на сервер одним маленьким запросом
+    sync_server.app.test_client().post("/api/sync/upload", headers=sync_headers, json={"tree": _tree(3)})
+    with client.session_transaction() as s:
+        s["server_token"] = sync_headers["Authorization"].split()[1]
+    r = client.put("/api/photo/2", json={"photo": base64.b64encode(PNG).decode()})
+    assert r.status_code == 200
+    assert client.patch("/api/tree/persons/9", json={"name": "X"}).status_code == 404
+    assert [(m, p) for m, p, _, _ in sync_urlopen] == [("PUT", "/api/tree/persons/2/photo"),
+                                                       ("PATCH", "/api/tree/persons/9")]
+    assert _download(sync_server.app.test_client(), sync_headers)["persons"]["2"]["photo_hash"]
+
+
+def test_web_concurrent_edits_are_not_lost(web_app):
+    import threading
+    import tree_service
+
+    tree_service.save_tree("ivan", {"persons": {}, "marriages": []})
+
+    def add(n):
+        def apply(persons, edit):
+            pid = tree_service.next_person_id(persons)
+            edit.create_person(pid, {"name": f"Иван{n}", "surname": "Тестов"})
+            return pid
+        assert tree_service.edit_tree("ivan", apply) is not None
+
+    threads = [threading.Thread(target=add, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    persons = tree_service.load_tree("ivan")["persons"]
+    assert sorted(p["name"] for p in persons.values()) == sorted(f"Иван{n}" for n in range(8))
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""Тесты окрестности персоны и постраничной загрузки дерева."""
+
+
+def _person(name, parents=(), children=(), spouses=()):
+    return {"name": name, "surname": "Тестов", "gender": "Мужской",
+            "parents": list(parents), "children": list(children), "spouse_ids": list(spouses)}
+
+
+def _family():
+    """1+2 → 3, 7; 3+4 → 5; 5 → 6; 8 — не родственник."""
+    return {
+        "1": _person("Дед", children=["3", "7"], spouses=["2"]),
+        "2": _person("Бабушка", children=["3", "7"], spouses=["1"]),
+        "3": _person("Отец", parents=["1", "2"], children=["5"], spouses=["4"]),
+        "4": _person("Мать", children=["5"], spouses=["3"]),
+        "5": _person("Сын", parents=["3", "4"], children=["6"]),
+        "6": _person("Внук", parents=["5"]),
+        "7": _person("Дядя", parents=["1", "2"]),
+        "8": _person("Сосед"),
+    }
+
+
+def _marriages():
+    return [{"persons": ["1", "2"], "date": ""}, {"persons": ["3", "4"], "date": "1970"}]
+
+
+def _all_pages(client, url, headers=None, limit=3, cursor=None):
+    persons, marriages = {}, []
+    while True:
+        r = client.get(url, query_string={"limit": limit, **({"cursor": cursor} if cursor else {})},
+                       headers=headers)
+        assert r.status_code == 200
+        data = r.get_json()
+        assert len(data["persons"]) <= limit
+        persons.update(data["persons"])
+        marriages += data["marriages"]
+        cursor = data["next_cursor"]
+        if cursor is None:
+            return persons, marriages
+
+
+def test_sync_neighbourhood_and_pages(sync_server, sync_headers):
+    client = sync_server.app.test_client()
+    client.post("/api/sync/upload", headers=sync_headers,
+                json={"tree": {"persons": _family(), "marriages": _marriages()}})
+
+    r = client.get("/api/tree/persons/3/neighbourhood?up=1&down=1", headers=sync_headers)
+    data = r.get_json()
+    assert data["roles"] == {"3": "self", "1": "ancestor", "2": "ancestor", "5": "descendant",
+                             "7": "sibling", "4": "spouse"}
+    assert data["persons"]["5"]["name"] == "Сын"
+    assert data["marriages"] == [{"persons": ["1", "2"], "date": ""}, {"persons": ["3", "4"], "date": "1970"}]
+    assert client.get("/api/tree/persons/3/neighbourhood?up=1&down=1",
+                      headers={**sync_headers, "If-None-Match": r.headers["ETag"]}).status_code == 304
+    assert client.get("/api/tree/persons/99/neighbourhood", headers=sync_headers).status_code == 404
+
+    # Остальное дерево — страницами с курсора окрестности, каждый брак один раз
+    persons, marriages = _all_pages(client, "/api/tree/persons", sync_headers, cursor=data["cursor"])
+    assert set(persons) == set(_family())
+    assert sorted(m["persons"][0] for m in marriages) == ["1", "3"]
+
+    # Курсор устарел после изменения дерева
+    page = client.get("/api/tree/persons?limit=2", headers=sync_headers).get_json()
+    client.post("/api/sync/delta", headers=sync_headers,
+                json={"base_revision": page["revision"], "persons": {"8": _person("Сосед Иван")}})
+    r = client.get(f"/api/tree/persons?cursor={page['next_cursor']}", headers=sync_headers)
+    assert r.status_code == 409
+    assert client.get("/api/tree/persons?cursor=xx", headers=sync_headers).status_code == 400
+
+
+def test_web_neighbourhood_local_and_proxy(web_app, sync_urlopen, sync_headers, sync_server):
+    from tree_service import save_tree
+
+    save_tree("ivan", {"persons": _family(), "marriages": [["1", "2"], ["3", "4"]], "current_center": "3"})
+    client = web_app.app.test_client()
+    with client.session_transaction() as s:
+        s["username"] = "ivan"
+    data = client.get("/api/tree/persons/6/neighbourhood?up=2&down=0&siblings=0").get_json()
+    assert data["roles"] == {"6": "self", "5": "ancestor", "3": "ancestor", "4": "ancestor"}
+    assert data["marriages"] == [["3", "4"]]
+    persons, marriages = _all_pages(client, "/api/tree/persons")
+    assert set(persons) == set(_family()) and marriages == [["1", "2"], ["3", "4"]]
+
+    # С токеном сервера — ответ сервера синхронизации
+    sync_server.app.test_client().post("/api/sync/upload", headers=sync_headers,
+                                       json={"tree": {"persons": {"1": _person("Серверный")}}})
+    with client.session_transaction() as s:
+        s["username"] = "admin"
+        s["server_token"] = sync_headers["Authorization"].split()[1]
+    data = client.get("/api/tree/persons/1/neighbourhood").get_json()
+    assert data["persons"]["1"]["name"] == "Серверный"
+    assert _all_pages(client, "/api/tree/persons")[0].keys() == {"1"}
+    assert ("GET", "/api/tree/persons/1/neighbourhood", 200) in [c[:3] for c in sync_urlopen]
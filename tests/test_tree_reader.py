@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""Тесты потокового чтения дерева (tree_reader): тяжёлые поля — ссылки на файл до первого обращения."""
+import json
+import os
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "Дерево"))
+
+from models import FamilyTreeModel  # noqa: E402
+from tree_reader import LAZY_MIN_BYTES, LazyField, LazyPersonData, read_tree  # noqa: E402
+
+PHOTO = "QUJD" * 200
+BIOGRAPHY = 'Родился в "Минске", писал \\"мемуары\\"\n' * 20
+
+
+def _write_tree(path):
+    persons = {
+        "1": {"name": "Иван", "surname": "Иванов", "gender": "Мужской", "photo": PHOTO,
+              "biography": BIOGRAPHY, "notes": "коротко", "children": ["2"], "spouse_ids": []},
+        "2": {"name": "Пётр", "surname": "Иванов", "gender": "Мужской", "photo": None,
+              "photo_full": PHOTO + "==", "notes": "\\" * LAZY_MIN_BYTES, "parents": ["1"]},
+    }
+    path.write_text(json.dumps({"persons": persons, "marriages": [], "current_center": "1"},
+                               ensure_ascii=False, indent=1), encoding="utf-8")
+
+
+def test_heavy_fields_are_read_on_first_access(tmp_path):
+    path = tmp_path / "tree.json"
+    _write_tree(path)
+
+    data = read_tree(path)
+    first, second = data["persons"]["1"], data["persons"]["2"]
+    assert type(first["photo"]) is LazyField and type(second["notes"]) is LazyField
+    assert first["notes"] == "коротко" and second["photo"] is None and second["parents"] == ["1"]
+    assert first["photo"].load() == PHOTO and first["biography"].load() == BIOGRAPHY
+    assert second["notes"].load() == "\\" * LAZY_MIN_BYTES and second["photo_full"].load() == PHOTO + "=="
+
+    m = FamilyTreeModel(data_file=str(path))
+    assert m.load_from_file()
+    ivan = m.persons["1"]
+    assert type(ivan._photo) is LazyField and ivan.has_photo()
+    assert ivan.name == "Иван" and ivan.children == {"2"}
+    assert ivan.photo == PHOTO and type(ivan._photo) is str
+    assert ivan.to_dict()["biography"] == BIOGRAPHY
+
+    out = tmp_path / "saved.json"
+    assert m.save_to_file(str(out))
+    saved = json.loads(out.read_text(encoding="utf-8"))["persons"]
+    assert saved["1"]["photo"] == PHOTO and saved["1"]["biography"] == BIOGRAPHY
+    assert saved["2"]["photo_full"] == PHOTO + "==" and saved["2"]["notes"] == "\\" * LAZY_MIN_BYTES
+
+
+def test_replaced_file_is_reindexed(tmp_path):
+    path = tmp_path / "tree.json"
+    _write_tree(path)
+    m = FamilyTreeModel(data_file=str(path))
+    m.load_from_file()
+
+    # Другой процесс переписал файл: байтовые смещения устарели
+    data = json.loads(path.read_text(encoding="utf-8"))
+    data["persons"]["1"]["name"] = "Иван Сергеевич"
+    data["persons"]["1"]["biography"] = "новая биография"
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    os.utime(path, ns=(1, 1))
+
+    assert m.persons["1"].biography == "новая биография"
+    assert m.persons["1"].photo == PHOTO
+
+
+def test_tree_service_hydrates_lazy_persons(tmp_path):
+    from services.tree_service import TreeService
+
+    service = TreeService(str(tmp_path))
+    _write_tree(service.get_tree_path("ivan"))
+    tree = service.load_tree("ivan")
+    person = tree["persons"]["1"]
+    assert isinstance(person, LazyPersonData) and person["photo"] == PHOTO
+    assert person.get("biography") == BIOGRAPHY
+
+    ok, error = service.save_tree("ivan", tree)
+    assert ok, error
+    eager = service.load_tree("ivan", lazy=False)
+    assert eager["persons"]["2"]["photo_full"] == PHOTO + "==" and eager["persons"]["1"]["biography"] == BIOGRAPHY
+
+
+def test_nested_heavy_keys_are_not_lazy(tmp_path):
+    link = {"title": "Архив [фото]", "notes": BIOGRAPHY}
+    album = [{"photo": PHOTO, "caption": "{свадьба}"}]
+    persons = {"1": {"name": "Иван", "photo": PHOTO, "links": [link], "photo_album": album}}
+    settings = {"photo": PHOTO}
+    path = tmp_path / "tree.json"
+    path.write_text(json.dumps({"settings": settings, "persons": persons, "marriages": []}, ensure_ascii=False),
+                    encoding="utf-8")
+
+    data = read_tree(path)
+    ivan = data["persons"]["1"]
+    assert type(ivan["photo"]) is LazyField and ivan["photo"].load() == PHOTO
+    assert ivan["links"] == [link] and ivan["photo_album"] == album
+    assert data["settings"] == settings
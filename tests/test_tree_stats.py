@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""Тесты статистики дерева (tree_stats): поколения за O(N + E), счётчики, кэш на версию файла."""
+import time
+
+
+def _person(name, gender="Мужской", parents=(), **extra):
+    return {"name": name, "surname": extra.pop("surname", "Тестов"), "gender": gender,
+            "parents": list(parents), "children": [], "spouse_ids": [], **extra}
+
+
+def _ladder(generations):
+    """Родственные браки в каждом поколении: у пары общие оба родителя (прежний подсчёт — 2^N)."""
+    persons = {"1": _person("Адам"), "2": _person("Ева", "Женский")}
+    for g in range(1, generations):
+        a, b = str(2 * g - 1), str(2 * g)
+        persons[str(2 * g + 1)] = _person(f"Сын{g}", parents=(a, b))
+        persons[str(2 * g + 2)] = _person(f"Дочь{g}", "Женский", parents=(a, b))
+    return persons
+
+
+def test_counters_and_distributions():
+    from tree_stats import tree_stats
+
+    persons = {
+        "1": _person("Иван", birth_date="01.01.1900", death_date="01.06.1975", is_deceased=True,
+                     birth_place="Минск"),
+        "2": _person("Анна", "Женский", birth_date="1905", birth_place="Минск", surname="Петрова"),
+        "3": _person("Пётр", parents=("1", "2"), birth_date="10.10.1931", death_date="01.01.1990",
+                     is_deceased=True, birth_place="Гомель"),
+        "4": _person("Ольга", "Женский", parents=("3", "missing")),
+    }
+    stats = tree_stats(persons, marriages_count=1)
+    assert stats["total_persons"] == 4 and stats["male_count"] == 2 and stats["female_count"] == 2
+    assert stats["deceased_count"] == 2 and stats["living_count"] == 2 and stats["marriages_count"] == 1
+    assert stats["max_generations"] == 3 and stats["generation_sizes"] == {"1": 2, "2": 1, "3": 1}
+    assert stats["average_age"] == round((75 + 58) / 2)
+    assert stats["top_birth_places"] == [("Минск", 2), ("Гомель", 1)]
+    assert stats["top_surnames"][0] == ("Тестов", 3)
+    assert stats["birth_decades"] == {"1900": 2, "1930": 1}
+    assert stats["lifespan_distribution"] == {"50-59": 1, "70-79": 1}
+
+
+def test_pedigree_collapse_and_cycles_are_linear():
+    from tree_stats import generation_depths, tree_stats
+
+    started = time.perf_counter()
+    assert tree_stats(_ladder(2000))["max_generations"] == 2000
+    assert time.perf_counter() - started < 2
+
+    cyclic = {"1": _person("А", parents=("2",)), "2": _person("Б", parents=("1",)), "3": _person("В", parents=("1",))}
+    depths = generation_depths(cyclic)
+    assert set(depths) == {"1", "2", "3"} and max(depths.values()) <= 3
+
+
+def test_endpoint_caches_per_tree_version(web_app):
+    import tree_service
+
+    tree_service.save_tree("ivan", {"persons": _ladder(30), "marriages": []})
+    client = web_app.app.test_client()
+    with client.session_transaction() as s:
+        s["username"] = "ivan"
+
+    first = client.get("/api/stats")
+    assert first.status_code == 200 and first.get_json()["max_generations"] == 30
+    assert client.get("/api/stats", headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
+    client.get("/api/stats")
+    assert web_app._stats_cache.get_stats()["hits"] == 1
+    assert tree_service.tree_cache.get_stats()["misses"] == 1
+
+    tree_service.save_tree("ivan", {"persons": _ladder(31), "marriages": []})
+    again = client.get("/api/stats", headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 200 and again.get_json()["max_generations"] == 31
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""Тесты проверки токена сервера в web: /api/auth/introspect и кэш личности на токен."""
+
+
+def _tree(n):
+    persons = {str(i): {"name": f"Иван{i}", "surname": "Тестов", "gender": "Мужской",
+                        "parents": [], "children": [], "spouse_ids": []} for i in range(1, n + 1)}
+    return {"persons": persons, "marriages": [{"persons": ["1", "2"], "date": ""}]}
+
+
+def _web_client(web_app, sync_headers):
+    client = web_app.app.test_client()
+    with client.session_transaction() as s:
+        s["username"] = "admin"
+        s["server_token"] = sync_headers["Authorization"].split()[1]
+        s["server_user_id"] = 1
+    return client
+
+
+def test_introspect_returns_identity_and_counts(sync_server, sync_headers):
+    http = sync_server.app.test_client()
+    http.post("/api/sync/upload", headers=sync_headers, json={"tree": _tree(3)})
+
+    data = http.get("/api/auth/introspect", headers=sync_headers).get_json()
+    assert data["login"] == "admin" and data["is_admin"] is True
+    assert data["tree"]["persons_count"] == 3 and data["tree"]["marriages_count"] == 1
+    assert data["tree"]["revision"] >= 1 and data["expires_in"] > 0
+    assert "persons" not in data["tree"]
+    assert http.get("/api/auth/introspect", headers={"Authorization": "Bearer nope"}).status_code == 401
+
+
+def test_tree_page_load_is_one_upstream_request(web_app, sync_urlopen, sync_server, sync_headers):
+    sync_server.app.test_client().post("/api/sync/upload", headers=sync_headers, json={"tree": _tree(5)})
+    client = _web_client(web_app, sync_headers)
+
+    per_load = []
+    for _ in range(3):
+        sync_urlopen.clear()
+        assert client.get("/api/tree").status_code == 200
+        per_load.append([path for _, path, _, _ in sync_urlopen])
+    assert per_load[0] == ["/api/auth/introspect", "/api/sync/changes"]
+    assert per_load[1] == per_load[2] == ["/api/sync/changes"]
+
+    # Проверка прав администратора — из того же кэша
+    sync_urlopen.clear()
+    with web_app.app.test_request_context():
+        web_app.session["server_token"] = sync_headers["Authorization"].split()[1]
+        assert web_app.check_admin_access("someone")
+    assert sync_urlopen == []
+
+
+def test_session_verification_is_single_request(web_app, sync_urlopen, sync_server, sync_headers):
+    sync_server.app.test_client().post("/api/sync/upload", headers=sync_headers, json={"tree": _tree(4)})
+    token = sync_headers["Authorization"].split()[1]
+    client = web_app.app.test_client()
+
+    r = client.post("/api/auth/session", json={"token": token, "user_id": 1, "login": "admin"})
+    assert r.status_code == 200
+    assert r.get_json() == {"ok": True, "persons": 4, "is_admin": True}
+    assert [path for _, path, _, _ in sync_urlopen] == ["/api/auth/introspect"]
+
+    r = client.post("/api/auth/session", json={"token": token, "user_id": 1, "login": "ivan"})
+    assert r.status_code == 401
+
+
+def test_logout_and_401_invalidate(web_app, sync_urlopen, sync_server, sync_headers):
+    client = _web_client(web_app, sync_headers)
+    token = sync_headers["Authorization"].split()[1]
+    client.get("/api/tree")
+    assert web_app._identities.get(token) is not None
+
+    # Токен отозван на сервере: первый же 401 сбрасывает кэш, следующая загрузка проверяет заново
+    sync_server.app.test_client().post("/api/auth/logout", headers=sync_headers)
+    client.get("/api/tree")
+    assert web_app._identities.get(token) is None
+    sync_urlopen.clear()
+    client.get("/api/tree")
+    assert sync_urlopen[0][1:3] == ("/api/auth/introspect", 401)
+
+    other = _web_client(web_app, sync_headers)
+    web_app._identities.put(token, {"login": "admin"})
+    other.get("/logout")
+    assert web_app._identities.get(token) is None
@@ -37,6 +37,8 @@ from auth_utils import (
     is_super_admin,
     auth_check_local
 )
+# Запросы к серверу синхронизации — через пул keep-alive соединений
+import http_client
 
 # Переопределяем BCRYPT_AVAILABLE для web-версии
 try:
@@ -231,7 +233,7 @@ def auth_check(login: str, password: str) -> bool:
             headers={'Content-Type': 'application/json'},
             method='POST'
         )
-        with urllib.request.urlopen(req, timeout=10) as response:
+        with http_client.urlopen(req, timeout=10) as response:
             data = json.loads(response.read().decode())
             if data.get('token'):
                 # Сохраняем токен в сессии
@@ -299,7 +301,7 @@ def auth_register(login: str, password: str, email: str = ""):
             headers={'Content-Type': 'application/json'},
             method='POST'
         )
-        with urllib.request.urlopen(req, timeout=10) as response:
+        with http_client.urlopen(req, timeout=10) as response:
             data = json.loads(response.read().decode())
             if data.get('success') or data.get('token') or data.get('message'):
                 # Успешно зарегистрирован на сервере
@@ -315,7 +317,19 @@ def auth_register(login: str, password: str, email: str = ""):
         return f"Ошибка подключения к серверу: {str(e)}"
 
 
-from tree_service import load_tree, save_tree, DATA_DIR
+from tree_service import (
+    load_tree, save_tree, get_data_path, DATA_DIR, decode_cursor, encode_cursor, tree_neighbourhood, tree_page,
+    photo_cache, photo_hashes, edit_tree, next_person_id,
+)
+from photo_cache import RENDITIONS, WEBP_AVAILABLE
+from tree_stats import StatsCache, tree_stats
+from server_tree_cache import (
+    IdentityCache, PhotoGrantCache, ServerTreeCache, ValidatorCache, apply_changes as apply_server_changes,
+)
+from http_cache import (
+    ACCEPT_ENCODING, JsonArrayStream, JsonObjectStream, decode_body, json_response, make_etag, not_modified,
+    not_modified_response, stream_json_response,
+)
 
 # Импортируем email сервис
 try:
@@ -418,7 +432,7 @@ def login():
                         headers={'Content-Type': 'application/json'},
                         method='POST'
                     )
-                    with urllib.request.urlopen(req, timeout=10) as response:
+                    with http_client.urlopen(req, timeout=10) as response:
                         data = json.loads(response.read().decode())
                         if data.get('token'):
                             session['server_token'] = data['token']
@@ -487,64 +501,34 @@ def api_session():
     login = data.get('login')
 
     if token:
-        # ВАЖНО: Сначала проверяем, что токен соответствует указанному login
+        # ВАЖНО: Сначала проверяем, что токен соответствует указанному login.
+        # Один запрос /api/auth/introspect: личность, роль и счётчики дерева без загрузки персон
         try:
-            me_req = urllib.request.Request(
-                f"{SYNC_SERVER_URL}/api/auth/me",
-                headers={'Authorization': f'Bearer {token}'},
-                method='GET'
-            )
-            with urllib.request.urlopen(me_req, timeout=5) as me_resp:
-                me_data = json.loads(me_resp.read().decode())
-                server_login = me_data.get('login', '')
-                
-                # Если логин на сервере не совпадает с тем, что прислали — это ошибка!
-                if server_login != login:
-                    print(f"[SESSION] SECURITY VIOLATION: server_login='{server_login}' != provided login='{login}'")
-                    print(f"[SESSION] Rejecting session")
-                    return jsonify({"error": "Несоответствие пользователя"}), 401
-                
-                print(f"[SESSION] Login verified: {server_login}")
+            identity = _server_identity(token)
         except Exception as e:
             print(f"[SESSION] Could not verify login: {e}")
             # Блокируем вход если проверка не прошла
             return jsonify({"error": "Не удалось проверить пользователя"}), 401
 
+        server_login = identity.get('login', '')
+        # Если логин на сервере не совпадает с тем, что прислали — это ошибка!
+        if server_login != login:
+            print(f"[SESSION] SECURITY VIOLATION: server_login='{server_login}' != provided login='{login}'")
+            print(f"[SESSION] Rejecting session")
+            return jsonify({"error": "Несоответствие пользователя"}), 401
+        print(f"[SESSION] Login verified: {server_login}")
+
         session['server_token'] = token
         session['server_user_id'] = user_id
         if login:
             session['username'] = login
 
-        # Проверяем, что токен работает
-        # Для админа проверяем через /api/admin/stats, для остальных через /api/sync/download
-        try:
-            if login == 'admin':
-                # Админ проверяется через admin/stats
-                req = urllib.request.Request(
-                    f"{SYNC_SERVER_URL}/api/admin/stats",
-                    headers={'Authorization': f'Bearer {token}'},
-                    method='GET'
-                )
-                with urllib.request.urlopen(req, timeout=10) as resp:
-                    stats = json.loads(resp.read().decode())
-                    total_persons = stats.get('overview', {}).get('total_persons', 0)
-                    print(f"[SESSION] Admin token OK, total persons on server: {total_persons}")
-                    return jsonify({"ok": True, "persons": total_persons, "is_admin": True}), 200
-            else:
-                # Обычные пользователи через sync/download
-                req = urllib.request.Request(
-                    f"{SYNC_SERVER_URL}/api/sync/download",
-                    headers={'Authorization': f'Bearer {token}'},
-                    method='GET'
-                )
-                resp = urllib.request.urlopen(req, timeout=10)
-                tree_data = json.loads(resp.read().decode())
-                persons_count = len(tree_data.get('tree', {}).get('persons', {}))
-                print(f"[SESSION] Token OK, persons: {persons_count}")
-                return jsonify({"ok": True, "persons": persons_count}), 200
-        except Exception as e:
-            print(f"[SESSION] Token check failed: {e}")
-            return jsonify({"error": str(e)}), 500
+        persons_count = (identity.get('tree') or {}).get('persons_count', 0)
+        print(f"[SESSION] Token OK, persons: {persons_count}")
+        result = {"ok": True, "persons": persons_count}
+        if identity.get('is_admin'):
+            result["is_admin"] = True
+        return jsonify(result), 200
 
     return jsonify({"error": "No token"}), 400
 
@@ -619,7 +603,7 @@ def api_send_code():
             headers={'Content-Type': 'application/json'},
             method='POST'
         )
-        with urllib.request.urlopen(req, timeout=5) as resp:
+        with http_client.urlopen(req, timeout=5) as resp:
             check_data = json.loads(resp.read().decode())
             if check_data.get('exists'):
                 logger.warning(f"[API] [ERROR] Email уже зарегистрирован: {email}")
@@ -703,6 +687,8 @@ def service_worker():
 @app.route("/logout")
 def logout():
     """Выход из системы — полная очистка сессии."""
+    if session.get('server_token'):
+        _identities.invalidate(session['server_token'])
     session.clear()  # Очищаем ВСЮ сессию, включая server_token
     return redirect(url_for("login"))
 
@@ -723,13 +709,7 @@ def admin_panel():
     server_token = session.get('server_token')
     if server_token:
         try:
-            req = urllib.request.Request(
-                f"{SYNC_SERVER_URL}/api/admin/stats",
-                headers={'Authorization': f'Bearer {server_token}'},
-                method='GET'
-            )
-            with urllib.request.urlopen(req, timeout=5) as response:
-                # Если запрос успешен - пользователь админ
+            if _server_identity(server_token).get('is_admin'):
                 return render_template("admin.html", username=username)
         except Exception as e:
             print(f"[ADMIN] Access denied for {username}: {e}")
@@ -753,16 +733,11 @@ def check_admin_access(username):
         print(f"[CHECK_ADMIN] {username} is admin via local users.json")
         return True
     
-    # 2. Если не локальный админ, проверяем через сервер
+    # 2. Если не локальный админ, проверяем через сервер (is_admin проверенного токена)
     server_token = session.get('server_token')
     if server_token:
         try:
-            req = urllib.request.Request(
-                f"{SYNC_SERVER_URL}/api/admin/stats",
-                headers={'Authorization': f'Bearer {server_token}'},
-                method='GET'
-            )
-            with urllib.request.urlopen(req, timeout=5) as response:
+            if _server_identity(server_token).get('is_admin'):
                 print(f"[CHECK_ADMIN] {username} is admin via server")
                 return True
         except Exception as e:
@@ -798,7 +773,7 @@ def api_admin_stats():
             headers={'Authorization': f'Bearer {server_token}'},
             method='GET'
         )
-        with urllib.request.urlopen(req, timeout=10) as response:
+        with http_client.urlopen(req, timeout=10) as response:
             data = json.loads(response.read().decode())
             return jsonify(data)
     except Exception as e:
@@ -855,7 +830,7 @@ def api_admin_users():
                 headers={'Authorization': f'Bearer {server_token}'},
                 method='GET'
             )
-            with urllib.request.urlopen(req, timeout=10) as response:
+            with http_client.urlopen(req, timeout=10) as response:
                 server_data = json.loads(response.read().decode())
                 print(f"[ADMIN] Loaded users from sync server: {len(server_data.get('users', []))}")
                 # Возвращаем данные с сервера
@@ -943,7 +918,7 @@ def api_heartbeat():
                 headers={'Authorization': f'Bearer {server_token}'},
                 method='POST'
             )
-            with urllib.request.urlopen(req, timeout=5) as response:
+            with http_client.urlopen(req, timeout=5) as response:
                 return jsonify({"status": "ok"})
         except Exception as e:
             print(f"[HEARTBEAT] Error: {e}")
@@ -972,7 +947,7 @@ def api_admin_toggle_user(user_id):
                 headers={'Authorization': f'Bearer {server_token}'},
                 method='POST'
             )
-            with urllib.request.urlopen(req, timeout=10) as response:
+            with http_client.urlopen(req, timeout=10) as response:
                 return jsonify({"message": "Статус пользователя изменён"})
         except Exception as e:
             print(f"[ADMIN] Toggle failed: {e}")
@@ -1004,7 +979,7 @@ def api_admin_delete_user(user_id):
                 headers={'Authorization': f'Bearer {server_token}'},
                 method='GET'
             )
-            with urllib.request.urlopen(users_req, timeout=10) as users_resp:
+            with http_client.urlopen(users_req, timeout=10) as users_resp:
                 users_data = json.loads(users_resp.read().decode())
                 users_list = users_data.get('users', [])
                 target_user = next((u for u in users_list if u.get('id') == user_id), None)
@@ -1017,7 +992,7 @@ def api_admin_delete_user(user_id):
                 headers={'Authorization': f'Bearer {server_token}'},
                 method='POST'
             )
-            with urllib.request.urlopen(req, timeout=10) as response:
+            with http_client.urlopen(req, timeout=10) as response:
                 print(f"[ADMIN] User {user_id} deleted from sync server")
         except urllib.error.HTTPError as e:
             if e.code == 404:
@@ -1082,7 +1057,7 @@ def api_admin_get_user_trees(user_id):
                 headers={'Authorization': f'Bearer {server_token}'},
                 method='GET'
             )
-            with urllib.request.urlopen(req, timeout=10) as response:
+            with http_client.urlopen(req, timeout=10) as response:
                 data = json.loads(response.read().decode())
                 return jsonify(data)
         except Exception as e:
@@ -1092,6 +1067,57 @@ def api_admin_get_user_trees(user_id):
     return jsonify({"trees": []})
 
 
+# Деревьев на странице сводки при загрузке всех страниц сразу
+ADMIN_TREES_PAGE = 100
+
+
+def _admin_trees_from_server(server_token):
+    """
+    Деревья для админки из /api/admin/trees/summary сервера синхронизации.
+
+    ?cursor/?limit/?include — одна страница как есть (next_cursor для
+    следующей); без них — все страницы с персонами (include=persons), как
+    ждёт вкладка «Деревья». Страницы запрашиваются по мере отдачи ответа
+    потоком: в памяти держится одна страница, а не все деревья сразу.
+    Первая страница берётся до ответа — ошибка сервера (например, 404 у
+    старого сервера) ещё уходит в fallback. Если поток прервался, в
+    next_cursor — курсор непрочитанной страницы, иначе null.
+    """
+    if "cursor" in request.args or "limit" in request.args:
+        params = {k: request.args[k] for k in ("cursor", "limit", "include") if request.args.get(k)}
+        return json_response(_sync_get_json(f"/api/admin/trees/summary?{urllib.parse.urlencode(params)}",
+                                            server_token))
+
+    def fetch(cursor):
+        params = {"include": "persons", "limit": ADMIN_TREES_PAGE, **({"cursor": cursor} if cursor else {})}
+        return _sync_get_json(f"/api/admin/trees/summary?{urllib.parse.urlencode(params)}", server_token)
+
+    page = fetch(None)
+    state = {"cursor": None, "count": 0}
+
+    def trees():
+        data = page
+        while True:
+            for tree in data.get("trees", []):
+                yield tree
+            state["count"] += len(data.get("trees", []))
+            state["cursor"] = data.get("next_cursor")
+            if not state["cursor"]:
+                print(f"[ADMIN] Streamed {state['count']} trees from sync server")
+                return
+            try:
+                data = fetch(state["cursor"])
+            except Exception as e:
+                print(f"[ADMIN] Error loading trees page from sync server: {e}")
+                return
+
+    def pairs():
+        yield "trees", JsonArrayStream(trees())
+        yield "next_cursor", state["cursor"]
+
+    return stream_json_response(JsonObjectStream(pairs()))
+
+
 @app.route("/api/admin/trees")
 def api_admin_all_trees():
     """Получить все деревья (для вкладки Деревья)."""
@@ -1106,48 +1132,7 @@ def api_admin_all_trees():
     server_token = session.get('server_token')
     if server_token:
         try:
-            # Получаем список пользователей с сервера
-            req = urllib.request.Request(
-                f"{SYNC_SERVER_URL}/api/admin/users",
-                headers={'Authorization': f'Bearer {server_token}'},
-                method='GET'
-            )
-            with urllib.request.urlopen(req, timeout=10) as response:
-                users_data = json.loads(response.read().decode())
-                users_list = users_data.get('users', [])
-                
-                trees = []
-                for user in users_list:
-                    user_login = user.get('login')
-                    user_id = user.get('id')
-                    
-                    # Получаем дерево пользователя
-                    try:
-                        tree_req = urllib.request.Request(
-                            f"{SYNC_SERVER_URL}/api/admin/user/{user_id}/trees",
-                            headers={'Authorization': f'Bearer {server_token}'},
-                            method='GET'
-                        )
-                        with urllib.request.urlopen(tree_req, timeout=10) as tree_resp:
-                            tree_data = json.loads(tree_resp.read().decode())
-                            user_trees = tree_data.get('trees', [])
-                            
-                            for tree in user_trees:
-                                trees.append({
-                                    "id": tree.get('id'),
-                                    "user_id": user_id,
-                                    "user_login": user_login,
-                                    "name": tree.get('name', f"Дерево {user_login}"),
-                                    "persons": tree.get('persons', {}),
-                                    "marriages": tree.get('marriages', []),
-                                    "created_at": tree.get('created_at'),
-                                    "updated_at": tree.get('updated_at')
-                                })
-                    except Exception as e:
-                        print(f"[ADMIN] Error loading tree for {user_login}: {e}")
-                
-                return jsonify({"trees": trees})
-
+            return _admin_trees_from_server(server_token)
         except Exception as e:
             print(f"[ADMIN] Error loading from sync server: {e}")
             # Fallback на локальные данные
@@ -1179,6 +1164,8 @@ def api_admin_all_trees():
                     "name": f"Дерево {user_login}",
                     "persons": persons,
                     "marriages": marriages,
+                    "persons_count": persons_count,
+                    "marriages_count": len(marriages),
                     "created_at": datetime.now().isoformat(),
                     "updated_at": datetime.now().isoformat()
                 })
@@ -1192,6 +1179,84 @@ def api_admin_all_trees():
         return jsonify({"trees": []})
 
 
+# Последняя ревизия дерева каждого пользователя: /api/tree забирает с сервера только изменения
+_server_trees = ServerTreeCache()
+# ETag последних GET-ответов сервера синхронизации: неизменённый ответ приходит как 304 без тела
+_sync_validators = ValidatorCache()
+# Проверенные токены сервера (логин, роль): не спрашиваем сервер на каждый запрос страницы
+_identities = IdentityCache()
+# Версия формата ответа /api/tree в ETag: увеличить при изменении полей ответа
+TREE_ETAG_VERSION = 1
+
+
+def _sync_get_json(path, server_token, timeout=10):
+    """GET к серверу синхронизации со сжатием и If-None-Match (304 — запомненное тело)."""
+    key = (server_token, path)
+    etag, cached = _sync_validators.get(key)
+    headers = {'Authorization': f'Bearer {server_token}', 'Accept-Encoding': ACCEPT_ENCODING}
+    if cached is not None:
+        headers['If-None-Match'] = etag
+    req = urllib.request.Request(f"{SYNC_SERVER_URL}{path}", headers=headers, method='GET')
+    try:
+        with http_client.urlopen(req, timeout=timeout) as response:
+            raw = decode_body(response.read(), response.headers.get('Content-Encoding'))
+            if response.headers.get('ETag'):
+                _sync_validators.put(key, response.headers['ETag'], raw)
+    except urllib.error.HTTPError as e:
+        if e.code == 401:
+            # Токен отозван или истёк — проверка личности больше не действительна
+            _identities.invalidate(server_token)
+        if e.code != 304 or cached is None:
+            raise
+        raw = cached
+    return json.loads(raw.decode())
+
+
+def _server_identity(server_token):
+    """
+    Проверенный токен сервера: {'id', 'login', 'is_admin', 'tree': {счётчики}}.
+
+    Ответ /api/auth/introspect кэшируется на токен (не дольше expires_in из
+    ответа); старый сервер без introspect — /api/auth/me. 401 от любого
+    запроса к серверу сбрасывает запись (_sync_get_json).
+    """
+    identity = _identities.get(server_token)
+    if identity is None:
+        try:
+            identity = _sync_get_json("/api/auth/introspect", server_token, timeout=5)
+        except urllib.error.HTTPError as e:
+            if e.code != 404:
+                raise
+            identity = _sync_get_json("/api/auth/me", server_token, timeout=5)
+        _identities.put(server_token, identity, identity.get('expires_in'))
+    return identity
+
+
+def _fetch_server_tree(server_token, cache_key):
+    """
+    Дерево пользователя с сервера синхронизации.
+
+    Запрашивает изменения после закэшированной ревизии (/api/sync/changes);
+    если сервер не поддерживает ревизии — скачивает дерево целиком.
+    Возвращает (ревизия, дерево); ревизия None — сервер без ревизий.
+    """
+    revision, cached = _server_trees.get(cache_key)
+    try:
+        changes = _sync_get_json(f"/api/sync/changes?since={revision if cached is not None else 0}", server_token)
+    except urllib.error.HTTPError as e:
+        if e.code != 404:
+            raise
+        # Старый сервер синхронизации без /api/sync/changes
+        data = _sync_get_json("/api/sync/download", server_token)
+        return None, apply_server_changes(None, {"full": True, **data.get('tree', {})})
+
+    tree = apply_server_changes(cached, changes)
+    print(f"[API_TREE] Revision {revision} -> {changes.get('revision')}, full={changes.get('full')}, "
+          f"changed={len(changes.get('persons', {}))}, deleted={len(changes.get('deleted_persons', []))}")
+    _server_trees.put(cache_key, changes.get('revision', 0), tree)
+    return changes.get('revision', 0), tree
+
+
 @app.route("/api/tree", methods=["GET", "POST", "OPTIONS"])
 def api_tree():
     # Обработка CORS preflight (OPTIONS) запроса
@@ -1237,7 +1302,7 @@ def api_tree():
                         headers={'Authorization': f'Bearer {server_token}'},
                         method='GET'
                     )
-                    with urllib.request.urlopen(users_req, timeout=10) as users_resp:
+                    with http_client.urlopen(users_req, timeout=10) as users_resp:
                         users_data = json.loads(users_resp.read().decode())
                         users_list = users_data.get('users', [])
                         target_user = next((u for u in users_list if u.get('login') == tree_owner), None)
@@ -1250,7 +1315,7 @@ def api_tree():
                                 headers={'Authorization': f'Bearer {server_token}'},
                                 method='GET'
                             )
-                            with urllib.request.urlopen(tree_req, timeout=10) as tree_resp:
+                            with http_client.urlopen(tree_req, timeout=10) as tree_resp:
                                 tree_data_resp = json.loads(tree_resp.read().decode())
                                 user_trees = tree_data_resp.get('trees', [])
                                 
@@ -1264,7 +1329,7 @@ def api_tree():
                                                     p[k] = [str(x) for x in p[k]]
                                     cc = tree.get("current_center") or next(iter(persons.keys()), None)
                                     print(f"[API_TREE] Admin loaded tree for {tree_owner}: {len(persons)} persons")
-                                    return jsonify({
+                                    return json_response({
                                         "persons": persons,
                                         "marriages": tree.get("marriages", []),
                                         "current_center": cc,
@@ -1277,59 +1342,52 @@ def api_tree():
             try:
                 print(f"[API_TREE] Downloading from sync server...")
 
-                # Проверяем, что токен соответствует текущему пользователю
-                me_req = urllib.request.Request(
-                    f"{SYNC_SERVER_URL}/api/auth/me",
-                    headers={'Authorization': f'Bearer {server_token}'},
-                    method='GET'
-                )
-                with urllib.request.urlopen(me_req, timeout=5) as me_resp:
-                    me_data = json.loads(me_resp.read().decode())
-                    server_login = me_data.get('login', '')
-                    print(f"[API_TREE] Server login: {server_login}, session username: {username}")
-
-                    if server_login != username:
-                        print(f"[API_TREE] SECURITY: Server login '{server_login}' != session username '{username}'")
-                        session.clear()
-                        return jsonify({"error": "Сессия недействительна. Войдите снова."}), 401
-
-                req = urllib.request.Request(
-                    f"{SYNC_SERVER_URL}/api/sync/download",
-                    headers={'Authorization': f'Bearer {server_token}'},
-                    method='GET'
-                )
-                with urllib.request.urlopen(req, timeout=10) as response:
-                    data = json.loads(response.read().decode())
-                    tree_data = data.get('tree', {})
-                    persons_count = len(tree_data.get("persons", {}))
-                    print(f"[API_TREE] Sync server returned {persons_count} persons")
-
-                    # Если сервер вернул пустое дерево, используем локальное
-                    if persons_count == 0:
-                        print(f"[API_TREE] Server returned empty tree, using local file")
-                        raise Exception("Empty tree from server")  # Переходим к локальным данным
-
-                    # Сервер вернул данные - используем их
-                    persons = {str(k): v for k, v in tree_data.get("persons", {}).items()}
-                    for p in persons.values():
-                        if isinstance(p, dict):
-                            for k in ("parents", "children", "spouse_ids"):
-                                if k in p and isinstance(p[k], list):
-                                    p[k] = [str(x) for x in p[k]]
-                    cc = tree_data.get("current_center")
-                    marriages = [list(m) if isinstance(m, tuple) else m for m in tree_data.get("marriages", [])]
-                    print(f"[API_TREE] Marriages from server: {len(marriages)}")
-                    return jsonify({
-                        "persons": persons,
-                        "marriages": marriages,
-                        "current_center": str(cc) if cc is not None and str(cc) != "None" else None,
-                    })
+                # Проверяем, что токен соответствует текущему пользователю (проверка кэшируется на токен)
+                server_login = _server_identity(server_token).get('login', '')
+                print(f"[API_TREE] Server login: {server_login}, session username: {username}")
+
+                if server_login != username:
+                    print(f"[API_TREE] SECURITY: Server login '{server_login}' != session username '{username}'")
+                    _identities.invalidate(server_token)
+                    session.clear()
+                    return jsonify({"error": "Сессия недействительна. Войдите снова."}), 401
+
+                revision, tree_data = _fetch_server_tree(server_token, server_user_id or username)
+                persons_count = len(tree_data.get("persons", {}))
+                print(f"[API_TREE] Sync server returned {persons_count} persons")
+
+                # Если сервер вернул пустое дерево, используем локальное
+                if persons_count == 0:
+                    print(f"[API_TREE] Server returned empty tree, using local file")
+                    raise Exception("Empty tree from server")  # Переходим к локальным данным
+
+                # Сервер вернул данные - используем их
+                persons = tree_data["persons"]
+                cc = tree_data.get("current_center")
+                marriages = [list(m) if isinstance(m, tuple) else m for m in tree_data.get("marriages", [])]
+                print(f"[API_TREE] Marriages from server: {len(marriages)}")
+                # Дерево из кэша отдаётся потоково (без копии JSON в памяти); ETag — из ревизии
+                etag = (make_etag('server', TREE_ETAG_VERSION, server_user_id or username, revision)
+                        if revision is not None else None)
+                return stream_json_response(JsonObjectStream([
+                    ("persons", JsonObjectStream(persons)),
+                    ("marriages", marriages),
+                    ("current_center", str(cc) if cc is not None and str(cc) != "None" else None),
+                ]), etag=etag)
             except Exception as e:
                 print(f"[API_TREE] Sync server failed: {e}")
                 print(f"[API_TREE] Falling back to local file")
 
         # Fallback на локальный файл
         print(f"[API_TREE] Loading local file for username='{username}'")
+        # ETag из mtime/размера файла (stat до чтения: при гонке ETag лишь устареет)
+        try:
+            st = os.stat(get_data_path(username))
+            local_etag = make_etag('local', TREE_ETAG_VERSION, username, st.st_mtime_ns, st.st_size)
+        except OSError:
+            local_etag = make_etag('local', TREE_ETAG_VERSION, username, 0, 0)
+        if not_modified(local_etag):
+            return not_modified_response(local_etag)
         data = load_tree(username)
         persons_count = len(data.get("persons", {}))
         print(f"[API_TREE] Local file loaded {persons_count} persons for '{username}'")
@@ -1346,11 +1404,11 @@ def api_tree():
         # Преобразуем кортежи браков в массивы для JSON
         local_marriages = [list(m) if isinstance(m, tuple) else m for m in data.get("marriages", [])]
         print(f"[API_TREE] Returning local marriages: {len(local_marriages)} (converted)")
-        return jsonify({
-            "persons": persons,
-            "marriages": local_marriages,
-            "current_center": str(cc) if cc is not None and str(cc) != "None" else None,
-        })
+        return stream_json_response(JsonObjectStream([
+            ("persons", JsonObjectStream(persons)),
+            ("marriages", local_marriages),
+            ("current_center", str(cc) if cc is not None and str(cc) != "None" else None),
+        ]), etag=local_etag)
     
     # POST — сохранить
     print(f"[API_TREE_POST] ===== START SAVE =====")
@@ -1390,7 +1448,7 @@ def api_tree():
                 },
                 method='POST'
             )
-            with urllib.request.urlopen(req, timeout=10) as response:
+            with http_client.urlopen(req, timeout=10) as response:
                 result = json.loads(response.read().decode())
                 print(f"[API_TREE_POST] Sync server response: {result}")
                 if result.get('success') or result.get('message'):
@@ -1424,6 +1482,214 @@ def api_tree():
         return jsonify({"error": "Ошибка сохранения"}), 500
 
 
+def _local_tree_version(username):
+    """Версия локального файла дерева для курсоров страниц (mtime в наносекундах)."""
+    try:
+        return os.stat(get_data_path(username)).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def _sync_proxy(path, server_token):
+    """
+    GET к серверу синхронизации для прогрессивной загрузки дерева.
+
+    Ответ сервера (в т.ч. 400/409 с JSON) отдаётся как есть; None — сервер
+    недоступен или не знает этот путь (старая версия), нужен локальный файл.
+    """
+    try:
+        return json_response(_sync_get_json(path, server_token))
+    except urllib.error.HTTPError as e:
+        if e.code in (400, 409):
+            try:
+                return jsonify(json.loads(e.read().decode())), e.code
+            except ValueError:
+                return jsonify({"error": f"HTTP {e.code}"}), e.code
+        print(f"[API_TREE] Sync server {path}: HTTP {e.code}")
+    except Exception as e:
+        print(f"[API_TREE] Sync server {path} failed: {e}")
+    return None
+
+
+@app.route("/api/tree/persons/<person_id>/neighbourhood")
+def api_tree_neighbourhood(person_id):
+    """Окрестность персоны (?up=2&down=2&siblings=1) для быстрой первой отрисовки.
+
+    Ответ как у сервера синхронизации: persons, roles, marriages, revision и
+    cursor для /api/tree/persons — остальное дерево догружается страницами.
+    """
+    if "username" not in session:
+        return jsonify({"error": "Не авторизован"}), 401
+    up = max(0, min(request.args.get("up", 2, type=int), 100))
+    down = max(0, min(request.args.get("down", 2, type=int), 100))
+    siblings = max(0, min(request.args.get("siblings", 1, type=int), 100))
+
+    server_token = session.get("server_token")
+    if server_token:
+        query = urllib.parse.urlencode({"up": up, "down": down, "siblings": siblings})
+        response = _sync_proxy(
+            f"/api/tree/persons/{urllib.parse.quote(person_id, safe='')}/neighbourhood?{query}", server_token)
+        if response is not None:
+            return response
+
+    username = session["username"]
+    version = _local_tree_version(username)
+    data = load_tree(username)
+    persons = {str(k): v for k, v in data.get("persons", {}).items()}
+    if person_id not in persons:
+        return jsonify({"error": "Персона не найдена"}), 404
+    roles = tree_neighbourhood(persons, person_id, up, down, siblings)
+    marriages = [m for m in data.get("marriages", []) if str(m[0]) in roles and str(m[1]) in roles]
+    return json_response({
+        "person_id": person_id,
+        "persons": {pid: persons[pid] for pid in roles},
+        "roles": roles,
+        "marriages": marriages,
+        "revision": version,
+        "cursor": encode_cursor(version, ""),
+    })
+
+
+@app.route("/api/tree/persons")
+def api_tree_persons_page():
+    """Страница персон дерева по курсору (?cursor=...&limit=500), next_cursor=None — конец."""
+    if "username" not in session:
+        return jsonify({"error": "Не авторизован"}), 401
+    limit = max(1, min(request.args.get("limit", 500, type=int), 5000))
+    cursor = request.args.get("cursor")
+
+    server_token = session.get("server_token")
+    if server_token:
+        params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+        response = _sync_proxy(f"/api/tree/persons?{urllib.parse.urlencode(params)}", server_token)
+        if response is not None:
+            return response
+
+    username = session["username"]
+    version = _local_tree_version(username)
+    try:
+        cursor_version, after = decode_cursor(cursor) if cursor else (version, "")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if cursor_version != version:
+        return jsonify({"error": "Дерево изменилось, начните загрузку заново", "revision": version}), 409
+    data = load_tree(username)
+    persons, last_id = tree_page({str(k): v for k, v in data.get("persons", {}).items()}, after, limit)
+    return json_response({
+        "persons": persons,
+        "marriages": [m for m in data.get("marriages", []) if str(m[0]) in persons],
+        "revision": version,
+        "next_cursor": encode_cursor(version, last_id) if last_id is not None else None,
+    })
+
+
+# === ТОЧЕЧНЫЕ ПРАВКИ ===
+# Пути совпадают с сервером синхронизации: запрос передаётся ему как есть
+
+def _sync_edit(method, path, server_token, payload=None):
+    """
+    Точечная правка на сервере синхронизации.
+
+    Ответ сервера (в т.ч. 4xx с JSON) отдаётся как есть; None — сервер
+    недоступен, правка применяется к локальному файлу.
+    """
+    req = urllib.request.Request(
+        f"{SYNC_SERVER_URL}{path}",
+        data=json.dumps(payload).encode() if payload is not None else None,
+        headers={"Authorization": f"Bearer {server_token}", "Content-Type": "application/json"},
+        method=method,
+    )
+    try:
+        with http_client.urlopen(req, timeout=15) as resp:
+            return jsonify(json.loads(resp.read().decode()))
+    except urllib.error.HTTPError as e:
+        if 400 <= e.code < 500:
+            if e.code == 401:
+                _identities.invalidate(server_token)
+            try:
+                return jsonify(json.loads(e.read().decode())), e.code
+            except ValueError:
+                return jsonify({"error": f"HTTP {e.code}"}), e.code
+        print(f"[TREE_EDIT] Sync server {method} {path}: HTTP {e.code}")
+    except Exception as e:
+        print(f"[TREE_EDIT] Sync server {method} {path} failed: {e}")
+    return None
+
+
+def _tree_edit(apply, path=None, payload=None):
+    """
+    Правка одной персоны, связи или брака: на сервере синхронизации (если есть
+    токен), иначе в локальном файле. apply(persons, edit) — локальная правка.
+    Ответ как у сервера: revision, person_id, updated, deleted.
+    """
+    if "username" not in session:
+        return jsonify({"error": "Не авторизован"}), 401
+    server_token = session.get("server_token")
+    if server_token:
+        if payload is None:
+            payload = request.get_json(silent=True)
+        response = _sync_edit(request.method, path or request.path, server_token, payload)
+        if response is not None:
+            return response
+
+    username = session["username"]
+    try:
+        result = edit_tree(username, apply)
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if result is None:
+        return jsonify({"error": "Ошибка сохранения"}), 500
+    edit, person_id = result
+    print(f"[TREE_EDIT] {username}: {request.method} {request.path} persons={len(edit.persons)} "
+          f"deleted={len(edit.deleted)}")
+    return jsonify({
+        "revision": _local_tree_version(username),
+        "person_id": person_id,
+        "updated": sorted(edit.persons),
+        "deleted": edit.deleted,
+    })
+
+
+@app.route("/api/tree/persons", methods=["POST"])
+def api_tree_create_person():
+    """Новая персона (тело — JSON персоны; id необязателен, иначе максимум + 1)."""
+    data = request.get_json(silent=True) or {}
+    return _tree_edit(lambda persons, edit: edit.create_person(data.get("id") or next_person_id(persons), data))
+
+
+@app.route("/api/tree/persons/<person_id>", methods=["PATCH"])
+def api_tree_update_person(person_id):
+    """Изменить поля одной персоны (связи — отдельными запросами)."""
+    fields = request.get_json(silent=True) or {}
+    return _tree_edit(lambda persons, edit: edit.update_person(person_id, fields))
+
+
+@app.route("/api/tree/persons/<person_id>", methods=["DELETE"])
+def api_tree_delete_person(person_id):
+    """Удалить персону, ссылки на неё у родственников и её браки."""
+    return _tree_edit(lambda persons, edit: edit.delete_person(person_id))
+
+
+@app.route("/api/tree/persons/<person_id>/<relation>/<other_id>", methods=["PUT", "DELETE"])
+def api_tree_link_person(person_id, relation, other_id):
+    """Связь родитель — ребёнок: /parents/<id родителя> или /children/<id ребёнка>."""
+    if relation not in ("parents", "children"):
+        return jsonify({"error": "Неизвестная связь"}), 404
+    child_id, parent_id = (person_id, other_id) if relation == "parents" else (other_id, person_id)
+    linked = request.method == "PUT"
+    return _tree_edit(lambda persons, edit: edit.link_parent(child_id, parent_id, linked))
+
+
+@app.route("/api/tree/marriages/<person1_id>/<person2_id>", methods=["PUT", "DELETE"])
+def api_tree_set_marriage(person1_id, person2_id):
+    """Добавить брак (PUT, тело {date}) или убрать его (DELETE)."""
+    married = request.method == "PUT"
+    date = (request.get_json(silent=True) or {}).get("date") if married else None
+    return _tree_edit(lambda persons, edit: edit.set_marriage(person1_id, person2_id, married, date))
+
+
 @app.route("/download/desktop")
 def download_desktop():
     """Скачать Windows-версию: .exe (если собран) или ZIP с исходниками."""
@@ -1487,12 +1753,118 @@ def download_desktop():
     return send_file(buf, mimetype="application/zip", as_attachment=True, download_name="Семейное_древо_source.zip")
 
 
+# Фото по хешу содержимого не меняется: браузер не перепроверяет его вовсе
+PHOTO_IMMUTABLE = "private, max-age=31536000, immutable"
+# Хеши фото, которые сервер синхронизации отдал пользователю (в этом процессе, LRU)
+_server_photo_grants = PhotoGrantCache()
+
+
+def _photo_allowed(username, photo_hash):
+    """
+    Можно ли отдать пользователю фото из общего кэша: хеш есть в его дереве
+    или сервер уже отдавал ему это фото. Иначе решает сервер синхронизации.
+    """
+    if _server_photo_grants.allowed(username, photo_hash):
+        return True
+    photos = photo_hashes(username) or {}
+    return any(photo_hash in entry.values() for entry in photos.values())
+
+
+def _cached_photo_response(photo_hash, rendition=None, cache_control=PHOTO_IMMUTABLE):
+    """Фото из photo_cache: ETag по хешу и размеру, 304 при совпадении. None — хеша нет в кэше."""
+    webp = WEBP_AVAILABLE and rendition is not None and "image/webp" in request.headers.get("Accept", "")
+    found = photo_cache.get(photo_hash, rendition, webp=webp)
+    if found is None:
+        return None
+    path, mime = found
+    etag = '"' + os.path.basename(path) + '"'
+    if not_modified(etag):
+        response = not_modified_response(etag, cache_control)
+    else:
+        response = send_file(path, mimetype=mime, conditional=False, etag=False, max_age=None)
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = cache_control
+    if WEBP_AVAILABLE and rendition is not None:
+        response.vary.add("Accept")
+    return response
+
+
+@app.route("/api/photo/hash/<photo_hash>")
+@app.route("/api/photo/hash/<photo_hash>/<rendition>")
+def api_photo_by_hash(photo_hash, rendition=None):
+    """
+    Фото по SHA-256 (rendition: thumb, card или full).
+
+    Из дискового кэша фото — если хеш есть в дереве пользователя или сервер уже
+    отдавал ему это фото (кэш общий для всех пользователей); иначе — с сервера
+    синхронизации, который проверяет доступ. Полученные байты кладутся в кэш.
+    """
+    if "username" not in session:
+        return "", 401
+    if rendition is not None and rendition not in RENDITIONS:
+        return "", 404
+    if photo_cache.enabled and _photo_allowed(session["username"], photo_hash):
+        response = _cached_photo_response(photo_hash, rendition)
+        if response is not None:
+            return response
+    server_token = session.get('server_token')
+    if not server_token:
+        return "", 404
+
+    headers = {'Authorization': f'Bearer {server_token}'}
+    if request.headers.get('If-None-Match') and rendition is None:
+        headers['If-None-Match'] = request.headers['If-None-Match']
+    req = urllib.request.Request(f"{SYNC_SERVER_URL}/api/photos/{photo_hash}", headers=headers, method='GET')
+    try:
+        with http_client.urlopen(req, timeout=15) as resp:
+            raw = resp.read()
+            response = Response(raw, mimetype=resp.headers.get('Content-Type', 'image/jpeg'))
+            upstream = resp.headers
+    except urllib.error.HTTPError as e:
+        if e.code != 304:
+            return "", e.code
+        response = Response(status=304)
+        upstream = e.headers
+    if response.status_code == 200:
+        _server_photo_grants.grant(session["username"], photo_hash)
+    if photo_cache.enabled and response.status_code == 200 and photo_cache.put(raw) == photo_hash:
+        cached = _cached_photo_response(photo_hash, rendition)
+        if cached is not None:
+            return cached
+    for name in ('ETag', 'Cache-Control'):
+        if upstream.get(name):
+            response.headers[name] = upstream[name]
+    return response
+
+
+def _person_photo_response(username, person_id, fields, rendition):
+    """
+    Фото персоны по индексу photo_cache (первое непустое из fields).
+
+    URL по id персоны не неизменяем (фото могут заменить), поэтому ответ
+    перепроверяется (no-cache), но по ETag — 304 без тела. None — в индексе
+    фото нет (или кэш отключён): отдаём по-старому из дерева.
+    """
+    photos = photo_hashes(username)
+    if not photos:
+        return None
+    entry = photos.get(str(person_id)) or {}
+    for field in fields:
+        if entry.get(field):
+            return _cached_photo_response(entry[field], rendition, cache_control="private, no-cache")
+    return None
+
+
 @app.route("/api/photo/<person_id>")
 def api_photo(person_id):
-    """Возвращает миниатюру фото персоны из base64 (для карточки)."""
+    """Возвращает миниатюру фото персоны из base64 (для карточки). ?size=thumb|card|full — размер."""
     if "username" not in session:
         return "", 401
     username = session["username"]
+    size = request.args.get("size", "card")
+    cached = _person_photo_response(username, person_id, ("photo",), size if size in RENDITIONS else "card")
+    if cached is not None:
+        return cached
     data = load_tree(username)
     persons = data.get("persons", {})
     p = persons.get(str(person_id)) or persons.get(person_id)
@@ -1533,6 +1905,9 @@ def api_photo_full(person_id):
     if "username" not in session:
         return "", 401
     username = session["username"]
+    cached = _person_photo_response(username, person_id, ("photo_full", "photo"), "full")
+    if cached is not None:
+        return cached
     data = load_tree(username)
     persons = data.get("persons", {})
     p = persons.get(str(person_id)) or persons.get(person_id)
@@ -1566,31 +1941,20 @@ def api_photo_full(person_id):
 
 
 @app.route("/api/photo/<person_id>", methods=["PUT"])
+@app.route("/api/tree/persons/<person_id>/photo", methods=["PUT"])
 def api_photo_upload(person_id):
-    """Загрузка фото для персоны (через base64)."""
+    """Загрузка фото для персоны (через base64) — правка одной персоны, без выгрузки дерева."""
     if "username" not in session:
         return jsonify({"error": "Не авторизован"}), 401
-
-    username = session["username"]
-    data = load_tree(username)
-    persons = data.get("persons", {})
-    
-    # Находим персону
-    p = persons.get(str(person_id)) or persons.get(person_id)
-    if not p:
-        return jsonify({"error": "Персона не найдена"}), 404
-    
-    # Получаем фото из запроса
-    req_data = request.get_json() or {}
+    req_data = request.get_json(silent=True) or {}
     photo_base64 = req_data.get("photo")
     photo_path = req_data.get("photo_path", "")
-    
-    if not photo_base64:
+
+    if not photo_base64 or not isinstance(photo_base64, str):
         return jsonify({"error": "Фото не предоставлено"}), 400
-    
+
     # Проверяем формат base64
     try:
-        # Декодируем для проверки
         raw = base64.b64decode(photo_base64.strip())
         if len(raw) < 100:
             return jsonify({"error": "Слишком маленькое фото"}), 400
@@ -1598,43 +1962,22 @@ def api_photo_upload(person_id):
             return jsonify({"error": "Фото слишком большое (макс. 5MB)"}), 400
     except Exception as e:
         return jsonify({"error": f"Неверный формат фото: {e}"}), 400
-    
-    # Сохраняем в дерево
-    p["photo"] = photo_base64.strip()
-    if photo_path:
-        p["photo_path"] = photo_path
-    
-    # Сохраняем дерево
-    save_tree(username, data)
-    
-    # Синхронизируем с сервером если есть токен
-    server_token = session.get('server_token')
-    if server_token:
-        try:
-            # Загружаем всё дерево на сервер синхронизации
-            upload_req = urllib.request.Request(
-                f"{SYNC_SERVER_URL}/api/sync/upload",
-                data=json.dumps({
-                    "tree": data,
-                    "tree_name": f"Дерево {username}"
-                }).encode(),
-                headers={
-                    "Authorization": f"Bearer {server_token}",
-                    "Content-Type": "application/json"
-                },
-                method="POST"
-            )
-            with urllib.request.urlopen(upload_req, timeout=30) as resp:
-                result = json.loads(resp.read().decode())
-                logger.info(f"[PHOTO_UPLOAD] Synced to server: {result}")
-        except Exception as e:
-            logger.warning(f"[PHOTO_UPLOAD] Sync failed: {e}")
-    
-    logger.info(f"[PHOTO_UPLOAD] Photo uploaded for person {person_id} by {username}")
-    
+
+    payload = {"photo": photo_base64.strip(), **({"photo_path": photo_path} if photo_path else {})}
+    response = _tree_edit(
+        lambda persons, edit: edit.set_photo(person_id, payload["photo"], photo_path=payload.get("photo_path")),
+        path=f"/api/tree/persons/{urllib.parse.quote(str(person_id), safe='')}/photo",
+        payload=payload,
+    )
+    result = response[0] if isinstance(response, tuple) else response
+    if result.status_code != 200:
+        return response
+
+    logger.info(f"[PHOTO_UPLOAD] Photo uploaded for person {person_id} by {session.get('username')}")
     return jsonify({
         "message": "Фото сохранено",
         "size": len(photo_base64) // 1024,  # KB
+        "revision": result.get_json().get("revision"),
     })
 
 
@@ -1885,78 +2228,35 @@ def api_backup_restore():
         return jsonify({"error": f"Ошибка восстановления: {str(e)}"}), 500
 
 
+# Статистика на версию файла дерева: повторный запрос не обходит дерево
+_stats_cache = StatsCache()
+
+
 @app.route("/api/stats")
 def api_stats():
-    """Статистика дерева."""
+    """Статистика дерева (tree_stats: один проход, кэш на версию файла, ETag)."""
     if "username" not in session:
         return jsonify({"error": "Не авторизован"}), 401
 
     username = session["username"]
-    print(f"[API_STATS] username='{username}'")
-    data = load_tree(username)
-    persons = data.get("persons", {})
-    print(f"[API_STATS] Loaded {len(persons)} persons")
-    
-    # Подсчёт статистики
-    male_count = sum(1 for p in persons.values() if p.get('gender') == 'Мужской')
-    female_count = sum(1 for p in persons.values() if p.get('gender') == 'Женский')
-    deceased_count = sum(1 for p in persons.values() if p.get('is_deceased'))
-    
-    # Подсчёт поколе��ий (упрощённо)
-    def get_generation(pid, visited=None):
-        if visited is None:
-            visited = set()
-        if pid in visited:
-            return 0
-        visited.add(pid)
-        p = persons.get(str(pid)) or persons.get(pid)
-        if not p or not p.get('parents'):
-            return 1
-        return 1 + max(get_generation(pr, visited.copy()) for pr in p.get('parents', []))
-    
-    max_generation = 0
-    for pid in persons:
-        gen = get_generation(pid)
-        max_generation = max(max_generation, gen)
-    
-    # Подсчёт браков
-    marriages_count = len(data.get("marriages", []))
-    
-    # Средний возраст (для умерших)
-    ages = []
-    for p in persons.values():
-        if p.get('is_deceased') and p.get('birth_date') and p.get('death_date'):
-            try:
-                birth = datetime.strptime(p['birth_date'], '%d.%m.%Y')
-                death = datetime.strptime(p['death_date'], '%d.%m.%Y')
-                age = (death - birth).days // 365
-                if 0 < age < 120:
-                    ages.append(age)
-            except ValueError:
-                pass
-    
-    avg_age = round(sum(ages) / len(ages)) if ages else None
-    
-    # Статистика по местам рожден��я
-    birth_places = {}
-    for p in persons.values():
-        place = p.get('birth_place', '')
-        if place:
-            birth_places[place] = birth_places.get(place, 0) + 1
-    
-    top_places = sorted(birth_places.items(), key=lambda x: x[1], reverse=True)[:5]
-    
-    return jsonify({
-        "total_persons": len(persons),
-        "male_count": male_count,
-        "female_count": female_count,
-        "deceased_count": deceased_count,
-        "living_count": len(persons) - deceased_count,
-        "marriages_count": marriages_count,
-        "max_generations": max_generation,
-        "average_age": avg_age,
-        "top_birth_places": top_places,
-    })
+    path = get_data_path(username)
+    try:
+        st = os.stat(path)
+        stamp = (st.st_mtime_ns, st.st_size)
+    except OSError:
+        stamp = (0, 0)
+    etag = make_etag("stats", TREE_ETAG_VERSION, username, *stamp)
+    if not_modified(etag):
+        return not_modified_response(etag)
+
+    stats = _stats_cache.get(path, stamp)
+    if stats is None:
+        data = load_tree(username)
+        stats = tree_stats(data.get("persons", {}), len(data.get("marriages", [])))
+        _stats_cache.put(path, stamp, stats)
+        print(f"[API_STATS] username='{username}': {stats['total_persons']} persons, "
+              f"{stats['max_generations']} generations")
+    return json_response(stats, etag=etag)
 
 
 @app.route("/api/version/check")
@@ -1970,7 +2270,7 @@ def api_version_check():
             "https://api.github.com/repos/Andrey1803/family-tree/releases/latest",
             headers={"User-Agent": "Mozilla/5.0"}
         )
-        with urllib.request.urlopen(req, timeout=5) as resp:
+        with http_client.urlopen(req, timeout=5) as resp:
             release_data = json.loads(resp.read())
             latest_version = release_data.get("tag_name", "v0.0.0").lstrip('v')
             
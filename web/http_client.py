@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+"""
+HTTP-клиент с пулом keep-alive соединений для запросов к серверу синхронизации.
+
+Общий модуль web и desktop: Дерево/http_client.py — копия этого файла
+(у web и desktop свои корни сборки), содержимое совпадает.
+
+urlopen(req, timeout) — замена urllib.request.urlopen для urllib.request.Request:
+тот же ответ (status, headers, read(), with) и те же исключения (HTTPError на
+статус >= 300, в том числе 304; URLError при ошибке соединения), но соединение
+берётся из пула на хост и после ответа возвращается в него — TCP/TLS-рукопожатие
+не повторяется на каждый запрос.
+
+- на хост не больше HTTP_POOL_SIZE соединений одновременно (остальные ждут
+  свободного в пределах timeout), простаивающие дольше HTTP_POOL_IDLE секунд закрываются;
+- идемпотентные запросы (GET, HEAD, PUT, DELETE, OPTIONS) повторяются до
+  HTTP_RETRIES раз при ошибке соединения (кроме таймаута) и ответах
+  429/502/503/504 с экспоненциальной задержкой и случайным разбросом (full jitter);
+- соединение из пула, закрытое сервером за время простоя, перед запросом
+  заменяется новым; если обрыв обнаружился уже после отправки запроса, сразу
+  повторяются только идемпотентные методы — POST мог быть выполнен сервером;
+- GET и HEAD следуют перенаправлениям 3xx (до MAX_REDIRECTS, Authorization на
+  другой хост не передаётся);
+- если для схемы задан прокси (HTTP(S)_PROXY, настройки Windows — как у urllib)
+  и хост не в исключениях, запрос идёт через urllib.request без пула.
+"""
+
+import http.client
+import io
+import os
+import random
+import select
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import deque
+
+POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "8"))
+IDLE_TIMEOUT = float(os.environ.get("HTTP_POOL_IDLE", "60"))
+RETRIES = int(os.environ.get("HTTP_RETRIES", "2"))
+# Базовая и наибольшая задержка перед повтором (секунды)
+BACKOFF = 0.2
+BACKOFF_MAX = 2.0
+DEFAULT_TIMEOUT = 30
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "PUT", "DELETE", "OPTIONS"})
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+REDIRECT_METHODS = frozenset({"GET", "HEAD"})
+REDIRECT_STATUSES = frozenset({301, 302, 303, 307, 308})
+MAX_REDIRECTS = 5
+# Ошибки соединения из пула, которое сервер закрыл за время простоя
+_STALE_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+
+
+class Response:
+    """Ответ, прочитанный целиком (соединение уже вернулось в пул)."""
+
+    def __init__(self, url, status, reason, headers, data):
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self._data = data
+
+    def read(self):
+        return self._data
+
+    def getcode(self):
+        return self.status
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Перенаправления через прокси разбирает PooledHttpClient.request, как и без него."""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+def _is_dropped(conn):
+    """Простаивающее соединение закрыто сервером: сокет «читаем» (EOF) без запроса."""
+    if conn.sock is None:
+        return True
+    try:
+        return bool(select.select([conn.sock], [], [], 0)[0])
+    except (OSError, ValueError):
+        return True
+
+
+class _HostPool:
+    """Свободные соединения одного хоста и ограничение их общего числа."""
+
+    def __init__(self, size):
+        self.idle = deque()  # (соединение, время возврата)
+        self.slots = threading.BoundedSemaphore(size)
+
+
+class PooledHttpClient:
+    """
+    Потокобезопасный пул соединений {(схема, хост, порт): соединения}.
+
+    proxies — {схема: URL прокси, "no": исключения} как у urllib.request.getproxies();
+    None — прокси системы.
+    """
+
+    def __init__(self, pool_size=None, retries=None, idle_timeout=None, backoff=BACKOFF, backoff_max=BACKOFF_MAX,
+                 proxies=None):
+        self._system_proxies = proxies is None
+        self.proxies = urllib.request.getproxies() if proxies is None else dict(proxies)
+        self._proxy_opener = urllib.request.build_opener(
+            urllib.request.ProxyHandler(self.proxies), _NoRedirect) if self.proxies else None
+        self.pool_size = pool_size or POOL_SIZE
+        self.retries = RETRIES if retries is None else retries
+        self.idle_timeout = IDLE_TIMEOUT if idle_timeout is None else idle_timeout
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self._pools = {}
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "connections": 0, "reused": 0, "retries": 0}
+
+    def _pool(self, key):
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                pool = self._pools[key] = _HostPool(self.pool_size)
+            return pool
+
+    def _checkout(self, key, pool, timeout):
+        """(соединение, взято ли из пула). Слот пула уже занят вызывающим."""
+        now = time.monotonic()
+        with self._lock:
+            while pool.idle:
+                conn, returned = pool.idle.pop()
+                if now - returned < self.idle_timeout and not _is_dropped(conn):
+                    self.stats["reused"] += 1
+                    conn.timeout = timeout
+                    if conn.sock is not None:
+                        conn.sock.settimeout(timeout)
+                    return conn, True
+                conn.close()
+            self.stats["connections"] += 1
+        scheme, host, port = key
+        cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return cls(host, port, timeout=timeout), False
+
+    def _checkin(self, pool, conn):
+        with self._lock:
+            pool.idle.append((conn, time.monotonic()))
+
+    def _proxied(self, scheme, host):
+        """Идёт ли запрос к хосту через прокси."""
+        if scheme not in self.proxies:
+            return False
+        if self._system_proxies:
+            return not urllib.request.proxy_bypass(host)
+        return not urllib.request.proxy_bypass_environment(host, self.proxies)
+
+    def _send_via_proxy(self, method, url, body, headers, timeout):
+        """Один запрос через прокси (urllib.request). Returns: (ответ, байты) при любом статусе."""
+        req = urllib.request.Request(url, data=body, headers=headers, method=method)
+        try:
+            resp = self._proxy_opener.open(req, timeout=timeout)
+        except urllib.error.HTTPError as e:
+            return e, e.read()
+        except urllib.error.URLError as e:
+            # Ошибку соединения разбирает request() — как без прокси
+            if isinstance(e.reason, OSError):
+                raise e.reason
+            raise
+        with resp:
+            return resp, resp.read()
+
+    def _send(self, key, pool, method, path, body, headers, timeout):
+        """Один запрос на соединении из пула (с заменой закрытого сервером соединения)."""
+        if not pool.slots.acquire(timeout=timeout):
+            raise urllib.error.URLError(f"нет свободного соединения с {key[1]} за {timeout} с")
+        try:
+            while True:
+                conn, reused = self._checkout(key, pool, timeout)
+                sent = False
+                try:
+                    conn.request(method, path, body=body, headers=headers)
+                    sent = True
+                    resp = conn.getresponse()
+                    data = resp.read()
+                except _STALE_ERRORS:
+                    conn.close()
+                    # Запрос ушёл: неидемпотентный метод сервер мог уже выполнить
+                    if reused and (not sent or method in IDEMPOTENT_METHODS):
+                        continue
+                    raise
+                except BaseException:
+                    conn.close()
+                    raise
+                if resp.will_close:
+                    conn.close()
+                else:
+                    self._checkin(pool, conn)
+                return resp, data
+        finally:
+            pool.slots.release()
+
+    def _delay(self, attempt, retry_after=None):
+        delay = random.uniform(0, min(self.backoff_max, self.backoff * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    def request(self, method, url, body=None, headers=None, timeout=None):
+        """Выполнить запрос. Returns: Response (любой статус); URLError — ошибка соединения."""
+        timeout = DEFAULT_TIMEOUT if timeout is None else timeout
+        method = method.upper()
+        headers = dict(headers or {})
+        with self._lock:
+            self.stats["requests"] += 1
+        for _ in range(MAX_REDIRECTS):
+            resp = self._request_once(method, url, body, headers, timeout)
+            location = resp.headers.get("Location")
+            if method not in REDIRECT_METHODS or resp.status not in REDIRECT_STATUSES or not location:
+                return resp
+            target = urllib.parse.urljoin(url, location)
+            if urllib.parse.urlsplit(target).netloc != urllib.parse.urlsplit(url).netloc:
+                headers = {k: v for k, v in headers.items() if k.lower() not in ("authorization", "cookie")}
+            url = target
+        return self._request_once(method, url, body, headers, timeout)
+
+    def _request_once(self, method, url, body, headers, timeout):
+        """Запрос без перенаправлений, с повторами идемпотентных методов."""
+        parts = urllib.parse.urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        proxied = self._proxied(parts.scheme, parts.hostname)
+        pool = None if proxied else self._pool(key)
+        attempts = 1 + (self.retries if method in IDEMPOTENT_METHODS else 0)
+
+        for attempt in range(attempts):
+            last = attempt == attempts - 1
+            try:
+                if proxied:
+                    resp, data = self._send_via_proxy(method, url, body, headers, timeout)
+                else:
+                    resp, data = self._send(key, pool, method, path, body, headers, timeout)
+            except urllib.error.URLError:
+                raise
+            except TimeoutError as e:
+                # Медленный сервер повтором не нагружаем
+                raise urllib.error.URLError(e)
+            except (OSError, http.client.HTTPException) as e:
+                if last:
+                    raise urllib.error.URLError(e)
+                retry_after = None
+            else:
+                if resp.status not in RETRY_STATUSES or last:
+                    return Response(url, resp.status, resp.reason, resp.headers, data)
+                try:
+                    retry_after = float(resp.headers.get("Retry-After"))
+                except (TypeError, ValueError):
+                    retry_after = None
+            with self._lock:
+                self.stats["retries"] += 1
+            time.sleep(self._delay(attempt, retry_after))
+
+    def urlopen(self, req, timeout=None):
+        """Как urllib.request.urlopen для urllib.request.Request: HTTPError на статус >= 300."""
+        headers = dict(req.header_items())
+        if req.data is not None and not any(h.lower() == "content-type" for h in headers):
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        resp = self.request(req.get_method(), req.full_url, req.data, headers, timeout)
+        if resp.status >= 300:
+            raise urllib.error.HTTPError(req.full_url, resp.status, resp.reason, resp.headers,
+                                         io.BytesIO(resp.read()))
+        return resp
+
+    def close(self):
+        """Закрыть все свободные соединения."""
+        with self._lock:
+            for pool in self._pools.values():
+                while pool.idle:
+                    pool.idle.pop()[0].close()
+
+    def get_stats(self):
+        with self._lock:
+            snapshot = dict(self.stats)
+            snapshot["idle"] = sum(len(p.idle) for p in self._pools.values())
+        return snapshot
+
+
+# Общий пул процесса
+default_client = PooledHttpClient()
+
+
+def urlopen(req, timeout=None):
+    """urlopen через общий пул процесса."""
+    return default_client.urlopen(req, timeout)
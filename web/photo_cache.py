@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Дисковый кэш фото web по SHA-256 содержимого.
+
+Фото персон лежат в JSON дерева как base64 (photo — миниатюра, photo_full —
+полное фото). Декодированные байты хранятся в <корень>/<хеш[:2]>/<хеш>, а для
+каждого файла дерева — индекс {персона: {поле: хеш}} (index/<имя файла>.json)
+со штампом файла дерева (mtime_ns, размер): пока файл не менялся, фото
+отдаётся по индексу, без чтения и разбора JSON дерева.
+
+Хеш — тот же SHA-256 байтов, что у сервера синхронизации (photo_store.photo_hash),
+поэтому /api/photo/hash/<хеш> общий для локальных фото и фото с сервера.
+Содержимое по хешу не меняется — такие ответы кэшируются браузером навсегда.
+
+Размеры RENDITIONS (thumb, card, full) строятся при первом запросе, если
+установлен Pillow (WebP — если Pillow его умеет, а браузер принимает
+image/webp); без Pillow любой размер — исходные байты. Кэш производный:
+папку можно удалить, она заполнится заново. WEB_PHOTO_CACHE=0 — отключить.
+"""
+
+import base64
+import binascii
+import hashlib
+import json
+import os
+import re
+import threading
+from io import BytesIO
+
+from atomic_json import write_bytes, write_json
+
+try:
+    from PIL import Image, features
+    PIL_AVAILABLE = True
+    WEBP_AVAILABLE = bool(features.check("webp"))
+except ImportError:
+    PIL_AVAILABLE = False
+    WEBP_AVAILABLE = False
+
+# Наибольшая сторона производного размера, px
+RENDITIONS = {"thumb": 96, "card": 320, "full": 1600}
+# Поля персоны с фото в base64
+PHOTO_FIELDS = ("photo", "photo_full")
+
+_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+_FORMAT_MIME = {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+
+def is_photo_hash(value):
+    return isinstance(value, str) and bool(_HASH_RE.match(value))
+
+
+def sniff_mime(head):
+    """MIME по первым байтам изображения."""
+    if head[:8] == b"\x89PNG\r\n\x1a\n" or head[:4] == b"\x89PNG":
+        return "image/png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
+
+
+def decode_photo(value):
+    """Байты фото из base64 поля персоны или None."""
+    if not isinstance(value, str) or not value.strip():
+        return None
+    try:
+        return base64.b64decode(value.strip()) or None
+    except (ValueError, binascii.Error):
+        return None
+
+
+class PhotoCache:
+    """Байты фото и их размеры по хешу плюс индекс фото персон на файл дерева."""
+
+    def __init__(self, root, enabled=None):
+        self.root = root
+        self.enabled = (enabled if enabled is not None
+                        else os.environ.get("WEB_PHOTO_CACHE", "1") != "0")
+        self._indexes = {}  # путь дерева -> (штамп, {персона: {поле: хеш}})
+        self._originals = set()  # (хеш, размер), где исходник не больше размера
+        self._lock = threading.Lock()
+        self.stats = {"index_hits": 0, "index_misses": 0, "stored": 0, "renditions": 0}
+
+    def _blob_path(self, photo_hash, suffix=""):
+        return os.path.join(self.root, photo_hash[:2], photo_hash + suffix)
+
+    def _index_path(self, tree_path):
+        return os.path.join(self.root, "index", os.path.basename(tree_path))
+
+    def put(self, raw):
+        """Сохранить байты фото (если их ещё нет). Returns: хеш."""
+        photo_hash = hashlib.sha256(raw).hexdigest()
+        path = self._blob_path(photo_hash)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Одинаковые байты по одному хешу: блокировка и fsync не нужны
+            write_bytes(path, raw, fsync=False, lock=False)
+            self.stats["stored"] += 1
+        return photo_hash
+
+    def get(self, photo_hash, rendition=None, webp=False):
+        """(путь, mime) фото нужного размера или None, если хеша нет в кэше."""
+        if not is_photo_hash(photo_hash):
+            return None
+        path = self._blob_path(photo_hash)
+        try:
+            with open(path, "rb") as f:
+                head = f.read(12)
+        except OSError:
+            return None
+        if rendition and PIL_AVAILABLE:
+            derived = self._rendition(path, photo_hash, rendition, webp and WEBP_AVAILABLE)
+            if derived:
+                return derived
+        return path, sniff_mime(head)
+
+    def _rendition(self, path, photo_hash, rendition, webp):
+        """Уменьшенная копия (строится один раз). None — исходник уже не больше размера."""
+        limit = RENDITIONS[rendition]
+        if not webp and (photo_hash, rendition) in self._originals:
+            return None
+        for fmt in ("WEBP",) if webp else ("JPEG", "PNG"):
+            target = self._blob_path(photo_hash, f".{rendition}.{fmt.lower()}")
+            if os.path.exists(target):
+                return target, _FORMAT_MIME[fmt]
+        try:
+            with Image.open(path) as img:
+                if max(img.size) <= limit and not webp:
+                    self._originals.add((photo_hash, rendition))
+                    return None
+                fmt = "WEBP" if webp else ("PNG" if img.format == "PNG" else "JPEG")
+                img.thumbnail((limit, limit))
+                if fmt == "JPEG" and img.mode not in ("RGB", "L"):
+                    img = img.convert("RGB")
+                target = self._blob_path(photo_hash, f".{rendition}.{fmt.lower()}")
+                buf = BytesIO()
+                img.save(buf, fmt, quality=85)
+        except Exception as e:
+            print(f"[PHOTO_CACHE] Rendition {rendition} of {photo_hash[:12]} failed: {e}")
+            return None
+        write_bytes(target, buf.getvalue(), fsync=False, lock=False)
+        self.stats["renditions"] += 1
+        return target, _FORMAT_MIME[fmt]
+
+    def lookup(self, tree_path, stamp):
+        """Индекс фото файла дерева со штампом stamp или None, если индекс устарел."""
+        with self._lock:
+            entry = self._indexes.get(tree_path)
+        if entry is None or entry[0] != stamp:
+            # Индекс мог построить другой воркер
+            try:
+                with open(self._index_path(tree_path), "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                entry = (tuple(data["stamp"]), data["photos"])
+            except (OSError, ValueError, KeyError, TypeError):
+                entry = None
+            if entry is not None and entry[0] == stamp:
+                with self._lock:
+                    self._indexes[tree_path] = entry
+        with self._lock:
+            if entry is None or entry[0] != stamp:
+                self.stats["index_misses"] += 1
+                return None
+            self.stats["index_hits"] += 1
+        return entry[1]
+
+    def index(self, tree_path, stamp, persons):
+        """Разложить фото персон по кэшу и запомнить индекс файла дерева. Returns: индекс."""
+        photos = {}
+        for pid, p in persons.items():
+            if not isinstance(p, dict):
+                continue
+            entry = {}
+            for field in PHOTO_FIELDS:
+                raw = decode_photo(p.get(field))
+                if raw:
+                    entry[field] = self.put(raw)
+            if entry:
+                photos[str(pid)] = entry
+        index_path = self._index_path(tree_path)
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        write_json(index_path, {"stamp": list(stamp), "photos": photos}, fsync=False)
+        with self._lock:
+            self._indexes[tree_path] = (tuple(stamp), photos)
+        return photos
+
+    def get_stats(self):
+        with self._lock:
+            snapshot = dict(self.stats)
+            snapshot["indexes"] = len(self._indexes)
+        snapshot["pil"] = PIL_AVAILABLE
+        snapshot["webp"] = WEBP_AVAILABLE
+        return snapshot
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Кэш деревьев, полученных с сервера синхронизации.
+
+Web-версия хранит последнюю полученную ревизию дерева пользователя и при
+следующем запросе /api/tree забирает с сервера только изменения
+(/api/sync/changes?since=N), а не всё дерево с фото.
+Кэш — на процесс (воркер gunicorn), ограничен WEB_TREE_CACHE_SIZE деревьями.
+
+IdentityCache — проверенный токен сервера (логин, роль) на WEB_AUTH_CACHE_TTL
+секунд: /api/tree и проверки прав не спрашивают /api/auth/introspect на каждый запрос.
+
+PhotoGrantCache — хеши фото, которые сервер уже отдавал пользователю; не больше
+WEB_PHOTO_GRANTS_SIZE пар (пользователь, хеш).
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def _normalize_person(person):
+    """id связей — строки (как ожидает tree.js)."""
+    if isinstance(person, dict):
+        person = dict(person)
+        for k in ("parents", "children", "spouse_ids"):
+            if k in person and isinstance(person[k], list):
+                person[k] = [str(x) for x in person[k]]
+    return person
+
+
+def _marriage_key(marriage):
+    pair = marriage.get("persons", []) if isinstance(marriage, dict) else list(marriage)
+    return (str(pair[0]), str(pair[1])) if len(pair) >= 2 else None
+
+
+def apply_changes(tree, changes):
+    """
+    Применить ответ /api/sync/changes к дереву {'persons', 'marriages'}.
+
+    Возвращает новое дерево; исходное не изменяется (его могут читать
+    параллельные запросы).
+    """
+    if changes.get("full") or tree is None:
+        persons = {}
+        marriages = {}
+    else:
+        persons = dict(tree.get("persons", {}))
+        marriages = {_marriage_key(m): m for m in tree.get("marriages", [])}
+        for pid in changes.get("deleted_persons", []):
+            persons.pop(str(pid), None)
+        for pair in changes.get("deleted_marriages", []):
+            marriages.pop(_marriage_key(pair), None)
+
+    for pid, person in changes.get("persons", {}).items():
+        persons[str(pid)] = _normalize_person(person)
+    for marriage in changes.get("marriages", []):
+        key = _marriage_key(marriage)
+        if key:
+            marriages[key] = marriage
+    marriages.pop(None, None)
+    return {"persons": persons, "marriages": list(marriages.values())}
+
+
+class ServerTreeCache:
+    """LRU-кэш {ключ пользователя: (ревизия, дерево)}."""
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries or int(os.environ.get("WEB_TREE_CACHE_SIZE", "32"))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """(revision, tree) или (0, None)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return 0, None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, revision, tree):
+        with self._lock:
+            self._entries[key] = (revision, tree)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class ValidatorCache(ServerTreeCache):
+    """LRU-кэш {(токен, путь): (ETag, тело ответа)} для условных GET к серверу синхронизации."""
+
+
+class IdentityCache:
+    """TTL-кэш {токен сервера: ответ /api/auth/introspect}; сбрасывается при выходе и 401."""
+
+    def __init__(self, ttl=None, max_entries=None):
+        self.ttl = ttl if ttl is not None else float(os.environ.get("WEB_AUTH_CACHE_TTL", "60"))
+        self.max_entries = max_entries or int(os.environ.get("WEB_AUTH_CACHE_SIZE", "1000"))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token, now=None):
+        """Проверенные данные токена или None (нет записи или истёк TTL)."""
+        now = now if now is not None else time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            if entry[1] <= now:
+                del self._entries[token]
+                return None
+            return entry[0]
+
+    def put(self, token, identity, ttl=None, now=None):
+        """Запомнить на min(ttl, self.ttl) секунд (ttl — срок, который разрешил сервер)."""
+        now = now if now is not None else time.time()
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[token] = (identity, now + ttl)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, token):
+        with self._lock:
+            self._entries.pop(token, None)
+
+
+class PhotoGrantCache:
+    """LRU-множество пар (пользователь, хеш фото), доступ к которым подтвердил сервер синхронизации."""
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries or int(os.environ.get("WEB_PHOTO_GRANTS_SIZE", "20000"))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def allowed(self, username, photo_hash):
+        key = (username, photo_hash)
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._entries.move_to_end(key)
+            return True
+
+    def grant(self, username, photo_hash):
+        key = (username, photo_hash)
+        with self._lock:
+            self._entries[key] = None
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
@@ -321,8 +321,8 @@ function renderTreesList(trees) {
     }
     
     list.innerHTML = trees.map(t => {
-        const personsCount = t.persons ? Object.keys(t.persons).length : 0;
-        const marriagesCount = (t.marriages || []).length;
+        const personsCount = t.persons_count ?? (t.persons ? Object.keys(t.persons).length : 0);
+        const marriagesCount = t.marriages_count ?? (t.marriages || []).length;
         const userLogin = t.user_login || 'Неизвестно';
         
         return `
@@ -848,7 +848,7 @@ function render() {
             if (activeFilters.gender === "Только женщины" && p.gender !== "Женский") continue;
         }
         if (activeFilters.status === "Только живые" && p.is_deceased) continue;
-        if (activeFilters.photos_only && !((p.photo_path || p.photo || "").toString().trim())) continue;
+        if (activeFilters.photos_only && !((p.photo_path || p.photo || p.photo_hash || "").toString().trim())) continue;
         if (activeFilters.childless && (p.children || []).length > 0) continue;
         related.add(pid);
     }
@@ -912,6 +912,9 @@ function render() {
             const b = p.photo.trim();
             const mime = b.startsWith("iVBORw0K") ? "image/png" : "image/jpeg";
             photoSrc = `data:${mime};base64,${b}`;
+        } else if (p.photo_hash && typeof p.photo_hash === "string") {
+            // Фото по хешу содержимого: браузер кэширует его навсегда
+            photoSrc = `/api/photo/hash/${encodeURIComponent(p.photo_hash)}`;
         } else if (p.photo_path && typeof p.photo_path === "string" && p.photo_path.trim()) {
             photoSrc = `/api/photo/${encodeURIComponent(pid)}`;
         }
@@ -2572,6 +2575,41 @@ async function saveTree(showNotification = false) {
     return false;
 }
 
+// Сохранение полей одной персоны (PATCH /api/tree/persons/<id>) вместо выгрузки всего дерева.
+// Если точечная правка не прошла — сохраняем дерево целиком (saveTree).
+async function savePerson(pid, fields, showNotification = false) {
+    try {
+        const response = await fetch(`/api/tree/persons/${encodeURIComponent(pid)}`, {
+            method: "PATCH",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify(fields),
+            credentials: "include"
+        });
+        if (response.status === 401) {
+            alert('Сессия истекла. Пожалуйста, войдите снова.');
+            window.location.href = '/login';
+            return false;
+        }
+        if (response.ok) {
+            const backupData = {...treeData, _username: localStorage.getItem('family_tree_username') || 'unknown'};
+            localStorage.setItem('family_tree_backup', JSON.stringify(backupData));
+            lastSavedState = JSON.stringify(treeData);
+            if (showNotification || window.innerWidth <= 480) {
+                const msg = document.createElement('div');
+                msg.style.cssText = 'position:fixed;top:20px;left:50%;transform:translateX(-50%);background:#27ae60;color:white;padding:12px 24px;border-radius:8px;z-index:10000;box-shadow:0 4px 12px rgba(0,0,0,0.3);font-size:16px;font-weight:bold;';
+                msg.textContent = '✅ Дерево сохранено на сервере!';
+                document.body.appendChild(msg);
+                setTimeout(() => msg.remove(), 4000);
+            }
+            return true;
+        }
+        console.warn('[SAVE_PERSON] PATCH failed:', response.status, '- saving whole tree');
+    } catch (e) {
+        console.warn('[SAVE_PERSON] PATCH error:', e, '- saving whole tree');
+    }
+    return saveTree(showNotification);
+}
+
 // === ИСПРАВЛЕНИЕ СКРОЛЛА НА МОБИЛЬНОМ ===
 // Добавляем обработчик для принудительной прокрутки в модальных окнах
 document.addEventListener('DOMContentLoaded', function() {
@@ -3267,8 +3305,14 @@ async function editPerson(pid) {
             p.spouse_dates = spouseDates;
         }
 
-        // Сохраняем дерево
-        saveTree(true).then(() => {
+        // Сохраняем только эту персону (связи редактор не меняет)
+        const fields = {};
+        for (const key of Object.keys(p)) {
+            if (!["parents", "children", "spouse_ids", "photo", "photo_full", "photo_hash", "photo_full_hash"].includes(key)) {
+                fields[key] = p[key];
+            }
+        }
+        savePerson(pid, fields, true).then(() => {
             ov.remove();
             render();
             const savedName = [p.name, p.patronymic, p.surname].filter(Boolean).join(" ");
@@ -3952,7 +3996,7 @@ function openTimeline() {
         let filtered = [...personsWithDates];
         if (filterType === "male") filtered = filtered.filter(p => p.gender === "Мужской");
         else if (filterType === "female") filtered = filtered.filter(p => p.gender === "Женский");
-        else if (filterType === "with_photos") filtered = filtered.filter(p => p.photo || p.photo_path);
+        else if (filterType === "with_photos") filtered = filtered.filter(p => p.photo || p.photo_hash || p.photo_path);
         
         if (filtered.length === 0) {
             svg.innerHTML = '<text x="500" y="200" font-size="14" fill="#64748b">Нет персон по выбранному фильтру</text>';
@@ -218,7 +218,7 @@ function applyFilters(afterFocus, persons, activeFilters) {
         
         // Фильтр "Только с фото"
         if (activeFilters.photos_only) {
-            const hasPhoto = person.photo_path || person.photo;
+            const hasPhoto = person.photo_path || person.photo || person.photo_hash;
             if (!hasPhoto || !String(hasPhoto).trim()) {
                 return;
             }
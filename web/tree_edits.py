@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Точечные правки дерева: персона, связь родитель — ребёнок, брак, фото.
+
+Общий модуль sync_server и web: web/tree_edits.py — копия этого файла
+(у сервисов свои корни деплоя), содержимое совпадает.
+
+TreeEdit работает с отображением persons {id: JSON персоны}, из которого
+берутся только затронутые персоны: сервер синхронизации подгружает их из БД
+по обращению persons[id] (tree_store.edit_tree), web передаёт дерево из файла.
+Обе стороны связи меняются вместе (parents ↔ children, spouse_ids у обоих
+супругов). Результат — edit.persons (записать), edit.deleted (удалить),
+edit.marriages {(p1, p2): дата} и edit.removed_marriages; применяет его
+вызывающий код. Ошибки: LookupError — нет персоны, ValueError — неверная правка.
+"""
+
+# Поля связей: меняются только через link_parent/set_marriage (у связи две стороны)
+RELATION_FIELDS = ("parents", "children", "spouse_ids")
+# base64-поле фото и поле его хеша (хеш устаревает при замене фото)
+PHOTO_FIELDS = (("photo", "photo_hash"), ("photo_full", "photo_full_hash"))
+
+
+def _toggle(ids, other, present):
+    if present and other not in ids:
+        ids.append(other)
+    elif not present and other in ids:
+        ids.remove(other)
+
+
+class TreeEdit:
+    """
+    Правка части дерева. find_marriage(a, b) → ключ брака (p1, p2) в любом порядке или None.
+
+    Методы правок возвращают id основной персоны (созданной, изменённой, ребёнка связи).
+    """
+
+    def __init__(self, persons, find_marriage):
+        self._source = persons
+        self._find_marriage = find_marriage
+        self.persons = {}
+        self.deleted = []
+        self.marriages = {}
+        self.removed_marriages = []
+
+    def person(self, person_id):
+        """Изменяемая копия персоны (связи — списки строковых id). LookupError — нет персоны."""
+        pid = str(person_id)
+        if pid in self.persons:
+            return self.persons[pid]
+        try:
+            source = self._source[pid] if pid not in self.deleted else None
+        except KeyError:
+            source = None
+        if not isinstance(source, dict):
+            raise LookupError(f"Персона {pid} не найдена")
+        person = dict(source)
+        for field in RELATION_FIELDS:
+            person[field] = [str(x) for x in person.get(field) or []]
+        self.persons[pid] = person
+        return person
+
+    def exists(self, person_id):
+        try:
+            self.person(person_id)
+        except LookupError:
+            return False
+        return True
+
+    def create_person(self, person_id, data):
+        """Новая персона; parents/children/spouse_ids из data связываются с обеих сторон."""
+        pid = str(person_id)
+        if self.exists(pid):
+            self.persons.pop(pid, None)
+            raise ValueError(f"Персона {pid} уже есть")
+        person = {k: v for k, v in (data or {}).items() if k not in RELATION_FIELDS and k != "id"}
+        person.update({field: [] for field in RELATION_FIELDS})
+        self.persons[pid] = person
+        for parent_id in (data or {}).get("parents") or []:
+            self.link_parent(pid, parent_id)
+        for child_id in (data or {}).get("children") or []:
+            self.link_parent(child_id, pid)
+        for spouse_id in (data or {}).get("spouse_ids") or []:
+            self.set_marriage(pid, spouse_id)
+        return pid
+
+    def update_person(self, person_id, fields):
+        """Изменить поля персоны (кроме связей)."""
+        relations = [field for field in RELATION_FIELDS if field in (fields or {})]
+        if relations:
+            raise ValueError(f"Связи ({', '.join(relations)}) меняются отдельными запросами")
+        person = self.person(person_id)
+        for field, hash_field in PHOTO_FIELDS:
+            if field in fields:
+                person[hash_field] = None
+        person.update({k: v for k, v in fields.items() if k != "id"})
+        return str(person_id)
+
+    def delete_person(self, person_id):
+        """Удалить персону и ссылки на неё у родителей, детей и супругов."""
+        pid = str(person_id)
+        person = self.person(pid)
+        for key, back in (("parents", "children"), ("children", "parents")):
+            for other in person[key]:
+                if other != pid and self.exists(other):
+                    _toggle(self.person(other)[back], pid, False)
+        for spouse_id in person["spouse_ids"]:
+            if spouse_id != pid and self.exists(spouse_id):
+                _toggle(self.person(spouse_id)["spouse_ids"], pid, False)
+            key = self._find_marriage(pid, spouse_id)
+            if key:
+                self.removed_marriages.append(key)
+        del self.persons[pid]
+        self.deleted.append(pid)
+        return pid
+
+    def link_parent(self, child_id, parent_id, linked=True):
+        """Добавить (linked=False — убрать) связь родитель — ребёнок."""
+        child_id, parent_id = str(child_id), str(parent_id)
+        if child_id == parent_id:
+            raise ValueError("Персона не может быть своим родителем")
+        child, parent = self.person(child_id), self.person(parent_id)
+        _toggle(child["parents"], parent_id, linked)
+        _toggle(parent["children"], child_id, linked)
+        return child_id
+
+    def set_marriage(self, person1_id, person2_id, married=True, date=None):
+        """Добавить (married=False — убрать) брак; date=None — дату существующего брака не менять."""
+        a, b = str(person1_id), str(person2_id)
+        if a == b:
+            raise ValueError("Персона не может состоять в браке сама с собой")
+        first, second = self.person(a), self.person(b)
+        _toggle(first["spouse_ids"], b, married)
+        _toggle(second["spouse_ids"], a, married)
+        key = self._find_marriage(a, b)
+        if married:
+            if key is None or date is not None:
+                self.marriages[key or (a, b)] = date or ""
+        elif key:
+            self.removed_marriages.append(key)
+        return a
+
+    def set_photo(self, person_id, photo, photo_full=None, photo_path=None):
+        """Заменить фото персоны (base64; None — убрать)."""
+        fields = {"photo": photo}
+        if photo_full is not None:
+            fields["photo_full"] = photo_full
+        if photo_path is not None:
+            fields["photo_path"] = photo_path
+        return self.update_person(person_id, fields)
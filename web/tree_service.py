@@ -1,8 +1,26 @@
 # -*- coding: utf-8 -*-
-"""Сервис работы с деревом: загрузка/сохранение JSON, совместим с desktop."""
+"""
+Сервис работы с деревом: загрузка/сохранение JSON, совместим с desktop.
 
+Разобранные деревья кэшируются на процесс (TreeCache): повторный load_tree
+того же файла — без чтения и json.load, пока не изменились mtime и размер
+файла. save_tree сбрасывает запись явно (запись в том же такте mtime и с тем
+же размером иначе осталась бы незамеченной) и пишет файл атомарно (atomic_json).
+
+Фото персон раскладываются по дисковому кэшу photo_cache (по хешу содержимого)
+при сохранении; photo_hashes() отдаёт хеши фото дерева без разбора JSON.
+"""
+
+import base64
+import bisect
 import json
 import os
+import threading
+from collections import OrderedDict
+
+from atomic_json import file_lock, write_json
+from photo_cache import PhotoCache
+from tree_edits import TreeEdit
 
 # Абсолютный путь к папке данных - как в app.py
 # _web_dir = папка web
@@ -36,15 +54,116 @@ def get_data_path(username):
     return path
 
 
+class TreeCache:
+    """
+    LRU разобранных деревьев {путь: ((mtime_ns, размер), дерево)}.
+
+    Бюджет памяти — по суммарному размеру файлов (WEB_TREE_PARSE_CACHE_MB,
+    разобранное дерево занимает в памяти в несколько раз больше); дерево
+    крупнее бюджета не кэшируется. Счётчики — get_stats().
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = (max_bytes if max_bytes is not None
+                          else int(float(os.environ.get("WEB_TREE_PARSE_CACHE_MB", "64")) * 1024 * 1024))
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0, "evictions": 0}
+
+    def get(self, path, stamp):
+        """Дерево, если файл не изменился с момента разбора, иначе None."""
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry[0] != stamp:
+                # Файл изменился — устаревшее дерево больше не нужно
+                self._drop(path)
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(path)
+            self.stats["hits"] += 1
+            return entry[1]
+
+    def put(self, path, stamp, tree):
+        size = stamp[1]
+        with self._lock:
+            self._drop(path)
+            if size > self.max_bytes:
+                return
+            self._entries[path] = (stamp, tree)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+
+    def _drop(self, path):
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self._bytes -= entry[0][1]
+
+    def invalidate(self, path):
+        with self._lock:
+            self._drop(path)
+            self.stats["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_stats(self):
+        with self._lock:
+            snapshot = dict(self.stats)
+            snapshot["entries"] = len(self._entries)
+            snapshot["bytes"] = self._bytes
+            snapshot["max_bytes"] = self.max_bytes
+        return snapshot
+
+
+# Кэш разобранных деревьев воркера
+tree_cache = TreeCache()
+# Декодированные фото и индекс фото деревьев (общие для воркеров — на диске)
+photo_cache = PhotoCache(os.path.join(DATA_DIR, "photo_cache"))
+
+
+def _copy_tree(tree):
+    """
+    Копия дерева из кэша для вызывающего кода.
+
+    Вызывающие меняют поля персон (photo, списки связей) и добавляют персоны —
+    копируются словари персон и списки браков; строки (фото) общие, без копий.
+    """
+    return {
+        "persons": {pid: dict(p) if isinstance(p, dict) else p for pid, p in tree["persons"].items()},
+        "marriages": [list(m) for m in tree["marriages"]],
+        "current_center": tree["current_center"],
+    }
+
+
 def load_tree(username):
     """Загружает дерево из JSON. Возвращает {persons: {}, marriages: [], current_center}.
     
     Добавлена улучшенная обработка ошибок и валидация структуры данных.
+    Разобранное дерево берётся из tree_cache, если файл не менялся.
     """
     path = get_data_path(username)
-    if not os.path.exists(path):
+    try:
+        st = os.stat(path)
+    except OSError:
         print(f"[TREE_SERVICE] File not found: {path}")
         return {"persons": {}, "marriages": [], "current_center": None}
+    stamp = (st.st_mtime_ns, st.st_size)
+    tree = tree_cache.get(path, stamp)
+    if tree is None:
+        tree = _parse_tree(path, username)
+        if tree is None:
+            return {"persons": {}, "marriages": [], "current_center": None}
+        tree_cache.put(path, stamp, tree)
+    return _copy_tree(tree)
+
+
+def _parse_tree(path, username):
+    """Прочитать и проверить файл дерева. None — файл испорчен."""
     try:
         with open(path, "r", encoding="utf-8") as f:
             data = json.load(f)
@@ -52,7 +171,7 @@ def load_tree(username):
         # Валидация структуры данных
         if not isinstance(data, dict):
             print(f"[TREE_SERVICE] ERROR: Invalid data type for {username}: expected dict, got {type(data)}")
-            return {"persons": {}, "marriages": [], "current_center": None}
+            return None
         
         persons = data.get("persons", {})
         
@@ -102,10 +221,10 @@ def load_tree(username):
         }
     except json.JSONDecodeError as e:
         print(f"[TREE_SERVICE] ERROR: JSON decode error for {username}: {e}")
-        return {"persons": {}, "marriages": [], "current_center": None}
+        return None
     except Exception as e:
         print(f"[TREE_SERVICE] ERROR: Unexpected error loading tree for {username}: {type(e).__name__}: {e}")
-        return {"persons": {}, "marriages": [], "current_center": None}
+        return None
 
 
 def save_tree(username, data):
@@ -134,8 +253,154 @@ def save_tree(username, data):
         "current_center": str(data.get("current_center")) if data.get("current_center") else None,
     }
     try:
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(out, f, ensure_ascii=False, indent=2)
-        return True
-    except Exception:
+        # Временный файл + fsync + os.replace под блокировкой файла, компактный JSON
+        write_json(path, out)
+    except Exception as e:
+        print(f"[TREE_SERVICE] ERROR: save failed for {username}: {type(e).__name__}: {e}")
         return False
+    finally:
+        tree_cache.invalidate(path)
+    if photo_cache.enabled:
+        try:
+            st = os.stat(path)
+            photo_cache.index(path, (st.st_mtime_ns, st.st_size), persons_serial)
+        except Exception as e:
+            # Индекс построится заново при первом запросе фото
+            print(f"[TREE_SERVICE] WARNING: photo index failed for {username}: {type(e).__name__}: {e}")
+    return True
+
+
+def photo_hashes(username):
+    """
+    Хеши фото персон дерева {id: {"photo": хеш, "photo_full": хеш}}.
+
+    Пока файл дерева не менялся, индекс берётся из photo_cache без чтения JSON;
+    иначе дерево загружается один раз и индекс строится заново.
+    None — кэш фото отключён (WEB_PHOTO_CACHE=0).
+    """
+    if not photo_cache.enabled:
+        return None
+    path = get_data_path(username)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return {}
+    stamp = (st.st_mtime_ns, st.st_size)
+    photos = photo_cache.lookup(path, stamp)
+    if photos is None:
+        photos = photo_cache.index(path, stamp, load_tree(username)["persons"])
+    return photos
+
+
+def next_person_id(persons):
+    """Следующий числовой id персоны (как у клиентов: максимум + 1)."""
+    return str(max((int(pid) for pid in persons if str(pid).isdigit()), default=0) + 1)
+
+
+def edit_tree(username, apply):
+    """
+    Точечная правка локального дерева (tree_edits.TreeEdit).
+
+    apply(persons, edit) меняет персоны через edit; изменённые персоны и браки
+    переносятся в дерево, файл сохраняется. Ошибки правки — LookupError/ValueError.
+    Чтение, правка и запись идут под блокировкой <дерево>.edit.lock: правки
+    воркеров одного пользователя не теряют друг друга.
+
+    Returns:
+        (edit, результат apply) или None, если файл не сохранился.
+    """
+    try:
+        with file_lock(get_data_path(username) + ".edit"):
+            return _edit_tree(username, apply)
+    except TimeoutError as e:
+        print(f"[TREE_SERVICE] ERROR: edit lock timeout for {username}: {e}")
+        return None
+
+
+def _edit_tree(username, apply):
+    data = load_tree(username)
+    persons = data["persons"]
+    marriages = data["marriages"]
+    pairs = {(str(m[0]), str(m[1])) for m in marriages}
+
+    def find_marriage(a, b):
+        return next((key for key in ((a, b), (b, a)) if key in pairs), None)
+
+    edit = TreeEdit(persons, find_marriage)
+    result = apply(persons, edit)
+    persons.update(edit.persons)
+    for pid in edit.deleted:
+        persons.pop(pid, None)
+    removed = set(edit.removed_marriages)
+    data["marriages"] = [m for m in marriages if (str(m[0]), str(m[1])) not in removed]
+    data["marriages"] += [list(key) for key in edit.marriages if key not in pairs]
+    if data.get("current_center") in edit.deleted:
+        data["current_center"] = next(iter(persons), None)
+    if not save_tree(username, data):
+        return None
+    return edit, result
+
+
+def _ids(person, key):
+    return [str(x) for x in (person or {}).get(key) or []]
+
+
+def tree_neighbourhood(persons, person_id, up=2, down=2, siblings=1):
+    """
+    Окрестность персоны {id: роль} по JSON дерева — как
+    /api/tree/persons/<id>/neighbourhood сервера синхронизации: self,
+    ancestor (до up поколений), descendant (до down), sibling (свои и
+    предков до siblings поколений), spouse (супруги всех найденных).
+    """
+    person_id = str(person_id)
+    found = {person_id: "self"}
+    for key, depth, role in (("parents", up, "ancestor"), ("children", down, "descendant")):
+        frontier = [person_id]
+        for _ in range(depth):
+            frontier = [other for pid in frontier for other in _ids(persons.get(pid), key)
+                        if other in persons and other not in found]
+            for other in frontier:
+                found.setdefault(other, role)
+    line = {person_id}
+    for _ in range(siblings):
+        line = {parent for pid in line for parent in _ids(persons.get(pid), "parents") if parent in persons}
+        for parent in line:
+            for child in _ids(persons.get(parent), "children"):
+                if child in persons:
+                    found.setdefault(child, "sibling")
+    for pid in list(found):
+        for spouse in _ids(persons.get(pid), "spouse_ids"):
+            if spouse in persons:
+                found.setdefault(spouse, "spouse")
+    return found
+
+
+def encode_cursor(version, after):
+    """Курсор страницы дерева: версия снимка и последний выданный id."""
+    raw = json.dumps([version, after], ensure_ascii=False).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Курсор → (версия, после какого id). ValueError — испорченный курсор."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        version, after = json.loads(raw)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Неверный курсор: {cursor!r}") from e
+    if not isinstance(version, int) or not isinstance(after, str):
+        raise ValueError(f"Неверный курсор: {cursor!r}")
+    return version, after
+
+
+def tree_page(persons, after="", limit=500):
+    """
+    Страница персон по возрастанию id после after.
+
+    Returns: (persons {id: JSON}, последний id страницы или None, если страниц больше нет).
+    """
+    ids = sorted(persons)
+    start = bisect.bisect_right(ids, after)
+    page = ids[start:start + limit]
+    more = start + limit < len(ids)
+    return {pid: persons[pid] for pid in page}, (page[-1] if more and page else None)
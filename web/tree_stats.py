@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Статистика дерева для /api/stats за один проход по персонам.
+
+tree_stats(persons, marriages_count) считает всё за O(N + E): число поколений
+— длина самой длинной цепочки предков (итеративный обход с мемоизацией глубины
+каждой персоны; общие предки при родственных браках считаются один раз, циклы
+в испорченных данных обрываются), счётчики по полу, статусу, фамилиям,
+десятилетиям рождения и местам, распределение продолжительности жизни.
+
+StatsCache хранит результат на версию файла дерева (mtime_ns, размер):
+повторный запрос без изменений дерева не загружает и не обходит его.
+"""
+
+import re
+import threading
+from collections import Counter, OrderedDict
+from datetime import date
+
+# Сколько значений отдавать в топах (фамилии, места рождения)
+TOP_SURNAMES = 10
+TOP_PLACES = 5
+# Ширина корзины распределения продолжительности жизни, лет
+LIFESPAN_BUCKET = 10
+
+_YEAR_RE = re.compile(r"(\d{4})\s*$")
+
+
+def _parse_date(value):
+    """'ДД.ММ.ГГГГ' → date или None."""
+    try:
+        day, month, year = value.split(".")
+        return date(int(year), int(month), int(day))
+    except (AttributeError, ValueError):
+        return None
+
+
+def _birth_year(value):
+    match = _YEAR_RE.search(value) if isinstance(value, str) else None
+    return int(match.group(1)) if match else None
+
+
+def generation_depths(persons):
+    """
+    {id: поколение} — 1 у персоны без известных родителей, иначе 1 + максимум по родителям.
+
+    Итеративный обход в глубину: каждая персона и каждое ребро обрабатываются
+    один раз. Ребро к персоне, которая ещё на стеке (цикл), даёт 0, как в
+    прежнем рекурсивном подсчёте.
+    """
+    depth = {}
+    on_stack = set()
+    for root in persons:
+        if root in depth:
+            continue
+        stack = [(root, iter(_parents(persons, root)))]
+        on_stack.add(root)
+        best = {root: 0}
+        while stack:
+            pid, parents = stack[-1]
+            for parent in parents:
+                if parent in depth:
+                    best[pid] = max(best[pid], depth[parent])
+                elif parent not in on_stack:
+                    stack.append((parent, iter(_parents(persons, parent))))
+                    on_stack.add(parent)
+                    best[parent] = 0
+                    break
+            else:
+                stack.pop()
+                on_stack.discard(pid)
+                depth[pid] = best.pop(pid) + 1
+                if stack:
+                    child = stack[-1][0]
+                    best[child] = max(best[child], depth[pid])
+    return depth
+
+
+def _parents(persons, pid):
+    person = persons.get(pid)
+    if not isinstance(person, dict):
+        return ()
+    return [str(x) for x in person.get("parents") or [] if str(x) in persons]
+
+
+def tree_stats(persons, marriages_count=0):
+    """Статистика дерева (формат ответа /api/stats)."""
+    persons = {str(pid): p for pid, p in persons.items() if isinstance(p, dict)}
+    genders = Counter()
+    surnames = Counter()
+    places = Counter()
+    decades = Counter()
+    lifespans = Counter()
+    deceased = 0
+    ages_total = ages_count = 0
+    for p in persons.values():
+        genders[p.get("gender") or ""] += 1
+        if p.get("surname"):
+            surnames[p["surname"]] += 1
+        if p.get("birth_place"):
+            places[p["birth_place"]] += 1
+        year = _birth_year(p.get("birth_date"))
+        if year is not None:
+            decades[year // 10 * 10] += 1
+        if not p.get("is_deceased"):
+            continue
+        deceased += 1
+        birth, death = _parse_date(p.get("birth_date")), _parse_date(p.get("death_date"))
+        if birth and death:
+            age = (death - birth).days // 365
+            if 0 < age < 120:
+                ages_total += age
+                ages_count += 1
+                bucket = age // LIFESPAN_BUCKET * LIFESPAN_BUCKET
+                lifespans[f"{bucket}-{bucket + LIFESPAN_BUCKET - 1}"] += 1
+
+    depths = generation_depths(persons)
+    return {
+        "total_persons": len(persons),
+        "male_count": genders["Мужской"],
+        "female_count": genders["Женский"],
+        "deceased_count": deceased,
+        "living_count": len(persons) - deceased,
+        "marriages_count": marriages_count,
+        "max_generations": max(depths.values(), default=0),
+        "average_age": round(ages_total / ages_count) if ages_count else None,
+        "top_birth_places": places.most_common(TOP_PLACES),
+        "top_surnames": surnames.most_common(TOP_SURNAMES),
+        "birth_decades": {str(d): n for d, n in sorted(decades.items())},
+        "lifespan_distribution": {k: lifespans[k] for k in sorted(lifespans, key=lambda k: int(k.split("-")[0]))},
+        "generation_sizes": {str(g): n for g, n in sorted(Counter(depths.values()).items())},
+    }
+
+
+class StatsCache:
+    """Статистика на версию файла дерева {путь: (штамп, статистика)}, не больше max_entries деревьев."""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, path, stamp):
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry[0] != stamp:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(path)
+            self.stats["hits"] += 1
+            return entry[1]
+
+    def put(self, path, stamp, stats):
+        with self._lock:
+            self._entries[path] = (stamp, stats)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_stats(self):
+        with self._lock:
+            snapshot = dict(self.stats)
+            snapshot["entries"] = len(self._entries)
+        return snapshot
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Индекс предков для проверок модели: цикл при добавлении родителя и кровное
+родство при добавлении брака.
+
+Каждой персоне (и id родителя, которого нет в дереве) назначается плотный
+номер бита; предки персоны — целое число с битами номеров всех её предков.
+Запросы «A — предок B?» и «есть ли у A и B общий предок?» — одна побитовая
+операция. Индекс поддерживается инкрементально: новая связь «ребёнок → родитель»
+добавляет биты ребёнку и его потомкам (обход останавливается там, где биты уже
+есть), удаление связи пересчитывает только потомков ребёнка.
+
+Связи берутся из person.parents (источник истины), потомки для распространения
+— из person.children; check() сверяет индекс с пересчётом с нуля и сообщает
+о несимметричных связях и циклах.
+"""
+
+
+class AncestorIndex:
+    """Предки каждой персоны битовой маской над плотными номерами id."""
+
+    def __init__(self):
+        self._bit = {}        # id → 1 << номер
+        self._ancestors = {}  # id → маска предков (без самой персоны)
+        # Значение LineageSet.epoch, на котором индекс совпадает со связями модели
+        self.epoch = None
+
+    @classmethod
+    def build(cls, persons, bits=None):
+        """
+        Индекс с нуля за O(N + E) (итеративный обход в глубину с мемоизацией).
+        bits — готовая нумерация {id: бит} (check() строит индекс с той же нумерацией, чтобы сравнивать маски).
+        """
+        index = cls()
+        if bits:
+            index._bit = dict(bits)
+        ancestors = index._ancestors
+        on_stack = set()
+        for root in persons:
+            if root in ancestors:
+                continue
+            index._bit_of(root)
+            stack = [(root, iter(_parents(persons, root)))]
+            on_stack.add(root)
+            acc = {root: 0}
+            while stack:
+                pid, parents = stack[-1]
+                for parent in parents:
+                    bit = index._bit_of(parent)
+                    if parent in ancestors:
+                        acc[pid] |= ancestors[parent] | bit
+                    elif parent in on_stack:
+                        # Цикл в данных: родитель на стеке — берём только его бит
+                        acc[pid] |= bit
+                    else:
+                        stack.append((parent, iter(_parents(persons, parent))))
+                        on_stack.add(parent)
+                        acc[parent] = 0
+                        break
+                else:
+                    stack.pop()
+                    on_stack.discard(pid)
+                    ancestors[pid] = acc.pop(pid)
+                    if stack:
+                        child = stack[-1][0]
+                        acc[child] |= ancestors[pid] | index._bit[pid]
+        return index
+
+    def _bit_of(self, pid):
+        bit = self._bit.get(pid)
+        if bit is None:
+            bit = self._bit[pid] = 1 << len(self._bit)
+        return bit
+
+    def is_ancestor(self, ancestor_id, person_id):
+        """ancestor_id — предок person_id (через любое число поколений)."""
+        bit = self._bit.get(ancestor_id)
+        return bool(bit and self._ancestors.get(person_id, 0) & bit)
+
+    def creates_cycle(self, parent_id, child_id):
+        """Связь «child_id → родитель parent_id» замкнёт цикл: это та же персона или child_id — её предок."""
+        return parent_id == child_id or self.is_ancestor(child_id, parent_id)
+
+    def share_ancestor(self, person1_id, person2_id):
+        """У двух персон есть общий предок."""
+        return bool(self._ancestors.get(person1_id, 0) & self._ancestors.get(person2_id, 0))
+
+    def add_person(self, pid):
+        """Новая персона без связей."""
+        self._bit_of(pid)
+        self._ancestors.setdefault(pid, 0)
+
+    def add_edge(self, persons, child_id, parent_id):
+        """Связь «child_id → родитель parent_id» уже добавлена в persons: дополнить потомков."""
+        new = self._ancestors.setdefault(parent_id, 0) | self._bit_of(parent_id)
+        self._bit_of(child_id)
+        stack = [child_id]
+        while stack:
+            pid = stack.pop()
+            current = self._ancestors.get(pid, 0)
+            if current | new == current:
+                continue
+            self._ancestors[pid] = current | new
+            person = persons.get(pid)
+            if person is not None:
+                stack.extend(person.children)
+
+    def recompute_descendants(self, persons, roots):
+        """
+        Пересчитать предков roots и всех их потомков (после удаления связей или персон).
+
+        Потомки обрабатываются в топологическом порядке: персона — после всех
+        своих родителей из пересчитываемого множества.
+        """
+        affected = set()
+        stack = [pid for pid in roots if pid in persons]
+        while stack:
+            pid = stack.pop()
+            if pid in affected:
+                continue
+            affected.add(pid)
+            stack.extend(c for c in persons[pid].children if c in persons)
+        pending = {pid: sum(1 for p in _parents(persons, pid) if p in affected) for pid in affected}
+        ready = [pid for pid, n in pending.items() if n == 0]
+        while ready:
+            pid = ready.pop()
+            mask = 0
+            for parent in _parents(persons, pid):
+                mask |= self._ancestors.get(parent, 0) | self._bit_of(parent)
+            self._ancestors[pid] = mask
+            for child in persons[pid].children:
+                if child in pending:
+                    pending[child] -= 1
+                    if pending[child] == 0:
+                        ready.append(child)
+        # Оставшиеся в pending — в цикле: пересчитать их честно может только build()
+        return [pid for pid, n in pending.items() if n > 0]
+
+    def remove_person(self, pid):
+        """Персона удалена из дерева (связи с ней уже убраны)."""
+        self._ancestors.pop(pid, None)
+
+    def check(self, persons):
+        """
+        Проверка согласованности: список описаний проблем (пустой — всё в порядке).
+
+        Сверяет маски с построенным с нуля индексом, ищет несимметричные связи
+        parents/children и циклы.
+        """
+        problems = []
+        for pid, person in persons.items():
+            for parent in person.parents:
+                if parent in persons and pid not in persons[parent].children:
+                    problems.append(f"{pid}: родитель {parent} не знает о ребёнке")
+            for child in person.children:
+                if child in persons and pid not in persons[child].parents:
+                    problems.append(f"{pid}: ребёнок {child} не знает о родителе")
+        fresh = AncestorIndex.build(persons, self._bit)
+        names = {bit: pid for pid, bit in fresh._bit.items()}
+        for pid in persons:
+            expected = fresh._ancestors.get(pid, 0)
+            if expected & fresh._bit[pid]:
+                problems.append(f"{pid}: цикл в связях родителей")
+            actual = self._ancestors.get(pid)
+            if actual != expected:
+                extra = _decode(names, (actual or 0) & ~expected)
+                missing = _decode(names, expected & ~(actual or 0))
+                problems.append(f"{pid}: предки в индексе расходятся с данными (лишние {extra}, нет {missing})")
+        return problems
+
+
+def _decode(names, mask):
+    """Маска → отсортированный список id."""
+    result = []
+    while mask:
+        low = mask & -mask
+        result.append(names[low])
+        mask ^= low
+    return sorted(result)
+
+
+def _parents(persons, pid):
+    person = persons.get(pid)
+    return person.parents if person is not None else ()
@@ -73,7 +73,7 @@ def fit_dialog_to_content(dialog, min_width=400, min_height=300, max_width=1200,
     y = parent_y + (parent_height - height) // 2
     
     dialog.geometry(f"{width}x{height}+{x}+{y}")
-from models import Person, FamilyTreeModel
+from models import Person, FamilyTreeModel, canonical_id, marriage_pair
 from ui_helpers import create_form_fields
 
 # Модуль родства
@@ -477,9 +477,8 @@ class FamilyTreeApp:
 
     def on_person_double_click(self, pid):
         """Двойной клик по персоне: выбор и открытие редактора."""
-        persons = self.model.get_all_persons()
-        key = next((k for k in persons if str(k) == str(pid)), pid)
-        if key not in persons:
+        key = self.model.resolve_id(pid)
+        if key is None:
             return
         self.last_selected_person_id = key
         self.model.current_center = key
@@ -785,6 +784,7 @@ class FamilyTreeApp:
 
         # Добавляем в модель
         self.model.persons[person_id] = new_person
+        self.model.mark_modified(person_id)
 
         # Устанавливаем как центр дерева
         self.model.current_center = person_id
@@ -1183,8 +1183,7 @@ class FamilyTreeApp:
 
         # Выбор персоны при правом клике: приводим id к ключу модели
         if clicked_pid is not None:
-            persons = self.model.get_all_persons()
-            key = next((k for k in persons if str(k) == str(clicked_pid)), None)
+            key = self.model.resolve_id(clicked_pid)
             if key is not None:
                 self.last_selected_person_id = key
                 self.model.current_center = key
@@ -1493,40 +1492,31 @@ class FamilyTreeApp:
 
             print(f"[SYNC] Login OK, token: {result.get('token', '')[:20]}...")
 
-            # === ОБНОВЛЯЕМ last_sync НА СЕРВЕРЕ (чтобы админ-панель видела онлайн) ===
-            print(f"[SYNC] Updating last_sync timestamp...")
+            # === ОБНОВЛЯЕМ АКТИВНОСТЬ НА СЕРВЕРЕ (чтобы админ-панель видела онлайн) ===
+            # Раньше для этого загружалось пустое дерево, но сервер теперь удаляет
+            # персоны, которых нет в загрузке, — используем heartbeat.
             try:
-                import urllib.request
-                import json
-                from sync_client import DEFAULT_SERVER_URL
-                
-                # Отправляем запрос на обновление last_sync
-                req = urllib.request.Request(
-                    f"{DEFAULT_SERVER_URL}/api/sync/upload",
-                    data=json.dumps({
-                        'tree': {'persons': {}, 'marriages': []},  # Пустое дерево, только для обновления last_sync
-                        'tree_name': f"Дерево {self.username}"
-                    }).encode('utf-8'),
-                    headers={'Content-Type': 'application/json', 'Authorization': f'Bearer {result.get("token")}'},
-                    method='POST'
-                )
-                with urllib.request.urlopen(req, timeout=10) as response:
-                    if response.status == 200:
-                        print(f"[SYNC] last_sync updated successfully via upload")
-                    else:
-                        print(f"[SYNC] last_sync update returned {response.status}")
+                client._request('/api/heartbeat', method='POST')
+                print(f"[SYNC] Heartbeat sent")
             except Exception as e:
-                print(f"[SYNC] last_sync update error: {e}")
-            # === /ОБНОВЛЯЕМ last_sync ===
+                print(f"[SYNC] Heartbeat error: {e}")
+            # === /ОБНОВЛЯЕМ АКТИВНОСТЬ ===
 
-            # Сначала пробуем загрузить дерево с сервера
-            print(f"[SYNC] Downloading tree from server...")
+            # Сначала пробуем загрузить дерево с сервера: только изменения
+            # после последней известной ревизии (или полный снимок, если её нет)
+            print(f"[SYNC] Fetching changes since revision {client.revision}...")
             try:
-                server_data = client.download_tree()
-
-                if server_data and 'tree' in server_data:
-                    tree_data = server_data.get('tree', {})
-                    persons = tree_data.get('persons', {})
+                server_data = client.get_changes()
+
+                if server_data and not server_data.get('full'):
+                    print(f"[SYNC] Delta: {len(server_data.get('persons', {}))} changed, "
+                          f"{len(server_data.get('deleted_persons', []))} deleted, "
+                          f"revision {server_data.get('revision')}")
+                    self._load_tree_from_server(server_data)
+                    self.root.update_idletasks()
+                    return  # Локальное дерево догнало сервер
+                elif server_data:
+                    persons = server_data.get('persons', {})
 
                     if persons:
                         print(f"[SYNC] Downloaded tree with {len(persons)} persons")
@@ -1564,65 +1554,138 @@ class FamilyTreeApp:
             traceback.print_exc()
     
     def _load_tree_from_server(self, server_data):
-        """Загрузить дерево из данных сервера"""
-        tree_data = server_data.get('tree', {})
+        """
+        Загрузить дерево из данных сервера.
+
+        server_data — ответ /api/sync/download ({'tree': {...}}) или
+        /api/sync/changes. Дельта (full=False) применяется к текущей модели
+        без её пересборки; полный снимок заменяет дерево целиком.
+        """
+        from sync_client import get_sync_client
+
+        if 'full' in server_data and not server_data.get('full'):
+            # Дельта: изменённые персоны и браки дописываются в журнал
+            pids, marriage_keys = self._apply_server_changes(server_data)
+            self.model.mark_modified(*pids, marriages=marriage_keys)
+        else:
+            self._replace_tree_from_server(server_data.get('tree', server_data))
+            # Дерево заменено целиком — сохраняется снимком
+            self.model.mark_modified()
+
+        # Сохраняем загруженное дерево в локальный файл
+        self.model.save_to_file()
+        print(f"[SYNC_LOAD] Дерево сохранено в {self.model.data_file}")
+
+        # Запоминаем ревизию: следующая синхронизация передаст только изменения
+        if server_data.get('revision') is not None:
+            client = get_sync_client()
+            tree_data = client.build_tree_data(self.model)
+            if 'full' in server_data:
+                client.remember_changes(tree_data, server_data)
+            else:
+                client.remember_tree(tree_data, server_data['revision'])
+
+        # Обновляем интерфейс
+        self.refresh_view()
+
+    @staticmethod
+    def _fill_person_from_server(p, pdata):
+        """Перенести поля персоны из JSON сервера в объект Person."""
+        p.name = pdata.get('name', '')
+        p.surname = pdata.get('surname', '')
+        p.patronymic = pdata.get('patronymic', '')
+        p.birth_date = pdata.get('birth_date', '')
+        p.gender = pdata.get('gender', '')
+        p.is_deceased = pdata.get('is_deceased', False)
+        p.death_date = pdata.get('death_date', '')
+        p.parents = set(pdata.get('parents', []))
+        p.children = set(pdata.get('children', []))
+        p.spouse_ids = set(pdata.get('spouse_ids', []))
+
+    @staticmethod
+    def _marriage_from_server(marriage_item):
+        """Брак из JSON сервера → ((h_id, w_id), date) или None."""
+        # Сервер возвращает в формате: [["1", "4"], ["2", "3"], ...] (список списков)
+        # Либо в формате: [{"persons": ["1", "4"], "date": ""}, ...] (список словарей)
+        if isinstance(marriage_item, dict):
+            # Формат словаря: {'persons': [h_id, w_id], 'date': '...'}
+            persons_in_marriage = marriage_item.get('persons', [])
+            marriage_date = marriage_item.get('date', '')
+        elif isinstance(marriage_item, (list, tuple)):
+            # Формат списка: [h_id, w_id] или (h_id, w_id)
+            persons_in_marriage = marriage_item
+            marriage_date = ''
+        else:
+            return None
+        if len(persons_in_marriage) != 2:
+            return None
+        return marriage_pair(persons_in_marriage[0], persons_in_marriage[1]), marriage_date
+
+    def _replace_tree_from_server(self, tree_data):
+        """Заменить дерево модели полным снимком с сервера."""
+        from models import Person
+
         persons = tree_data.get('persons', {})
-        marriages_data = tree_data.get('marriages', [])  # ����ервер возвращает список
+        marriages_data = tree_data.get('marriages', [])  # Сервер возвращает список
 
-        # Очища��м текущее дерево
+        # Очищаем текущее дерево
         self.model.persons.clear()
         self.model.marriages.clear()
 
         # Добавляем персоны из сервера
         for pid, pdata in persons.items():
-            from models import Person
-            p = Person(
-                name=pdata.get('name', ''),
-                surname=pdata.get('surname', ''),
-                patronymic=pdata.get('patronymic', ''),
-                birth_date=pdata.get('birth_date', ''),
-                gender=pdata.get('gender', ''),
-                is_deceased=pdata.get('is_deceased', False),
-                death_date=pdata.get('death_date', ''),
-            )
+            p = Person(name=pdata.get('name', ''), surname=pdata.get('surname', ''))
+            self._fill_person_from_server(p, pdata)
             p.id = pid
-            p.parents = set(pdata.get('parents', []))
-            p.children = set(pdata.get('children', []))
-            p.spouse_ids = set(pdata.get('spouse_ids', []))
             self.model.persons[pid] = p
 
         # === ЗАГРУЖАЕМ БРАКИ ИЗ СЕРВЕРА ===
-        # Сервер возвращает в формате: [["1", "4"], ["2", "3"], ...] (список списков)
-        # Либо в формате: [{"persons": ["1", "4"], "date": ""}, ...] (список словарей)
         marriages_loaded = 0
         if marriages_data and isinstance(marriages_data, list):
             for marriage_item in marriages_data:
-                if isinstance(marriage_item, dict):
-                    # Формат словаря: {'persons': [h_id, w_id], 'date': '...'}
-                    persons_in_marriage = marriage_item.get('persons', [])
-                    marriage_date = marriage_item.get('date', '')
-                elif isinstance(marriage_item, (list, tuple)):
-                    # Формат списка: [h_id, w_id] или (h_id, w_id)
-                    persons_in_marriage = marriage_item
-                    marriage_date = ''
-                else:
-                    continue
-
-                if len(persons_in_marriage) == 2:
-                    h_id, w_id = str(persons_in_marriage[0]), str(persons_in_marriage[1])
-                    self.model.marriages[(h_id, w_id)] = {'date': marriage_date}
+                marriage = self._marriage_from_server(marriage_item)
+                if marriage:
+                    key, marriage_date = marriage
+                    self.model.marriages[key] = {'date': marriage_date}
                     marriages_loaded += 1
             print(f"[SYNC_LOAD] Загружено {marriages_loaded} браков из сервера")
         else:
             print(f"[SYNC_LOAD] Браки не найдены в серверных данных (format: {type(marriages_data)})")
         # === /ЗАГРУЖАЕМ БРАКИ ===
 
-        # Сохраняем загруженное дерево в локальный файл
-        self.model.save_to_file()
-        print(f"[SYNC_LOAD] Дерево сохранено в {self.model.data_file}")
-
-        # Обновляем интерфейс
-        self.refresh_view()
+    def _apply_server_changes(self, changes):
+        """Применить дельту /api/sync/changes к текущей модели. Returns: (id персон, ключи браков) изменённых."""
+        from models import Person
+
+        pids, marriage_keys = [], []
+        for pid in changes.get('deleted_persons', []):
+            self.model.persons.pop(canonical_id(pid), None)
+            pids.append(pid)
+
+        for pid, pdata in changes.get('persons', {}).items():
+            p = self.model.get_person(pid)
+            if p is None:
+                p = Person(name=pdata.get('name', ''), surname=pdata.get('surname', ''))
+                self.model.persons[pid] = p
+            self._fill_person_from_server(p, pdata)
+            pids.append(pid)
+
+        for marriage_item in changes.get('deleted_marriages', []):
+            marriage = self._marriage_from_server(marriage_item)
+            if marriage:
+                self.model.marriages.pop(marriage[0], None)
+                marriage_keys.append(marriage[0])
+
+        for marriage_item in changes.get('marriages', []):
+            marriage = self._marriage_from_server(marriage_item)
+            if marriage:
+                key, marriage_date = marriage
+                self.model.marriages[key] = {'date': marriage_date}
+                marriage_keys.append(key)
+
+        print(f"[SYNC_LOAD] Применены изменения до ревизии {changes.get('revision')}: "
+              f"{len(changes.get('persons', {}))} персон, {len(changes.get('deleted_persons', []))} удалено")
+        return pids, marriage_keys
 
     def _view_person_by_id(self, person_id):
         """Просмотр персоны по ID."""
@@ -1710,6 +1773,10 @@ class FamilyTreeApp:
             elif result:  # Нажата Да
                 self.save_file()
 
+        # Дожидаемся фоновой свёртки журнала изменений в снимок
+        if self.model:
+            self.model.wait_for_compaction()
+
         # Очистка кэша изображений
         self.photo_images.clear()
 
@@ -1833,9 +1900,8 @@ class FamilyTreeApp:
                 break
 
         if clicked_pid:
-            persons = self.model.get_all_persons()
-            key = next((k for k in persons if str(k) == str(clicked_pid)), clicked_pid)
-            self.on_person_click(key)
+            key = self.model.resolve_id(clicked_pid)
+            self.on_person_click(key if key is not None else clicked_pid)
 
     def draw_person_card(self, pid, person, x, y):
         """
@@ -2311,10 +2377,8 @@ class FamilyTreeApp:
 
         # === ОТРИСОВКА СВЯЗЕЙ РОДИТЕЛИ → ДЕТИ (середина линии родителей → общая линия детей → верх карточки ребёнка, скругления) ===
         def _key_in_vis(pid):
-            if pid is None:
-                return None
-            s = str(pid)
-            return next((k for k in self.visible_persons_in_coords if str(k) == s), None)
+            key = canonical_id(pid)
+            return key if key in self.visible_persons_in_coords else None
 
         parent_set_to_children = {}
         for pid, (sx, sy) in self.visible_persons_in_coords.items():
@@ -2512,14 +2576,8 @@ class FamilyTreeApp:
         if constants.DEBUG_LAYOUT:
             print(f"[DEBUG] Персон с супругами: {persons_with_spouse}")
 
-        # === ШАГ 1: ОПРЕДЕЛЕНИЕ ЦЕНТРА (поиск по нормализованному id из‑за возможного int/str) ===
-        center_pid = self.model.current_center
-        if center_pid is not None:
-            center_key = next((k for k in persons if str(k) == str(center_pid)), None)
-            if center_key is not None:
-                center_pid = center_key
-            else:
-                center_pid = None
+        # === ШАГ 1: ОПРЕДЕЛЕНИЕ ЦЕНТРА (id в модели канонические — поиск по словарю) ===
+        center_pid = self.model.resolve_id(self.model.current_center)
         center_person_exists = center_pid is not None
 
         if not center_person_exists:
@@ -2545,10 +2603,8 @@ class FamilyTreeApp:
         visited = set()
 
         def _key_in_persons(pid):
-            if pid is None:
-                return None
-            pid_str = str(pid)
-            return next((k for k in persons if str(k) == pid_str), None)
+            key = canonical_id(pid)
+            return key if key in persons else None
 
         # ИТЕРАТИВНЫЙ BFS (вместо рекурсии — для больших деревьев)
         queue = collections.deque([center_pid])
@@ -2592,11 +2648,7 @@ class FamilyTreeApp:
         # === ИСПРАВЛЕНИЕ: добавляем всех супругов из marriages в related_pids ===
         # Это гарантирует, что супруги будут отрисованы даже если не были найдены через BFS
         for marriage_key in marriages.keys():
-            h_id, w_id = marriage_key
-            h_str, w_str = str(h_id), str(w_id)
-            # Ищем совпадения в persons
-            h_key = next((k for k in persons if str(k) == h_str), None)
-            w_key = next((k for k in persons if str(k) == w_str), None)
+            h_key, w_key = (_key_in_persons(pid) for pid in marriage_key)
             if h_key and h_key in related_pids and w_key and w_key not in related_pids:
                 related_pids.add(w_key)
                 print(f"[MARRIAGE_FIX] Добавлен супруг {w_key} в related_pids (из marriages)")
@@ -2609,9 +2661,8 @@ class FamilyTreeApp:
 
         # Сохраняем позицию центральной персоны: при перерисовке ветви останутся вокруг неё на месте
         old_center_coord = None
-        center_key_for_pin = next((k for k in self.coords if str(k) == str(center_pid)), None)
-        if center_key_for_pin is not None:
-            old_center_coord = self.coords[center_key_for_pin]
+        if center_pid in self.coords:
+            old_center_coord = self.coords[center_pid]
 
         # === ШАГ 5: ПОВТОРНАЯ ЛОГИКА РАЗМЕЩЕНИЯ (ОТНОСИТЕЛЬНО СВЯЗАННЫХ ПЕРСОН) ===
         canvas_width = max(self.canvas.winfo_width(), 800)
@@ -2623,23 +2674,16 @@ class FamilyTreeApp:
         self.coords = {}
         self.level_structure = {}
 
-        def _norm_id(pid):
-            """Нормализация id для сравнения (str)."""
-            return str(pid) if pid is not None else None
-
         def _key_in_filtered(pid):
             """Возвращает ключ из filtered_persons, совпадающий с pid (любой тип). Иначе None."""
-            if pid is None:
-                return None
-            s = _norm_id(pid)
-            return next((k for k in filtered_persons if _norm_id(k) == s), None)
+            key = canonical_id(pid)
+            return key if key in filtered_persons else None
 
         def _display_spouse_ids(person):
             """Список супругов персоны, отображаемых на этом уровне (не свёрнутых)."""
             result = []
             for sid in (person.spouse_ids or []):
-                sid_str = _norm_id(sid)
-                key = next((k for k in filtered_persons if _norm_id(k) == sid_str), None)
+                key = _key_in_filtered(sid)
                 if key and not getattr(filtered_persons.get(key), 'collapsed_branches', False):
                     result.append(key)
             return result
@@ -2653,9 +2697,7 @@ class FamilyTreeApp:
             p2 = filtered_persons.get(cid2)
             if not p1 or not p2:
                 return self.CARD_WIDTH * SIBLING_SPACING_COUSINS
-            set1 = frozenset(str(x) for x in (p1.parents or []))
-            set2 = frozenset(str(x) for x in (p2.parents or []))
-            if set1 == set2:
+            if p1.parents == p2.parents:
                 return self.CARD_WIDTH * SIBLING_SPACING_FULL
             return self.CARD_WIDTH * SIBLING_SPACING_COUSINS
 
@@ -2668,11 +2710,18 @@ class FamilyTreeApp:
                 return self.CARD_WIDTH + gap + len(display_spouses) * step
             return self.CARD_WIDTH
 
+        subtree_widths = {}
+
         def get_subtree_width(pid):
-            """Возвращает ширину, необходимую для поддерева (персона + все потомки)."""
+            """Возвращает ширину, необходимую для поддерева (персона + все потомки); за раскладку считается один раз."""
             key = _key_in_filtered(pid)
             if key is None:
                 return self.CARD_WIDTH
+            if key not in subtree_widths:
+                subtree_widths[key] = _subtree_width(key)
+            return subtree_widths[key]
+
+        def _subtree_width(key):
             person = filtered_persons[key]
             block_width = _block_width_only(person)
 
@@ -2767,16 +2816,7 @@ class FamilyTreeApp:
                         pk = _key_in_filtered(p_id)
                         if pk is not None and pk in filtered_persons:
                             parent_keys_of_children.add(pk)
-                seen_norm = set()
-                parent_xs = []
-                for pk in parent_keys_of_children:
-                    n = _norm_id(pk)
-                    if n in seen_norm:
-                        continue
-                    coord_key = next((k for k in self.coords if _norm_id(k) == n), None)
-                    if coord_key is not None:
-                        seen_norm.add(n)
-                        parent_xs.append(self.coords[coord_key][0])
+                parent_xs = [self.coords[pk][0] for pk in parent_keys_of_children if pk in self.coords]
                 parent_center_x = (sum(parent_xs) / len(parent_xs)) if parent_xs else (block_x + block_width / 2)
 
                 child_widths = []
@@ -2855,8 +2895,7 @@ class FamilyTreeApp:
         while True:
             added = 0
             for h_id, w_id in marriages:
-                h_key = next((k for k in filtered_persons if _norm_id(k) == _norm_id(h_id)), None)
-                w_key = next((k for k in filtered_persons if _norm_id(k) == _norm_id(w_id)), None)
+                h_key, w_key = _key_in_filtered(h_id), _key_in_filtered(w_id)
                 if not h_key or not w_key:
                     continue
                 if place_next_to_spouse(h_key, w_key):
@@ -2870,7 +2909,7 @@ class FamilyTreeApp:
                 if not person or not person.spouse_ids:
                     continue
                 for spouse_id in person.spouse_ids:
-                    partner_key = next((k for k in filtered_persons if _norm_id(k) == _norm_id(spouse_id)), None)
+                    partner_key = _key_in_filtered(spouse_id)
                     if place_next_to_spouse(pid, partner_key):
                         added += 1
                         break
@@ -2892,9 +2931,8 @@ class FamilyTreeApp:
 
         # === ШАГ 8.5: ПРИВЯЗКА ЦЕНТРА — персона остаётся на месте, ветви перерисовываются вокруг неё ===
         if old_center_coord is not None:
-            pin_key = next((k for k in self.coords if str(k) == str(center_pid)), None)
-            if pin_key is not None:
-                new_x, new_y = self.coords[pin_key]
+            if center_pid in self.coords:
+                new_x, new_y = self.coords[center_pid]
                 dx = old_center_coord[0] - new_x
                 dy = old_center_coord[1] - new_y
                 for pid in list(self.coords.keys()):
@@ -3022,15 +3060,19 @@ class FamilyTreeApp:
 
     def collapse_all_branches(self):
         """Сворачивает ветви ВСЕХ персон (кроме центра)."""
-        for person in self.model.get_all_persons().values():
-            person.collapsed_branches = True
+        changed = [pid for pid, person in self.model.get_all_persons().items() if not person.collapsed_branches]
+        for pid in changed:
+            self.model.persons[pid].collapsed_branches = True
+        self.model.mark_modified(*changed)
 
         self.refresh_view()
 
     def expand_all_branches(self):
         """Разворачивает ветви ВСЕХ персон."""
-        for person in self.model.get_all_persons().values():
-            person.collapsed_branches = False
+        changed = [pid for pid, person in self.model.get_all_persons().items() if person.collapsed_branches]
+        for pid in changed:
+            self.model.persons[pid].collapsed_branches = False
+        self.model.mark_modified(*changed)
 
         self.refresh_view()
 
@@ -4130,7 +4172,7 @@ class FamilyTreeApp:
             for (p1_id, p2_id), date_var in marriage_date_vars.items():
                 self.model.set_marriage_date(p1_id, p2_id, date_var.get().strip())
 
-            self.model.mark_modified()
+            self.model.mark_modified(person.id)
             dialog.destroy()
             self.refresh_view()
             messagebox.showinfo("Успех", f"Данные персоны «{person.display_name()}» сохранены.")
@@ -4150,7 +4192,7 @@ class FamilyTreeApp:
         if messagebox.askyesno("Удалить фото", "Вы уверены, что хотите удалить фото эт��й персоны?"):
             person.photo_path = ""
             person.photo = None
-            self.model.mark_modified()
+            self.model.mark_modified(person.id)
 
             # Обновляем интерфейс
             if preview_label:
@@ -4218,7 +4260,7 @@ class FamilyTreeApp:
                 if str(other_id) != str(parent_id):
                     self.model.add_marriage(parent_id, other_id)
                     break
-        self.model.mark_modified()
+        self.model.mark_modified(child_id, parent_id)
         edit_dialog.destroy()
         self.refresh_view()
         messagebox.showinfo("Успех", "Родитель добавлен.")
@@ -4300,7 +4342,7 @@ class FamilyTreeApp:
         person.chronic_conditions = form_data.get("chronic_conditions", "").strip()
 
         # Устанавливаем флаг изменений
-        self.mark_modified()
+        self.model.mark_modified(person.id)
 
         return True, constants.MSG_SUCCESS_PERSON_EDITED
 
@@ -4393,9 +4435,7 @@ class FamilyTreeApp:
             messagebox.showinfo("Успех", f"{parent_type.capitalize()} успешно добавлен(а)!")
             dialog.destroy()
             # Центр оставляем на ребёнке (для кого добавляли родителя), чтобы персона не пропадала с холста
-            persons = self.model.get_all_persons()
-            center_key = next((k for k in persons if str(k) == str(child_id)), None)
-            self.model.current_center = center_key if center_key is not None else child_id
+            self.model.current_center = child_id
             self.refresh_view()
 
         # Кнопки — фиксируем внизу окна (вне прокручиваемой области)
@@ -4672,8 +4712,8 @@ class FamilyTreeApp:
                             other_parent_obj.children.add(sibling_id)
                             sibling_obj.parents.add(other_pid)
 
-            # Помечаем модель как изменённую
-            self.model.mark_modified()
+            # Помечаем модель как изменённую (новая персона и её родители — в журнал изменений)
+            self.model.mark_modified(sibling_id, *person.parents)
 
             # === Сообщение об успехе ===
             messagebox.showinfo("Успех", f"{sibling_type.capitalize()} успешно добавлен(а)!")
@@ -4844,8 +4884,8 @@ class FamilyTreeApp:
                             other_parent_obj.children.add(sibling_id)
                             sibling_obj.parents.add(other_pid)
 
-            # Помечаем модель как изменённую
-            self.model.mark_modified()
+            # Помечаем модель как изменённую (новая персона и её родители — в журнал изменений)
+            self.model.mark_modified(sibling_id, *person.parents)
 
             # === Сообщение об успехе ===
             messagebox.showinfo("Успех", f"{sibling_type.capitalize()} успешно добавлен(а)!")
@@ -5307,7 +5347,7 @@ class FamilyTreeApp:
 
             imported_count = len(new_persons)
             self.model.persons.update(new_persons)
-            self.model.mark_modified()
+            self.model.mark_modified(*new_persons)
 
             # Восстанавливаем связи в модели (брак и spouse_ids)
             for pid, person in new_persons.items():
@@ -5315,6 +5355,7 @@ class FamilyTreeApp:
                 for spouse_id in person.spouse_ids:
                     if spouse_id in self.model.persons:
                         self.model.persons[spouse_id].spouse_ids.add(pid)
+                        self.model.mark_modified(spouse_id)
                 # Добавляем браки в модель
                 for spouse_id in person.spouse_ids:
                     if spouse_id in self.model.persons:
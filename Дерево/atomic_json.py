@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Надёжная запись JSON-файлов деревьев.
+
+Общий модуль web и desktop: Дерево/atomic_json.py — копия этого файла
+(у web и desktop свои корни сборки), содержимое совпадает.
+
+write_json(path, data) пишет во временный файл рядом с целевым, делает
+fsync и подменяет целевой файл os.replace — при сбое посреди записи на диске
+остаётся прежняя версия целиком. Запись идёт под блокировкой файла
+(<путь>.lock: fcntl.flock / msvcrt.locking, плюс блокировка потоков процесса),
+поэтому записи воркеров gunicorn не перемешиваются. По умолчанию JSON
+компактный (без отступов); pretty=True — для явного экспорта.
+"""
+
+import contextlib
+import json
+import os
+import stat
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Права нового файла — как у open(): 0o666 с учётом umask процесса
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+
+def dumps(data, pretty=False):
+    """JSON в байтах UTF-8: компактный или с отступами (pretty=True)."""
+    if pretty:
+        text = json.dumps(data, ensure_ascii=False, indent=2)
+    else:
+        text = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return text.encode("utf-8")
+
+
+def _thread_lock(path):
+    with _thread_locks_guard:
+        lock = _thread_locks.get(path)
+        if lock is None:
+            lock = _thread_locks[path] = threading.Lock()
+        return lock
+
+
+@contextlib.contextmanager
+def file_lock(path, timeout=30):
+    """Эксклюзивная блокировка файла между потоками и процессами (через <путь>.lock)."""
+    path = os.path.abspath(path)
+    lock = _thread_lock(path)
+    if not lock.acquire(timeout=timeout):
+        raise TimeoutError(f"Файл {path} занят дольше {timeout} с")
+    try:
+        fd = os.open(path + ".lock", os.O_RDWR | os.O_CREAT, 0o666 & ~_UMASK)
+        try:
+            deadline = time.monotonic() + timeout
+            while True:
+                try:
+                    if fcntl is not None:
+                        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    else:
+                        msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    if time.monotonic() >= deadline:
+                        raise TimeoutError(f"Файл {path} занят дольше {timeout} с")
+                    time.sleep(0.01)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                else:
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(fd)
+    finally:
+        lock.release()
+
+
+def _fsync_dir(directory):
+    """fsync каталога: переименование переживает сбой питания (на Windows не поддерживается)."""
+    if os.name == "nt":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_bytes(path, payload, fsync=True, lock=True):
+    """Атомарно заменить содержимое файла. Returns: число записанных байт."""
+    path = os.path.abspath(path)
+    directory = os.path.dirname(path)
+    with file_lock(path) if lock else contextlib.nullcontext():
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+                f.flush()
+                if fsync:
+                    os.fsync(f.fileno())
+            try:
+                os.chmod(tmp, stat.S_IMODE(os.stat(path).st_mode))
+            except FileNotFoundError:
+                os.chmod(tmp, 0o666 & ~_UMASK)
+            os.replace(tmp, path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(tmp)
+            raise
+        if fsync:
+            _fsync_dir(directory)
+    return len(payload)
+
+
+def write_json(path, data, pretty=False, fsync=True):
+    """Записать data в path атомарно и под блокировкой. Returns: размер файла в байтах."""
+    return write_bytes(path, dumps(data, pretty), fsync=fsync)
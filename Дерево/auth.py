@@ -87,6 +87,7 @@ def auth_check(login: str, password: str) -> bool:
     # Пробуем проверить на сервере синхронизации
     try:
         import urllib.request
+        import http_client
         sync_url = "https://ravishing-caring-production-3656.up.railway.app"
         req = urllib.request.Request(
             f"{sync_url}/api/auth/login",
@@ -94,7 +95,7 @@ def auth_check(login: str, password: str) -> bool:
             headers={'Content-Type': 'application/json'},
             method='POST'
         )
-        with urllib.request.urlopen(req, timeout=10) as response:
+        with http_client.urlopen(req, timeout=10) as response:
             data = json.loads(response.read().decode())
             if data.get('token'):
                 return True  # Успешный вход на сервере
@@ -180,6 +181,7 @@ def auth_register(login: str, password: str) -> Optional[str]:
     # Пробуем зарегистрировать на сервере синхронизации
     try:
         import urllib.request
+        import http_client
         sync_url = "https://ravishing-caring-production-3656.up.railway.app"
         req = urllib.request.Request(
             f"{sync_url}/api/auth/register",
@@ -191,7 +193,7 @@ def auth_register(login: str, password: str) -> Optional[str]:
             headers={'Content-Type': 'application/json'},
             method='POST'
         )
-        with urllib.request.urlopen(req, timeout=5) as response:
+        with http_client.urlopen(req, timeout=5) as response:
             data = json.loads(response.read().decode())
             if data.get('success') or data.get('token'):
                 return None  # Успешно зарегистрирован на сервере
@@ -19,6 +19,9 @@ import logging
 from datetime import datetime
 from pathlib import Path
 
+from atomic_json import write_json
+from change_journal import consolidated_tree, discard_journal
+
 logger = logging.getLogger(__name__)
 
 # Настройки
@@ -73,7 +76,12 @@ class BackupManager:
             backup_filename = f"{backup_name_prefix}_{timestamp}{file_path.suffix}"
             backup_path = self.backup_dir / backup_filename
 
-            shutil.copy2(file_path, backup_path)
+            # Правки, ещё не свёрнутые из журнала изменений, попадают в копию
+            data = consolidated_tree(file_path)
+            if data is not None:
+                write_json(backup_path, data)
+            else:
+                shutil.copy2(file_path, backup_path)
             logger.info(f"Бэкап создан: {backup_path}")
 
             # Удаляем старые бэкапы
@@ -139,6 +147,7 @@ class BackupManager:
 
         try:
             shutil.copy2(backup_file, target_file)
+            discard_journal(target_file)
             logger.info(f"Восстановлено из бэкапа: {backup_file}")
             return True
         except Exception as e:
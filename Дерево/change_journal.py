@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+Журнал изменений настольного дерева (write-ahead): <файл дерева>.journal.
+
+Сохранение после правки нескольких персон не переписывает весь файл с фото:
+в журнал дописывается пакет компактных записей — по одной на изменённую
+персону, брак или центр — и строка commit. При загрузке пакеты применяются
+к снимку (replay). Когда журнал разрастается, модель сворачивает его в новый
+снимок в фоновом потоке (rotate → запись снимка → finish_rotation).
+
+Формат: строка «<crc32 в hex> <JSON>\\n»; первая строка — заголовок с
+поколением снимка, к которому относится журнал. Пакет без commit, строка с
+неверной контрольной суммой или без перевода строки (сбой посреди дописывания)
+и всё после неё отбрасываются, файл обрезается до последнего commit.
+
+Поколения: снимок хранит journal_generation. Журнал применяется, только если
+его поколение совпадает со снимком; во время свёртки прежний журнал лежит в
+<файл>.journal.old (поколение g), новые пакеты — в <файл>.journal (g + 1),
+а снимок g + 1 пишется в фоне. Сбой на любом шаге оставляет согласованную цепочку.
+"""
+
+import json
+import logging
+import os
+import threading
+import zlib
+
+from atomic_json import dumps
+
+logger = logging.getLogger(__name__)
+
+GENERATION_KEY = "journal_generation"
+# Свёртка, когда журнал больше COMPACT_MIN_BYTES и больше этой доли снимка
+COMPACT_MIN_BYTES = 4 * 1024 * 1024
+COMPACT_SNAPSHOT_FRACTION = 0.25
+
+
+def _line(record):
+    payload = dumps(record)
+    return b"%08x %s\n" % (zlib.crc32(payload), payload)
+
+
+def _parse(raw):
+    """(заголовок или None, список пакетов, длина корректной части в байтах)."""
+    header, batches, batch = None, [], []
+    good = pos = 0
+    while pos < len(raw):
+        end = raw.find(b"\n", pos)
+        if end < 0:
+            break
+        crc, _, payload = raw[pos:end].partition(b" ")
+        try:
+            if int(crc, 16) != zlib.crc32(payload):
+                break
+            record = json.loads(payload)
+        except ValueError:
+            break
+        pos = end + 1
+        if header is None:
+            if record.get("op") != "journal":
+                break
+            header, good = record, pos
+        elif record.get("op") == "commit":
+            batches.append(batch)
+            batch, good = [], pos
+        else:
+            batch.append(record)
+    return header, batches, good
+
+
+def apply_batches(data, batches):
+    """Применить пакеты к документу дерева (формат файла): персоны, браки, центр."""
+    persons = data.setdefault("persons", {})
+    marriages = None
+    for batch in batches:
+        for record in batch:
+            op = record.get("op")
+            if op == "put":
+                persons[str(record["id"])] = record["person"]
+            elif op == "del":
+                persons.pop(str(record["id"]), None)
+            elif op in ("marry", "unmarry"):
+                if marriages is None:
+                    marriages = _marriages_by_pair(data.get("marriages") or [])
+                pair = tuple(sorted(str(x) for x in record["persons"]))
+                if op == "marry":
+                    marriages[pair] = record.get("date", "")
+                else:
+                    marriages.pop(pair, None)
+            elif op == "center":
+                data["current_center"] = record.get("id")
+    if marriages is not None:
+        data["marriages"] = [{"persons": list(pair), "date": date} for pair, date in marriages.items()]
+    return data
+
+
+def _marriages_by_pair(items):
+    result = {}
+    for item in items:
+        if isinstance(item, dict):
+            pair, date = item.get("persons") or [], item.get("date", "")
+        else:
+            pair, date = item, ""
+        if isinstance(pair, (list, tuple)) and len(pair) >= 2:
+            result[tuple(sorted((str(pair[0]), str(pair[1]))))] = date
+    return result
+
+
+class ChangeJournal:
+    """Журнал рядом с файлом дерева: чтение цепочки, дописывание пакетов, ротация при свёртке."""
+
+    def __init__(self, tree_path):
+        self.tree_path = os.path.abspath(tree_path)
+        self.path = self.tree_path + ".journal"
+        self.old_path = self.path + ".old"
+        self.generation = 0
+        self._committed = 0  # длина корректной части текущего журнала
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        return self._committed
+
+    @property
+    def rotating(self):
+        """Есть прежний журнал, ещё не свёрнутый в снимок."""
+        return os.path.exists(self.old_path)
+
+    def _read(self, path, truncate):
+        """(поколение или None, пакеты, длина корректной части); truncate — обрезать хвост после сбоя."""
+        try:
+            with open(path, "rb") as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return None, [], 0
+        header, batches, good = _parse(raw)
+        if header is None:
+            return None, [], 0
+        if truncate and good < len(raw):
+            logger.warning(f"[JOURNAL] {path}: отброшено {len(raw) - good} байт незавершённой записи")
+            with open(path, "r+b") as f:
+                f.truncate(good)
+                f.flush()
+                os.fsync(f.fileno())
+        return header.get("generation"), batches, good
+
+    def replay(self, data):
+        """
+        Применить к документу снимка журналы его поколения.
+
+        Returns: (число применённых пакетов, применён ли прежний журнал .old).
+        Журналы другого поколения (снимок уже новее или подменён) удаляются.
+        """
+        base = data.get(GENERATION_KEY, 0) if isinstance(data, dict) else 0
+        with self._lock:
+            old_gen, old_batches, _ = self._read(self.old_path, truncate=True)
+            gen, batches, good = self._read(self.path, truncate=True)
+            chain, used_old = [], False
+            if old_gen is not None and old_gen == base:
+                chain.extend(old_batches)
+                used_old = True
+                base += 1
+            else:
+                self._unlink(self.old_path)
+            if gen == base:
+                chain.extend(batches)
+                self._committed = good
+            else:
+                if gen is not None:
+                    logger.warning(f"[JOURNAL] {self.path}: поколение {gen} не совпадает со снимком, журнал отброшен")
+                self._unlink(self.path)
+                self._committed = 0
+            self.generation = base
+        apply_batches(data, chain)
+        return len(chain), used_old
+
+    def append(self, records):
+        """Дописать пакет записей со строкой commit и fsync. Returns: число записанных байт."""
+        payload = b"".join(_line(r) for r in records) + _line({"op": "commit"})
+        with self._lock:
+            if self._committed == 0:
+                payload = _line({"op": "journal", "generation": self.generation}) + payload
+            mode = "r+b" if os.path.exists(self.path) else "wb"
+            with open(self.path, mode) as f:
+                # Обрезаем хвост неудачной прежней попытки, чтобы не дописывать после мусора
+                f.seek(self._committed)
+                f.truncate()
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            self._committed += len(payload)
+        return len(payload)
+
+    def reset(self, generation):
+        """Снимок поколения generation записан целиком: журналы больше не нужны."""
+        with self._lock:
+            self._unlink(self.old_path)
+            self._unlink(self.path)
+            self.generation = generation
+            self._committed = 0
+
+    def rotate(self):
+        """Начать свёртку: текущий журнал → .old, новые пакеты — в поколение +1. Returns: новое поколение."""
+        with self._lock:
+            if not self._committed:
+                with open(self.path, "wb") as f:
+                    f.write(_line({"op": "journal", "generation": self.generation}))
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(self.path, self.old_path)
+            self.generation += 1
+            self._committed = 0
+            return self.generation
+
+    def finish_rotation(self):
+        """Снимок нового поколения записан: прежний журнал больше не нужен."""
+        with self._lock:
+            self._unlink(self.old_path)
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+def consolidated_tree(tree_path):
+    """
+    Документ дерева с применённым журналом (None — журнала нет).
+    Для копий файла (резервные копии), которым снимок без журнала не подходит.
+    """
+    journal = ChangeJournal(tree_path)
+    if not os.path.exists(journal.path) and not journal.rotating:
+        return None
+    with open(tree_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    applied, _ = journal.replay(data)
+    if not applied:
+        return None
+    data.pop(GENERATION_KEY, None)
+    return data
+
+
+def discard_journal(tree_path):
+    """Файл дерева подменён целиком (восстановление из копии): журнал к нему не относится."""
+    ChangeJournal(tree_path).reset(0)
@@ -1,10 +1,16 @@
 # -*- coding: utf-8 -*-
 """Модели данных: Person и FamilyTreeModel."""
 
-import json
 import os
 import logging
+import sys
+import threading
+from collections.abc import MutableSet
 
+from ancestor_index import AncestorIndex
+from atomic_json import write_json
+from change_journal import COMPACT_MIN_BYTES, COMPACT_SNAPSHOT_FRACTION, GENERATION_KEY, ChangeJournal
+from tree_reader import LAZY_FIELDS, LazyField, read_tree
 from constants import (
     GENDER_MALE,
     GENDER_FEMALE,
@@ -22,8 +28,224 @@ from constants import (
 )
 
 
+# Кортеж связей до такой длины; больше — обычное множество (O(1) поиск у «многодетных»)
+RELATION_TUPLE_MAX = 8
+
+
+# Запись слота в обход Person.__setattr__ (без отметки об изменении)
+_set_attr = object.__setattr__
+
+
+def _intern(value):
+    """Одинаковые короткие строки (пол, фамилии, места, id) — один объект на всё дерево."""
+    return sys.intern(value) if type(value) is str else value
+
+
+def canonical_id(pid):
+    """
+    Канонический id персоны: интернированная строка без пробелов по краям.
+
+    42, "42" и " 42" дают один и тот же объект "42"; None и пустая строка — None.
+    Все id модели (ключи persons, связи, браки, current_center) хранятся в этом
+    виде, поэтому поиск по id — обычная проверка по словарю или множеству.
+    """
+    if pid is None:
+        return None
+    if type(pid) is not str:
+        pid = str(pid)
+    pid = pid.strip()
+    return sys.intern(pid) if pid else None
+
+
+def marriage_pair(pid1, pid2):
+    """Ключ брака в FamilyTreeModel.marriages: отсортированная пара канонических id."""
+    a, b = canonical_id(pid1), canonical_id(pid2)
+    return (a, b) if a <= b else (b, a)
+
+
+class RelationSet(MutableSet):
+    """
+    Компактное множество id связей персоны (parents, children, spouse_ids).
+
+    Id приводятся к canonical_id при добавлении и поиске. До RELATION_TUPLE_MAX элементов хранит кортеж в порядке добавления
+    (у большинства персон 0–2 родителя и 0–1 супруг), дальше — set.
+    Поддерживает привычный интерфейс множества: in, len, итерация, add,
+    discard, remove, update, сравнение и операции с set.
+    Изменение отмечает персону-владельца (owner) изменённой, как и присваивание её полей.
+    """
+
+    __slots__ = ("_items", "_owner")
+
+    def __init__(self, items=(), owner=None):
+        if items:
+            items = tuple(key for key in map(canonical_id, items) if key is not None)
+            if len(items) > 1 and len(set(items)) < len(items):
+                items = tuple(dict.fromkeys(items))
+        self._items = items if len(items) <= RELATION_TUPLE_MAX else set(items)
+        self._owner = owner
+
+    def _touch(self):
+        if self._owner is not None:
+            _set_attr(self._owner, "_dirty", True)
+
+    def __contains__(self, item):
+        if type(item) is not str:
+            item = canonical_id(item)
+        return item in self._items
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __repr__(self):
+        return "{" + ", ".join(map(repr, self._items)) + "}" if self._items else "set()"
+
+    @classmethod
+    def _from_iterable(cls, it):
+        return set(it)
+
+    def add(self, item):
+        item = canonical_id(item)
+        items = self._items
+        if item is None or item in items:
+            return
+        if type(items) is set:
+            items.add(item)
+        elif len(items) < RELATION_TUPLE_MAX:
+            self._items = items + (item,)
+        else:
+            self._items = set(items)
+            self._items.add(item)
+        self._touch()
+
+    def discard(self, item):
+        if type(item) is not str:
+            item = canonical_id(item)
+        items = self._items
+        if item not in items:
+            return
+        if type(items) is set:
+            items.discard(item)
+        else:
+            self._items = tuple(x for x in items if x != item)
+        self._touch()
+
+    def clear(self):
+        if self._items:
+            self._items = ()
+            self._touch()
+
+    def update(self, *iterables):
+        for items in iterables:
+            for item in items:
+                self.add(item)
+
+    def copy(self):
+        return set(self._items)
+
+    def union(self, *others):
+        return set(self._items).union(*others)
+
+    def intersection(self, *others):
+        return set(self._items).intersection(*others)
+
+    def difference(self, *others):
+        return set(self._items).difference(*others)
+
+    def issubset(self, other):
+        return set(self._items).issubset(other)
+
+    def issuperset(self, other):
+        return set(self._items).issuperset(other)
+
+
+class LineageSet(RelationSet):
+    """
+    RelationSet для parents и children: каждое изменение увеличивает
+    LineageSet.epoch. По нему индекс предков модели узнаёт, что связи правили
+    в обход её методов (undo, импорт, синхронизация), и перестраивается.
+    """
+
+    __slots__ = ()
+    epoch = 0
+
+    def add(self, item):
+        LineageSet.epoch += 1
+        super().add(item)
+
+    def discard(self, item):
+        LineageSet.epoch += 1
+        super().discard(item)
+
+    def clear(self):
+        LineageSet.epoch += 1
+        super().clear()
+
+
+def _relation_property(slot, cls=RelationSet):
+    def fget(self):
+        return getattr(self, slot)
+
+    def fset(self, value):
+        if cls is LineageSet:
+            LineageSet.epoch += 1
+        if type(value) is not cls:
+            value = cls(value or ())
+        value._owner = self
+        setattr(self, slot, value)
+
+    return property(fget, fset)
+
+
+def _lazy_property(slot):
+    """Тяжёлое поле: LazyField из read_tree загружается при первом чтении и заменяется значением."""
+    def fget(self):
+        value = getattr(self, slot)
+        if type(value) is LazyField:
+            value = value.load()
+            # Загрузка из файла — не изменение персоны
+            _set_attr(self, slot, value)
+        return value
+
+    def fset(self, value):
+        setattr(self, slot, value)
+
+    return property(fget, fset)
+
+
 class Person:
-    """Модель одной персоны в семейном дереве."""
+    """
+    Модель одной персоны в семейном дереве.
+
+    Атрибуты в __slots__ (без __dict__ на каждый экземпляр), короткие строковые
+    поля (имя, фамилия, пол, места…) интернируются, связи — RelationSet. Присваивание
+    p.parents = set(...) по-прежнему работает: значение оборачивается в RelationSet
+    (для parents и children — LineageSet). Фото, полное фото, биография и заметки
+    после load_from_file читаются из файла при первом обращении (tree_reader).
+
+    Любое присваивание поля и изменение связей выставляет _dirty: модель узнаёт
+    при сохранении персоны, изменённые без mark_modified, и пишет снимок целиком.
+    """
+
+    __slots__ = (
+        "_id", "name", "surname", "patronymic", "birth_date", "gender", "_photo", "photo_path",
+        "_photo_full", "is_deceased", "death_date", "maiden_name", "_parents", "_children",
+        "_spouse_ids", "collapsed_branches", "birth_place", "_biography", "burial_place",
+        "burial_date", "photo_album", "links", "occupation", "education", "address", "_notes",
+        "significant_events", "phone", "email", "social_media", "blood_type", "medical_info",
+        "vk", "telegram", "whatsapp", "rh_factor", "allergies", "chronic_conditions", "_dirty",
+    )
+
+    id = property(lambda self: self._id, lambda self, value: setattr(self, "_id", canonical_id(value)))
+    parents = _relation_property("_parents", LineageSet)
+    children = _relation_property("_children", LineageSet)
+    spouse_ids = _relation_property("_spouse_ids")
+    photo = _lazy_property("_photo")
+    photo_full = _lazy_property("_photo_full")
+    biography = _lazy_property("_biography")
+    notes = _lazy_property("_notes")
 
     def __init__(self, name="", surname="", patronymic="", birth_date="", gender="",
                  photo=None, photo_path="", is_deceased=False, death_date="", maiden_name="",
@@ -32,45 +254,57 @@ class Person:
                  significant_events=None, phone="", email="", social_media=None, blood_type="", medical_info=None,
                  vk="", telegram="", whatsapp="", rh_factor="", allergies="", chronic_conditions="",
                  photo_full=None):
-        self.id = None
-        self.name = name
-        self.surname = surname
-        self.patronymic = patronymic
+        self._id = None
+        self.name = _intern(name)
+        self.surname = _intern(surname)
+        self.patronymic = _intern(patronymic)
         self.birth_date = birth_date
-        self.gender = gender
+        self.gender = _intern(gender)
         self.photo = photo
         self.photo_path = photo_path or ""
         self.photo_full = photo_full  # Полное фото (сжатое) для веб-версии
         self.is_deceased = is_deceased
         self.death_date = death_date or ""
-        self.maiden_name = maiden_name or ""
-        self.parents = set()
-        self.children = set()
-        self.spouse_ids = set()
+        self.maiden_name = _intern(maiden_name or "")
+        self._parents = LineageSet(owner=self)
+        self._children = LineageSet(owner=self)
+        self._spouse_ids = RelationSet(owner=self)
         self.collapsed_branches = False
-        self.birth_place = birth_place if birth_place is not None else ""
+        self.birth_place = _intern(birth_place) if birth_place is not None else ""
         self.biography = biography if biography is not None else ""
-        self.burial_place = burial_place if burial_place is not None else ""
+        self.burial_place = _intern(burial_place) if burial_place is not None else ""
         self.burial_date = burial_date if burial_date is not None else ""
         self.photo_album = list(photo_album) if photo_album is not None else []
         self.links = list(links) if links is not None else []
-        self.occupation = occupation if occupation is not None else ""
-        self.education = education if education is not None else ""
+        self.occupation = _intern(occupation) if occupation is not None else ""
+        self.education = _intern(education) if education is not None else ""
         self.address = address if address is not None else ""
         self.notes = notes if notes is not None else ""
         self.significant_events = list(significant_events) if significant_events is not None else []
         self.phone = phone if phone is not None else ""
         self.email = email if email is not None else ""
         self.social_media = list(social_media) if social_media is not None else []
-        self.blood_type = blood_type if blood_type is not None else ""
+        self.blood_type = _intern(blood_type) if blood_type is not None else ""
         self.medical_info = list(medical_info) if medical_info is not None else []
         self.vk = vk if vk is not None else ""
         self.telegram = telegram if telegram is not None else ""
         self.whatsapp = whatsapp if whatsapp is not None else ""
-        self.rh_factor = rh_factor if rh_factor is not None else ""
+        self.rh_factor = _intern(rh_factor) if rh_factor is not None else ""
         self.allergies = allergies if allergies is not None else ""
         self.chronic_conditions = chronic_conditions if chronic_conditions is not None else ""
 
+    def to_dict(self):
+        """Атрибуты персоны словарём (вместо __dict__, которого у slots-объекта нет); связи — списки."""
+        data = {name.lstrip("_"): getattr(self, name.lstrip("_")) for name in self.__slots__ if name != "_dirty"}
+        data["parents"] = list(self._parents)
+        data["children"] = list(self._children)
+        data["spouse_ids"] = list(self._spouse_ids)
+        return data
+
+    def __setattr__(self, name, value):
+        _set_attr(self, name, value)
+        _set_attr(self, "_dirty", True)
+
     def full_name(self):
         return f"{self.name} {self.surname}"
 
@@ -89,32 +323,210 @@ class Person:
     def has_photo(self):
         if self.photo_path and os.path.exists(self.photo_path):
             return True
+        if type(self._photo) is LazyField:
+            return True
         if self.photo and isinstance(self.photo, str) and self.photo.strip():
             return True
         return False
 
 
+class PersonRegistry(dict):
+    """
+    Реестр персон {канонический id: Person}.
+
+    Запись (persons[pid] = p, update, setdefault) приводит ключ к canonical_id,
+    пустой id — ValueError; p.id выставляется равным ключу. Чтение — обычный
+    dict (ключи уже канонические); persons[42] находит запись "42" через __missing__.
+    Замена и удаление меняют предков потомков — увеличивают LineageSet.epoch.
+    Ключи записанных и удалённых персон копятся в changed (сбрасывает модель при сохранении).
+    """
+
+    def __init__(self, items=()):
+        super().__init__()
+        self.changed = set()
+        self.update(items)
+
+    @staticmethod
+    def _key(pid):
+        key = canonical_id(pid)
+        if key is None:
+            raise ValueError(f"Некорректный id персоны: {pid!r}")
+        return key
+
+    def __setitem__(self, pid, person):
+        key = self._key(pid)
+        if isinstance(person, Person):
+            person.id = key
+        if key in self:
+            LineageSet.epoch += 1
+        self.changed.add(key)
+        super().__setitem__(key, person)
+
+    def __delitem__(self, pid):
+        key = self._key(pid)
+        LineageSet.epoch += 1
+        super().__delitem__(key)
+        self.changed.add(key)
+
+    def pop(self, pid, *default):
+        key = canonical_id(pid)
+        LineageSet.epoch += 1
+        if key in self:
+            self.changed.add(key)
+        return super().pop(key, *default)
+
+    def popitem(self):
+        LineageSet.epoch += 1
+        key, person = super().popitem()
+        self.changed.add(key)
+        return key, person
+
+    def clear(self):
+        LineageSet.epoch += 1
+        self.changed.update(self)
+        super().clear()
+
+    def __missing__(self, pid):
+        key = canonical_id(pid)
+        if key is None or key == pid:
+            raise KeyError(pid)
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for pid, person in dict(*args, **kwargs).items():
+            self[pid] = person
+
+    def setdefault(self, pid, person=None):
+        key = self._key(pid)
+        if key not in self:
+            self[key] = person
+        return self[key]
+
+
+class MarriageRegistry(dict):
+    """Браки {marriage_pair: {"date": ...}}; ключи записанных и удалённых браков копятся в changed."""
+
+    def __init__(self, items=()):
+        super().__init__()
+        self.changed = set()
+        self.update(items)
+
+    def __setitem__(self, key, value):
+        self.changed.add(key)
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.changed.add(key)
+
+    def pop(self, key, *default):
+        if key in self:
+            self.changed.add(key)
+        return super().pop(key, *default)
+
+    def popitem(self):
+        key, value = super().popitem()
+        self.changed.add(key)
+        return key, value
+
+    def clear(self):
+        self.changed.update(self)
+        super().clear()
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def setdefault(self, key, value=None):
+        if key not in self:
+            self[key] = value
+        return self[key]
+
+
 class FamilyTreeModel:
     """Модель семейного дерева: персоны, браки, загрузка/сохранение."""
 
     def __init__(self, data_file="family_tree.json"):
-        self.persons = {}
-        # marriages: dict {(pid1, pid2): {"date": "dd.mm.yyyy"}}
+        self.persons = PersonRegistry()
+        # marriages: dict {(pid1, pid2): {"date": "dd.mm.yyyy"}}, ключ — marriage_pair
         self.marriages = {}
         self.data_file = data_file
         self.current_center = None
         self.logger = logging.getLogger(__name__)
         self._modified = False
         self.next_id = 1
+        self._journal = None
+        self._compaction = None
+        self._reset_tracking()
+
+    @property
+    def persons(self):
+        return self._persons
+
+    @persons.setter
+    def persons(self, value):
+        self._persons = value if isinstance(value, PersonRegistry) else PersonRegistry(value)
+        self._ancestor_index = None
+        # Дерево заменено целиком: журнал правок к нему не применим
+        self._untracked = True
+
+    @property
+    def marriages(self):
+        return self._marriages
+
+    @marriages.setter
+    def marriages(self, value):
+        self._marriages = value if isinstance(value, MarriageRegistry) else MarriageRegistry(value)
+        self._untracked = True
+
+    def _ancestors(self):
+        """Индекс предков (AncestorIndex), актуальный для текущих связей; строится при первом запросе."""
+        index = self._ancestor_index
+        if index is None or index.epoch != LineageSet.epoch:
+            index = self._ancestor_index = AncestorIndex.build(self.persons)
+            index.epoch = LineageSet.epoch
+        return index
+
+    def check_ancestors(self):
+        """Проверка индекса предков и связей parents/children (список проблем, пустой — всё в порядке)."""
+        return self._ancestors().check(self.persons)
+
+    @property
+    def current_center(self):
+        return self._current_center
+
+    @current_center.setter
+    def current_center(self, pid):
+        self._current_center = canonical_id(pid)
+
+    def resolve_id(self, pid):
+        """Ключ persons для pid любого вида (int, строка с пробелами) или None, если такой персоны нет."""
+        key = canonical_id(pid)
+        return key if key in self.persons else None
 
     def get_person(self, pid):
-        if pid is None:
-            return None
-        key = str(pid)
-        person = self.persons.get(key)
-        if person is not None:
-            return person
-        return self.persons.get(pid)
+        return self.persons.get(canonical_id(pid))
+
+    def validate_ids(self):
+        """
+        Проверка реестра id: ключ совпадает с person.id, связи и браки ссылаются
+        на существующих персон. Возвращает список описаний проблем (пустой — всё в порядке).
+        """
+        problems = []
+        persons = self.persons
+        for pid, person in persons.items():
+            if pid != canonical_id(pid):
+                problems.append(f"{pid!r}: ключ не канонический")
+            if person.id != pid:
+                problems.append(f"{pid}: person.id = {person.id!r}")
+            for attr in ("parents", "children", "spouse_ids"):
+                missing = [rid for rid in getattr(person, attr) if rid not in persons]
+                if missing:
+                    problems.append(f"{pid}: {attr} ссылается на отсутствующих {sorted(missing)}")
+        for key in self.marriages:
+            if key != marriage_pair(*key) or any(pid not in persons for pid in key):
+                problems.append(f"брак {key}: некорректный ключ или нет персоны")
+        return problems
 
     @staticmethod
     def _validate_date(date_str):
@@ -136,42 +548,36 @@ class FamilyTreeModel:
             return False
 
     def remove_spouse_link(self, person1_id, person2_id):
+        person1_id, person2_id = canonical_id(person1_id), canonical_id(person2_id)
         if person1_id not in self.persons or person2_id not in self.persons:
             return False, "One or both persons do not exist."
         p1 = self.persons[person1_id]
         p2 = self.persons[person2_id]
         p1.spouse_ids.discard(person2_id)
         p2.spouse_ids.discard(person1_id)
-        marriage_key = tuple(sorted((person1_id, person2_id)))
-        self.marriages.discard(marriage_key)
-        self.mark_modified()
+        marriage_key = marriage_pair(person1_id, person2_id)
+        self.marriages.pop(marriage_key, None)
+        self.mark_modified(person1_id, person2_id, marriages=[marriage_key])
         return True, "Spouse link removed successfully."
 
     def creates_cycle(self, potential_parent_id, potential_child_id):
-        visited = set()
-        stack = [potential_child_id]
-        while stack:
-            current_id = stack.pop()
-            if current_id == potential_parent_id:
-                return True
-            if current_id in visited:
-                continue
-            visited.add(current_id)
-            current_person = self.persons.get(current_id)
-            if current_person:
-                stack.extend(current_person.parents)
-        return False
+        """Добавление родителя замкнёт цикл: это та же персона или ребёнок уже её предок."""
+        return self._ancestors().creates_cycle(canonical_id(potential_parent_id), canonical_id(potential_child_id))
 
     def add_parent(self, child_id, parent_id):
+        child_id, parent_id = canonical_id(child_id), canonical_id(parent_id)
         if child_id not in self.persons or parent_id not in self.persons:
             return False, "Ребёнок или родитель не найдены"
         child_obj = self.persons[child_id]
         parent_obj = self.persons[parent_id]
-        if self.creates_cycle(parent_id, child_id):
+        index = self._ancestors()
+        if index.creates_cycle(parent_id, child_id):
             return False, "Обнаружен цикл в родственных связях"
         child_obj.parents.add(parent_id)
         parent_obj.children.add(child_id)
-        self.mark_modified()
+        index.add_edge(self.persons, child_id, parent_id)
+        index.epoch = LineageSet.epoch
+        self.mark_modified(child_id, parent_id)
         return True, f"Родитель {parent_id} успешно добавлен к ребёнку {child_id}"
 
     def add_person(self, name=None, surname="", patronymic="", birth_date="", gender=GENDER_MALE,
@@ -181,6 +587,9 @@ class FamilyTreeModel:
                    significant_events=None, phone="", email="", social_media=None,
                    blood_type="", medical_info=None, vk="", telegram="", whatsapp="",
                    rh_factor="", allergies="", chronic_conditions=""):
+        # Индекс предков, актуальный до вызова, дополняется новой персоной без перестройки
+        index = self._ancestor_index
+        index_fresh = index is not None and index.epoch == LineageSet.epoch
         # Поддержка двух вариантов вызова: с объектом Person или с отдельными параметрами
         if isinstance(name, Person):
             person = name
@@ -191,7 +600,7 @@ class FamilyTreeModel:
             )
             if not is_valid:
                 return None, "\n".join(validation_errors)
-            new_id = str(self.next_id)
+            new_id = canonical_id(self.next_id)
             self.next_id += 1
             new_person = person
             new_person.id = new_id
@@ -211,7 +620,7 @@ class FamilyTreeModel:
             )
             if not is_valid:
                 return None, "\n".join(validation_errors)
-            new_id = str(self.next_id)
+            new_id = canonical_id(self.next_id)
             self.next_id += 1
             new_person = Person(
                 name=name, surname=surname, patronymic=patronymic,
@@ -231,7 +640,10 @@ class FamilyTreeModel:
             new_person.spouse_ids = set()
             new_person.collapsed_branches = False
         self.persons[new_id] = new_person
-        self.mark_modified()
+        if index_fresh and not new_person.parents and not new_person.children:
+            index.add_person(new_id)
+            index.epoch = LineageSet.epoch
+        self.mark_modified(new_id)
         self.logger.info(f"Добавлена персона: {new_person.display_name()} (ID: {new_id})")
         return new_id, None
 
@@ -251,9 +663,10 @@ class FamilyTreeModel:
         return len(errors) == 0, errors
 
     def add_marriage(self, person1_id, person2_id, marriage_date=None):
+        person1_id, person2_id = canonical_id(person1_id), canonical_id(person2_id)
         if person1_id == person2_id:
             return False, MSG_ERROR_CANNOT_ADD_TO_SELF
-        marriage_key = tuple(sorted((person1_id, person2_id)))
+        marriage_key = marriage_pair(person1_id, person2_id)
         if marriage_key in self.marriages:
             return False, MSG_ERROR_DUPLICATE_MARRIAGE
         if self._is_blood_relative(person1_id, person2_id):
@@ -264,13 +677,17 @@ class FamilyTreeModel:
             p1.spouse_ids.add(person2_id)
             p2.spouse_ids.add(person1_id)
         self.marriages[marriage_key] = {"date": marriage_date or ""}
-        self.mark_modified()
+        self.mark_modified(person1_id, person2_id, marriages=[marriage_key])
         return True, MSG_SUCCESS_MARRIAGE_ADDED
 
     def delete_person(self, pid):
+        pid = canonical_id(pid)
         if pid not in self.persons:
             return False, "Персона не найдена."
+        index = self._ancestors()
         person = self.persons[pid]
+        children = list(person.children)
+        relatives = [*person.parents, *person.children, *person.spouse_ids]
         for parent_id in list(person.parents):
             parent = self.get_person(parent_id)
             if parent and pid in parent.children:
@@ -281,21 +698,27 @@ class FamilyTreeModel:
                 child.parents.discard(pid)
         marriages_to_remove = [m for m in self.marriages if pid in m]
         for marriage in marriages_to_remove:
-            self.marriages.discard(marriage)
+            self.marriages.pop(marriage, None)
             spouse_id = marriage[0] if marriage[1] == pid else marriage[1]
             spouse = self.get_person(spouse_id)
             if spouse and pid in spouse.spouse_ids:
                 spouse.spouse_ids.discard(pid)
         del self.persons[pid]
+        index.remove_person(pid)
+        if index.recompute_descendants(self.persons, children):
+            self._ancestor_index = None
+        else:
+            index.epoch = LineageSet.epoch
         if self.current_center == pid:
             self.current_center = None
-        self.mark_modified()
+        self.mark_modified(pid, *relatives, marriages=marriages_to_remove)
         return True, MSG_SUCCESS_PERSON_DELETED
 
     def remove_marriage(self, person1_id, person2_id):
+        person1_id, person2_id = canonical_id(person1_id), canonical_id(person2_id)
         if person1_id not in self.persons or person2_id not in self.persons:
             return False, "One or both persons do not exist."
-        marriage_key = tuple(sorted((person1_id, person2_id)))
+        marriage_key = marriage_pair(person1_id, person2_id)
         if marriage_key not in self.marriages:
             return False, "Marriage does not exist."
         p1 = self.persons[person1_id]
@@ -303,7 +726,7 @@ class FamilyTreeModel:
         p1.spouse_ids.discard(person2_id)
         p2.spouse_ids.discard(person1_id)
         del self.marriages[marriage_key]
-        self.mark_modified()
+        self.mark_modified(person1_id, person2_id, marriages=[marriage_key])
         return True, MSG_SUCCESS_MARRIAGE_REMOVED
 
     def get_spouse(self, person_id):
@@ -323,17 +746,17 @@ class FamilyTreeModel:
 
     def get_marriage_date(self, person1_id, person2_id):
         """Возвращает дату брака между двумя персонами."""
-        marriage_key = tuple(sorted((person1_id, person2_id)))
+        marriage_key = marriage_pair(person1_id, person2_id)
         if marriage_key in self.marriages:
             return self.marriages[marriage_key].get("date", "")
         return ""
 
     def set_marriage_date(self, person1_id, person2_id, marriage_date):
         """Устанавливает дату брака между двумя персонами."""
-        marriage_key = tuple(sorted((person1_id, person2_id)))
+        marriage_key = marriage_pair(person1_id, person2_id)
         if marriage_key in self.marriages:
             self.marriages[marriage_key]["date"] = marriage_date
-            self.mark_modified()
+            self.mark_modified(marriages=[marriage_key])
             return True
         return False
 
@@ -347,68 +770,132 @@ class FamilyTreeModel:
         return None
 
     def _is_blood_relative(self, person1_id, person2_id):
-        def get_all_ancestors(pid, ancestors):
-            person = self.persons.get(pid)
-            if not person:
-                return
-            for parent_id in person.parents:
-                if parent_id not in ancestors:
-                    ancestors.add(parent_id)
-                    get_all_ancestors(parent_id, ancestors)
-
+        """Одна и та же персона или у двух персон есть общий предок."""
+        person1_id, person2_id = canonical_id(person1_id), canonical_id(person2_id)
         if person1_id == person2_id:
             return True
-        ancestors1 = set()
-        get_all_ancestors(person1_id, ancestors1)
-        ancestors2 = set()
-        get_all_ancestors(person2_id, ancestors2)
-        return bool(ancestors1 & ancestors2)
+        return self._ancestors().share_ancestor(person1_id, person2_id)
+
+    @staticmethod
+    def _person_record(p, lazy=False):
+        """
+        Персона в формате файла дерева. lazy=True — не загружать фото и тексты,
+        ещё лежащие в файле (LazyField): их подставит _write_snapshot.
+        """
+        def heavy(name):
+            value = getattr(p, "_" + name)
+            return value if lazy and type(value) is LazyField else getattr(p, name)
+
+        photo = heavy("photo")
+        return {
+            "name": p.name, "surname": p.surname, "patronymic": p.patronymic,
+            "birth_date": p.birth_date, "gender": p.gender,
+            "photo": photo if type(photo) is LazyField or (photo and isinstance(photo, str) and photo.strip()) else None,
+            "photo_path": getattr(p, "photo_path", "") or "",
+            "photo_full": heavy("photo_full"),
+            "is_deceased": p.is_deceased, "death_date": p.death_date,
+            "maiden_name": getattr(p, "maiden_name", "") or "",
+            "parents": list(p.parents), "children": list(p.children),
+            "spouse_ids": list(p.spouse_ids), "collapsed_branches": p.collapsed_branches,
+            "birth_place": getattr(p, "birth_place", "") or "",
+            "biography": heavy("biography") or "",
+            "burial_place": getattr(p, "burial_place", "") or "",
+            "burial_date": getattr(p, "burial_date", "") or "",
+            # Копии: снимок для фоновой свёртки не должен делить списки с редактируемой персоной
+            "photo_album": list(getattr(p, "photo_album", None) or []),
+            "links": [dict(link) if isinstance(link, dict) else link for link in getattr(p, "links", None) or []],
+            "occupation": getattr(p, "occupation", "") or "",
+            "education": getattr(p, "education", "") or "",
+            "address": getattr(p, "address", "") or "",
+            "notes": heavy("notes") or "",
+            "phone": getattr(p, "phone", "") or "",
+            "email": getattr(p, "email", "") or "",
+            "blood_type": getattr(p, "blood_type", "") or "",
+            "vk": getattr(p, "vk", "") or "",
+            "telegram": getattr(p, "telegram", "") or "",
+            "whatsapp": getattr(p, "whatsapp", "") or "",
+            "rh_factor": getattr(p, "rh_factor", "") or "",
+            "allergies": getattr(p, "allergies", "") or "",
+            "chronic_conditions": getattr(p, "chronic_conditions", "") or "",
+        }
+
+    def _snapshot(self, lazy=False):
+        """Всё дерево в формате файла."""
+        return {
+            "persons": {pid: self._person_record(p, lazy) for pid, p in self.persons.items()},
+            "marriages": [
+                {"persons": list(key), "date": val.get("date", "")}
+                for key, val in self.marriages.items()
+            ],
+            "current_center": self.current_center
+        }
+
+    @staticmethod
+    def _write_snapshot(filename, data, pretty=False):
+        """Записать снимок из _snapshot(lazy=True): отложенные поля читаются из прежнего файла до его замены."""
+        for pdata in data["persons"].values():
+            for field in LAZY_FIELDS:
+                if type(pdata[field]) is LazyField:
+                    pdata[field] = pdata[field].load()
+        write_json(filename, data, pretty=pretty)
+
+    def _own_file(self, filename):
+        return os.path.abspath(filename) == os.path.abspath(self.data_file)
+
+    def _journal_for_data_file(self):
+        journal = self._journal
+        if journal is None or journal.tree_path != os.path.abspath(self.data_file):
+            journal = self._journal = ChangeJournal(self.data_file)
+        return journal
+
+    def _reset_tracking(self, untracked=False):
+        """Всё записано (или загружено): сбросить отметки mark_modified и признаки изменений."""
+        self._dirty_persons = set()
+        self._dirty_marriages = set()
+        self._untracked = untracked
+        self._journal_center = self.current_center
+        for person in self._persons.values():
+            if person._dirty:
+                _set_attr(person, "_dirty", False)
+        self._persons.changed.clear()
+        self._marriages.changed.clear()
+
+    def _unmarked_changes(self):
+        """Есть изменения, не отмеченные через mark_modified с id: поля и связи персон, реестры."""
+        marked = self._dirty_persons
+        if not self._persons.changed <= marked or not self._marriages.changed <= self._dirty_marriages:
+            return True
+        return any(person._dirty and pid not in marked for pid, person in self._persons.items())
 
-    def save_to_file(self, filename=None):
+    def save_to_file(self, filename=None, pretty=False):
+        """
+        Сохранить дерево в JSON атомарно (atomic_json); pretty=True — с отступами, для экспорта.
+
+        Если все изменения с прошлого сохранения отмечены через mark_modified с id
+        персон или браков, в файл данных ничего не переписывается: они дописываются
+        пакетом в журнал (change_journal), а снимок обновляется фоновой свёрткой.
+        """
         if filename is None:
             filename = self.data_file
+        own = self._own_file(filename)
         try:
-            data = {
-                "persons": {
-                    pid: {
-                        "name": p.name, "surname": p.surname, "patronymic": p.patronymic,
-                        "birth_date": p.birth_date, "gender": p.gender,
-                        "photo": p.photo if p.photo and isinstance(p.photo, str) and p.photo.strip() else None,
-                        "photo_path": getattr(p, "photo_path", "") or "",
-                        "photo_full": getattr(p, "photo_full", None),
-                        "is_deceased": p.is_deceased, "death_date": p.death_date,
-                        "maiden_name": getattr(p, "maiden_name", "") or "",
-                        "parents": list(p.parents), "children": list(p.children),
-                        "spouse_ids": list(p.spouse_ids), "collapsed_branches": p.collapsed_branches,
-                        "birth_place": getattr(p, "birth_place", "") or "",
-                        "biography": getattr(p, "biography", "") or "",
-                        "burial_place": getattr(p, "burial_place", "") or "",
-                        "burial_date": getattr(p, "burial_date", "") or "",
-                        "photo_album": getattr(p, "photo_album", None) or [],
-                        "links": getattr(p, "links", None) or [],
-                        "occupation": getattr(p, "occupation", "") or "",
-                        "education": getattr(p, "education", "") or "",
-                        "address": getattr(p, "address", "") or "",
-                        "notes": getattr(p, "notes", "") or "",
-                        "phone": getattr(p, "phone", "") or "",
-                        "email": getattr(p, "email", "") or "",
-                        "blood_type": getattr(p, "blood_type", "") or "",
-                        "vk": getattr(p, "vk", "") or "",
-                        "telegram": getattr(p, "telegram", "") or "",
-                        "whatsapp": getattr(p, "whatsapp", "") or "",
-                        "rh_factor": getattr(p, "rh_factor", "") or "",
-                        "allergies": getattr(p, "allergies", "") or "",
-                        "chronic_conditions": getattr(p, "chronic_conditions", "") or "",
-                    } for pid, p in self.persons.items()
-                },
-                "marriages": [
-                    {"persons": list(key), "date": val.get("date", "")}
-                    for key, val in self.marriages.items()
-                ],
-                "current_center": self.current_center
-            }
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            journal = self._journal
+            # Что-то изменено без отметки mark_modified — не журналируем, пишем снимок целиком
+            if (own and not pretty and self._modified and not self._untracked and journal is not None
+                    and journal.tree_path == os.path.abspath(filename) and os.path.exists(filename)
+                    and not self._unmarked_changes()):
+                return self._save_to_journal(journal)
+            if own:
+                self.wait_for_compaction()
+                journal = self._journal_for_data_file()
+                generation = journal.generation + 1
+            data = self._snapshot(lazy=True)
+            if own:
+                data[GENERATION_KEY] = generation
+            self._write_snapshot(filename, data, pretty=pretty)
+            if own:
+                journal.reset(generation)
+                self._reset_tracking()
             self.logger.info(f"Данные успешно сохранены в {filename}")
             self.clear_modified_flag()
             return True
@@ -418,6 +905,64 @@ class FamilyTreeModel:
             traceback.print_exc()
             return False
 
+    def _save_to_journal(self, journal):
+        records = []
+        for pid in sorted(self._dirty_persons):
+            person = self.persons.get(pid)
+            if person is not None:
+                records.append({"op": "put", "id": pid, "person": self._person_record(person)})
+            else:
+                records.append({"op": "del", "id": pid})
+        for pair in sorted(self._dirty_marriages):
+            marriage = self.marriages.get(pair)
+            if marriage is not None:
+                records.append({"op": "marry", "persons": list(pair), "date": marriage.get("date", "")})
+            else:
+                records.append({"op": "unmarry", "persons": list(pair)})
+        if self.current_center != self._journal_center:
+            records.append({"op": "center", "id": self.current_center})
+        try:
+            written = journal.append(records)
+        except Exception:
+            # Хвост журнала мог остаться недописанным: следующее сохранение — снимком целиком
+            self._untracked = True
+            raise
+        self._reset_tracking()
+        self.clear_modified_flag()
+        self.logger.info(f"[JOURNAL] {len(records)} записей ({written} байт) дописано в {journal.path}")
+        self._maybe_compact(journal)
+        return True
+
+    def _maybe_compact(self, journal):
+        """Журнал больше COMPACT_MIN_BYTES и доли COMPACT_SNAPSHOT_FRACTION снимка — свернуть его в новый снимок в фоне."""
+        if journal.size < COMPACT_MIN_BYTES or journal.rotating:
+            return
+        if self._compaction is not None and self._compaction.is_alive():
+            return
+        if journal.size < os.path.getsize(self.data_file) * COMPACT_SNAPSHOT_FRACTION:
+            return
+        data = self._snapshot(lazy=True)
+        data[GENERATION_KEY] = journal.rotate()
+        self._compaction = threading.Thread(target=self._compact, args=(journal, data),
+                                            name="journal-compaction", daemon=True)
+        self._compaction.start()
+
+    def _compact(self, journal, data):
+        try:
+            self._write_snapshot(journal.tree_path, data)
+            journal.finish_rotation()
+            self.logger.info(f"[JOURNAL] Журнал свёрнут в снимок {journal.tree_path} (поколение {data[GENERATION_KEY]})")
+        except Exception as e:
+            # Прежний журнал остался в .old и применится при загрузке; следующее сохранение — снимком
+            self.logger.error(f"[JOURNAL] Ошибка свёртки журнала: {e}")
+            self._untracked = True
+
+    def wait_for_compaction(self):
+        """Дождаться фоновой свёртки (перед записью снимка целиком и при выходе)."""
+        if self._compaction is not None:
+            self._compaction.join()
+            self._compaction = None
+
     def load_from_file(self, filename=None):
         if filename is None:
             filename = self.data_file
@@ -425,11 +970,18 @@ class FamilyTreeModel:
             self.logger.info(f"Файл {filename} не найден, создание нового дерева.")
             return False
         try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            self.persons = {}
+            # Фото и длинные тексты остаются ссылками на файл до первого обращения
+            data = read_tree(filename)
+            self.wait_for_compaction()
+            journal = ChangeJournal(filename)
+            replayed, from_rotation = journal.replay(data)
+            if replayed:
+                self.logger.info(f"[JOURNAL] Применено пакетов журнала: {replayed}")
+            self.persons = PersonRegistry()
             for pid, pdata in data.get("persons", {}).items():
-                pid = str(pid)
+                pid = canonical_id(pid)
+                if pid is None:
+                    continue
                 p = Person(
                     name=pdata.get("name", ""),
                     surname=pdata.get("surname", ""),
@@ -462,10 +1014,9 @@ class FamilyTreeModel:
                     allergies=pdata.get("allergies", ""),
                     chronic_conditions=pdata.get("chronic_conditions", ""),
                 )
-                p.id = pid
-                p.parents = set(str(pid) for pid in pdata.get("parents", []) if pid)
-                p.children = set(str(pid) for pid in pdata.get("children", []) if pid)
-                p.spouse_ids = set(str(pid) for pid in pdata.get("spouse_ids", []) if pid)
+                p._parents = LineageSet(pdata.get("parents") or (), owner=p)
+                p._children = LineageSet(pdata.get("children") or (), owner=p)
+                p._spouse_ids = RelationSet(pdata.get("spouse_ids") or (), owner=p)
                 p.collapsed_branches = pdata.get("collapsed_branches", False)
                 self.persons[pid] = p
 
@@ -478,8 +1029,8 @@ class FamilyTreeModel:
                         persons_list = pair.get("persons", [])
                         marriage_date = pair.get("date", "")
                         if isinstance(persons_list, (list, tuple)) and len(persons_list) >= 2:
-                            h_id, w_id = str(persons_list[0]), str(persons_list[1])
-                            self.marriages[tuple(sorted((h_id, w_id)))] = {"date": marriage_date}
+                            h_id, w_id = canonical_id(persons_list[0]), canonical_id(persons_list[1])
+                            self.marriages[marriage_pair(h_id, w_id)] = {"date": marriage_date}
                             # Восстанавливаем spouse_ids у персон!
                             if h_id in self.persons:
                                 self.persons[h_id].spouse_ids.add(w_id)
@@ -487,8 +1038,8 @@ class FamilyTreeModel:
                                 self.persons[w_id].spouse_ids.add(h_id)
                     elif isinstance(pair, (list, tuple)) and len(pair) >= 2:
                         # Старый формат: [id1, id2]
-                        h_id, w_id = str(pair[0]), str(pair[1])
-                        self.marriages[tuple(sorted((h_id, w_id)))] = {"date": ""}
+                        h_id, w_id = canonical_id(pair[0]), canonical_id(pair[1])
+                        self.marriages[marriage_pair(h_id, w_id)] = {"date": ""}
                         # Восстанавливаем spouse_ids у персон!
                         if h_id in self.persons:
                             self.persons[h_id].spouse_ids.add(w_id)
@@ -503,7 +1054,7 @@ class FamilyTreeModel:
                 restored_count = 0
                 for pid, person in self.persons.items():
                     for spouse_id in person.spouse_ids:
-                        marriage_key = tuple(sorted((pid, spouse_id)))
+                        marriage_key = marriage_pair(pid, spouse_id)
                         if marriage_key not in self.marriages:
                             self.marriages[marriage_key] = {"date": ""}
                             restored_count += 1
@@ -521,6 +1072,9 @@ class FamilyTreeModel:
                     pass
             self.next_id = max(numeric_ids, default=0) + 1
 
+            self._journal = journal
+            # Журнал, не свёрнутый прошлой сессией, сворачивается при следующем сохранении
+            self._reset_tracking(untracked=from_rotation)
             self.logger.info(f"Данные успешно загружены из {filename}")
             self.clear_modified_flag()
             return True
@@ -592,8 +1146,19 @@ class FamilyTreeModel:
         self.add_parent(child_id, new_parent_id)
         return new_parent_id, None
 
-    def mark_modified(self):
+    def mark_modified(self, *pids, marriages=()):
+        """
+        Отметить изменение дерева. pids и marriages (ключи marriage_pair) — что
+        изменилось: такое сохранение дописывается в журнал. Без них следующее
+        сохранение записывает снимок целиком — как и при любом изменении персоны,
+        реестра или брака, не отмеченном здесь (Person._dirty, changed реестров).
+        """
         self._modified = True
+        if pids or marriages:
+            self._dirty_persons.update(canonical_id(pid) for pid in pids)
+            self._dirty_marriages.update(marriages)
+        else:
+            self._untracked = True
 
     def clear_modified_flag(self):
         self._modified = False
@@ -11,6 +11,9 @@ from pathlib import Path
 from datetime import datetime
 from typing import List, Optional, Dict, Any
 
+from atomic_json import write_json
+from change_journal import consolidated_tree, discard_journal
+
 logger = logging.getLogger(__name__)
 
 # Настройки
@@ -61,7 +64,12 @@ class BackupService:
             backup_filename = f"{prefix}_{timestamp}{file_path.suffix}"
             backup_path = self.backup_dir / backup_filename
 
-            shutil.copy2(file_path, backup_path)
+            # Правки, ещё не свёрнутые из журнала изменений, попадают в копию
+            data = consolidated_tree(file_path)
+            if data is not None:
+                write_json(backup_path, data)
+            else:
+                shutil.copy2(file_path, backup_path)
             logger.info(f"Бэкап создан: {backup_path}")
 
             # Удаляем старые бэкапы
@@ -166,6 +174,7 @@ class BackupService:
                 return False
 
             shutil.copy2(src, dst)
+            discard_journal(dst)
             logger.info(f"Восстановлено из бэкапа: {backup_path} -> {target_path}")
             return True
 
@@ -10,6 +10,9 @@ import logging
 from pathlib import Path
 from typing import Dict, Any, Optional, Tuple
 
+from atomic_json import write_json
+from tree_reader import LazyPersonData, read_tree
+
 logger = logging.getLogger(__name__)
 
 
@@ -46,12 +49,14 @@ class TreeService:
         safe_name = (username or "Гость").replace("..", "").strip() or "Гость"
         return self.data_dir / f"family_tree_{safe_name}.json"
 
-    def load_tree(self, username: str) -> Dict[str, Any]:
+    def load_tree(self, username: str, lazy: bool = True) -> Dict[str, Any]:
         """
         Загружает дерево пользователя из JSON.
 
         Args:
             username: Имя пользователя.
+            lazy: Фото, биография и заметки читаются из файла при первом обращении
+                (персоны — LazyPersonData, см. tree_reader); False — весь файл сразу.
 
         Returns:
             Словарь с данными дерева: {persons, marriages, current_center, version}.
@@ -61,8 +66,15 @@ class TreeService:
             return self._create_empty_tree()
 
         try:
-            with open(path, "r", encoding="utf-8") as f:
-                data = json.load(f)
+            if lazy:
+                data = read_tree(path)
+                persons_raw = data.get("persons")
+                if isinstance(persons_raw, dict):
+                    data["persons"] = {k: LazyPersonData(v) if isinstance(v, dict) else v
+                                       for k, v in persons_raw.items()}
+            else:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
 
             # Применяем миграции
             from data_migrations import migrate_data, get_current_version
@@ -146,7 +158,14 @@ class TreeService:
             # Подготовка данных к сохранению
             persons = {}
             for pid, p in data.get("persons", {}).items():
-                pp = dict(p) if isinstance(p, dict) else getattr(p, "__dict__", {})
+                if isinstance(p, LazyPersonData):
+                    pp = dict(p.items())  # загружает отложенные поля
+                elif isinstance(p, dict):
+                    pp = dict(p)
+                elif hasattr(p, "to_dict"):
+                    pp = p.to_dict()
+                else:
+                    pp = getattr(p, "__dict__", {})
                 # Нормализация списков
                 for k in ("parents", "children", "spouse_ids"):
                     if k in pp:
@@ -167,8 +186,8 @@ class TreeService:
                 "version": "1.3.0",
             }
 
-            with open(path, "w", encoding="utf-8") as f:
-                json.dump(out, f, ensure_ascii=False, indent=2)
+            # Временный файл + fsync + os.replace под блокировкой файла, компактный JSON
+            write_json(path, out)
 
             logger.info(f"Дерево сохранено: {path}")
             return True, None
@@ -4,21 +4,37 @@
 Синхронизация с сервером через REST API.
 """
 
+import base64
+import gzip
+import hashlib
 import json
 import os
 import urllib.request
 import urllib.error
 from datetime import datetime
 
+import atomic_json
+import http_client
+
 # Настройки сервера
 DEFAULT_SERVER_URL = "https://ravishing-caring-production-3656.up.railway.app"
 CONFIG_FILE = "sync_config.json"
 REMEMBER_FILE = "login_remember.json"
+# Последняя ревизия дерева на сервере и хеши синхронизированных сущностей
+SYNC_STATE_FILE = "sync_state.json"
 
 # Учётные данные не хранятся в коде — только через окно входа / users.json / сервер.
 USER_CREDENTIALS = {}
 
 
+class SyncHTTPError(Exception):
+    """Сервер ответил кодом ошибки HTTP; code — статус ответа."""
+
+    def __init__(self, code, message):
+        super().__init__(f"HTTP {code}: {message}")
+        self.code = code
+
+
 class SyncClient:
     """Клиент для синхронизации с сервером."""
 
@@ -27,6 +43,9 @@ class SyncClient:
         self.token = self._load_token()
         self.user_id = None
         self.username = self._load_username()
+        self._sync_state = self._load_sync_state()
+        # (токен, endpoint) → (ETag, тело ответа): повторный GET без изменений — 304 без тела
+        self._validators = {}
 
     def _load_username(self):
         """Загрузить сохранённое имя пользователя"""
@@ -109,15 +128,26 @@ class SyncClient:
         self.user_id = user_id
     
     def _request(self, endpoint, method='GET', data=None):
-        """Выполнить HTTP запрос к серверу."""
+        """Выполнить HTTP запрос к серверу.
+
+        Ответы сжимаются gzip; для GET отправляется If-None-Match с ETag
+        прошлого ответа, и на 304 возвращается запомненное тело. Соединение
+        с сервером берётся из пула keep-alive (http_client).
+        """
         url = f"{self.server_url}{endpoint}"
         headers = {
             'Content-Type': 'application/json',
-            'Accept': 'application/json'
+            'Accept': 'application/json',
+            'Accept-Encoding': 'gzip'
         }
         
         if self.token:
             headers['Authorization'] = f'Bearer {self.token}'
+
+        validator_key = (self.token, endpoint)
+        cached = self._validators.get(validator_key) if method == 'GET' else None
+        if cached:
+            headers['If-None-Match'] = cached[0]
         
         body = None
         if data:
@@ -126,18 +156,30 @@ class SyncClient:
         req = urllib.request.Request(url, data=body, headers=headers, method=method)
         
         try:
-            with urllib.request.urlopen(req, timeout=30) as response:
+            with http_client.urlopen(req, timeout=30) as response:
                 if response.status == 204:
                     return None
-                return json.loads(response.read().decode('utf-8'))
+                raw = response.read()
+                if response.headers.get('Content-Encoding') == 'gzip':
+                    raw = gzip.decompress(raw)
+                etag = response.headers.get('ETag')
+                if method == 'GET' and etag:
+                    self._validators[validator_key] = (etag, raw)
+                return json.loads(raw.decode('utf-8'))
         except urllib.error.HTTPError as e:
-            error_body = e.read().decode('utf-8') if e.fp else ''
+            if e.code == 304 and cached:
+                print(f"[SYNC] {endpoint}: не изменилось (304)")
+                return json.loads(cached[1].decode('utf-8'))
+            error_body = e.read() if e.fp else b''
+            if e.headers and e.headers.get('Content-Encoding') == 'gzip':
+                error_body = gzip.decompress(error_body)
+            error_body = error_body.decode('utf-8')
             try:
                 error_data = json.loads(error_body)
                 error_msg = error_data.get('error', str(e))
             except:
                 error_msg = str(e)
-            raise Exception(f"HTTP {e.code}: {error_msg}")
+            raise SyncHTTPError(e.code, error_msg)
         except urllib.error.URLError as e:
             raise Exception(f"Ошибка соединения: {e.reason}")
         except Exception as e:
@@ -280,7 +322,15 @@ class SyncClient:
         """Загрузить дерево на сервер из модели"""
         print(f"[SYNC] Uploading tree: {tree_name}")
         print(f"[SYNC] Token: {self.token[:20] if self.token else 'None'}...")
-        
+
+        tree_data = self.build_tree_data(model)
+        print(f"[SYNC] Persons: {len(tree_data['persons'])}, Marriages: {len(tree_data['marriages'])}")
+
+        return self.upload_tree_data(tree_data, tree_name)
+
+    @staticmethod
+    def build_tree_data(model):
+        """Данные дерева для отправки на сервер (из модели или dict персон)."""
         tree_data = {
             'persons': {},
             'marriages': []
@@ -308,9 +358,10 @@ class SyncClient:
                     'gender': person.gender,
                     'is_deceased': person.is_deceased,
                     'death_date': person.death_date,
-                    'parents': list(person.parents),
-                    'children': list(person.children),
-                    'spouse_ids': list(person.spouse_ids),
+                    # sorted: порядок множеств меняется между запусками, а хеши дельты — нет
+                    'parents': sorted(person.parents),
+                    'children': sorted(person.children),
+                    'spouse_ids': sorted(person.spouse_ids),
                 }
             else:
                 # Это dict
@@ -330,22 +381,92 @@ class SyncClient:
                 else:
                     tree_data['marriages'].append({'persons': [marriage], 'date': ''})
 
-        print(f"[SYNC] Persons: {len(tree_data['persons'])}, Marriages: {len(tree_data['marriages'])}")
-
-        return self.upload_tree_data(tree_data, tree_name)
+        return tree_data
 
     def upload_tree_data(self, tree_data, tree_name='Моё дерево'):
-        """Загрузить дерево на сервер"""
+        """
+        Загрузить дерево на сервер.
+
+        Если известна ревизия последней синхронизации — отправляются только
+        изменённые и удалённые сущности (/api/sync/delta). Если дерево на
+        сервере успело измениться (409) или ревизии нет — всё дерево целиком.
+        """
         if not self.token:
             raise Exception("Требуется авторизация")
-        
+
+        if self.revision:
+            delta = self.compute_delta(tree_data)
+            changed = sum(len(v) for v in delta.values())
+            if not changed:
+                print(f"[SYNC] No changes since revision {self.revision}")
+                return {'message': 'Нет изменений', 'revision': self.revision}
+            delta['persons'] = self._without_known_photos(delta['persons'])
+            try:
+                result = self._request('/api/sync/delta', method='POST', data={
+                    'base_revision': self.revision,
+                    'tree_name': tree_name,
+                    **delta
+                })
+                print(f"[SYNC] Delta upload: {changed} changes, revision {self.revision} -> {result.get('revision')}")
+                self.remember_tree(tree_data, result.get('revision'))
+                return result
+            except SyncHTTPError as e:
+                if e.code != 409:
+                    raise
+                print(f"[SYNC] Server tree changed since revision {self.revision}, uploading full tree")
+
+        payload = dict(tree_data, persons=self._without_known_photos(tree_data.get('persons', {})))
         result = self._request('/api/sync/upload', method='POST', data={
-            'tree': tree_data,
+            'tree': payload,
             'tree_name': tree_name
         })
-        
+        if result and result.get('revision') is not None:
+            self.remember_tree(tree_data, result['revision'])
+
         return result
     
+    def _without_known_photos(self, persons):
+        """
+        Заменить base64-фото, которые уже есть на сервере, их SHA-256.
+
+        Сервер хранит фото по хешу содержимого, поэтому повторно отправлять
+        байты не нужно. Персоны, где фото заменено, копируются.
+        """
+        refs = {}
+        for pid, pdata in persons.items():
+            for field in ('photo', 'photo_full'):
+                value = pdata.get(field) if isinstance(pdata, dict) else None
+                if value and isinstance(value, str):
+                    try:
+                        raw = base64.b64decode(value.split(',', 1)[-1] if value.startswith('data:') else value)
+                    except Exception:
+                        continue
+                    refs[(pid, field)] = hashlib.sha256(raw).hexdigest()
+        if not refs:
+            return persons
+
+        try:
+            missing = set(self._request('/api/photos/missing', method='POST', data={
+                'hashes': sorted(set(refs.values()))
+            }).get('missing', []))
+        except Exception as e:
+            # Старый сервер без хранилища фото — отправляем как есть
+            print(f"[SYNC] Photo check skipped: {e}")
+            return persons
+
+        result = dict(persons)
+        for (pid, field), digest in refs.items():
+            if digest in missing:
+                continue
+            if result[pid] is persons[pid]:
+                result[pid] = dict(persons[pid])
+            result[pid][field] = None
+            result[pid][f'{field}_hash'] = digest
+        skipped = sum(1 for digest in refs.values() if digest not in missing)
+        if skipped:
+            print(f"[SYNC] Photos already on server: {skipped}")
+        return result
+
     def download_tree(self):
         """Скачать дерево с сервера."""
         if not self.token:
@@ -353,6 +474,149 @@ class SyncClient:
         
         result = self._request('/api/sync/download')
         return result
+
+    def get_changes(self):
+        """
+        Изменения дерева на сервере после последней известной ревизии.
+
+        Returns:
+            dict: revision, full, persons, marriages, deleted_persons,
+            deleted_marriages. full=True — полный снимок дерева.
+        """
+        if not self.token:
+            raise Exception("Требуется авторизация")
+
+        return self._request(f'/api/sync/changes?since={self.revision}')
+
+    # === РЕВИЗИИ (ДЕЛЬТА-СИНХРОНИЗАЦИЯ) ===
+    def _state_key(self):
+        """Состояние синхронизации привязано к серверу и пользователю."""
+        return f"{self.server_url}#{self.user_id or self._load_config().get('user_id')}"
+
+    def _load_config(self):
+        if os.path.exists(CONFIG_FILE):
+            try:
+                with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                pass
+        return {}
+
+    def _load_sync_state(self):
+        """Загрузить ревизию и хеши последней синхронизации."""
+        if os.path.exists(SYNC_STATE_FILE):
+            try:
+                with open(SYNC_STATE_FILE, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                print(f"[SYNC] Error loading sync state: {e}")
+        return {}
+
+    def _save_sync_state(self):
+        """Сохранить состояние атомарно: при сбое посреди записи остаётся прежняя ревизия и хеши."""
+        try:
+            atomic_json.write_json(SYNC_STATE_FILE, self._sync_state)
+        except Exception as e:
+            print(f"[SYNC] Error saving sync state: {e}")
+
+    @property
+    def revision(self):
+        """Ревизия дерева на сервере при последней синхронизации (0 — неизвестна)."""
+        if self._sync_state.get('key') != self._state_key():
+            return 0
+        return self._sync_state.get('revision') or 0
+
+    @staticmethod
+    def entity_hash(data):
+        """Хеш сущности дерева (для поиска изменений с последней синхронизации)."""
+        raw = json.dumps(data, ensure_ascii=False, sort_keys=True, default=str, separators=(',', ':'))
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _marriages_map(marriages):
+        """Браки → {ключ пары: дата}."""
+        result = {}
+        for marriage in marriages or []:
+            if isinstance(marriage, dict):
+                pair = marriage.get('persons', [])
+                date = marriage.get('date', '') or ''
+            else:
+                pair, date = list(marriage), ''
+            if len(pair) >= 2:
+                result[json.dumps([str(pair[0]), str(pair[1])], ensure_ascii=False)] = date
+        return result
+
+    def remember_tree(self, tree_data, revision):
+        """Запомнить, что tree_data совпадает с деревом на сервере в ревизии revision."""
+        if revision is None:
+            return
+        self._sync_state = {
+            'key': self._state_key(),
+            'revision': revision,
+            'persons': {str(pid): self.entity_hash(p) for pid, p in tree_data.get('persons', {}).items()},
+            'marriages': self._marriages_map(tree_data.get('marriages', [])),
+        }
+        self._save_sync_state()
+
+    def remember_changes(self, tree_data, changes):
+        """
+        Запомнить применённые изменения сервера (ответ get_changes).
+
+        Обновляются только хеши сущностей из changes — локальные правки,
+        ещё не отправленные на сервер, останутся в следующей дельте.
+        """
+        if changes.get('full') or not self.revision:
+            self.remember_tree(tree_data, changes.get('revision'))
+            return
+        persons = tree_data.get('persons', {})
+        known = self._sync_state.setdefault('persons', {})
+        for pid in changes.get('deleted_persons', []):
+            known.pop(str(pid), None)
+        for pid in changes.get('persons', {}):
+            if str(pid) in persons:
+                known[str(pid)] = self.entity_hash(persons[str(pid)])
+        marriages = self._sync_state.setdefault('marriages', {})
+        for key in self._marriages_map(changes.get('deleted_marriages', [])):
+            marriages.pop(key, None)
+        marriages.update(self._marriages_map(changes.get('marriages', [])))
+        self._sync_state['revision'] = changes.get('revision')
+        self._save_sync_state()
+
+    def compute_delta(self, tree_data):
+        """Изменённые и удалённые сущности tree_data относительно последней синхронизации."""
+        known = self._sync_state.get('persons', {})
+        persons = tree_data.get('persons', {})
+        changed = {pid: p for pid, p in persons.items()
+                   if known.get(str(pid)) != self.entity_hash(p)}
+        deleted = [pid for pid in known if pid not in persons]
+
+        known_marriages = self._sync_state.get('marriages', {})
+        current_marriages = self._marriages_map(tree_data.get('marriages', []))
+        return {
+            'persons': changed,
+            'deleted_persons': deleted,
+            'marriages': [{'persons': json.loads(key), 'date': date}
+                          for key, date in current_marriages.items() if known_marriages.get(key) != date],
+            'deleted_marriages': [json.loads(key) for key in known_marriages if key not in current_marriages],
+        }
+
+    @staticmethod
+    def apply_changes(tree_data, changes):
+        """Применить ответ get_changes к dict дерева ({'persons', 'marriages'}). Возвращает новое дерево."""
+        if changes.get('full'):
+            return {'persons': dict(changes.get('persons', {})), 'marriages': list(changes.get('marriages', []))}
+        persons = dict(tree_data.get('persons', {}))
+        for pid in changes.get('deleted_persons', []):
+            persons.pop(str(pid), None)
+        persons.update(changes.get('persons', {}))
+        marriages = SyncClient._marriages_map(tree_data.get('marriages', []))
+        for key in SyncClient._marriages_map(changes.get('deleted_marriages', [])):
+            marriages.pop(key, None)
+        marriages.update(SyncClient._marriages_map(changes.get('marriages', [])))
+        return {
+            'persons': persons,
+            'marriages': [{'persons': json.loads(key), 'date': date} for key, date in marriages.items()],
+        }
     
     def sync(self, model, tree_name='Моё дерево'):
         """
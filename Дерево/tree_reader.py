@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+Потоковое чтение файла дерева с отложенной загрузкой тяжёлых полей.
+
+read_tree(path) не держит в памяти фото и длинные тексты: файл отображается
+в память (mmap, страницы подгружает ОС по мере чтения), значения полей
+LAZY_FIELDS длиннее LAZY_MIN_BYTES находятся поиском по байтам и заменяются
+ссылкой на свой байтовый диапазон. Заменяются только ключи самого объекта
+персоны в "persons": между совпадениями отслеживается вложенность скобок, и
+одноимённые ключи глубже (например, в links) остаются в документе как есть.
+json.loads разбирает только оставшийся лёгкий документ: id, имена, даты, пол,
+связи, браки.
+
+Тяжёлое поле в результате — LazyField; load() читает диапазон из файла при
+первом обращении. Если файл с тех пор подменили (другой размер или mtime —
+например, свёртка журнала изменений записала новый снимок), TreeSource один раз
+перечитывает лёгкую часть нового файла и дальше берёт значения по его смещениям.
+"""
+
+import json
+import logging
+import mmap
+import os
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Поля персоны, которые не нужны холсту и раскладке
+LAZY_FIELDS = ("photo", "photo_full", "biography", "notes")
+# Короче этого значение разбирается сразу: ссылка дороже самой строки
+LAZY_MIN_BYTES = 256
+
+_LAZY_KEY = "$lazy"
+# Ключ тяжёлого поля и строка не короче LAZY_MIN_BYTES (короткие значения не совпадают).
+# Внутри строки JSON каждая кавычка экранирована; совпадение внутри строки отсеивает _Nesting.walk
+_LAZY_RE = re.compile(rb'"(' + b"|".join(f.encode() for f in LAZY_FIELDS) + rb')"\s*:\s*"'
+                      + rb'(?=[^"]{%d}|(?:[^"\\]|\\.){%d})' % ((LAZY_MIN_BYTES - 2,) * 2))
+_BACKSLASH = ord("\\")
+_QUOTE, _LBRACE, _LBRACKET = ord('"'), ord("{"), ord("[")
+# translate(None, ...) оставляет от отрезка только кавычки, обратную косую черту и скобки
+_NOT_STRUCTURAL = bytes(b for b in range(256) if b not in b'"\\{}[]')
+_QUOTED_RE = re.compile(rb'"[^"]*"')
+_TOKEN_RE = re.compile(rb'["{}\[\]]')
+
+
+class TreeSource:
+    """
+    Файл, из которого прочитаны LazyField: путь, отметка (mtime_ns, размер) и,
+    после подмены файла, значения тяжёлых полей нового файла {(id, поле): значение или LazyField}.
+    """
+
+    __slots__ = ("path", "stamp", "moved", "lock")
+
+    def __init__(self, path, stamp):
+        self.path = path
+        self.stamp = stamp
+        self.moved = None
+        self.lock = threading.Lock()
+
+    def read(self, field):
+        with open(self.path, "rb") as f:
+            st = os.fstat(f.fileno())
+            stamp = (st.st_mtime_ns, st.st_size)
+            with self.lock:
+                if stamp != self.stamp:
+                    logger.info(f"[TREE_READER] {self.path} подменён после загрузки, смещения полей перечитаны")
+                    self.moved = _heavy_values(f, self.path)
+                    self.stamp = stamp
+                moved = self.moved
+            if moved is not None:
+                field = moved.get((field.pid, field.field))
+                if type(field) is not LazyField:
+                    return field
+            f.seek(field.start)
+            return json.loads(f.read(field.end - field.start))
+
+
+class LazyField:
+    """Значение тяжёлого поля в файле: байтовый диапазон [start, end) строки JSON."""
+
+    __slots__ = ("source", "start", "end", "pid", "field")
+
+    def __init__(self, source, start, end):
+        self.source = source
+        self.start = start
+        self.end = end
+        self.pid = None
+        self.field = None
+
+    def __repr__(self):
+        return f"LazyField({self.field!r}, {self.end - self.start} байт)"
+
+    def load(self):
+        return self.source.read(self)
+
+
+def _string_end(buf, pos):
+    """Индекс сразу за закрывающей кавычкой строки, начавшейся перед pos."""
+    while True:
+        quote = buf.find(b'"', pos)
+        if quote < 0:
+            raise ValueError("Незакрытая строка в файле дерева")
+        k = quote
+        while buf[k - 1] == _BACKSLASH:
+            k -= 1
+        if (quote - k) % 2 == 0:
+            return quote + 1
+        pos = quote + 1
+
+
+class _Nesting:
+    """
+    Вложенность при проходе по файлу: открытые { и [, последняя строка
+    верхнего уровня (ключ) и признак, что второй уровень — значение "persons".
+    """
+
+    __slots__ = ("stack", "key", "in_persons")
+
+    def __init__(self):
+        self.stack = []
+        self.key = None
+        self.in_persons = False
+
+    def in_person(self):
+        """Позиция — среди ключей объекта персоны."""
+        return len(self.stack) == 3 and self.in_persons and self.stack[2] == _LBRACE
+
+    def _open(self, c):
+        if len(self.stack) == 1:
+            self.in_persons = self.key == b"persons"
+        self.stack.append(c)
+
+    def walk(self, buf, pos, end):
+        """
+        Пройти отрезок [pos, end), начинающийся вне строки. Returns: позиция
+        после отрезка; больше end — end оказался внутри строки.
+        """
+        # Обычно хватает скобок вне строк (без экранирования кавычки идут парами):
+        # строки без скобок внутри — это "", остальные вырезает _QUOTED_RE; затем
+        # парные скобки сокращаются, остаются закрытые и открытые в отрезке
+        compact = buf[pos:end].translate(None, _NOT_STRUCTURAL)
+        if b"\\" not in compact:
+            brackets = compact.replace(b'""', b"")
+            if b'"' in brackets:
+                brackets = _QUOTED_RE.sub(b"", compact)
+            while True:
+                reduced = brackets.replace(b"[]", b"").replace(b"{}", b"")
+                if len(reduced) == len(brackets):
+                    break
+                brackets = reduced
+            opened = brackets.lstrip(b"}]")
+            depth = len(self.stack) - (len(brackets) - len(opened))
+            # Открытие на верхнем уровне требует ключа — точный проход
+            if depth >= (2 if opened else 0) and not opened.strip(b"{["):
+                self.stack[depth:] = opened
+                return end
+        # Точный проход по строкам и скобкам
+        while True:
+            token = _TOKEN_RE.search(buf, pos, end)
+            if token is None:
+                return max(pos, end)
+            pos = token.start()
+            c = buf[pos]
+            if c == _QUOTE:
+                string_end = _string_end(buf, pos + 1)
+                if len(self.stack) == 1:
+                    self.key = buf[pos + 1:string_end - 1]
+                pos = string_end
+            else:
+                if c == _LBRACE or c == _LBRACKET:
+                    self._open(c)
+                elif self.stack:
+                    self.stack.pop()
+                pos += 1
+
+
+def _lazy_hook(source):
+    def hook(obj):
+        if len(obj) == 1 and _LAZY_KEY in obj:
+            start, end = obj[_LAZY_KEY]
+            return LazyField(source, start, end)
+        return obj
+
+    return hook
+
+
+def read_tree(path):
+    """
+    Документ дерева как json.load, но тяжёлые поля персон — LazyField.
+
+    Ссылки привязаны к файлу на момент чтения (mtime_ns, размер).
+    """
+    with open(path, "rb") as f:
+        return _read(f, os.fspath(path))
+
+
+def _heavy_values(f, path):
+    """Тяжёлые поля всех персон открытого файла: {(id, поле): значение или LazyField}."""
+    persons = _read(f, path).get("persons") or {}
+    return {(str(pid), field): pdata.get(field) for pid, pdata in persons.items()
+            if isinstance(pdata, dict) for field in LAZY_FIELDS}
+
+
+def _read(f, path):
+    st = os.fstat(f.fileno())
+    if st.st_size == 0:
+        return json.loads(b"")
+    source = TreeSource(path, (st.st_mtime_ns, st.st_size))
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        pieces = []
+        prev = pos = 0
+        nesting = _Nesting()
+        while True:
+            match = _LAZY_RE.search(buf, pos)
+            if match is None:
+                break
+            pos = nesting.walk(buf, pos, match.start())
+            if pos > match.start():
+                continue  # совпадение внутри строки
+            start = match.end() - 1
+            end = _string_end(buf, match.end())
+            pos = end
+            if end - start < LAZY_MIN_BYTES or not nesting.in_person():
+                continue
+            pieces.append(buf[prev:start])
+            pieces.append(b'{"%s":[%d,%d]}' % (_LAZY_KEY.encode(), start, end))
+            prev = end
+        pieces.append(buf[prev:])
+    data = json.loads(b"".join(pieces), object_hook=_lazy_hook(source))
+    persons = data.get("persons") if isinstance(data, dict) else None
+    if isinstance(persons, dict):
+        for pid, pdata in persons.items():
+            if not isinstance(pdata, dict):
+                continue
+            for field in LAZY_FIELDS:
+                value = pdata.get(field)
+                if type(value) is LazyField:
+                    value.pid, value.field = str(pid), field
+    return data
+
+
+def hydrate(value):
+    """Значение поля: LazyField загружается, остальное — как есть."""
+    return value.load() if type(value) is LazyField else value
+
+
+class LazyPersonData(dict):
+    """
+    Словарь персоны из read_tree, в котором тяжёлые поля загружаются при чтении
+    ([], get, items, values); dict(p.items()) даёт полностью загруженную копию.
+    """
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        if type(value) is LazyField:
+            value = value.load()
+            super().__setitem__(key, value)
+        return value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def items(self):
+        return [(k, self[k]) for k in self]
+
+    def values(self):
+        return [self[k] for k in self]
@@ -22,6 +22,12 @@ logger = logging.getLogger(__name__)
 MAX_HISTORY_SIZE = 50
 
 
+def _marriage_key(person1_id, person2_id):
+    """Ключ брака в model.marriages (marriage_pair)."""
+    from models import marriage_pair
+    return marriage_pair(person1_id, person2_id)
+
+
 class UndoAction:
     """Базовый класс для действий."""
 
@@ -50,14 +56,14 @@ class AddPersonAction(UndoAction):
         self.person_data = self._serialize_person(model.persons.get(self.person_id))
         if self.person_id in model.persons:
             del model.persons[self.person_id]
-            model.mark_modified()
+            model.mark_modified(self.person_id)
 
     def redo(self, model):
         from models import Person
         person = self._deserialize_person(self.person_data)
         person.id = self.person_id
         model.persons[self.person_id] = person
-        model.mark_modified()
+        model.mark_modified(self.person_id)
 
     def _serialize_person(self, person):
         if not person:
@@ -113,28 +119,34 @@ class DeletePersonAction(UndoAction):
         model.persons[self.person_id] = person
 
         # Восстанавливаем связи
+        affected, marriages = [self.person_id], []
         for parent_id in self.affected_relations.get('parents', []):
             if parent_id in model.persons:
                 model.persons[parent_id].children.add(self.person_id)
                 person.parents.add(parent_id)
+                affected.append(parent_id)
 
         for child_id in self.affected_relations.get('children', []):
             if child_id in model.persons:
                 model.persons[child_id].parents.add(self.person_id)
                 person.children.add(child_id)
+                affected.append(child_id)
 
         for spouse_id in self.affected_relations.get('spouses', []):
             if spouse_id in model.persons:
                 model.persons[spouse_id].spouse_ids.add(self.person_id)
                 person.spouse_ids.add(spouse_id)
-                model.marriages.add(tuple(sorted((self.person_id, spouse_id))))
+                marriage_key = _marriage_key(self.person_id, spouse_id)
+                model.marriages.setdefault(marriage_key, {"date": ""})
+                affected.append(spouse_id)
+                marriages.append(marriage_key)
 
-        model.mark_modified()
+        model.mark_modified(*affected, marriages=marriages)
 
     def redo(self, model):
         if self.person_id in model.persons:
             del model.persons[self.person_id]
-            model.mark_modified()
+            model.mark_modified(self.person_id)
 
     def _deserialize_person(self, data):
         from models import Person
@@ -167,14 +179,14 @@ class EditPersonAction(UndoAction):
             return
         person = model.persons[self.person_id]
         self._apply_data(person, self.old_data)
-        model.mark_modified()
+        model.mark_modified(self.person_id)
 
     def redo(self, model):
         if self.person_id not in model.persons:
             return
         person = model.persons[self.person_id]
         self._apply_data(person, self.new_data)
-        model.mark_modified()
+        model.mark_modified(self.person_id)
 
     def _apply_data(self, person, data):
         person.name = data['name']
@@ -202,9 +214,9 @@ class AddMarriageAction(UndoAction):
             p1.spouse_ids.discard(self.person2_id)
         if p2:
             p2.spouse_ids.discard(self.person1_id)
-        marriage_key = tuple(sorted((self.person1_id, self.person2_id)))
-        model.marriages.discard(marriage_key)
-        model.mark_modified()
+        marriage_key = _marriage_key(self.person1_id, self.person2_id)
+        model.marriages.pop(marriage_key, None)
+        model.mark_modified(self.person1_id, self.person2_id, marriages=[marriage_key])
 
     def redo(self, model):
         p1 = model.get_person(self.person1_id)
@@ -212,9 +224,9 @@ class AddMarriageAction(UndoAction):
         if p1 and p2:
             p1.spouse_ids.add(self.person2_id)
             p2.spouse_ids.add(self.person1_id)
-            marriage_key = tuple(sorted((self.person1_id, self.person2_id)))
-            model.marriages.add(marriage_key)
-            model.mark_modified()
+            marriage_key = _marriage_key(self.person1_id, self.person2_id)
+            model.marriages.setdefault(marriage_key, {"date": ""})
+            model.mark_modified(self.person1_id, self.person2_id, marriages=[marriage_key])
 
 
 class RemoveMarriageAction(UndoAction):
@@ -231,9 +243,9 @@ class RemoveMarriageAction(UndoAction):
         if p1 and p2:
             p1.spouse_ids.add(self.person2_id)
             p2.spouse_ids.add(self.person1_id)
-            marriage_key = tuple(sorted((self.person1_id, self.person2_id)))
-            model.marriages.add(marriage_key)
-            model.mark_modified()
+            marriage_key = _marriage_key(self.person1_id, self.person2_id)
+            model.marriages.setdefault(marriage_key, {"date": ""})
+            model.mark_modified(self.person1_id, self.person2_id, marriages=[marriage_key])
 
     def redo(self, model):
         p1 = model.get_person(self.person1_id)
@@ -242,9 +254,9 @@ class RemoveMarriageAction(UndoAction):
             p1.spouse_ids.discard(self.person2_id)
         if p2:
             p2.spouse_ids.discard(self.person1_id)
-        marriage_key = tuple(sorted((self.person1_id, self.person2_id)))
-        model.marriages.discard(marriage_key)
-        model.mark_modified()
+        marriage_key = _marriage_key(self.person1_id, self.person2_id)
+        model.marriages.pop(marriage_key, None)
+        model.mark_modified(self.person1_id, self.person2_id, marriages=[marriage_key])
 
 
 class UndoManager: